@@ -6,7 +6,8 @@ IF UNAME_SYSNAME == "Darwin":
   # Darwin doesn't have a CLOCK_BOOTTIME
   CLOCK_BOOTTIME = CLOCK_MONOTONIC_RAW
 ELSE:
-  from posix.time cimport CLOCK_BOOTTIME
+  from posix.time cimport CLOCK_BOOTTIME, clock_nanosleep, TIMER_ABSTIME
+  from libc.errno cimport EINTR
 
 cdef double readclock(clockid_t clock_id):
   cdef timespec ts
@@ -22,3 +23,25 @@ def monotonic_time():
 def sec_since_boot():
   return readclock(CLOCK_BOOTTIME)
 
+IF UNAME_SYSNAME == "Darwin":
+  ABSOLUTE_SLEEP = False
+
+  def sleep_until(double t):
+    # no clock_nanosleep, relative sleep
+    import time
+    time.sleep(max(t - sec_since_boot(), 0.))
+ELSE:
+  ABSOLUTE_SLEEP = True
+
+  def sleep_until(double t):
+    """Sleep until sec_since_boot() == t, without the drift of a relative sleep"""
+    cdef timespec ts
+    cdef int err
+    ts.tv_sec = <long>t
+    ts.tv_nsec = <long>((t - ts.tv_sec) * 1000000000.)
+    with nogil:
+      err = clock_nanosleep(CLOCK_BOOTTIME, TIMER_ABSTIME, &ts, NULL)
+      while err == EINTR:
+        err = clock_nanosleep(CLOCK_BOOTTIME, TIMER_ABSTIME, &ts, NULL)
+    if err != 0:
+      raise OSError(err, "clock_nanosleep failed")
@@ -3,20 +3,70 @@ import os
 import sys
 import copy
 import json
+import math
 import uuid
 import socket
 import logging
 import traceback
 from threading import local
 from collections import OrderedDict
+from enum import Enum
 from contextlib import contextmanager
 
+# optional, several times faster than the stdlib json module
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
 def json_handler(obj):
   # if isinstance(obj, (datetime.date, datetime.time)):
   #   return obj.isoformat()
+  # like orjson serializes them, which doesn't call the handler for these
+  if isinstance(obj, Enum):
+    return obj.value
+  if isinstance(obj, uuid.UUID):
+    return str(obj)
+  # numpy values as numbers and lists, a numpy value means numpy is imported already
+  np = sys.modules.get("numpy")
+  if np is not None:
+    if isinstance(obj, np.generic):
+      return obj.item()
+    if isinstance(obj, np.ndarray):
+      return obj.tolist()
   return repr(obj)
 
+if orjson is not None:
+  # datetimes and dataclasses go through json_handler like with json
+  ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | \
+                   orjson.OPT_SERIALIZE_NUMPY
+
+def has_nonfinite(obj):
+  if isinstance(obj, float):
+    return not math.isfinite(obj)
+  np = sys.modules.get("numpy")
+  if np is not None and isinstance(obj, (np.generic, np.ndarray)):
+    return obj.dtype.kind in "fc" and not np.isfinite(obj).all()
+  if isinstance(obj, dict):
+    obj = obj.values()
+  elif not isinstance(obj, (list, tuple)):
+    return False
+  for v in obj:
+    if has_nonfinite(v):
+      return True
+  return False
+
 def json_robust_dumps(obj):
+  """The same JSON with and without orjson, up to whitespace and float formatting"""
+  if orjson is not None:
+    try:
+      dat = orjson.dumps(obj, default=json_handler, option=ORJSON_OPTIONS)
+      # orjson writes NaN and Infinity as null, json keeps them
+      if b"null" not in dat or not has_nonfinite(obj):
+        return dat.decode('utf-8')
+    except TypeError:
+      # e.g. ints larger than 64 bits, stdlib json handles those
+      pass
   return json.dumps(obj, default=json_handler)
 
 class NiceOrderedDict(OrderedDict):
@@ -67,6 +117,58 @@ class SwagFormatter(logging.Formatter):
       raise Exception("must set swaglogger before calling format()")
     return json_robust_dumps(self.format_dict(record))
 
+class SwagCompactFormatter(SwagFormatter):
+  """Serializes only the record fields that can't be derived later as a JSON
+  array. Used for the IPC socket so the realtime processes don't pay for the
+  full record dict, logmessaged turns it back into one with expand()."""
+
+  def format(self, record):
+    if self.swaglogger is None:
+      raise Exception("must set swaglogger before calling format()")
+
+    if isinstance(record.msg, dict):
+      msg = record.msg
+    else:
+      try:
+        msg = record.getMessage()
+      except (ValueError, TypeError):
+        msg = [record.msg]+record.args
+
+    exc_info = self.formatException(record.exc_info) if record.exc_info else None
+
+    return json_robust_dumps([msg, self.swaglogger.get_ctx(), exc_info, record.levelno, record.name, record.lineno,
+                              record.pathname, record.funcName, record.process, record.thread, record.threadName,
+                              record.created])
+
+  @staticmethod
+  def is_compact(s):
+    return s.startswith('[')
+
+  def expand(self, s):
+    """Returns the same dict as SwagFormatter.format_dict from a compact record"""
+    msg, ctx, exc_info, levelno, name, lineno, pathname, funcName, process, thread, threadName, created = json.loads(s)
+    filename = os.path.basename(pathname)
+
+    record_dict = NiceOrderedDict()
+    record_dict['msg'] = msg
+    record_dict['ctx'] = ctx
+    if exc_info is not None:
+      record_dict['exc_info'] = exc_info
+    record_dict['level'] = logging.getLevelName(levelno)
+    record_dict['levelnum'] = levelno
+    record_dict['name'] = name
+    record_dict['filename'] = filename
+    record_dict['lineno'] = lineno
+    record_dict['pathname'] = pathname
+    record_dict['module'] = os.path.splitext(filename)[0]
+    record_dict['funcName'] = funcName
+    record_dict['host'] = self.host
+    record_dict['process'] = process
+    record_dict['thread'] = thread
+    record_dict['threadName'] = threadName
+    record_dict['created'] = created
+    return record_dict
+
 class SwagLogFileFormatter(SwagFormatter):
   def fix_kv(self, k, v):
     # append type to names to preserve legacy naming in logs
@@ -95,6 +197,8 @@ class SwagLogFileFormatter(SwagFormatter):
   def format(self, record):
     if isinstance(record, str):
       v = json.loads(record)
+    elif isinstance(record, dict):
+      v = copy.copy(record)
     else:
       v = self.format_dict(record)
 
@@ -43,3 +43,134 @@ class Profiler():
       else:
         print("%30s: %9.2f  avg: %7.2f  percent: %3.0f" % (n, ms*1000.0, ms*1000.0/self.iter, ms/self.tot*100))
     print("Iter clock: %2.6f   TOTAL: %2.2f" % (self.tot/self.iter, self.tot))
+
+
+# latency buckets: exact below 4 ns, then 4 per power of two (<= 25% wide).
+# only integer ops to find a bucket, so a checkpoint costs a few hundred ns
+SUB_BUCKETS = 4
+N_BUCKETS = 65 * SUB_BUCKETS
+
+
+def bucket_index(ns):
+  bl = ns.bit_length()
+  if bl < 3:
+    return ns
+  return (bl << 2) | ((ns >> (bl - 3)) & 3)
+
+
+def bucket_upper_ns(idx):
+  if idx < SUB_BUCKETS:
+    return idx
+  bl, sub = idx >> 2, idx & 3
+  return (5 + sub) << (bl - 3)
+
+
+class Histogram():
+  __slots__ = ("counts", "total_ns", "max_ns")
+
+  def __init__(self):
+    self.counts = [0] * N_BUCKETS
+    self.total_ns = 0
+    self.max_ns = 0
+
+  def add(self, ns):
+    self.counts[bucket_index(ns)] += 1
+    self.total_ns += ns
+    if ns > self.max_ns:
+      self.max_ns = ns
+
+  @property
+  def n(self):
+    return sum(self.counts)
+
+  def percentile(self, p):
+    """Upper bound of the bucket holding the p-th percentile, in ns"""
+    n = self.n
+    if n == 0:
+      return 0
+    target = p / 100. * n
+    cnt = 0
+    for idx, c in enumerate(self.counts):
+      cnt += c
+      if c and cnt >= target:
+        return min(bucket_upper_ns(idx), self.max_ns)
+    return self.max_ns
+
+  def stats(self):
+    n = self.n
+    return {
+      "count": n,
+      "mean_us": round(self.total_ns / max(n, 1) / 1e3, 1),
+      "p50_us": round(self.percentile(50) / 1e3, 1),
+      "p99_us": round(self.percentile(99) / 1e3, 1),
+      "max_us": round(self.max_ns / 1e3, 1),
+    }
+
+
+class HistogramProfiler():
+  """Drop-in for Profiler that keeps a latency histogram per checkpoint instead
+  of totals, and logs their percentiles as a swaglog "profile" event every
+  publish_interval seconds, instead of printing. display() ends a loop iteration.
+
+  Checkpoints passed to the constructor are preallocated, others are added the
+  first time they are hit."""
+  def __init__(self, proc_name, checkpoints=(), enabled=True, publish_interval=60., log=None):
+    self.proc_name = proc_name
+    self.enabled = enabled
+    self.publish_interval_ns = int(publish_interval * 1e9)
+    self.log = log
+    self.hists = {name: Histogram() for name in checkpoints}
+    self.total = self.hists["total"] = Histogram()
+    self.cp_ignored = set()
+    self.last_ns = time.perf_counter_ns()
+    self.iter_ns = 0
+    self.last_publish_ns = self.last_ns
+
+  def reset(self):
+    self.hists = {name: Histogram() for name in self.hists}
+    self.total = self.hists["total"]
+
+  def checkpoint(self, name, ignore=False):
+    # ignore flag needed when benchmarking threads with ratekeeper
+    if not self.enabled:
+      return
+    t = time.perf_counter_ns()
+    dt = t - self.last_ns
+    self.last_ns = t
+
+    h = self.hists.get(name)
+    if h is None:
+      h = self.hists[name] = Histogram()
+
+    # Histogram.add, inlined
+    bl = dt.bit_length()
+    h.counts[(bl << 2) | ((dt >> (bl - 3)) & 3) if bl > 2 else dt] += 1
+    h.total_ns += dt
+    if dt > h.max_ns:
+      h.max_ns = dt
+
+    if ignore:
+      self.cp_ignored.add(name)
+    else:
+      self.iter_ns += dt
+
+  def display(self):
+    if not self.enabled:
+      return
+    self.total.add(self.iter_ns)
+    self.iter_ns = 0
+    if self.last_ns - self.last_publish_ns > self.publish_interval_ns:
+      self.publish()
+
+  def stats(self):
+    return {name: h.stats() for name, h in self.hists.items() if h.n}
+
+  def publish(self):
+    log = self.log
+    if log is None:
+      from selfdrive.swaglog import cloudlog
+      log = self.log = cloudlog
+    log.event("profile", proc=self.proc_name, interval=round((self.last_ns - self.last_publish_ns) / 1e9, 1),
+              ignored=sorted(self.cp_ignored), checkpoints=self.stats())
+    self.last_publish_ns = self.last_ns
+    self.reset()
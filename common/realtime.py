@@ -3,9 +3,10 @@ import gc
 import os
 import time
 import multiprocessing
-from typing import Optional
+from typing import Any, Dict, Optional
 
-from common.clock import sec_since_boot  # pylint: disable=no-name-in-module, import-error
+from common.clock import ABSOLUTE_SLEEP, sec_since_boot, sleep_until  # pylint: disable=no-name-in-module, import-error
+from common.profiler import Histogram
 from selfdrive.hardware import PC, TICI
 
 
@@ -43,21 +44,114 @@ def set_core_affinity(core: int) -> None:
 
 
 def config_realtime_process(core: int, priority: int) -> None:
+  # automatic collection can pause any frame, collect with Ratekeeper(gc_budget=...) instead
   gc.disable()
   set_realtime_priority(priority)
   set_core_affinity(core)
 
 
+class ManagedGC:
+  """Garbage collection in the slack time of a realtime loop. Automatic collection stays
+  disabled, so it never pauses a frame, but cycles still get collected.
+
+  freeze() moves everything allocated during init to the permanent generation, after that
+  collect(slack) runs the generation gc would have picked, if its expected pause fits in
+  min(budget, slack). The pause of a young collection is estimated from the number of
+  objects allocated since the last one, older ones from their recent pauses."""
+  def __init__(self, budget: float = 0.002) -> None:
+    self.budget = budget
+    self.thresholds = gc.get_threshold()
+    # gen0 is per object, gen1 and gen2 per collection
+    self._pause_est = [0., 0., 0.]
+
+    self.pause = Histogram()
+    self.collections = [0, 0, 0]
+    self.collected = 0
+    self.skipped = 0
+
+  @staticmethod
+  def freeze() -> None:
+    gc.collect()
+    gc.freeze()
+
+  def collect(self, slack: float) -> bool:
+    count = gc.get_count()
+    if count[0] <= 0:
+      return False
+
+    gen = 2 if count[2] >= self.thresholds[2] else 1 if count[1] >= self.thresholds[1] else 0
+    budget = min(self.budget, slack)
+    if budget <= 0:
+      self.skipped += 1
+      return False
+    if gen > 0 and self._pause_est[gen] > budget:
+      # not enough time for an old collection, a young one keeps the allocations from growing.
+      # the estimate decays so it's retried eventually, garbage there would never be freed otherwise
+      self._pause_est[gen] *= 0.95
+      gen = 0
+    if gen == 0 and self._pause_est[0] * count[0] > budget:
+      self.skipped += 1
+      return False
+
+    t = time.perf_counter_ns()
+    self.collected += gc.collect(gen)
+    dt = time.perf_counter_ns() - t
+
+    self.pause.add(dt)
+    self.collections[gen] += 1
+    est = dt / 1e9 / count[0] if gen == 0 else dt / 1e9
+    self._pause_est[gen] = est if self.collections[gen] == 1 else 0.9 * self._pause_est[gen] + 0.1 * est
+    return True
+
+  def stats(self) -> Dict[str, Any]:
+    return {
+      "collections": list(self.collections),
+      "collected": self.collected,
+      "skipped": self.skipped,
+      "uncollectable": len(gc.garbage),
+      "frozen": gc.get_freeze_count(),
+      "pause": self.pause.stats(),
+    }
+
+  def reset_stats(self) -> None:
+    self.pause = Histogram()
+    self.collections = [0, 0, 0]
+    self.collected = 0
+    self.skipped = 0
+
+
 class Ratekeeper:
-  def __init__(self, rate: int, print_delay_threshold: Optional[float] = 0.0) -> None:
-    """Rate in Hz for ratekeeping. print_delay_threshold must be nonnegative."""
+  def __init__(self, rate: float, print_delay_threshold: Optional[float] = 0.0, absolute_sleep: bool = False,
+               publish_interval: Optional[float] = None, log=None, gc_budget: Optional[float] = None) -> None:
+    """Rate in Hz for ratekeeping. print_delay_threshold must be nonnegative.
+
+    absolute_sleep: keep_time sleeps until the frame deadline with clock_nanosleep(TIMER_ABSTIME),
+    instead of a relative sleep computed before it. Relative sleep where it's not supported.
+    publish_interval: log the loop stats as a "ratekeeper" event every publish_interval seconds
+    gc_budget: collect garbage with a ManagedGC after every frame, in at most gc_budget seconds of
+    the remaining time. Objects that exist at the first frame are frozen."""
     self._interval = 1. / rate
     self._next_frame_time = sec_since_boot() + self._interval
+    self._deadline = self._next_frame_time
     self._print_delay_threshold = print_delay_threshold
+    self._absolute_sleep = absolute_sleep and ABSOLUTE_SLEEP
     self._frame = 0
     self._remaining = 0.0
     self._process_name = multiprocessing.current_process().name
 
+    # loop stats since the last publish, jitter is |period - interval| between monitor_time calls
+    self._publish_interval = publish_interval
+    self._log = log
+    self._last_time: Optional[float] = None
+    self._last_publish_time = self._next_frame_time - self._interval
+    self._stats_frame = 0
+    self.jitter = Histogram()
+    self.misses = 0
+    self.miss_streak = 0
+    self.max_miss_streak = 0
+
+    self.gc = ManagedGC(gc_budget) if gc_budget is not None else None
+
   @property
   def frame(self) -> int:
     return self._frame
@@ -70,17 +164,79 @@ class Ratekeeper:
   def keep_time(self) -> bool:
     lagged = self.monitor_time()
     if self._remaining > 0:
-      time.sleep(self._remaining)
+      if self._absolute_sleep:
+        sleep_until(self._deadline)
+      elif self.gc is not None:
+        # the collection used some of the remaining time
+        time.sleep(max(self._deadline - sec_since_boot(), 0.))
+      else:
+        time.sleep(self._remaining)
     return lagged
 
   # this only monitor the cumulative lag, but does not enforce a rate
-  def monitor_time(self) -> bool:
+  # frame_start: when the input of a frame arrived in loops driven by messages, the next frame
+  # is expected an interval later. Only used for garbage collection, a lag in the schedule
+  # otherwise leaves it no time
+  def monitor_time(self, frame_start: Optional[float] = None) -> bool:
     lagged = False
-    remaining = self._next_frame_time - sec_since_boot()
+    t = sec_since_boot()
+    remaining = self._next_frame_time - t
+    self._deadline = self._next_frame_time
     self._next_frame_time += self._interval
     if self._print_delay_threshold is not None and remaining < -self._print_delay_threshold:
       print("%s lagging by %.2f ms" % (self._process_name, -remaining * 1000))
       lagged = True
     self._frame += 1
     self._remaining = remaining
+
+    if self._last_time is not None:
+      self.jitter.add(int(abs(t - self._last_time - self._interval) * 1e9))
+    self._last_time = t
+    if remaining < 0:
+      self.misses += 1
+      self.miss_streak += 1
+      self.max_miss_streak = max(self.max_miss_streak, self.miss_streak)
+    else:
+      self.miss_streak = 0
+
+    if self.gc is not None:
+      slack = remaining if frame_start is None else frame_start + self._interval - t
+      if self._frame == 1:
+        self.gc.freeze()
+      else:
+        self.gc.collect(slack)
+
+    if self._publish_interval is not None and t - self._last_publish_time > self._publish_interval:
+      self.publish(t)
     return lagged
+
+  def stats(self) -> Dict[str, Any]:
+    """Loop stats since the last publish or reset"""
+    ret = {
+      "frames": self._frame - self._stats_frame,
+      "misses": self.misses,
+      "max_miss_streak": self.max_miss_streak,
+      "jitter": self.jitter.stats(),
+    }
+    if self.gc is not None:
+      ret["gc"] = self.gc.stats()
+    return ret
+
+  def reset_stats(self) -> None:
+    self._stats_frame = self._frame
+    self.jitter = Histogram()
+    self.misses = 0
+    self.max_miss_streak = self.miss_streak
+    if self.gc is not None:
+      self.gc.reset_stats()
+
+  def publish(self, t: Optional[float] = None) -> None:
+    t = sec_since_boot() if t is None else t
+    log = self._log
+    if log is None:
+      from selfdrive.swaglog import cloudlog
+      log = self._log = cloudlog
+    log.event("ratekeeper", proc=self._process_name, rate=round(1. / self._interval, 2),
+              interval=round(t - self._last_publish_time, 1), **self.stats())
+    self._last_publish_time = t
+    self.reset_stats()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+import time
+
+from common.profiler import HistogramProfiler, Profiler
+
+N = 500000
+CHECKPOINTS = ["Ratekeeper", "Sample", "State transition", "State Control", "Sent"]
+
+
+def loop(prof, display=True):
+  # the checkpoints of a controlsd step, display() once per step
+  t = time.perf_counter_ns()
+  for _ in range(N // len(CHECKPOINTS)):
+    prof.checkpoint("Ratekeeper", ignore=True)
+    prof.checkpoint("Sample")
+    prof.checkpoint("State transition")
+    prof.checkpoint("State Control")
+    prof.checkpoint("Sent")
+    if display:
+      prof.display()
+  return (time.perf_counter_ns() - t) / N
+
+
+class NullLog:
+  def event(self, *args, **kwargs):
+    pass
+
+
+if __name__ == "__main__":
+  base = loop(Profiler(False))
+  print(f"Profiler, disabled           : {base:6.0f} ns/checkpoint")
+  # Profiler.display() prints every time, so only its checkpoints are timed
+  t = loop(Profiler(True), display=False)
+  print(f"Profiler, without display()  : {t:6.0f} ns/checkpoint, {t - base:6.0f} ns overhead")
+  t = loop(HistogramProfiler("bench", enabled=False))
+  print(f"HistogramProfiler, disabled  : {t:6.0f} ns/checkpoint")
+
+  prof = HistogramProfiler("bench", CHECKPOINTS, publish_interval=1., log=NullLog())
+  t = loop(prof)
+  print(f"HistogramProfiler            : {t:6.0f} ns/checkpoint, {t - base:6.0f} ns overhead, publishing every second")
+
+  t = time.perf_counter_ns()
+  prof.publish()
+  print(f"publish()                    : {(time.perf_counter_ns() - t) / 1e3:6.0f} us")
+  loop(prof)
+  for name, s in prof.stats().items():
+    print(f"  {name:18s} {s}")
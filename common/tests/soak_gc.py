@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""RSS growth of a realtime loop that makes reference cycles, over simulated hours of driving,
+with automatic, disabled (the old config_realtime_process policy) and managed collection.
+
+Every mode runs in its own process. Frames run back to back, the slack of a frame is the
+rest of its interval after the measured work, as if the loop waited for its next input."""
+import argparse
+import gc
+import subprocess
+import sys
+import time
+from collections import deque
+
+from cereal import log
+from common.realtime import ManagedGC
+from tools.lib.logreader import event_from_bytes
+
+MODES = ["auto", "disabled", "managed"]
+
+
+def rss_mb():
+  with open("/proc/self/statm") as f:
+    return int(f.read().split()[1]) * 4096 / 1e6
+
+
+class State:
+  def __init__(self):
+    self.history = deque(maxlen=100)
+    self.callbacks = []
+
+
+def frame(state, i):
+  # a message built and read back, like every daemon's output
+  msg = log.Event.new_message()
+  msg.logMonoTime = i
+  msg.init('controlsState')
+  msg.controlsState.vCruise = i * 0.01
+  reader = event_from_bytes(msg.to_bytes())
+  state.history.append(reader.controlsState.vCruise)
+
+  # cycles: an exception that keeps its frame alive, a closure that refers to itself and a
+  # parent/child pair
+  try:
+    raise ValueError(i)
+  except ValueError as e:
+    err = e  # noqa: F841  pylint: disable=unused-variable
+
+  def callback():
+    return callback
+  state.callbacks = [callback]
+
+  parent = {"child": {}}
+  parent["child"]["parent"] = parent
+  parent["reader"] = reader
+
+
+def run(mode, hours, rate, budget):
+  interval = 1. / rate
+  n_frames = int(hours * 3600 * rate)
+  report_every = int(900 * rate)
+
+  state = State()
+  if mode == "auto":
+    gc.enable()
+  else:
+    gc.disable()
+  mgc = ManagedGC(budget)
+  if mode == "managed":
+    mgc.freeze()
+
+  start_rss = rss_mb()
+  max_frame = 0.
+  t0 = time.monotonic()
+  for i in range(n_frames):
+    t = time.perf_counter()
+    frame(state, i)
+    if mode == "managed":
+      mgc.collect(interval - (time.perf_counter() - t))
+    max_frame = max(max_frame, time.perf_counter() - t)
+
+    if (i + 1) % report_every == 0:
+      print(f"  {mode:9s} {(i + 1) / rate / 3600:5.2f} h  rss {rss_mb():8.1f} MB", flush=True)
+
+  growth = (rss_mb() - start_rss) / hours
+  print(f"{mode:9s} rss growth {growth:8.1f} MB/h, slowest frame {max_frame * 1e3:6.2f} ms, "
+        f"{time.monotonic() - t0:.0f} s for {n_frames} frames")
+  if mode == "managed":
+    print(f"          {mgc.stats()}")
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--hours", type=float, default=2.)
+  parser.add_argument("--rate", type=float, default=100., help="loop rate in Hz")
+  parser.add_argument("--budget", type=float, default=0.001, help="ManagedGC budget in seconds")
+  parser.add_argument("--mode", choices=MODES, help="run one mode in this process")
+  args = parser.parse_args()
+
+  if args.mode is not None:
+    run(args.mode, args.hours, args.rate, args.budget)
+  else:
+    for mode in MODES:
+      subprocess.check_call([sys.executable, __file__, "--mode", mode, "--hours", str(args.hours),
+                             "--rate", str(args.rate), "--budget", str(args.budget)])
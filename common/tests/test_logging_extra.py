@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+import datetime
+import enum
+import json
+import logging
+import sys
+import unittest
+import uuid
+from unittest import mock
+
+import numpy as np
+
+from common import logging_extra
+from common.logging_extra import SwagCompactFormatter, SwagFormatter, SwagLogFileFormatter, SwagLogger, json_robust_dumps
+
+
+class Color(enum.Enum):
+  RED = 1
+
+
+class TestSwagFormatters(unittest.TestCase):
+  def setUp(self):
+    self.log = SwagLogger()
+    self.log.bind_global(dongle_id="0123456789abcdef")
+
+  def _records(self):
+    records = [
+      self.log.makeRecord("swaglog", logging.INFO, __file__, 10, "speed %.1f", (12.345,), None, "func"),
+      self.log.makeRecord("swaglog", logging.WARNING, __file__, 20, {"event": "test", "x": [1, 2], "big": 2**70}, (), None),
+    ]
+    try:
+      raise ValueError("test")
+    except ValueError:
+      records.append(self.log.makeRecord("swaglog", logging.ERROR, __file__, 30, "failed", (), sys.exc_info()))
+    return records
+
+  def test_compact_roundtrip(self):
+    full = SwagFormatter(self.log)
+    compact = SwagCompactFormatter(self.log)
+    for record in self._records():
+      s = compact.format(record)
+      self.assertTrue(compact.is_compact(s))
+      self.assertEqual(json.loads(json_robust_dumps(compact.expand(s))), json.loads(full.format(record)))
+
+  def test_file_formatter_input_types(self):
+    full = SwagFormatter(self.log)
+    file_formatter = SwagLogFileFormatter(None)
+    for record in self._records():
+      record_dict = full.format_dict(record)
+      from_str = json.loads(file_formatter.format(json_robust_dumps(record_dict)))
+      from_dict = json.loads(file_formatter.format(record_dict))
+      del from_str['id'], from_dict['id']
+      self.assertEqual(from_str, from_dict)
+      # input dict is left untouched
+      self.assertIn('msg', record_dict)
+
+  def test_robust_dumps(self):
+    obj = {"a": object(), 1: "int key", "big": 2**70, "nan": float("nan")}
+    self.assertEqual(set(json.loads(json_robust_dumps(obj)).keys()), {"a", "1", "big", "nan"})
+
+  @unittest.skipIf(logging_extra.orjson is None, "orjson not installed")
+  def test_robust_dumps_orjson(self):
+    # the same record with and without orjson
+    objs = [
+      {"msg": "x", "none": None, "floats": [0.1, 1e16, 1e-05], "unicode": "é"},
+      {"nan": float("nan"), "inf": [float("inf"), -float("inf")]},
+      {"when": datetime.datetime(2021, 1, 1, 12, 0, 0, 1), "id": uuid.UUID(int=1), "enum": Color.RED, "a": object()},
+      {"big": 2**70, 1: "int key"},
+      {"f64": np.float64(1.5), "f32": np.float32(0.25), "i": np.int64(3), "b": np.bool_(True),
+       "a": np.array([1., 2.]), "m": np.arange(4, dtype=np.int32).reshape(2, 2), "t": np.arange(6)[::2]},
+      {"f32 nan": np.float32("nan"), "a": np.array([1., np.inf])},
+    ]
+    for obj in objs:
+      fast = json_robust_dumps(obj)
+      with mock.patch.object(logging_extra, "orjson", None):
+        slow = json_robust_dumps(obj)
+      self.assertEqual(repr(json.loads(fast)), repr(json.loads(slow)))
+    self.assertIn("NaN", json_robust_dumps(objs[1]))
+    self.assertEqual(json.loads(json_robust_dumps(objs[4]))["f32"], 0.25)
+    self.assertIn("Infinity", json_robust_dumps(objs[5]))
+
+
+if __name__ == "__main__":
+  unittest.main()
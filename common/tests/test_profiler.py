@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+import random
+import unittest
+
+import numpy as np
+
+from common.profiler import N_BUCKETS, Histogram, HistogramProfiler, bucket_index, bucket_upper_ns
+
+
+class FakeLog:
+  def __init__(self):
+    self.events = []
+
+  def event(self, event_name, **kwargs):
+    self.events.append((event_name, kwargs))
+
+
+class TestHistogram(unittest.TestCase):
+  def test_buckets(self):
+    prev = 0
+    for ns in list(range(1000)) + [random.randrange(2**63) for _ in range(10000)] + [2**63 - 1]:
+      idx = bucket_index(ns)
+      self.assertLess(idx, N_BUCKETS)
+      self.assertLessEqual(ns, bucket_upper_ns(idx))
+      # at most 25% wide
+      self.assertLessEqual(bucket_upper_ns(idx), max(ns * 1.25, ns + 1))
+    for ns in range(100000):
+      idx = bucket_index(ns)
+      self.assertGreaterEqual(idx, prev)
+      prev = idx
+
+  def test_percentiles(self):
+    h = Histogram()
+    samples = np.random.lognormal(np.log(20000), 0.5, 10000).astype(int)
+    for ns in samples:
+      h.add(int(ns))
+    self.assertEqual(h.n, len(samples))
+    self.assertEqual(h.max_ns, samples.max())
+    for p in (50, 90, 99):
+      exact = np.percentile(samples, p)
+      self.assertGreaterEqual(h.percentile(p), exact * 0.99)
+      self.assertLessEqual(h.percentile(p), exact * 1.26)
+    self.assertEqual(h.percentile(100), samples.max())
+    self.assertEqual(Histogram().percentile(50), 0)
+
+
+class TestHistogramProfiler(unittest.TestCase):
+  def test_checkpoints(self):
+    log = FakeLog()
+    prof = HistogramProfiler("test", ["wait", "a", "b"], log=log)
+    for _ in range(10):
+      prof.checkpoint("wait", ignore=True)
+      prof.checkpoint("a")
+      prof.checkpoint("b")
+      prof.checkpoint("c")
+      prof.display()
+
+    stats = prof.stats()
+    self.assertEqual(set(stats), {"wait", "a", "b", "c", "total"})
+    self.assertTrue(all(s["count"] == 10 for s in stats.values()))
+    # ignored checkpoints are not part of the total
+    total = sum(prof.hists[name].total_ns for name in "abc")
+    self.assertEqual(prof.hists["total"].total_ns, total)
+
+    prof.publish()
+    self.assertEqual(len(log.events), 1)
+    name, kwargs = log.events[0]
+    self.assertEqual(name, "profile")
+    self.assertEqual(kwargs["proc"], "test")
+    self.assertEqual(kwargs["ignored"], ["wait"])
+    self.assertEqual(kwargs["checkpoints"], stats)
+    # every publish covers the time since the last one
+    self.assertEqual(prof.stats(), {})
+
+  def test_publish_interval(self):
+    log = FakeLog()
+    prof = HistogramProfiler("test", publish_interval=0., log=log)
+    for _ in range(3):
+      prof.checkpoint("a")
+      prof.display()
+    self.assertEqual(len(log.events), 3)
+
+    prof = HistogramProfiler("test", publish_interval=60., log=log)
+    prof.checkpoint("a")
+    prof.display()
+    self.assertEqual(len(log.events), 3)
+
+  def test_disabled(self):
+    log = FakeLog()
+    prof = HistogramProfiler("test", enabled=False, publish_interval=0., log=log)
+    prof.checkpoint("a")
+    prof.display()
+    self.assertEqual(prof.stats(), {})
+    self.assertEqual(log.events, [])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+import gc
+import unittest
+from unittest import mock
+
+from common import realtime
+from common.realtime import ManagedGC, Ratekeeper
+
+
+class FakeClock:
+  def __init__(self, t=100.):
+    self.t = t
+    self.sleeps = []
+    self.sleeps_until = []
+
+  def sec_since_boot(self):
+    return self.t
+
+  def sleep(self, dt):
+    self.sleeps.append(dt)
+    self.t += dt
+
+  def sleep_until(self, t):
+    self.sleeps_until.append(t)
+    self.t = max(self.t, t)
+
+
+class FakeLog:
+  def __init__(self):
+    self.events = []
+
+  def event(self, event_name, **kwargs):
+    self.events.append((event_name, kwargs))
+
+
+class TestRatekeeper(unittest.TestCase):
+  def setUp(self):
+    self.clock = FakeClock()
+    patches = [
+      mock.patch.object(realtime, "sec_since_boot", self.clock.sec_since_boot),
+      mock.patch.object(realtime, "sleep_until", self.clock.sleep_until),
+      mock.patch.object(realtime, "ABSOLUTE_SLEEP", True),
+      mock.patch.object(realtime.time, "sleep", self.clock.sleep),
+    ]
+    for p in patches:
+      p.start()
+      self.addCleanup(p.stop)
+
+  def test_keep_time(self):
+    rk = Ratekeeper(100, print_delay_threshold=None)
+    for i in range(10):
+      self.clock.t += 0.004
+      self.assertFalse(rk.keep_time())
+      self.assertAlmostEqual(self.clock.t, 100. + (i + 1) * 0.01)
+    self.assertEqual(rk.frame, 10)
+    self.assertEqual(rk.misses, 0)
+    self.assertEqual(rk.jitter.max_ns, 0)
+
+  def test_absolute_sleep(self):
+    rk = Ratekeeper(100, print_delay_threshold=None, absolute_sleep=True)
+    for i in range(10):
+      self.clock.t += 0.004
+      rk.keep_time()
+    self.assertEqual(self.clock.sleeps, [])
+    self.assertEqual(len(self.clock.sleeps_until), 10)
+    for i, t in enumerate(self.clock.sleeps_until):
+      self.assertAlmostEqual(t, 100. + (i + 1) * 0.01)
+
+  def test_misses_and_streaks(self):
+    rk = Ratekeeper(100, print_delay_threshold=None)
+    # on time, 3 late frames (the last one still catching up), on time, late, on time, late
+    for work in [0.005, 0.015, 0.015, 0.001, 0.001, 0.015, 0.001, 0.015]:
+      self.clock.t += work
+      rk.keep_time()
+    self.assertEqual(rk.misses, 5)
+    self.assertEqual(rk.max_miss_streak, 3)
+    self.assertEqual(rk.miss_streak, 1)
+
+    stats = rk.stats()
+    self.assertEqual(stats["frames"], 8)
+    self.assertEqual(stats["misses"], 5)
+    self.assertEqual(stats["max_miss_streak"], 3)
+    self.assertEqual(stats["jitter"]["count"], 7)
+    # the 23 ms period of the late frame after sleeping
+    self.assertAlmostEqual(stats["jitter"]["max_us"], 13000, delta=1)
+
+    rk.reset_stats()
+    self.assertEqual(rk.stats()["frames"], 0)
+    self.assertEqual(rk.misses, 0)
+    # the streak carries over the reset
+    self.assertEqual(rk.max_miss_streak, 1)
+
+  def test_jitter(self):
+    rk = Ratekeeper(100, print_delay_threshold=None)
+    for i in range(1000):
+      # periods of 9 and 11 ms
+      self.clock.t += 0.01 + (0.001 if i % 2 else -0.001)
+      rk.monitor_time()
+    stats = rk.stats()["jitter"]
+    self.assertEqual(stats["count"], 999)
+    self.assertAlmostEqual(stats["mean_us"], 1000, delta=1)
+    self.assertGreaterEqual(stats["p99_us"], 1000)
+    self.assertLessEqual(stats["p99_us"], 1000 * 1.25)
+
+  def test_publish(self):
+    log = FakeLog()
+    rk = Ratekeeper(10, print_delay_threshold=None, publish_interval=1., log=log)
+    for _ in range(25):
+      self.clock.t += 0.01
+      rk.keep_time()
+    self.assertEqual(len(log.events), 2)
+    name, kwargs = log.events[0]
+    self.assertEqual(name, "ratekeeper")
+    self.assertEqual(kwargs["rate"], 10)
+    self.assertEqual(kwargs["frames"], 11)
+    self.assertEqual(kwargs["misses"], 0)
+    self.assertEqual(sum(e[1]["frames"] for e in log.events) + rk.stats()["frames"], 25)
+
+    rk = Ratekeeper(10, print_delay_threshold=None, log=log)
+    for _ in range(25):
+      rk.keep_time()
+    self.assertEqual(len(log.events), 2)
+
+
+class Node:
+  def __init__(self):
+    self.ref = self
+
+
+def make_cycles(n):
+  for _ in range(n):
+    Node()
+
+
+class TestManagedGC(unittest.TestCase):
+  def setUp(self):
+    enabled = gc.isenabled()
+    gc.disable()
+    self.addCleanup(lambda: gc.enable() if enabled else None)
+    self.addCleanup(gc.unfreeze)
+    gc.collect()
+
+  def test_collect(self):
+    mgc = ManagedGC(budget=1.)
+    make_cycles(1000)
+    self.assertTrue(mgc.collect(1.))
+    self.assertGreaterEqual(mgc.collected, 1000)
+    self.assertEqual(mgc.collections[0], 1)
+    self.assertEqual(mgc.pause.n, 1)
+
+    # nothing allocated
+    self.assertFalse(mgc.collect(1.))
+
+    # older generations when gc would have collected them
+    for _ in range(mgc.thresholds[1]):
+      make_cycles(10)
+      mgc.collect(1.)
+    self.assertEqual(mgc.collections[1], 1)
+
+  def test_budget(self):
+    mgc = ManagedGC(budget=1.)
+    make_cycles(1000)
+    mgc.collect(1.)
+
+    # no time for the same amount of garbage
+    make_cycles(1000)
+    self.assertFalse(mgc.collect(1e-9))
+    self.assertEqual(mgc.skipped, 1)
+    mgc.budget = 1e-9
+    self.assertFalse(mgc.collect(1.))
+    self.assertEqual(mgc.skipped, 2)
+
+    stats = mgc.stats()
+    self.assertEqual(stats["collections"], [1, 0, 0])
+    self.assertEqual(stats["skipped"], 2)
+    mgc.reset_stats()
+    self.assertEqual(mgc.stats()["pause"]["count"], 0)
+
+  def test_ratekeeper(self):
+    clock = FakeClock()
+    with mock.patch.object(realtime, "sec_since_boot", clock.sec_since_boot), \
+         mock.patch.object(realtime.time, "sleep", clock.sleep):
+      rk = Ratekeeper(100, print_delay_threshold=None, gc_budget=1.)
+      clock.t += 0.001
+      rk.keep_time()
+      # frozen at the first frame
+      self.assertGreater(gc.get_freeze_count(), 0)
+
+      for _ in range(10):
+        make_cycles(100)
+        clock.t += 0.001
+        rk.keep_time()
+      self.assertEqual(sum(rk.gc.collections), 10)
+      self.assertGreaterEqual(rk.stats()["gc"]["collected"], 1000)
+
+      # a frame driven by a message that arrived 11 ms ago has no time left
+      make_cycles(100)
+      clock.t += 0.001
+      rk.monitor_time(frame_start=clock.t - 0.011)
+      self.assertEqual(sum(rk.gc.collections), 10)
+      self.assertEqual(rk.gc.skipped, 1)
+
+
+if __name__ == "__main__":
+  unittest.main()
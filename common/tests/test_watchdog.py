@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+import os
+import tempfile
+import unittest
+from multiprocessing import Process
+from unittest import mock
+
+from common import watchdog
+from common.clock import sec_since_boot  # pylint: disable=no-name-in-module, import-error
+from common.watchdog import SIZE, SLOTS, WatchdogTable
+
+
+def kick_and_exit(n):
+  os._exit(sum(watchdog.kick() for _ in range(n)))
+
+
+class TestWatchdogTable(unittest.TestCase):
+  def setUp(self):
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+    self.path = os.path.join(tmp.name, "watchdog")
+    self.table = WatchdogTable(self.path, create=True)
+
+    patcher = mock.patch.multiple(watchdog, WATCHDOG_SHM=self.path, _table=None, _slot=None)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def test_create(self):
+    self.assertEqual(os.path.getsize(self.path), SIZE)
+    self.assertEqual(self.table.find(0), 0)
+
+    # a new table is empty
+    self.table.claim(1234)
+    self.assertEqual(WatchdogTable(self.path).find(1234), 0)
+    self.assertIsNone(WatchdogTable(self.path, create=True).find(1234))
+
+  def test_open_missing(self):
+    with self.assertRaises(OSError):
+      WatchdogTable(self.path + "_missing")
+    with mock.patch.object(watchdog, "WATCHDOG_SHM", self.path + "_missing"):
+      self.assertFalse(watchdog.kick())
+
+  def test_claim(self):
+    slots = [self.table.claim(pid) for pid in range(1, SLOTS + 1)]
+    self.assertEqual(slots, list(range(SLOTS)))
+    self.assertIsNone(self.table.claim(SLOTS + 1))
+
+    # the slot is reset for the next process
+    self.table.kick(3)
+    self.assertEqual(self.table.claim(100, 3), 3)
+    self.assertEqual(self.table.pid(3), 100)
+    self.assertEqual(self.table.last_kick(3), 0)
+
+    self.table.release(3)
+    self.assertEqual(self.table.claim(101), 3)
+
+  def test_kick(self):
+    self.assertFalse(watchdog.kick())
+    self.assertEqual(self.table.last_kick(0), 0)
+
+    slot = self.table.claim(os.getpid())
+    t = sec_since_boot()
+    self.assertTrue(watchdog.kick())
+    self.assertAlmostEqual(self.table.last_kick(slot) / 1e9, t, delta=0.1)
+
+    # after the slot went to another process
+    self.table.claim(os.getpid() + 1, slot)
+    self.assertFalse(watchdog.kick())
+    self.assertEqual(self.table.last_kick(slot), 0)
+
+  def test_kick_child(self):
+    # the child's kicks are missed until it has a slot
+    p = Process(target=kick_and_exit, args=(3,))
+    p.start()
+    p.join()
+    self.assertEqual(p.exitcode, 0)
+
+    # the slot of the parent isn't the child's
+    self.table.claim(os.getpid())
+    self.assertTrue(watchdog.kick())
+    p = Process(target=kick_and_exit, args=(3,))
+    p.start()
+    p.join()
+    self.assertEqual(p.exitcode, 0)
+
+
+if __name__ == "__main__":
+  unittest.main()
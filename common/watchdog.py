@@ -0,0 +1,96 @@
+"""Watchdog table shared by the manager and the processes it watches.
+
+The manager creates a segment in /dev/shm with a slot of (pid, last kick in ns since boot) for
+every process with a watchdog, and writes the pid of the process to its slot once it runs. The
+process finds its slot by its pid and kicks it with a single 8 byte store, the manager checks it
+with a load, neither makes a syscall. selfdrive/common/watchdog.cc is the C++ side."""
+import mmap
+import os
+from typing import Optional
+
+from common.clock import sec_since_boot  # pylint: disable=no-name-in-module, import-error
+
+WATCHDOG_SHM = "/dev/shm/openpilot_watchdog"
+SLOTS = 64  # WATCHDOG_SLOTS in watchdog.h
+SIZE = SLOTS * 16  # uint64 pid, uint64 last_kick_ns
+
+
+class WatchdogTable:
+  def __init__(self, path: str = WATCHDOG_SHM, create: bool = False):
+    """create makes a new, empty segment. Raises OSError when there's no segment to open."""
+    if create:
+      # the processes never map a segment that's shorter than SIZE
+      tmp = f"{path}.{os.getpid()}.tmp"
+      fd = os.open(tmp, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o666)
+      try:
+        os.fchmod(fd, 0o666)
+        os.ftruncate(fd, SIZE)
+        os.rename(tmp, path)
+      except OSError:
+        os.close(fd)
+        os.unlink(tmp)
+        raise
+    else:
+      fd = os.open(path, os.O_RDWR)
+
+    try:
+      if os.fstat(fd).st_size < SIZE:
+        raise OSError(f"{path} is too short")
+      self.mm = mmap.mmap(fd, SIZE)
+    finally:
+      os.close(fd)
+    # pid of slot i at [2 * i], its last kick at [2 * i + 1]
+    self.slots = memoryview(self.mm).cast("Q")
+
+  def find(self, pid: int) -> Optional[int]:
+    for i in range(SLOTS):
+      if self.slots[2 * i] == pid:
+        return i
+    return None
+
+  def claim(self, pid: int, slot: Optional[int] = None) -> Optional[int]:
+    """Gives the slot, or a free one, to pid. Returns None when the table is full."""
+    if slot is None:
+      slot = self.find(0)
+      if slot is None:
+        return None
+    # the old process can't kick anymore once the pid is written
+    self.slots[2 * slot] = 0
+    self.slots[2 * slot + 1] = 0
+    self.slots[2 * slot] = pid
+    return slot
+
+  def release(self, slot: int) -> None:
+    self.slots[2 * slot] = 0
+
+  def pid(self, slot: int) -> int:
+    return self.slots[2 * slot]
+
+  def last_kick(self, slot: int) -> int:
+    """ns since boot, 0 until the process kicks"""
+    return self.slots[2 * slot + 1]
+
+  def kick(self, slot: int) -> None:
+    self.slots[2 * slot + 1] = int(sec_since_boot() * 1e9)
+
+
+_table: Optional[WatchdogTable] = None
+_slot: Optional[int] = None
+
+
+def kick() -> bool:
+  """Kicks the watchdog of this process, False while the manager hasn't given it a slot"""
+  global _table, _slot
+  pid = os.getpid()
+  if _table is None:
+    try:
+      _table = WatchdogTable(WATCHDOG_SHM)
+    except OSError:
+      return False
+
+  if _slot is None or _table.pid(_slot) != pid:
+    _slot = _table.find(pid)
+    if _slot is None:
+      return False
+  _table.kick(_slot)
+  return True
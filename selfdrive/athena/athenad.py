@@ -1,19 +1,20 @@
 #!/usr/bin/env python3
+import asyncio
 import base64
 import hashlib
 import io
 import json
 import os
-import sys
 import queue
 import random
 import select
 import socket
 import threading
 import time
-from collections import namedtuple
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
-from typing import Any
+from typing import Any, Dict, List, Set
 
 import requests
 from jsonrpc import JSONRPCResponseManager, dispatcher
@@ -26,30 +27,32 @@ from common.basedir import PERSIST
 from common.params import Params
 from common.realtime import sec_since_boot
 from selfdrive.hardware import HARDWARE, PC, TICI
+from selfdrive.athena.log_queue import LogQueue, LOG_SCAN_INTERVAL, log_needs_send
+from selfdrive.athena.upload_queue import UploadItem, UploadQueue, UPLOAD_PRIORITY_DEFAULT
 from selfdrive.loggerd.config import ROOT
-from selfdrive.loggerd.xattr_cache import getxattr, setxattr
 from selfdrive.swaglog import cloudlog, SWAGLOG_DIR
 from selfdrive.version import version, get_version, get_git_remote, get_git_branch, get_git_commit
 
 ATHENA_HOST = os.getenv('ATHENA_HOST', 'wss://athena.comma.ai')
 HANDLER_THREADS = int(os.getenv('HANDLER_THREADS', "4"))
+# single event loop instead of a thread per queue, see AthenaAsync
+ATHENA_ASYNCIO = os.getenv('ATHENA_ASYNCIO') is not None
 LOCAL_PORT_WHITELIST = set([8022])
 
-LOG_ATTR_NAME = 'user.upload'
-LOG_ATTR_VALUE_MAX_UNIX_TIME = int.to_bytes(2147483647, 4, sys.byteorder)
+# several small swaglog files are forwarded in one forwardLogs call
+LOG_BATCH_MAX_BYTES = int(os.getenv('ATHENA_LOG_BATCH_MAX_BYTES', str(512 * 1024)))
+# opt-in, backend must accept zlib+base64 encoded logs
+LOG_COMPRESSION = os.getenv('ATHENA_LOG_COMPRESSION') is not None
 RECONNECT_TIMEOUT_S = 70
 
-RETRY_DELAY = 10  # seconds
-MAX_RETRY_COUNT = 30  # Try for at most 5 minutes if upload fails immediately
+UPLOAD_THREADS = int(os.getenv('ATHENA_UPLOAD_THREADS', "4"))
 
 dispatcher["echo"] = lambda s: s
 recv_queue: Any = queue.Queue()
 send_queue: Any = queue.Queue()
-upload_queue: Any = queue.Queue()
+upload_queue = UploadQueue()  # the persisted items are loaded in main()
 log_send_queue: Any = queue.Queue()
 log_recv_queue: Any = queue.Queue()
-cancelled_uploads: Any = set()
-UploadItem = namedtuple('UploadItem', ['path', 'url', 'headers', 'created_at', 'id', 'retry_count'], defaults=(0,))
 
 
 def handle_long_poll(ws):
@@ -58,8 +61,10 @@ def handle_long_poll(ws):
   threads = [
     threading.Thread(target=ws_recv, args=(ws, end_event), name='ws_recv'),
     threading.Thread(target=ws_send, args=(ws, end_event), name='ws_send'),
-    threading.Thread(target=upload_handler, args=(end_event,), name='upload_handler'),
     threading.Thread(target=log_handler, args=(end_event,), name='log_handler'),
+  ] + [
+    threading.Thread(target=upload_handler, args=(end_event,), name=f'upload_handler_{x}')
+    for x in range(UPLOAD_THREADS)
   ] + [
     threading.Thread(target=jsonrpc_handler, args=(end_event,), name=f'worker_{x}')
     for x in range(HANDLER_THREADS)
@@ -100,39 +105,51 @@ def jsonrpc_handler(end_event):
 
 
 def upload_handler(end_event):
+  # one pooled session per worker
+  sess = requests.Session()
   while not end_event.is_set():
     try:
       item = upload_queue.get(timeout=1)
-      if item.id in cancelled_uploads:
-        cancelled_uploads.remove(item.id)
-        continue
+      if item is not None:
+        upload_item(item, sess)
+    except Exception:
+      cloudlog.exception("athena.upload_handler.exception")
 
-      try:
-        _do_upload(item)
-      except (requests.exceptions.Timeout, requests.exceptions.ConnectionError, requests.exceptions.SSLError) as e:
-        cloudlog.warning(f"athena.upload_handler.retry {e} {item}")
 
-        if item.retry_count < MAX_RETRY_COUNT:
-          item = item._replace(retry_count=item.retry_count + 1)
-          upload_queue.put_nowait(item)
+def upload_item(item, sess):
+  """Uploads one item from upload_queue. Failed uploads are retried with backoff, without blocking other items."""
+  try:
+    if item.url is None:
+      item = _get_upload_url(item)
+    _do_upload(item, sess)
+  except (requests.exceptions.Timeout, requests.exceptions.ConnectionError, requests.exceptions.SSLError) as e:
+    cloudlog.warning(f"athena.upload_handler.retry {e} {item}")
+    upload_queue.retry(item)
+  except Exception:
+    upload_queue.done(item)
+    raise
+  else:
+    upload_queue.done(item)
 
-          for _ in range(RETRY_DELAY):
-            time.sleep(1)
-            if end_event.is_set():
-              break
-    except queue.Empty:
-      pass
-    except Exception:
-      cloudlog.exception("athena.upload_handler.exception")
+
+def _get_upload_url(upload_item):
+  """A new url for an item restored after a restart, which has none, like the uploader gets them"""
+  dongle_id = Params().get("DongleId", encoding='utf-8')
+  api = Api(dongle_id)
+  key = os.path.relpath(upload_item.path, ROOT)
+  resp = api.get(f"v1.3/{dongle_id}/upload_url/", timeout=10, path=key, access_token=api.get_token())
+  resp.raise_for_status()
+  url_resp = resp.json()
+  return upload_item._replace(url=url_resp['url'], headers=url_resp['headers'])
 
 
-def _do_upload(upload_item):
+def _do_upload(upload_item, sess=requests):
   with open(upload_item.path, "rb") as f:
     size = os.fstat(f.fileno()).st_size
-    return requests.put(upload_item.url,
-                        data=f,
-                        headers={**upload_item.headers, 'Content-Length': str(size)},
-                        timeout=30)
+    return sess.put(upload_item.url,
+                    data=f,
+                    headers={**upload_item.headers, 'Content-Length': str(size)},
+                    timeout=30)
 
 
 # security: user should be able to request any message from their car
@@ -194,34 +211,32 @@ def reboot():
 
 
 @dispatcher.add_method
-def uploadFileToUrl(fn, url, headers):
+def uploadFileToUrl(fn, url, headers, priority=UPLOAD_PRIORITY_DEFAULT):
   if len(fn) == 0 or fn[0] == '/' or '..' in fn:
     return 500
   path = os.path.join(ROOT, fn)
   if not os.path.exists(path):
     return 404
 
-  item = UploadItem(path=path, url=url, headers=headers, created_at=int(time.time() * 1000), id=None)
+  item = UploadItem(path=path, url=url, headers=headers, created_at=int(time.time() * 1000), id=None, priority=priority)
   upload_id = hashlib.sha1(str(item).encode()).hexdigest()
   item = item._replace(id=upload_id)
 
-  upload_queue.put_nowait(item)
+  upload_queue.put(item)
 
   return {"enqueued": 1, "item": item._asdict()}
 
 
 @dispatcher.add_method
 def listUploadQueue():
-  return [item._asdict() for item in list(upload_queue.queue)]
+  return [item._asdict() for item in upload_queue.list()]
 
 
 @dispatcher.add_method
 def cancelUpload(upload_id):
-  upload_ids = set(item.id for item in list(upload_queue.queue))
-  if upload_id not in upload_ids:
+  if not upload_queue.cancel(upload_id):
     return 404
 
-  cancelled_uploads.add(upload_id)
   return {"success": 1}
 
 
@@ -315,82 +330,105 @@ def takeSnapshot():
 
 
 def get_logs_to_send_sorted():
-  # TODO: scan once then use inotify to detect file creation/deletion
   curr_time = int(time.time())
   logs = []
   for log_entry in os.listdir(SWAGLOG_DIR):
     log_path = os.path.join(SWAGLOG_DIR, log_entry)
-    try:
-      time_sent = int.from_bytes(getxattr(log_path, LOG_ATTR_NAME), sys.byteorder)
-    except (ValueError, TypeError):
-      time_sent = 0
-    # assume send failed and we lost the response if sent more than one hour ago
-    if not time_sent or curr_time - time_sent > 3600:
+    if log_needs_send(log_path, curr_time):
       logs.append(log_entry)
   # excluding most recent (active) log file
   return sorted(logs)[:-1]
 
 
+def build_forward_logs_request(log_entries):
+  logs = []
+  for log_entry in reversed(log_entries):  # oldest first
+    try:
+      with open(os.path.join(SWAGLOG_DIR, log_entry), "rb") as f:
+        logs.append(f.read())
+    except OSError:
+      pass  # file could be deleted by log rotation
+
+  if not len(logs):
+    return None
+
+  data = b"".join(logs)
+  params = {}
+  if LOG_COMPRESSION:
+    params["logs"] = base64.b64encode(zlib.compress(data)).decode("utf-8")
+    params["compression"] = "zlib"
+  else:
+    params["logs"] = data.decode("utf-8", errors="replace")
+
+  return json.dumps({
+    "method": "forwardLogs",
+    "params": params,
+    "jsonrpc": "2.0",
+    # newest entry identifies the batch
+    "id": log_entries[0],
+  })
+
+
+def handle_log_response(log_queue, batches, data):
+  log_resp = json.loads(data)
+  log_entry = log_resp.get("id")
+  log_success = "result" in log_resp and log_resp["result"].get("success")
+  cloudlog.debug(f"athena.log_handler.forward_response {log_entry} {log_success}")
+  entries = batches.pop(log_entry, [log_entry] if log_entry else [])
+  if log_success:
+    log_queue.mark_done(entries)
+  return log_entry
+
+
+def prune_log_batches(log_queue, batches):
+  # drop batches that will be re-sent after LOG_RESEND_TIMEOUT
+  for log_entry in list(batches):
+    if log_entry not in log_queue.in_flight:
+      del batches[log_entry]
+
+
 def log_handler(end_event):
   if PC:
     return
 
-  log_files = []
-  last_scan = 0
-  while not end_event.is_set():
-    try:
-      curr_scan = sec_since_boot()
-      if curr_scan - last_scan > 10:
-        log_files = get_logs_to_send_sorted()
-        last_scan = curr_scan
-
-      # send one log
-      curr_log = None
-      if len(log_files) > 0:
-        log_entry = log_files.pop() # newest log file
-        cloudlog.debug(f"athena.log_handler.forward_request {log_entry}")
-        try:
-          curr_time = int(time.time())
-          log_path = os.path.join(SWAGLOG_DIR, log_entry)
-          setxattr(log_path, LOG_ATTR_NAME, int.to_bytes(curr_time, 4, sys.byteorder))
-          with open(log_path, "r") as f:
-            jsonrpc = {
-              "method": "forwardLogs",
-              "params": {
-                "logs": f.read()
-              },
-              "jsonrpc": "2.0",
-              "id": log_entry
-            }
-            log_send_queue.put_nowait(json.dumps(jsonrpc))
-            curr_log = log_entry
-        except OSError:
-          pass  # file could be deleted by log rotation
-
-      # wait for response up to ~100 seconds
-      # always read queue at least once to process any old responses that arrive
-      for _ in range(100):
-        if end_event.is_set():
-          break
-        try:
-          log_resp = json.loads(log_recv_queue.get(timeout=1))
-          log_entry = log_resp.get("id")
-          log_success = "result" in log_resp and log_resp["result"].get("success")
-          cloudlog.debug(f"athena.log_handler.forward_response {log_entry} {log_success}")
-          if log_entry and log_success:
-            log_path = os.path.join(SWAGLOG_DIR, log_entry)
-            try:
-              setxattr(log_path, LOG_ATTR_NAME, LOG_ATTR_VALUE_MAX_UNIX_TIME)
-            except OSError:
-              pass  # file could be deleted by log rotation
-          if curr_log == log_entry:
-            break
-        except queue.Empty:
-          if curr_log is None:
+  log_queue = LogQueue(SWAGLOG_DIR)
+  batches = {}  # request id -> log entries
+  try:
+    while not end_event.is_set():
+      try:
+        log_queue.update()
+
+        # send one batch of logs
+        curr_log = None
+        log_entries = log_queue.get_batch(LOG_BATCH_MAX_BYTES)
+        if len(log_entries) > 0:
+          cloudlog.debug(f"athena.log_handler.forward_request {log_entries}")
+          log_queue.mark_sent(log_entries)
+          request = build_forward_logs_request(log_entries)
+          if request is not None:
+            log_send_queue.put_nowait(request)
+            curr_log = log_entries[0]
+            batches[curr_log] = log_entries
+
+        # wait for response up to ~100 seconds
+        # always read queue at least once to process any old responses that arrive
+        for _ in range(100):
+          if end_event.is_set():
             break
+          try:
+            log_entry = handle_log_response(log_queue, batches, log_recv_queue.get(timeout=1))
+            if curr_log == log_entry:
+              break
+          except queue.Empty:
+            if curr_log is None:
+              break
 
-    except Exception:
-      cloudlog.exception("athena.log_handler.exception")
+        prune_log_batches(log_queue, batches)
+
+      except Exception:
+        cloudlog.exception("athena.log_handler.exception")
+  finally:
+    log_queue.close()
 
 
 def ws_proxy_recv(ws, local_sock, ssock, end_event, global_end_event):
@@ -474,6 +512,182 @@ def ws_send(ws, end_event):
       end_event.set()
 
 
+# *** asyncio mode ***
+# One event loop replaces the per-queue threads and their 1s polling timeouts.
+# Blocking calls (websocket recv/send, RPC methods, uploads) run in a bounded executor.
+
+SEND_PRIORITY_RPC = 0
+SEND_PRIORITY_LOG = 1
+
+
+class AthenaAsync:
+  def __init__(self, ws):
+    self.ws = ws
+    # local proxy threads still watch a threading.Event
+    self.end_event = threading.Event()
+    self.send_seq = 0
+    self.rpc_tasks: Set[asyncio.Task] = set()
+
+  async def run(self):
+    self.loop = asyncio.get_running_loop()
+    # RPC workers + websocket recv + websocket send + log file reads + uploads
+    self.executor = ThreadPoolExecutor(max_workers=HANDLER_THREADS + 3 + UPLOAD_THREADS, thread_name_prefix='athena')
+    self.rpc_sem = asyncio.Semaphore(HANDLER_THREADS)
+    self.send_queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+    self.log_recv_queue: asyncio.Queue = asyncio.Queue()
+    self.upload_event = asyncio.Event()
+    self.end = asyncio.Event()
+    dispatcher["startLocalProxy"] = partial(startLocalProxy, self.end_event)
+
+    tasks = [asyncio.create_task(coro) for coro in (self.ws_recv(), self.ws_send(), self.upload_handler(), self.log_handler())]
+    try:
+      await self.end.wait()
+    finally:
+      self.end_event.set()
+      pending = tasks + list(self.rpc_tasks)
+      for task in pending:
+        task.cancel()
+      await asyncio.gather(*pending, return_exceptions=True)
+      # blocking websocket calls finish on their own timeout, same as the thread joins in handle_long_poll
+      cloudlog.debug("athena.joining executor")
+      self.executor.shutdown(wait=True)
+
+  def send(self, data, priority):
+    self.send_seq += 1
+    self.send_queue.put_nowait((priority, self.send_seq, data))
+
+  async def ws_recv(self):
+    last_ping = int(sec_since_boot() * 1e9)
+    while True:
+      try:
+        opcode, data = await self.loop.run_in_executor(self.executor, partial(self.ws.recv_data, control_frame=True))
+        if opcode in (ABNF.OPCODE_TEXT, ABNF.OPCODE_BINARY):
+          if opcode == ABNF.OPCODE_TEXT:
+            data = data.decode("utf-8")
+          task = asyncio.create_task(self.handle_message(data))
+          self.rpc_tasks.add(task)
+          task.add_done_callback(self.rpc_tasks.discard)
+        elif opcode == ABNF.OPCODE_PING:
+          last_ping = int(sec_since_boot() * 1e9)
+          Params().put("LastAthenaPingTime", str(last_ping))
+      except WebSocketTimeoutException:
+        ns_since_last_ping = int(sec_since_boot() * 1e9) - last_ping
+        if ns_since_last_ping > RECONNECT_TIMEOUT_S * 1e9:
+          cloudlog.exception("athenad.ws_recv.timeout")
+          self.end.set()
+          return
+      except Exception:
+        cloudlog.exception("athenad.ws_recv.exception")
+        self.end.set()
+        return
+
+  async def ws_send(self):
+    while True:
+      _, _, data = await self.send_queue.get()
+      try:
+        await self.loop.run_in_executor(self.executor, self.ws.send, data)
+      except Exception:
+        cloudlog.exception("athenad.ws_send.exception")
+        self.end.set()
+        return
+
+  async def handle_message(self, data):
+    try:
+      if "method" in data:
+        async with self.rpc_sem:
+          cloudlog.debug(f"athena.jsonrpc_handler.call_method {data}")
+          response = await self.loop.run_in_executor(self.executor, JSONRPCResponseManager.handle, data, dispatcher)
+        self.send(response.json, SEND_PRIORITY_RPC)
+        # uploadFileToUrl and cancelUpload change the upload queue
+        self.upload_event.set()
+      elif "id" in data and ("result" in data or "error" in data):
+        self.log_recv_queue.put_nowait(data)
+      else:
+        raise Exception("not a valid request or response")
+    except Exception as e:
+      cloudlog.exception("athena jsonrpc handler failed")
+      self.send(json.dumps({"error": str(e)}), SEND_PRIORITY_RPC)
+
+  async def upload_handler(self):
+    await asyncio.gather(*[self.upload_worker() for _ in range(UPLOAD_THREADS)])
+
+  async def upload_worker(self):
+    sess = requests.Session()
+    while True:
+      item = upload_queue.get(block=False)
+      if item is None:
+        # only RPC calls add items, handle_message sets the event after each one
+        self.upload_event.clear()
+        try:
+          await asyncio.wait_for(self.upload_event.wait(), upload_queue.time_to_next())
+        except asyncio.TimeoutError:
+          pass
+        continue
+
+      try:
+        await self.loop.run_in_executor(self.executor, upload_item, item, sess)
+      except Exception:
+        cloudlog.exception("athena.upload_handler.exception")
+      # a retried item changes when the next one is ready
+      self.upload_event.set()
+
+  async def log_handler(self):
+    if PC:
+      return
+
+    log_queue = LogQueue(SWAGLOG_DIR)
+    log_ready = asyncio.Event()
+    if log_queue.inotify is not None:
+      self.loop.add_reader(log_queue.inotify.fileno(), log_ready.set)
+
+    batches: Dict[str, List[str]] = {}
+    try:
+      while True:
+        try:
+          # process any old responses that arrived
+          while not self.log_recv_queue.empty():
+            handle_log_response(log_queue, batches, self.log_recv_queue.get_nowait())
+
+          log_ready.clear()
+          log_queue.update()
+          log_entries = log_queue.get_batch(LOG_BATCH_MAX_BYTES)
+          if len(log_entries) == 0:
+            # wake up on the next log file created
+            try:
+              await asyncio.wait_for(log_ready.wait(), LOG_SCAN_INTERVAL)
+            except asyncio.TimeoutError:
+              pass
+            continue
+
+          cloudlog.debug(f"athena.log_handler.forward_request {log_entries}")
+          log_queue.mark_sent(log_entries)
+          request = await self.loop.run_in_executor(self.executor, build_forward_logs_request, log_entries)
+          if request is None:
+            continue
+          curr_log = log_entries[0]
+          batches[curr_log] = log_entries
+          self.send(request, SEND_PRIORITY_LOG)
+
+          # wait for response up to ~100 seconds
+          deadline = self.loop.time() + 100
+          while self.loop.time() < deadline:
+            try:
+              data = await asyncio.wait_for(self.log_recv_queue.get(), deadline - self.loop.time())
+            except asyncio.TimeoutError:
+              break
+            if handle_log_response(log_queue, batches, data) == curr_log:
+              break
+
+          prune_log_batches(log_queue, batches)
+        except Exception:
+          cloudlog.exception("athena.log_handler.exception")
+          await asyncio.sleep(1)
+    finally:
+      if log_queue.inotify is not None:
+        self.loop.remove_reader(log_queue.inotify.fileno())
+      log_queue.close()
+
+
 def backoff(retries):
   return random.randrange(0, min(128, int(2 ** retries)))
 
@@ -497,6 +711,8 @@ def main():
   params = Params()
   dongle_id = params.get("DongleId", encoding='utf-8')
 
+  upload_queue.load()
+
   ws_uri = ATHENA_HOST + "/ws/v2/" + dongle_id
   api = Api(dongle_id)
 
@@ -514,7 +730,10 @@ def main():
       manage_tokens(api)
 
       conn_retries = 0
-      handle_long_poll(ws)
+      if ATHENA_ASYNCIO:
+        asyncio.run(AthenaAsync(ws).run())
+      else:
+        handle_long_poll(ws)
     except (KeyboardInterrupt, SystemExit):
       break
     except (ConnectionError, TimeoutError, WebSocketException):
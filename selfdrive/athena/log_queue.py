@@ -0,0 +1,148 @@
+import bisect
+import os
+import sys
+import time
+
+from common.inotify import Inotify, IN_CREATE, IN_DELETE, IN_MOVED_FROM, IN_MOVED_TO, IN_Q_OVERFLOW
+from selfdrive.loggerd.xattr_cache import getxattr, setxattr
+from selfdrive.swaglog import cloudlog
+
+LOG_ATTR_NAME = 'user.upload'
+LOG_ATTR_VALUE_MAX_UNIX_TIME = int.to_bytes(2147483647, 4, sys.byteorder)
+
+LOG_RESEND_TIMEOUT = 3600  # assume send failed and we lost the response if sent more than one hour ago
+LOG_SCAN_INTERVAL = 10  # seconds, only used when inotify is unavailable
+
+
+def log_needs_send(log_path, curr_time):
+  try:
+    time_sent = int.from_bytes(getxattr(log_path, LOG_ATTR_NAME), sys.byteorder)
+  except (ValueError, TypeError):
+    time_sent = 0
+  return not time_sent or curr_time - time_sent > LOG_RESEND_TIMEOUT
+
+
+def mark_log_sent(log_path, curr_time):
+  setxattr(log_path, LOG_ATTR_NAME, int.to_bytes(curr_time, 4, sys.byteorder))
+
+
+def mark_log_done(log_path):
+  setxattr(log_path, LOG_ATTR_NAME, LOG_ATTR_VALUE_MAX_UNIX_TIME)
+
+
+class LogQueue:
+  """Swaglog files waiting to be forwarded to athena.
+
+  The log directory is scanned (one getxattr per file) once, after that
+  file creation and deletion is tracked with inotify. Falls back to
+  periodic rescans if inotify is not available."""
+
+  def __init__(self, log_dir):
+    self.log_dir = log_dir
+    self.pending = []  # sorted, oldest first
+    self.in_flight = {}  # log entry -> unix time sent
+    self.newest = None  # most recent (active) log file, never sent
+    self.last_scan = 0.
+
+    try:
+      self.inotify = Inotify()
+      self.inotify.add_watch(log_dir, IN_CREATE | IN_MOVED_TO | IN_DELETE | IN_MOVED_FROM)
+    except OSError:
+      cloudlog.exception("athena.log_queue.inotify_failed")
+      self.inotify = None
+
+    # watch is set up before the scan so no file is missed in between
+    self.scan()
+
+  def __len__(self):
+    return len(self.pending)
+
+  def close(self):
+    if self.inotify is not None:
+      self.inotify.close()
+
+  def scan(self):
+    curr_time = int(time.time())
+    entries = sorted(os.listdir(self.log_dir))
+    self.newest = entries[-1] if len(entries) else None
+    self.pending = [e for e in entries if e not in self.in_flight and log_needs_send(os.path.join(self.log_dir, e), curr_time)]
+    self.last_scan = time.monotonic()
+
+  def _add(self, log_entry):
+    if self.newest is None or log_entry > self.newest:
+      self.newest = log_entry
+    if log_entry in self.in_flight:
+      return
+    idx = bisect.bisect_left(self.pending, log_entry)
+    if idx == len(self.pending) or self.pending[idx] != log_entry:
+      self.pending.insert(idx, log_entry)
+
+  def _remove(self, log_entry):
+    self.in_flight.pop(log_entry, None)
+    idx = bisect.bisect_left(self.pending, log_entry)
+    if idx < len(self.pending) and self.pending[idx] == log_entry:
+      del self.pending[idx]
+
+  def update(self, timeout=0):
+    if self.inotify is None:
+      if time.monotonic() - self.last_scan > LOG_SCAN_INTERVAL:
+        self.scan()
+    else:
+      for event in self.inotify.read(timeout):
+        if event.mask & IN_Q_OVERFLOW:
+          self.scan()
+        elif event.mask & (IN_CREATE | IN_MOVED_TO):
+          self._add(event.name)
+        elif event.mask & (IN_DELETE | IN_MOVED_FROM):
+          self._remove(event.name)
+
+    # re-queue logs we never got a response for
+    curr_time = int(time.time())
+    for log_entry, time_sent in list(self.in_flight.items()):
+      if curr_time - time_sent > LOG_RESEND_TIMEOUT:
+        del self.in_flight[log_entry]
+        self._add(log_entry)
+
+  def get_batch(self, max_bytes):
+    """Pops newest logs first until max_bytes is reached. Always returns at least one log if any is pending."""
+    batch = []
+    batch_bytes = 0
+    idx = len(self.pending) - 1
+    while idx >= 0:
+      log_entry = self.pending[idx]
+      if log_entry == self.newest:
+        idx -= 1
+        continue
+
+      try:
+        size = os.path.getsize(os.path.join(self.log_dir, log_entry))
+      except OSError:
+        # file could be deleted by log rotation
+        del self.pending[idx]
+        idx -= 1
+        continue
+
+      if len(batch) and batch_bytes + size > max_bytes:
+        break
+      del self.pending[idx]
+      batch.append(log_entry)
+      batch_bytes += size
+      idx -= 1
+    return batch
+
+  def mark_sent(self, log_entries):
+    curr_time = int(time.time())
+    for log_entry in log_entries:
+      self.in_flight[log_entry] = curr_time
+      try:
+        mark_log_sent(os.path.join(self.log_dir, log_entry), curr_time)
+      except OSError:
+        pass  # file could be deleted by log rotation
+
+  def mark_done(self, log_entries):
+    for log_entry in log_entries:
+      self.in_flight.pop(log_entry, None)
+      try:
+        mark_log_done(os.path.join(self.log_dir, log_entry))
+      except OSError:
+        pass  # file could be deleted by log rotation
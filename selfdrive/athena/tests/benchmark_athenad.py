@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+import asyncio
+import json
+import threading
+import time
+
+import numpy as np
+
+from selfdrive.athena import athenad
+from selfdrive.athena.tests.helpers import MockWebsocket
+
+N_RPC = 50  # in thread mode each response can wait out a 1s queue poll in ws_send
+IDLE_TIME = 10.  # seconds
+
+
+def run_session(ws, use_asyncio):
+  if use_asyncio:
+    asyncio.run(athenad.AthenaAsync(ws).run())
+  else:
+    athenad.handle_long_poll(ws)
+
+
+def benchmark(use_asyncio):
+  # long recv timeout so only athenad's own wakeups are measured while idle
+  ws = MockWebsocket(timeout=30.)
+  thread = threading.Thread(target=run_session, args=(ws, use_asyncio))
+  thread.start()
+  try:
+    rtt = []
+    for i in range(N_RPC):
+      t = time.monotonic()
+      ws.recv_queue.put_nowait(json.dumps({"method": "echo", "params": ["x"], "jsonrpc": "2.0", "id": i}))
+      ws.send_queue.get(timeout=5)
+      rtt.append(time.monotonic() - t)
+
+    cpu = time.process_time()
+    time.sleep(IDLE_TIME)
+    idle_cpu = (time.process_time() - cpu) / IDLE_TIME
+  finally:
+    ws.close()
+    thread.join()
+
+  rtt_ms = np.array(rtt) * 1000
+  return np.median(rtt_ms), np.percentile(rtt_ms, 99), idle_cpu * 100
+
+
+if __name__ == "__main__":
+  for name, use_asyncio in (("threads", False), ("asyncio", True)):
+    p50, p99, idle = benchmark(use_asyncio)
+    print(f"{name:8s} rpc rtt p50 {p50:6.3f} ms  p99 {p99:6.3f} ms  idle cpu {idle:5.2f}%")
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import tempfile
+import time
+
+import selfdrive.loggerd.xattr_cache as xattr_cache
+from selfdrive.athena.log_queue import LogQueue, log_needs_send
+
+N_LOGS = 2500  # default SwaglogRotatingFileHandler backup_count
+LOG_SIZE = 8 * 1024
+N_SCANS = 100
+
+
+def full_scan(log_dir):
+  # equivalent of athenad.get_logs_to_send_sorted, done every 10s before the inotify queue
+  curr_time = int(time.time())
+  return sorted(e for e in os.listdir(log_dir) if log_needs_send(os.path.join(log_dir, e), curr_time))[:-1]
+
+
+if __name__ == "__main__":
+  log_dir = tempfile.mkdtemp()
+  try:
+    line = b'{"msg": "benchmark"}\n'
+    for i in range(N_LOGS):
+      with open(os.path.join(log_dir, f"swaglog.{i:010}"), "wb") as f:
+        f.write(line * (LOG_SIZE // len(line)))
+
+    # the xattr cache is only cold after athenad starts
+    t = time.monotonic()
+    for _ in range(N_SCANS):
+      xattr_cache.cached_attributes.clear()
+      full_scan(log_dir)
+    scan_ms = (time.monotonic() - t) * 1000 / N_SCANS
+
+    t = time.monotonic()
+    for _ in range(N_SCANS):
+      full_scan(log_dir)
+    scan_cached_ms = (time.monotonic() - t) * 1000 / N_SCANS
+
+    xattr_cache.cached_attributes.clear()
+    t = time.monotonic()
+    q = LogQueue(log_dir)
+    init_ms = (time.monotonic() - t) * 1000
+
+    t = time.monotonic()
+    for _ in range(N_SCANS):
+      q.update()
+    update_ms = (time.monotonic() - t) * 1000 / N_SCANS
+
+    batches = 0
+    t = time.monotonic()
+    while len(q) > 1:
+      q.mark_sent(q.get_batch(512 * 1024))
+      batches += 1
+    drain_ms = (time.monotonic() - t) * 1000
+    q.close()
+
+    print(f"{N_LOGS} logs of {LOG_SIZE // 1024} kB")
+    print(f"full rescan (cold xattr cache): {scan_ms:8.3f} ms")
+    print(f"full rescan (warm xattr cache): {scan_cached_ms:8.3f} ms")
+    print(f"LogQueue initial scan:          {init_ms:8.3f} ms")
+    print(f"LogQueue update (inotify):      {update_ms:8.3f} ms")
+    print(f"forwardLogs requests: {batches} batched vs {N_LOGS - 1} one file per request ({drain_ms:.1f} ms to drain)")
+  finally:
+    shutil.rmtree(log_dir)
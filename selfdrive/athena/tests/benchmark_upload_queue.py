@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from selfdrive.athena import athenad
+from selfdrive.athena.tests.helpers import HTTPRequestHandler, http_server
+from selfdrive.athena.upload_queue import UploadItem, UploadQueue
+
+N_ITEMS = 32
+ITEM_SIZE = 1024 * 1024
+SERVER_DELAY = 0.1  # seconds, simulated upload latency
+
+
+def benchmark(n_threads, paths):
+  athenad.upload_queue = UploadQueue(params_key=None)
+  with http_server(delay=SERVER_DELAY) as url:
+    enqueued = {}
+    for path in paths:
+      fn = os.path.basename(path)
+      enqueued[f"/{fn}"] = time.monotonic()
+      athenad.upload_queue.put(UploadItem(path=path, url=f"{url}/{fn}", headers={}, created_at=int(time.time() * 1000), id=fn))
+
+    end_event = threading.Event()
+    threads = [threading.Thread(target=athenad.upload_handler, args=(end_event,)) for _ in range(n_threads)]
+    start = time.monotonic()
+    for t in threads:
+      t.start()
+    while len(athenad.upload_queue):
+      time.sleep(0.001)
+    elapsed = time.monotonic() - start
+    end_event.set()
+    for t in threads:
+      t.join()
+
+    latency = [HTTPRequestHandler.received[k] - v for k, v in enqueued.items()]
+  return len(paths) / elapsed, len(paths) * ITEM_SIZE / elapsed / 1e6, np.median(latency), np.max(latency)
+
+
+if __name__ == "__main__":
+  tmp = tempfile.mkdtemp()
+  try:
+    paths = []
+    for i in range(N_ITEMS):
+      paths.append(os.path.join(tmp, f"file{i}"))
+      with open(paths[-1], "wb") as f:
+        f.write(os.urandom(ITEM_SIZE))
+
+    print(f"{N_ITEMS} uploads of {ITEM_SIZE // 1024} kB, {SERVER_DELAY * 1000:.0f} ms server latency")
+    for n_threads in (1, 2, 4, 8):
+      rate, mbps, p50, worst = benchmark(n_threads, paths)
+      print(f"{n_threads} workers: {rate:6.1f} uploads/s {mbps:7.1f} MB/s  latency p50 {p50:6.3f} s  max {worst:6.3f} s")
+  finally:
+    shutil.rmtree(tmp)
@@ -0,0 +1,63 @@
+import http.server
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+from websocket import ABNF, WebSocketTimeoutException
+
+
+class MockWebsocket:
+  """In-process stand-in for a websocket-client connection"""
+  def __init__(self, timeout=1.):
+    self.timeout = timeout
+    self.recv_queue: queue.Queue = queue.Queue()
+    self.send_queue: queue.Queue = queue.Queue()
+
+  def recv_data(self, control_frame=False):
+    try:
+      data = self.recv_queue.get(timeout=self.timeout)
+    except queue.Empty:
+      raise WebSocketTimeoutException("timed out")
+    if isinstance(data, Exception):
+      raise data
+    return ABNF.OPCODE_TEXT, data.encode("utf-8")
+
+  def send(self, data, opcode=ABNF.OPCODE_TEXT):
+    self.send_queue.put_nowait(data)
+
+  def close(self):
+    # makes athenad's ws_recv exit and end the session
+    self.recv_queue.put_nowait(ConnectionError("closed"))
+
+
+class HTTPRequestHandler(http.server.BaseHTTPRequestHandler):
+  """Upload endpoint stand-in, accepts any PUT after an optional delay"""
+  delay = 0.
+  received: Dict[str, float] = {}
+
+  def do_PUT(self):
+    length = int(self.headers['Content-Length'])
+    self.rfile.read(length)
+    time.sleep(self.delay)
+    HTTPRequestHandler.received[self.path] = time.monotonic()
+    self.send_response(201, "Created")
+    self.end_headers()
+
+  def log_message(self, *args):
+    pass
+
+
+@contextmanager
+def http_server(delay=0.):
+  HTTPRequestHandler.delay = delay
+  HTTPRequestHandler.received = {}
+  server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), HTTPRequestHandler)
+  thread = threading.Thread(target=server.serve_forever, daemon=True)
+  thread.start()
+  try:
+    yield f"http://127.0.0.1:{server.server_port}"
+  finally:
+    server.shutdown()
+    server.server_close()
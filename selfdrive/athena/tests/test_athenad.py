@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from selfdrive.athena import athenad
+from selfdrive.athena.tests.helpers import HTTPRequestHandler, MockWebsocket, http_server
+
+
+class TestAthenadMethods(unittest.TestCase):
+  def _run_session(self, use_asyncio):
+    ws = MockWebsocket()
+    if use_asyncio:
+      target = lambda: asyncio.run(athenad.AthenaAsync(ws).run())
+    else:
+      target = lambda: athenad.handle_long_poll(ws)
+    thread = threading.Thread(target=target)
+    thread.start()
+    return ws, thread
+
+  def _check_echo(self, use_asyncio):
+    ws, thread = self._run_session(use_asyncio)
+    try:
+      for i in range(10):
+        ws.recv_queue.put_nowait(json.dumps({"method": "echo", "params": [f"hello {i}"], "jsonrpc": "2.0", "id": i}))
+      responses = [json.loads(ws.send_queue.get(timeout=5)) for _ in range(10)]
+      self.assertEqual(sorted(r["id"] for r in responses), list(range(10)))
+      for r in responses:
+        self.assertEqual(r["result"], f"hello {r['id']}")
+
+      ws.recv_queue.put_nowait("{}")
+      self.assertIn("error", json.loads(ws.send_queue.get(timeout=5)))
+    finally:
+      ws.close()
+      thread.join(timeout=10)
+    self.assertFalse(thread.is_alive())
+
+  def test_echo_threads(self):
+    self._check_echo(use_asyncio=False)
+
+  def test_echo_asyncio(self):
+    self._check_echo(use_asyncio=True)
+
+  def _check_upload(self, use_asyncio):
+    # without main(), the upload workers use the module's queue
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+    path = os.path.join(tmp.name, "qlog.bz2")
+    with open(path, "wb") as f:
+      f.write(b"\0" * 1024)
+
+    with http_server() as url:
+      ws, thread = self._run_session(use_asyncio)
+      try:
+        with mock.patch.object(athenad, "ROOT", tmp.name):
+          ws.recv_queue.put_nowait(json.dumps({"method": "uploadFileToUrl", "params": ["qlog.bz2", f"{url}/qlog.bz2", {}],
+                                               "jsonrpc": "2.0", "id": 0}))
+          self.assertEqual(json.loads(ws.send_queue.get(timeout=5))["result"]["enqueued"], 1)
+        for _ in range(500):
+          if "/qlog.bz2" in HTTPRequestHandler.received and len(athenad.upload_queue) == 0:
+            break
+          time.sleep(0.01)
+        self.assertIn("/qlog.bz2", HTTPRequestHandler.received)
+        self.assertEqual(len(athenad.upload_queue), 0)
+      finally:
+        ws.close()
+        thread.join(timeout=10)
+    self.assertFalse(thread.is_alive())
+
+  def test_upload_threads(self):
+    self._check_upload(use_asyncio=False)
+
+  def test_upload_asyncio(self):
+    self._check_upload(use_asyncio=True)
+
+
+if __name__ == "__main__":
+  unittest.main()
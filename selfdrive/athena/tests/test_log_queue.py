@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from selfdrive.athena.log_queue import LogQueue, LOG_RESEND_TIMEOUT, log_needs_send, mark_log_done
+
+
+class TestLogQueue(unittest.TestCase):
+  def setUp(self):
+    self.log_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.log_dir)
+
+  def _create_log(self, idx, size=100):
+    fn = f"swaglog.{idx:010}"
+    with open(os.path.join(self.log_dir, fn), "w") as f:
+      f.write("x" * size)
+    return fn
+
+  def test_initial_scan(self):
+    logs = [self._create_log(i) for i in range(5)]
+    mark_log_done(os.path.join(self.log_dir, logs[1]))
+
+    q = LogQueue(self.log_dir)
+    self.assertEqual(q.pending, [logs[0], logs[2], logs[3], logs[4]])
+    self.assertEqual(q.newest, logs[4])
+    q.close()
+
+  def test_inotify_tracks_files(self):
+    q = LogQueue(self.log_dir)
+    self.assertIsNotNone(q.inotify)
+
+    logs = [self._create_log(i) for i in range(3)]
+    q.update(timeout=1)
+    self.assertEqual(q.pending, logs)
+
+    os.remove(os.path.join(self.log_dir, logs[0]))
+    q.update(timeout=1)
+    self.assertEqual(q.pending, logs[1:])
+    q.close()
+
+  def test_batch_skips_active_log(self):
+    logs = [self._create_log(i, size=100) for i in range(6)]
+    q = LogQueue(self.log_dir)
+
+    # newest first, active log excluded, at least one log even if over the limit
+    self.assertEqual(q.get_batch(250), [logs[4], logs[3]])
+    self.assertEqual(q.get_batch(10), [logs[2]])
+    self.assertEqual(q.get_batch(10**6), [logs[1], logs[0]])
+    self.assertEqual(q.get_batch(10**6), [])
+    q.close()
+
+  def test_sent_and_resend(self):
+    logs = [self._create_log(i) for i in range(3)]
+    q = LogQueue(self.log_dir)
+    batch = q.get_batch(10**6)
+    q.mark_sent(batch)
+    self.assertFalse(log_needs_send(os.path.join(self.log_dir, logs[0]), int(time.time())))
+
+    # no response, re-queued after timeout
+    for log_entry in q.in_flight:
+      q.in_flight[log_entry] -= LOG_RESEND_TIMEOUT + 1
+    q.update()
+    self.assertEqual(q.pending, logs)
+
+    batch = q.get_batch(10**6)
+    q.mark_sent(batch)
+    q.mark_done(batch)
+    q.update()
+    self.assertEqual(q.pending, [logs[2]])
+    self.assertEqual(q.in_flight, {})
+
+    # a new scan (e.g. athenad restart) doesn't resend anything
+    q.scan()
+    self.assertEqual(q.get_batch(10**6), [])
+    q.close()
+
+
+if __name__ == "__main__":
+  unittest.main()
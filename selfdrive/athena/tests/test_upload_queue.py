@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from selfdrive.athena import athenad
+from selfdrive.athena.tests.helpers import http_server
+from selfdrive.athena.upload_queue import UploadItem, UploadQueue, MAX_RETRY_COUNT, RETRY_DELAY, UPLOAD_QUEUE_PARAM, retry_delay
+
+
+class TestUploadQueue(unittest.TestCase):
+  def setUp(self):
+    self.tmp = tempfile.mkdtemp()
+    self.q = UploadQueue(params_key=None)
+    self.prev_upload_queue = athenad.upload_queue
+    athenad.upload_queue = self.q
+
+  def tearDown(self):
+    athenad.upload_queue = self.prev_upload_queue
+    shutil.rmtree(self.tmp)
+
+  def _item(self, name, url="http://localhost/", priority=10, size=1024):
+    path = os.path.join(self.tmp, name)
+    with open(path, "wb") as f:
+      f.write(b"\0" * size)
+    return UploadItem(path=path, url=f"{url}/{name}", headers={}, created_at=int(time.time() * 1000), id=name, priority=priority)
+
+  def test_priority_order(self):
+    self.q.put(self._item("a", priority=10))
+    self.q.put(self._item("b", priority=1))
+    self.q.put(self._item("c", priority=10))
+    self.assertEqual([i.id for i in self.q.list()], ["b", "a", "c"])
+    self.assertEqual(self.q.get(block=False).id, "b")
+    self.assertTrue(self.q.list()[0].current)
+
+  def test_retry_does_not_block(self):
+    self.q.put(self._item("a", priority=1))
+    self.q.put(self._item("b"))
+
+    a = self.q.get(block=False)
+    self.assertTrue(self.q.retry(a))
+    self.assertEqual(self.q.get(block=False).id, "b")
+    self.assertIsNone(self.q.get(block=False))
+    self.assertAlmostEqual(self.q.time_to_next(), RETRY_DELAY, delta=1)
+
+    a = self.q.list()[-1]
+    self.assertEqual(a.retry_count, 1)
+    self.assertFalse(self.q.retry(a._replace(retry_count=MAX_RETRY_COUNT)))
+
+  def test_retry_budget(self):
+    # an upload that fails immediately is given up on after about 5 minutes
+    total = sum(retry_delay(n) for n in range(MAX_RETRY_COUNT))
+    self.assertGreaterEqual(total, 5 * 60)
+    self.assertLess(total, 6 * 60)
+
+  def test_cancel(self):
+    self.q.put(self._item("a"))
+    self.q.put(self._item("b"))
+    current = self.q.get(block=False)
+
+    self.assertTrue(self.q.cancel("b"))
+    self.assertTrue(self.q.cancel(current.id))
+    self.assertFalse(self.q.cancel("c"))
+
+    # cancelled in-progress upload is not retried
+    self.assertFalse(self.q.retry(current))
+    self.assertEqual(len(self.q), 0)
+
+  def restart(self):
+    q = UploadQueue(UPLOAD_QUEUE_PARAM)
+    q.load()
+    return q
+
+  def test_persistence(self):
+    q = self.restart()
+    for item in q.list():
+      q.cancel(item.id)
+    q.put(self._item("a")._replace(headers={"Authorization": "secret"}))
+    q.put(self._item("b"))
+    q.get(block=False)
+
+    # in-progress upload is re-queued after restart, without its url and headers
+    q = self.restart()
+    self.assertEqual(sorted(i.id for i in q.list()), ["a", "b"])
+    self.assertFalse(any(i.current for i in q.list()))
+    self.assertTrue(all(i.url is None and i.headers is None for i in q.list()))
+    q.cancel("a")
+    q.cancel("b")
+
+  def test_persistence_cancel(self):
+    q = self.restart()
+    for item in q.list():
+      q.cancel(item.id)
+    q.put(self._item("a"))
+    current = q.get(block=False)
+
+    # cancelled while uploading and athenad restarts before the upload finishes
+    q.cancel(current.id)
+    self.assertEqual(self.restart().list(), [])
+
+  def test_restored_item(self):
+    item = self._item("a")
+    restored = item._replace(url=None, headers=None)
+    with http_server() as url, \
+         mock.patch.object(athenad, "_get_upload_url", return_value=item._replace(url=f"{url}/a")) as get_upload_url:
+      self.q.put(restored)
+      athenad.upload_item(self.q.get(block=False), athenad.requests)
+    get_upload_url.assert_called_once_with(restored._replace(current=True))
+    self.assertEqual(len(self.q), 0)
+
+  def test_parallel_uploads(self):
+    n_items, n_threads, delay = 8, 4, 0.25
+    with http_server(delay=delay) as url:
+      # failing upload at highest priority must not hold up the others
+      self.q.put(self._item("unreachable", url="http://127.0.0.1:1", priority=0))
+      for i in range(n_items):
+        self.q.put(self._item(f"item{i}", url=url))
+
+      end_event = threading.Event()
+      threads = [threading.Thread(target=athenad.upload_handler, args=(end_event,)) for _ in range(n_threads)]
+      start = time.monotonic()
+      for t in threads:
+        t.start()
+      while len(self.q) > 1 and time.monotonic() - start < 10:
+        time.sleep(0.01)
+      elapsed = time.monotonic() - start
+      end_event.set()
+      for t in threads:
+        t.join()
+
+    self.assertEqual([i.id for i in self.q.list()], ["unreachable"])
+    self.assertEqual(self.q.list()[0].retry_count, 1)
+    self.assertLess(elapsed, n_items * delay / 2)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,160 @@
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from typing import Dict, List, Optional, Set, Tuple
+
+from common.params import Params
+from selfdrive.swaglog import cloudlog
+
+UPLOAD_QUEUE_PARAM = "AthenadUploadQueue"
+
+UPLOAD_PRIORITY_DEFAULT = 10  # lower is uploaded first
+RETRY_DELAY = 10  # seconds, doubled on every retry
+MAX_RETRY_DELAY = 60
+MAX_RETRY_COUNT = 7  # 10+20+40+4*60 s, try for at most about 5 minutes if upload fails immediately
+
+UploadItem = namedtuple('UploadItem', ['path', 'url', 'headers', 'created_at', 'id', 'retry_count', 'priority', 'next_attempt', 'current'],
+                        defaults=(0, UPLOAD_PRIORITY_DEFAULT, 0., False))
+
+# the url and headers give access to the upload location and expire, they're not written to disk.
+# A restored item has none and athenad requests a new url before uploading it
+PERSISTED_FIELDS = ['path', 'created_at', 'id', 'retry_count', 'priority']
+
+
+def retry_delay(retry_count):
+  return min(RETRY_DELAY * 2 ** retry_count, MAX_RETRY_DELAY)
+
+
+class UploadQueue:
+  """Pending athena uploads, ordered by (priority, created_at).
+
+  The queue is persisted in Params so uploads survive an athenad restart,
+  load() restores it. A failed item is delayed with exponential backoff
+  without holding up the other items, several workers can call get()
+  concurrently."""
+
+  def __init__(self, params_key: Optional[str] = UPLOAD_QUEUE_PARAM):
+    self.params_key = params_key
+    self.cv = threading.Condition()
+    # the Params writes are done outside of cv, in the order the queue changed
+    self.persist_lock = threading.Lock()
+    self.items: Dict[str, UploadItem] = {}
+    self.current: Dict[str, UploadItem] = {}
+    self.cancelled: Set[str] = set()
+
+  def __len__(self):
+    with self.cv:
+      return len(self.items) + len(self.current)
+
+  def load(self):
+    if self.params_key is None:
+      return
+
+    try:
+      data = Params().get(self.params_key)
+      items = [UploadItem(url=None, headers=None, **{k: d[k] for k in PERSISTED_FIELDS}) for d in json.loads(data)] if data else []
+    except Exception:
+      cloudlog.exception("athena.upload_queue.load_failed")
+      items = []
+
+    with self.cv:
+      for item in items:
+        # uploads in progress when athenad stopped are retried
+        if os.path.exists(item.path) and item.id not in self.current:
+          self.items[item.id] = item
+      self.cv.notify_all()
+
+  def _persist(self):
+    """Writes the queue to Params, called without holding cv"""
+    if self.params_key is None:
+      return
+
+    with self.persist_lock:
+      with self.cv:
+        items = [item for item in list(self.current.values()) + list(self.items.values()) if item.id not in self.cancelled]
+        data = json.dumps([{k: getattr(item, k) for k in PERSISTED_FIELDS} for item in items])
+      try:
+        Params().put(self.params_key, data)
+      except Exception:
+        cloudlog.exception("athena.upload_queue.persist_failed")
+
+  def _next_item(self) -> Tuple[Optional[UploadItem], Optional[float]]:
+    """Returns the next item ready for upload, or the time in seconds until one is ready"""
+    now = time.time()
+    best, wait = None, None
+    for item in self.items.values():
+      if item.next_attempt <= now:
+        if best is None or (item.priority, item.created_at) < (best.priority, best.created_at):
+          best = item
+      elif wait is None or item.next_attempt - now < wait:
+        wait = item.next_attempt - now
+    return best, wait
+
+  def put(self, item: UploadItem):
+    with self.cv:
+      self.items[item.id] = item
+      self.cv.notify()
+    self._persist()
+
+  def get(self, block=True, timeout=None) -> Optional[UploadItem]:
+    end_time = None if timeout is None else time.monotonic() + timeout
+    with self.cv:
+      while True:
+        item, wait = self._next_item()
+        if item is not None:
+          del self.items[item.id]
+          item = item._replace(current=True)
+          self.current[item.id] = item
+          return item
+
+        if not block:
+          return None
+        if end_time is not None:
+          remaining = end_time - time.monotonic()
+          if remaining <= 0:
+            return None
+          wait = remaining if wait is None else min(wait, remaining)
+        self.cv.wait(wait)
+
+  def time_to_next(self) -> Optional[float]:
+    """Seconds until a waiting item is ready, None if nothing is queued"""
+    with self.cv:
+      item, wait = self._next_item()
+      return 0. if item is not None else wait
+
+  def done(self, item: UploadItem):
+    with self.cv:
+      self.current.pop(item.id, None)
+      self.cancelled.discard(item.id)
+    self._persist()
+
+  def retry(self, item: UploadItem) -> bool:
+    with self.cv:
+      self.current.pop(item.id, None)
+      retried = item.id not in self.cancelled and item.retry_count < MAX_RETRY_COUNT
+      self.cancelled.discard(item.id)
+      if retried:
+        self.items[item.id] = item._replace(retry_count=item.retry_count + 1, current=False,
+                                            next_attempt=time.time() + retry_delay(item.retry_count))
+        self.cv.notify()
+    self._persist()
+    return retried
+
+  def cancel(self, upload_id: str) -> bool:
+    with self.cv:
+      if upload_id in self.items:
+        del self.items[upload_id]
+      elif upload_id in self.current:
+        # in-progress upload is not retried if it fails, and not restored after a restart
+        self.cancelled.add(upload_id)
+      else:
+        return False
+    self._persist()
+    return True
+
+  def list(self) -> List[UploadItem]:
+    with self.cv:
+      queued = sorted(self.items.values(), key=lambda item: (item.priority, item.created_at))
+      return list(self.current.values()) + queued
@@ -1,8 +1,10 @@
 import os
+from collections.abc import Mapping
 from common.params import Params
 from common.basedir import BASEDIR
 from selfdrive.version import comma_remote, tested_branch
-from selfdrive.car.fingerprints import eliminate_incompatible_cars, all_legacy_fingerprint_cars
+from selfdrive.car.fingerprints import ALL_CARS_MASK, all_legacy_fingerprint_cars, cars_to_mask, eliminate_incompatible_mask, mask_to_cars
+from selfdrive.car.manifest import get_manifest
 from selfdrive.car.vin import get_vin, VIN_UNKNOWN
 from selfdrive.car.fw_versions import get_fw_versions, match_fw_to_car
 from selfdrive.hardware import EON
@@ -57,32 +59,91 @@ def load_interfaces(brand_names):
   return ret
 
 
-def _get_interface_names():
-  # read all the folders in selfdrive/car and return a dict where:
-  # - keys are all the car names that which we have an interface for
-  # - values are lists of spefic car models for a given car
-  brand_names = {}
-  for car_folder in [x[0] for x in os.walk(BASEDIR + '/selfdrive/car')]:
-    try:
-      brand_name = car_folder.split('/')[-1]
-      model_names = __import__('selfdrive.car.%s.values' % brand_name, fromlist=['CAR']).CAR
-      model_names = [getattr(model_names, c) for c in model_names.__dict__.keys() if not c.startswith("__")]
-      brand_names[brand_name] = model_names
-    except (ImportError, IOError):
-      pass
+class LazyInterfaces(Mapping):
+  """model -> (CarInterface, CarController, CarState), like load_interfaces(brand_names).
+  A brand's modules are only imported when one of its models is looked up, so nothing is
+  imported before the car is fingerprinted."""
+  def __init__(self, brand_names):
+    self.brand_names = brand_names
+    self.model_brands = {model: brand for brand, models in brand_names.items() for model in models}
+    self.loaded = {}
 
-  return brand_names
+  def __getitem__(self, model_name):
+    if model_name not in self.loaded:
+      brand_name = self.model_brands[model_name]
+      self.loaded.update(load_interfaces({brand_name: self.brand_names[brand_name]}))
+    return self.loaded[model_name]
 
+  def __contains__(self, model_name):
+    return model_name in self.model_brands
 
-# imports from directory selfdrive/car/<name>/
-interface_names = _get_interface_names()
-interfaces = load_interfaces(interface_names)
+  def __iter__(self):
+    return iter(self.model_brands)
+
+  def __len__(self):
+    return len(self.model_brands)
+
+
+# brand -> models, from the cached manifest of the values in selfdrive/car/<name>/
+interface_names = get_manifest()["brands"]
+interfaces = LazyInterfaces(interface_names)
 
 
 def only_toyota_left(candidate_cars):
   return all(("TOYOTA" in c or "LEXUS" in c) for c in candidate_cars) and len(candidate_cars) > 0
 
 
+_NOT_TOYOTA_MASK = cars_to_mask(c for c in all_legacy_fingerprint_cars() if not only_toyota_left([c]))
+
+
+def can_fingerprint(next_can):
+  """Fingerprints the car from the can batches next_can() returns. Candidates are kept as
+  bitmasks, see fingerprints.eliminate_incompatible_mask"""
+  finger = gen_empty_fingerprint()
+  candidate_cars = {i: ALL_CARS_MASK for i in [0, 1]}  # attempt fingerprint on both bus 0 and 1
+  frame = 0
+  frame_fingerprint = 10  # 0.1s
+  car_fingerprint = None
+  done = False
+
+  while not done:
+    a = next_can()
+
+    for can in a.can:
+      # need to independently try to fingerprint both bus 0 and 1 to work
+      # for the combo black_panda and honda_bosch. Ignore extended messages
+      # and VIN query response.
+      # Include bus 2 for toyotas to disambiguate cars using camera messages
+      # (ideally should be done for all cars but we can't for Honda Bosch)
+      src, address, length = can.src, can.address, len(can.dat)
+      if 0 <= src < 4:
+        finger[src][address] = length
+      if address >= 0x800 or address in (0x7df, 0x7e0, 0x7e8):
+        continue
+      for b, mask in candidate_cars.items():
+        if src == b or (src == 2 and mask and not mask & _NOT_TOYOTA_MASK):
+          candidate_cars[b] = eliminate_incompatible_mask(address, length, mask)
+
+    # if we only have one car choice and the time since we got our first
+    # message has elapsed, exit
+    for b, mask in candidate_cars.items():
+      # Toyota needs higher time to fingerprint, since DSU does not broadcast immediately
+      if mask and not mask & _NOT_TOYOTA_MASK:
+        frame_fingerprint = 100  # 1s
+      if mask and not mask & (mask - 1) and frame > frame_fingerprint:
+        # fingerprint done
+        car_fingerprint = mask_to_cars(mask)[0]
+
+    # bail if no cars left or we've been waiting for more than 2s
+    failed = (all(mask == 0 for mask in candidate_cars.values()) and frame > frame_fingerprint) or frame > 200
+    succeeded = car_fingerprint is not None
+    done = failed or succeeded
+
+    frame += 1
+
+  return car_fingerprint, finger
+
+
 # **** for use live only ****
 def fingerprint(logcan, sendcan, has_relay):
   fixed_fingerprint = os.environ.get('FINGERPRINT', "")
@@ -115,45 +176,7 @@ def fingerprint(logcan, sendcan, has_relay):
   cloudlog.warning("VIN %s", vin)
   Params().put("CarVin", vin)
 
-  finger = gen_empty_fingerprint()
-  candidate_cars = {i: all_legacy_fingerprint_cars() for i in [0, 1]}  # attempt fingerprint on both bus 0 and 1
-  frame = 0
-  frame_fingerprint = 10  # 0.1s
-  car_fingerprint = None
-  done = False
-
-  while not done:
-    a = get_one_can(logcan)
-
-    for can in a.can:
-      # need to independently try to fingerprint both bus 0 and 1 to work
-      # for the combo black_panda and honda_bosch. Ignore extended messages
-      # and VIN query response.
-      # Include bus 2 for toyotas to disambiguate cars using camera messages
-      # (ideally should be done for all cars but we can't for Honda Bosch)
-      if can.src in range(0, 4):
-        finger[can.src][can.address] = len(can.dat)
-      for b in candidate_cars:
-        if (can.src == b or (only_toyota_left(candidate_cars[b]) and can.src == 2)) and \
-           can.address < 0x800 and can.address not in [0x7df, 0x7e0, 0x7e8]:
-          candidate_cars[b] = eliminate_incompatible_cars(can, candidate_cars[b])
-
-    # if we only have one car choice and the time since we got our first
-    # message has elapsed, exit
-    for b in candidate_cars:
-      # Toyota needs higher time to fingerprint, since DSU does not broadcast immediately
-      if only_toyota_left(candidate_cars[b]):
-        frame_fingerprint = 100  # 1s
-      if len(candidate_cars[b]) == 1 and frame > frame_fingerprint:
-          # fingerprint done
-          car_fingerprint = candidate_cars[b][0]
-
-    # bail if no cars left or we've been waiting for more than 2s
-    failed = (all(len(cc) == 0 for cc in candidate_cars.values()) and frame > frame_fingerprint) or frame > 200
-    succeeded = car_fingerprint is not None
-    done = failed or succeeded
-
-    frame += 1
+  car_fingerprint, finger = can_fingerprint(lambda: get_one_can(logcan))
 
   exact_match = True
   source = car.CarParams.FingerprintSource.can
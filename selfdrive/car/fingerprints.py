@@ -1,5 +1,6 @@
 import os
 from common.basedir import BASEDIR
+from selfdrive.car.manifest import combine_brands, get_manifest
 
 
 def get_attr_from_cars(attr, result=dict, combine_brands=True):
@@ -34,11 +35,49 @@ def get_attr_from_cars(attr, result=dict, combine_brands=True):
   return result
 
 
-FW_VERSIONS = get_attr_from_cars('FW_VERSIONS')
-_FINGERPRINTS = get_attr_from_cars('FINGERPRINTS')
+# from the cached manifest, get_attr_from_cars imports every brand
+FW_VERSIONS = combine_brands(get_manifest()["fw_versions"])
+_FINGERPRINTS = combine_brands(get_manifest()["fingerprints"])
 
 _DEBUG_ADDRESS = {1880: 8}   # reserved for debug purposes
 
+
+def _build_fingerprint_index(fingerprints):
+  """Candidate cars as bits of an int, bit i is the i-th car in the returned list. The index
+  maps every (address, length) in a fingerprint of a car to the cars that can send it."""
+  cars = list(fingerprints.keys())
+  index = {}
+  for i, car_name in enumerate(cars):
+    for fingerprint in fingerprints[car_name]:
+      for adr, length in {**fingerprint, **_DEBUG_ADDRESS}.items():
+        index[(adr, length)] = index.get((adr, length), 0) | (1 << i)
+  return cars, index
+
+
+_FINGERPRINT_CARS, _FINGERPRINT_INDEX = _build_fingerprint_index(_FINGERPRINTS)
+_FINGERPRINT_BITS = {car_name: 1 << i for i, car_name in enumerate(_FINGERPRINT_CARS)}
+ALL_CARS_MASK = (1 << len(_FINGERPRINT_CARS)) - 1
+
+
+def cars_to_mask(candidate_cars):
+  mask = 0
+  for car_name in candidate_cars:
+    mask |= _FINGERPRINT_BITS[car_name]
+  return mask
+
+
+def mask_to_cars(mask):
+  return [car_name for i, car_name in enumerate(_FINGERPRINT_CARS) if mask >> i & 1]
+
+
+def eliminate_incompatible_mask(address, length, candidate_mask):
+  """Bitmask version of eliminate_incompatible_cars, one lookup and AND per message"""
+  # ignore addresses that are more than 11 bits
+  if address >= 0x800:
+    return candidate_mask
+  return candidate_mask & _FINGERPRINT_INDEX.get((address, length), 0)
+
+
 def is_valid_for_fingerprint(msg, car_fingerprint):
   adr = msg.address
   # ignore addresses that are more than 11 bits
@@ -55,19 +94,8 @@ def eliminate_incompatible_cars(msg, candidate_cars):
      Returns:
       A list containing the subset of candidate_cars that could have sent msg.
   """
-  compatible_cars = []
-
-  for car_name in candidate_cars:
-    car_fingerprints = _FINGERPRINTS[car_name]
-
-    for fingerprint in car_fingerprints:
-      fingerprint.update(_DEBUG_ADDRESS)  # add alien debug address
-
-      if is_valid_for_fingerprint(msg, fingerprint):
-        compatible_cars.append(car_name)
-        break
-
-  return compatible_cars
+  mask = eliminate_incompatible_mask(msg.address, len(msg.dat), ALL_CARS_MASK)
+  return [car_name for car_name in candidate_cars if mask & _FINGERPRINT_BITS[car_name]]
 
 
 def all_known_cars():
@@ -3,13 +3,15 @@ import struct
 import traceback
 from typing import Any
 from collections import defaultdict
+from itertools import zip_longest
 
 from tqdm import tqdm
 
 import panda.python.uds as uds
 from cereal import car
-from selfdrive.car.fingerprints import FW_VERSIONS, get_attr_from_cars
-from selfdrive.car.isotp_parallel_query import IsoTpParallelQuery
+from selfdrive.car.fingerprints import FW_VERSIONS
+from selfdrive.car.manifest import get_manifest
+from selfdrive.car.isotp_parallel_query import IsoTpQueue
 from selfdrive.car.toyota.values import CAR as TOYOTA
 from selfdrive.swaglog import cloudlog
 
@@ -144,11 +146,6 @@ REQUESTS = [
 ]
 
 
-def chunks(l, n=128):
-  for i in range(0, len(l), n):
-    yield l[i:i + n]
-
-
 def build_fw_dict(fw_versions):
   fw_versions_dict = {}
   for fw in fw_versions:
@@ -158,34 +155,95 @@ def build_fw_dict(fw_versions):
   return fw_versions_dict
 
 
+ESSENTIAL_ECUS = [Ecu.engine, Ecu.eps, Ecu.esp, Ecu.fwdRadar, Ecu.fwdCamera, Ecu.vsa]
+
+# These ECUs are known to be shared between models (EPS only between hybrid/ICE version)
+# Getting this exactly right isn't crucial, but excluding camera and radar makes it almost
+# impossible to get 3 matching versions, even if two models with shared parts are released at the same
+# time and only one is in our database.
+FUZZY_EXCLUDE_ECUS = [Ecu.fwdCamera, Ecu.fwdRadar, Ecu.eps]
+
+
+def missing_ecu_allowed(candidate, ecu_type):
+  """If an ECU is not considered essential the FW version can be missing to get a fingerprint"""
+  if ecu_type == Ecu.esp and candidate in [TOYOTA.RAV4, TOYOTA.COROLLA, TOYOTA.HIGHLANDER]:
+    return True
+
+  # On some Toyota models, the engine can show on two different addresses
+  if ecu_type == Ecu.engine and candidate in [TOYOTA.CAMRY, TOYOTA.COROLLA_TSS2, TOYOTA.CHR, TOYOTA.LEXUS_IS]:
+    return True
+
+  return ecu_type not in ESSENTIAL_ECUS
+
+
+class FwMatchIndex:
+  """Lookup tables of a FW version database {car: {(ecu, addr, sub_addr): versions}}
+     versions: (addr, sub_addr, version) -> cars that accept the version on the address
+     ecu_cars: (addr, sub_addr) -> cars with an ECU on the address
+     essential: car -> addresses whose FW version can't be missing, and essential_cars the reverse
+     fuzzy: (addr, sub_addr, version) -> cars with the version, without FUZZY_EXCLUDE_ECUS"""
+  def __init__(self, fw_versions):
+    self.fw_versions = fw_versions
+    self.cars = frozenset(fw_versions)
+
+    versions = defaultdict(set)
+    ecu_cars = defaultdict(set)
+    fuzzy = defaultdict(list)
+    self.essential = {}
+    for candidate, fw_by_addr in fw_versions.items():
+      accepted = {}
+      essential = set()
+      for (ecu_type, addr, sub_addr), fws in fw_by_addr.items():
+        a = (addr, sub_addr)
+        # with more than one ECU on an address the version has to match all of them
+        accepted[a] = accepted[a] & set(fws) if a in accepted else set(fws)
+        if not missing_ecu_allowed(candidate, ecu_type):
+          essential.add(a)
+        if ecu_type not in FUZZY_EXCLUDE_ECUS:
+          for f in fws:
+            fuzzy[(addr, sub_addr, f)].append(candidate)
+
+      for a, fws in accepted.items():
+        ecu_cars[a].add(candidate)
+        for f in fws:
+          versions[(*a, f)].add(candidate)
+      self.essential[candidate] = frozenset(essential)
+
+    essential_cars = defaultdict(set)
+    for candidate, addrs in self.essential.items():
+      for a in addrs:
+        essential_cars[a].add(candidate)
+
+    self.versions = {k: frozenset(v) for k, v in versions.items()}
+    self.essential_cars = {k: frozenset(v) for k, v in essential_cars.items()}
+    self.ecu_cars = {k: frozenset(v) for k, v in ecu_cars.items()}
+    self.fuzzy = dict(fuzzy)
+
+
+_fw_index = None
+
+
+def get_fw_index():
+  """The FwMatchIndex of FW_VERSIONS, built on first use"""
+  global _fw_index
+  if _fw_index is None or _fw_index.fw_versions is not FW_VERSIONS:
+    _fw_index = FwMatchIndex(FW_VERSIONS)
+  return _fw_index
+
+
 def match_fw_to_car_fuzzy(fw_versions_dict, log=True, exclude=None):
   """Do a fuzzy FW match. This function will return a match, and the number of firmware version
   that were matched uniquely to that specific car. If multiple ECUs uniquely match to different cars
   the match is rejected."""
-
-  # These ECUs are known to be shared between models (EPS only between hybrid/ICE version)
-  # Getting this exactly right isn't crucial, but excluding camera and radar makes it almost
-  # impossible to get 3 matching versions, even if two models with shared parts are released at the same
-  # time and only one is in our database.
-  exclude_types = [Ecu.fwdCamera, Ecu.fwdRadar, Ecu.eps]
-
-  # Build lookup table from (addr, subaddr, fw) to list of candidate cars
-  all_fw_versions = defaultdict(list)
-  for candidate, fw_by_addr in FW_VERSIONS.items():
-    if candidate == exclude:
-      continue
-
-    for addr, fws in fw_by_addr.items():
-      if addr[0] in exclude_types:
-        continue
-      for f in fws:
-        all_fw_versions[(addr[1], addr[2], f)].append(candidate)
+  index = get_fw_index()
 
   match_count = 0
   candidate = None
   for addr, version in fw_versions_dict.items():
     # All cars that have this FW response on the specified address
-    candidates = all_fw_versions[(addr[0], addr[1], version)]
+    candidates = index.fuzzy.get((addr[0], addr[1], version), [])
+    if exclude is not None:
+      candidates = [c for c in candidates if c != exclude]
 
     if len(candidates) == 1:
       match_count += 1
@@ -203,36 +261,24 @@ def match_fw_to_car_fuzzy(fw_versions_dict, log=True, exclude=None):
     return set()
 
 
-def match_fw_to_car_exact(fw_versions_dict):
+def match_fw_to_car_exact(fw_versions_dict, candidates=None, unknown=frozenset()):
   """Do an exact FW match. Returns all cars that match the given
   FW versions for a list of "essential" ECUs. If an ECU is not considered
   essential the FW version can be missing to get a fingerprint, but if it's present it
-  needs to match the database."""
-  invalid = []
-  candidates = FW_VERSIONS
-
-  for candidate, fws in candidates.items():
-    for ecu, expected_versions in fws.items():
-      ecu_type = ecu[0]
-      addr = ecu[1:]
-      found_version = fw_versions_dict.get(addr, None)
-      ESSENTIAL_ECUS = [Ecu.engine, Ecu.eps, Ecu.esp, Ecu.fwdRadar, Ecu.fwdCamera, Ecu.vsa]
-      if ecu_type == Ecu.esp and candidate in [TOYOTA.RAV4, TOYOTA.COROLLA, TOYOTA.HIGHLANDER] and found_version is None:
-        continue
-
-      # On some Toyota models, the engine can show on two different addresses
-      if ecu_type == Ecu.engine and candidate in [TOYOTA.CAMRY, TOYOTA.COROLLA_TSS2, TOYOTA.CHR, TOYOTA.LEXUS_IS] and found_version is None:
-        continue
-
-      # Ignore non essential ecus
-      if ecu_type not in ESSENTIAL_ECUS and found_version is None:
-        continue
+  needs to match the database. The ECUs on the addresses in unknown aren't queried yet,
+  their missing FW versions don't rule out a car. candidates limits the cars matched."""
+  index = get_fw_index()
+  matches = set(index.cars) if candidates is None else index.cars & set(candidates)
 
-      if found_version not in expected_versions:
-        invalid.append(candidate)
-        break
+  for addr, version in fw_versions_dict.items():
+    ecu_cars = index.ecu_cars.get(addr)
+    if ecu_cars is not None:
+      matches -= ecu_cars - index.versions.get((addr[0], addr[1], version), frozenset())
 
-  return set(candidates.keys()) - set(invalid)
+  for addr, cars in index.essential_cars.items():
+    if addr not in fw_versions_dict and addr not in unknown:
+      matches -= cars
+  return matches
 
 
 def match_fw_to_car(fw_versions, allow_fuzzy=True):
@@ -250,18 +296,20 @@ def match_fw_to_car(fw_versions, allow_fuzzy=True):
   return exact_match, matches
 
 
-def get_fw_versions(logcan, sendcan, bus, extra=None, timeout=0.1, debug=False, progress=False):
+def get_fw_versions(logcan, sendcan, bus, extra=None, timeout=0.1, debug=False, progress=False, stop_on_match=True):
+  """Queries the FW versions of the ECUs of every brand. The ECUs are queried in parallel, one
+  request at a time per ECU with the brands taking turns. With stop_on_match the queries of the
+  other brands are skipped as soon as only one car can still match, and its FW versions are an
+  exact match. The queries of its brand all still run, so every ECU that answers is in carFw,
+  and the answers to the queries of other brands that were already running are ignored."""
   ecu_types = {}
 
   # Extract ECU adresses to query from fingerprints
-  # ECUs using a subadress need be queried one by one, the rest can be done in parallel
-  addrs = []
-  parallel_addrs = []
-
-  versions = get_attr_from_cars('FW_VERSIONS', combine_brands=False)
+  versions = dict(get_manifest()["fw_versions"])
   if extra is not None:
     versions.update(extra)
 
+  brand_addrs = defaultdict(list)
   for brand, brand_versions in versions.items():
     for c in brand_versions.values():
       for ecu_type, addr, sub_addr in c.keys():
@@ -269,28 +317,63 @@ def get_fw_versions(logcan, sendcan, bus, extra=None, timeout=0.1, debug=False,
         if a not in ecu_types:
           ecu_types[(addr, sub_addr)] = ecu_type
 
-        if sub_addr is None:
-          if a not in parallel_addrs:
-            parallel_addrs.append(a)
-        else:
-          if [a] not in addrs:
-            addrs.append([a])
-
-  addrs.insert(0, parallel_addrs)
+        if (addr, sub_addr) not in brand_addrs[brand]:
+          brand_addrs[brand].append((addr, sub_addr))
+
+  # The brands take turns, so an ECU isn't busy with the requests of one brand after another.
+  # Queries to the same ECU are serialized by the queue, ECUs using a subaddress included
+  brand_requests = defaultdict(list)
+  for i, (brand, _, _, _) in enumerate(REQUESTS):
+    brand_requests[brand].append(i)
+  order = [i for turn in zip_longest(*brand_requests.values()) for i in turn if i is not None]
+
+  queue = IsoTpQueue(sendcan, logcan, debug=debug)
+  pending = defaultdict(int)  # (brand, addr) -> queries still to finish
+  for i in order:
+    brand, request, response, response_offset = REQUESTS[i]
+    for b in (brand, 'any'):
+      for addr, sub_addr in brand_addrs.get(b, []):
+        t = 2 * timeout if sub_addr is None else timeout
+        queue.add(bus, addr, request, response, response_offset, sub_addr=sub_addr, timeout=t, tag=(i, b, (addr, sub_addr)))
+        pending[(b, (addr, sub_addr))] += 1
 
   fw_versions = {}
-  for i, addr in enumerate(tqdm(addrs, disable=not progress)):
-    for addr_chunk in chunks(addr):
-      for brand, request, response, response_offset in REQUESTS:
-        try:
-          addrs = [(a, s) for (b, a, s) in addr_chunk if b in (brand, 'any')]
-
-          if addrs:
-            query = IsoTpParallelQuery(sendcan, logcan, bus, addrs, request, response, response_offset, debug=debug)
-            t = 2 * timeout if i == 0 else timeout
-            fw_versions.update(query.get_data(t))
-        except Exception:
-          cloudlog.warning(f"FW query exception: {traceback.format_exc()}")
+  found = {}  # addr -> index of the request that found it, the later request wins like before
+  pbar = tqdm(total=len(queue), disable=not progress)
+  matched_brand = None
+
+  def on_done(query):
+    nonlocal matched_brand
+    i, brand, addr = query.tag
+    pending[(brand, addr)] -= 1
+    pbar.update()
+    if matched_brand is not None and brand not in (matched_brand, 'any'):
+      # was already running at the match, an ECU of another brand on an address of the matched one
+      return False
+    if query.result is not None and found.get(addr, -1) <= i:
+      fw_versions[addr] = query.result
+      found[addr] = i
+    elif pending[(brand, addr)] > 0:
+      return False
+
+    if not stop_on_match or matched_brand is not None:
+      return False
+    candidates = {}
+    for b, brand_versions in versions.items():
+      unknown = {a for a in brand_addrs[b] if pending[(b, a)] > 0}
+      candidates.update((c, b) for c in match_fw_to_car_exact(fw_versions, brand_versions, unknown))
+
+    if len(candidates) == 1 and set(candidates) == match_fw_to_car_exact(fw_versions):
+      # the ECUs of the brand that didn't answer yet, like a slow DSU, still end up in carFw
+      matched_brand = next(iter(candidates.values()))
+      queue.drop(lambda q: q.tag[1] not in (matched_brand, 'any'))
+    return False
+
+  try:
+    queue.run(on_done)
+  except Exception:
+    cloudlog.warning(f"FW query exception: {traceback.format_exc()}")
+  pbar.close()
 
   # Build capnp list to put into CarParams
   car_fw = []
@@ -343,7 +426,7 @@ if __name__ == "__main__":
   print()
 
   t = time.time()
-  fw_vers = get_fw_versions(logcan, sendcan, 1, extra=extra, debug=args.debug, progress=True)
+  fw_vers = get_fw_versions(logcan, sendcan, 1, extra=extra, debug=args.debug, progress=True, stop_on_match=False)
   _, candidates = match_fw_to_car(fw_vers)
 
   print()
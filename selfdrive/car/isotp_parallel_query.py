@@ -1,13 +1,98 @@
+import math
+import struct
 import time
-from collections import defaultdict
+import traceback
 from functools import partial
-from typing import Optional
+from typing import Dict, List, Optional, Set, Tuple
 
 import cereal.messaging as messaging
+from cereal import log
 from selfdrive.swaglog import cloudlog
 from selfdrive.boardd.boardd import can_list_to_can_capnp
 from panda.python.uds import CanClient, IsoTpMessage, FUNCTIONAL_ADDRS, get_rx_addr_for_tx_addr
 
+# the physical addresses answering a request to a functional address
+FUNCTIONAL_RX_ADDRS = {
+  FUNCTIONAL_ADDRS[0]: range(0x7E8, 0x7F0),
+  FUNCTIONAL_ADDRS[1]: range(0x18DAF100, 0x18DAF200),
+}
+
+
+class IsoTpDispatcher:
+  """Sorts the frames of a can socket into a buffer per ISO-TP session, indexed by bus, rx address
+  and subaddress, and sleeps on a poller until frames arrive or a timeout is up"""
+  def __init__(self, logcan):
+    self.logcan = logcan
+    self.poller = messaging.Poller()
+    self.poller.registerSocket(logcan)
+
+    self.index: Dict[Tuple[int, int], Dict[Optional[int], object]] = {}  # (bus, rx_addr) -> {sub_addr: session}
+    self.buffers: Dict[object, list] = {}
+    self.rx_addrs: Set[int] = set()
+    self.rx_patterns: List[bytes] = []
+
+  def register(self, session, bus, rx_addrs, sub_addr=None):
+    """Returns the rx function of the CanClient of the session"""
+    self.buffers[session] = []
+    for rx_addr in rx_addrs:
+      self.index.setdefault((bus, rx_addr), {})[sub_addr] = session
+    self._update_rx_addrs()
+    return partial(self._can_rx, session)
+
+  def unregister(self, session, bus, rx_addrs, sub_addr=None):
+    del self.buffers[session]
+    for rx_addr in rx_addrs:
+      subs = self.index[(bus, rx_addr)]
+      del subs[sub_addr]
+      if not subs:
+        del self.index[(bus, rx_addr)]
+    self._update_rx_addrs()
+
+  def _update_rx_addrs(self):
+    self.rx_addrs = {addr for _, addr in self.index}
+    # the address of a frame is stored as is in the capnp message, a little endian uint32
+    self.rx_patterns = [struct.pack("<I", addr) for addr in self.rx_addrs]
+
+  def _can_rx(self, session):
+    msgs = self.buffers[session]
+    self.buffers[session] = []
+    return msgs
+
+  def drain(self):
+    messaging.drain_sock_raw(self.logcan)
+    for session in self.buffers:
+      self.buffers[session] = []
+
+  def recv(self, timeout):
+    """Waits up to timeout seconds for frames of the registered sessions, returns the sessions that received some"""
+    updated: Set[object] = set()
+    if not self.poller.poll(max(math.ceil(timeout * 1000), 0)):
+      return updated
+
+    # reading the frames from capnp is most of the time spent here, packets without any of
+    # the rx addresses in their bytes can't have a frame for a session
+    index, rx_addrs = self.index, self.rx_addrs
+    for raw in messaging.drain_sock_raw(self.logcan):
+      if not any(p in raw for p in self.rx_patterns):
+        continue
+
+      for msg in log.Event.from_bytes(raw).can:
+        address = msg.address
+        if address not in rx_addrs:
+          continue
+        subs = index.get((msg.src, address))
+        if subs is None:
+          continue
+
+        dat = msg.dat
+        session = subs.get(None)
+        if session is None and len(dat):
+          session = subs.get(dat[0])
+        if session is not None:
+          self.buffers[session].append((address, msg.busTime, dat, msg.src))
+          updated.add(session)
+    return updated
+
 
 class IsoTpParallelQuery:
   def __init__(self, sendcan, logcan, bus, addrs, request, response, response_offset=0x8, functional_addr=False, debug=False):
@@ -27,52 +112,15 @@ class IsoTpParallelQuery:
         self.real_addrs.append((a, None))
 
     self.msg_addrs = {tx_addr: get_rx_addr_for_tx_addr(tx_addr[0], rx_offset=response_offset) for tx_addr in self.real_addrs}
-    self.msg_buffer = defaultdict(list)
-
-  def rx(self):
-    """Drain can socket and sort messages into buffers based on address"""
-    can_packets = messaging.drain_sock(self.logcan, wait_for_one=True)
-
-    for packet in can_packets:
-      for msg in packet.can:
-        if msg.src == self.bus:
-          if self.functional_addr:
-            if (0x7E8 <= msg.address <= 0x7EF) or (0x18DAF100 <= msg.address <= 0x18DAF1FF):
-              fn_addr = next(a for a in FUNCTIONAL_ADDRS if msg.address - a <= 32)
-              self.msg_buffer[fn_addr].append((msg.address, msg.busTime, msg.dat, msg.src))
-          elif msg.address in self.msg_addrs.values():
-            self.msg_buffer[msg.address].append((msg.address, msg.busTime, msg.dat, msg.src))
 
   def _can_tx(self, tx_addr, dat, bus):
     """Helper function to send single message"""
     msg = [tx_addr, 0, dat, bus]
     self.sendcan.send(can_list_to_can_capnp([msg], msgtype='sendcan'))
 
-  def _can_rx(self, addr, sub_addr=None):
-    """Helper function to retrieve message with specified address and subadress from buffer"""
-    keep_msgs = []
-
-    if sub_addr is None:
-      msgs = self.msg_buffer[addr]
-    else:
-      # Filter based on subadress
-      msgs = []
-      for m in self.msg_buffer[addr]:
-        first_byte = m[2][0]
-        if first_byte == sub_addr:
-          msgs.append(m)
-        else:
-          keep_msgs.append(m)
-
-    self.msg_buffer[addr] = keep_msgs
-    return msgs
-
-  def _drain_rx(self):
-    messaging.drain_sock(self.logcan)
-    self.msg_buffer = defaultdict(list)
-
   def get_data(self, timeout):
-    self._drain_rx()
+    dispatcher = IsoTpDispatcher(self.logcan)
+    dispatcher.drain()
 
     # Create message objects
     msgs = {}
@@ -80,11 +128,11 @@ class IsoTpParallelQuery:
     request_done = {}
     for tx_addr, rx_addr in self.msg_addrs.items():
       # rx_addr not set when using functional tx addr
-      id_addr = rx_addr or tx_addr[0]
+      rx_addrs = FUNCTIONAL_RX_ADDRS[tx_addr[0]] if rx_addr is None else [rx_addr]
       sub_addr = tx_addr[1]
 
-      can_client = CanClient(self._can_tx, partial(self._can_rx, id_addr, sub_addr=sub_addr), tx_addr[0], rx_addr,
-                             self.bus, sub_addr=sub_addr, debug=self.debug)
+      can_rx = dispatcher.register(tx_addr, self.bus, rx_addrs, sub_addr)
+      can_client = CanClient(self._can_tx, can_rx, tx_addr[0], rx_addr, self.bus, sub_addr=sub_addr, debug=self.debug)
 
       max_len = 8 if sub_addr is None else 7
 
@@ -96,14 +144,13 @@ class IsoTpParallelQuery:
       request_done[tx_addr] = False
 
     results = {}
-    start_time = time.time()
-    while True:
-      self.rx()
-
-      if all(request_done.values()):
-        break
+    deadline = time.time() + timeout
+    while not all(request_done.values()):
+      for tx_addr in dispatcher.recv(deadline - time.time()):
+        if request_done[tx_addr]:
+          continue
 
-      for tx_addr, msg in msgs.items():
+        msg = msgs[tx_addr]
         dat: Optional[bytes] = msg.recv()
 
         if not dat:
@@ -124,7 +171,142 @@ class IsoTpParallelQuery:
           request_done[tx_addr] = True
           cloudlog.warning(f"iso-tp query bad response: 0x{dat.hex()}")
 
-      if time.time() - start_time > timeout:
+      if time.time() > deadline:
         break
 
     return results
+
+
+class IsoTpQuery:
+  """A request sequence to one ECU, run by an IsoTpQueue"""
+  def __init__(self, bus, tx_addr, sub_addr, request, response, response_offset, timeout, tag):
+    self.bus = bus
+    self.tx_addr = tx_addr
+    self.sub_addr = sub_addr
+    self.rx_addr = get_rx_addr_for_tx_addr(tx_addr, rx_offset=response_offset)
+    self.request = request
+    self.response = response
+    self.timeout = timeout
+    self.tag = tag
+
+    self.result: Optional[bytes] = None
+    self.msg: Optional[IsoTpMessage] = None
+    self.counter = 0
+    self.deadline = 0.
+
+  @property
+  def locks(self):
+    # ECUs behind a sub address share the tx address and are queried one by one
+    return ((self.bus, self.tx_addr), (self.bus, self.rx_addr))
+
+
+class IsoTpQueue:
+  """Runs the request sequences of many ECUs over one can socket. A query starts as soon as no
+  running query uses its tx or rx address, so different ECUs are queried in parallel and the
+  queries of one ECU run in the order they were added. Every query has its own timeout."""
+  def __init__(self, sendcan, logcan, max_running=128, debug=False):
+    self.sendcan = sendcan
+    self.logcan = logcan
+    self.max_running = max_running
+    self.debug = debug
+
+    self.queued: List[IsoTpQuery] = []
+    self.running: List[IsoTpQuery] = []
+    self.locked: Set[Tuple[int, int]] = set()
+    self.dispatcher: Optional[IsoTpDispatcher] = None
+
+  def __len__(self):
+    return len(self.queued) + len(self.running)
+
+  def add(self, bus, tx_addr, request, response, response_offset=0x8, sub_addr=None, timeout=0.1, tag=None):
+    query = IsoTpQuery(bus, tx_addr, sub_addr, request, response, response_offset, timeout, tag)
+    self.queued.append(query)
+    return query
+
+  def drop(self, f):
+    """Drops the queued queries f(query) is True for, the running ones still finish"""
+    self.queued = [q for q in self.queued if not f(q)]
+
+  def _can_tx(self, tx_addr, dat, bus):
+    """Helper function to send single message"""
+    msg = [tx_addr, 0, dat, bus]
+    self.sendcan.send(can_list_to_can_capnp([msg], msgtype='sendcan'))
+
+  def _start(self, query):
+    can_rx = self.dispatcher.register(query, query.bus, [query.rx_addr], query.sub_addr)
+    can_client = CanClient(self._can_tx, can_rx, query.tx_addr, query.rx_addr, query.bus, sub_addr=query.sub_addr, debug=self.debug)
+    max_len = 8 if query.sub_addr is None else 7
+
+    self.running.append(query)
+    self.locked.update(query.locks)
+    query.msg = IsoTpMessage(can_client, timeout=0, max_len=max_len, debug=self.debug)
+    query.msg.send(query.request[0])
+    query.deadline = time.time() + query.timeout
+
+  def _start_queued(self):
+    queued = []
+    for query in self.queued:
+      if len(self.running) < self.max_running and not any(l in self.locked for l in query.locks):
+        self._start(query)
+      else:
+        queued.append(query)
+    self.queued = queued
+
+  def _finish(self, query):
+    self.running.remove(query)
+    self.locked.difference_update(query.locks)
+    self.dispatcher.unregister(query, query.bus, [query.rx_addr], query.sub_addr)
+
+  def _recv(self, query):
+    """Returns True when the query is done"""
+    dat: Optional[bytes] = query.msg.recv()
+    if not dat:
+      return False
+
+    expected_response = query.response[query.counter]
+    if dat[:len(expected_response)] != expected_response:
+      cloudlog.warning(f"iso-tp query bad response: 0x{dat.hex()}")
+      return True
+
+    if query.counter + 1 < len(query.request):
+      query.counter += 1
+      query.msg.send(query.request[query.counter])
+      return False
+
+    query.result = dat[len(expected_response):]
+    return True
+
+  def run(self, on_done=None):
+    """Runs the queued queries until all are done, or until on_done(query) returns True.
+    The result of a query is None when its ECU didn't answer or sent an unexpected response."""
+    self.dispatcher = IsoTpDispatcher(self.logcan)
+    self.dispatcher.drain()
+
+    self._start_queued()
+    while self.running:
+      updated = self.dispatcher.recv(min(q.deadline for q in self.running) - time.time())
+
+      done = []
+      t = time.time()
+      for query in self.running:
+        if query in updated:
+          try:
+            if self._recv(query):
+              done.append(query)
+              continue
+          except Exception:
+            # only this query is given up on
+            cloudlog.warning(f"iso-tp query exception: {traceback.format_exc()}")
+            done.append(query)
+            continue
+        if t > query.deadline:
+          done.append(query)
+
+      for query in done:
+        self._finish(query)
+        if on_done is not None and on_done(query):
+          self.queued, self.running, self.locked = [], [], set()
+          return
+
+      if done:
+        self._start_queued()
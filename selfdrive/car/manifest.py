@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""The models, CAN fingerprints and FW versions of every brand, read from the values.py of
+every brand without importing them all at startup. Importing them once takes long enough
+to delay controlsd, so the manifest is cached outside of the source tree and only rebuilt
+when the contents of a values.py changed."""
+import hashlib
+import os
+import pickle
+import tempfile
+from pathlib import Path
+
+from common.basedir import BASEDIR
+from selfdrive.hardware import PC
+
+CAR_DIR = os.path.join(BASEDIR, "selfdrive/car")
+if PC:
+  CACHE_DIR = os.getenv("CAR_MANIFEST_CACHE_DIR", os.path.join(str(Path.home()), ".comma", "cache"))
+else:
+  CACHE_DIR = os.getenv("CAR_MANIFEST_CACHE_DIR", "/data/cache")
+MANIFEST_PATH = os.path.join(CACHE_DIR, "car_manifest.pkl")
+MANIFEST_VERSION = 2
+
+_manifest = None
+
+
+def _values_hashes():
+  # (brand, sha1 of values.py) of every brand, a changed values.py rebuilds the manifest
+  ret = []
+  for entry in sorted(os.scandir(CAR_DIR), key=lambda e: e.name):
+    if entry.is_dir():
+      try:
+        with open(os.path.join(entry.path, "values.py"), "rb") as f:
+          ret.append((entry.name, hashlib.sha1(f.read()).hexdigest()))
+      except FileNotFoundError:
+        pass
+  return ret
+
+
+def build_manifest(hashes):
+  """Imports the values.py of every brand.
+     brands: brand -> models, for brands with a CAR class
+     fingerprints, fw_versions: brand -> {model: FINGERPRINTS/FW_VERSIONS}"""
+  manifest = {"version": MANIFEST_VERSION, "hashes": hashes, "brands": {}, "fingerprints": {}, "fw_versions": {}}
+  for brand, _ in hashes:
+    try:
+      values = __import__('selfdrive.car.%s.values' % brand, fromlist=['CAR'])
+    except (ImportError, IOError):
+      continue
+
+    if hasattr(values, 'CAR'):
+      manifest["brands"][brand] = [getattr(values.CAR, c) for c in values.CAR.__dict__.keys() if not c.startswith("__")]
+    for attr, key in (('FINGERPRINTS', 'fingerprints'), ('FW_VERSIONS', 'fw_versions')):
+      if isinstance(getattr(values, attr, None), dict):
+        manifest[key][brand] = getattr(values, attr)
+  return manifest
+
+
+def _save(manifest):
+  # atomic, another process might be loading it
+  try:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=CACHE_DIR, prefix=".car_manifest", delete=False) as f:
+      pickle.dump(manifest, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f.name, MANIFEST_PATH)
+  except OSError:
+    pass  # no writable cache, rebuilt every time
+
+
+def get_manifest():
+  global _manifest
+  if _manifest is not None:
+    return _manifest
+
+  hashes = _values_hashes()
+  try:
+    with open(MANIFEST_PATH, "rb") as f:
+      manifest = pickle.load(f)
+    if manifest["version"] == MANIFEST_VERSION and manifest["hashes"] == hashes:
+      _manifest = manifest
+      return _manifest
+  except Exception:
+    pass
+
+  _manifest = build_manifest(hashes)
+  _save(_manifest)
+  return _manifest
+
+
+def combine_brands(by_brand):
+  """{brand: {model: v}} -> {model: v}"""
+  return {model: v for models in by_brand.values() for model, v in models.items()}
+
+
+if __name__ == "__main__":
+  m = build_manifest(_values_hashes())
+  _save(m)
+  print(f"{MANIFEST_PATH}: {len(m['brands'])} brands, {sum(len(v) for v in m['brands'].values())} models")
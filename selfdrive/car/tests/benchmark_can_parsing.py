@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+import argparse
+import time
+
+from cereal import car
+from selfdrive.car.car_helpers import interfaces
+from selfdrive.car.fingerprints import _FINGERPRINTS as FINGERPRINTS
+from selfdrive.car.tests.can_generator import CanGenerator, brand_cars
+
+N_BATCHES = 1000  # 10 s of can
+
+
+def bench_car(car_name, n_batches):
+  gen = CanGenerator(car_name)
+  t = time.perf_counter()
+  events = list(gen.events(n_batches))
+  gen_time = time.perf_counter() - t
+  n_frames = sum(len(gen.frame(i)) for i in range(n_batches))
+
+  CarInterface, CarController, CarState = interfaces[car_name]
+  fingerprint = FINGERPRINTS[car_name][0]
+  CP = CarInterface.get_params(car_name, {0: fingerprint, 1: fingerprint, 2: fingerprint}, [])
+
+  # parser only
+  cp = CarState.get_can_parser(CP)
+  t = time.perf_counter()
+  for dat in events:
+    cp.update_strings([dat])
+  parser_time = time.perf_counter() - t
+
+  # parsers and CarState, like controlsd
+  CI = CarInterface(CP, CarController, CarState)
+  CC = car.CarControl.new_message()
+  t = time.perf_counter()
+  for dat in events:
+    CS = CI.update(CC, [dat])
+  update_time = time.perf_counter() - t
+
+  return n_frames, n_frames / gen_time, n_frames / parser_time, n_frames / update_time, CS.canValid
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Frames/s of the can parsers and CarInterface.update on synthetic can, per brand")
+  parser.add_argument("--batches", type=int, default=N_BATCHES)
+  parser.add_argument("brands", nargs="*", help="all brands by default")
+  args = parser.parse_args()
+
+  cars = brand_cars()
+  print(f"{'brand':12s} {'car':36s} {'frames':>8s} {'generate/s':>11s} {'parser/s':>11s} {'update/s':>11s} canValid")
+  for brand, car_name in cars.items():
+    if args.brands and brand not in args.brands:
+      continue
+    n_frames, gen_rate, parser_rate, update_rate, can_valid = bench_car(car_name, args.batches)
+    print(f"{brand:12s} {car_name:36s} {n_frames:8d} {gen_rate:11.0f} {parser_rate:11.0f} {update_rate:11.0f} {can_valid}")
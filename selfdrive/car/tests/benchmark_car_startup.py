@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""Time until controlsd can wait for its first CAN frame, the import of car_helpers, with every
+brand imported up front like before and with the lazy interfaces. Every run is a new process."""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+from selfdrive.car.manifest import MANIFEST_PATH
+
+RUN = """
+import time
+t = time.perf_counter()
+from selfdrive.car.car_helpers import interfaces
+if {eager}:
+  dict(interfaces.items())
+first_can = time.perf_counter() - t
+interfaces[{car!r}]
+print(first_can, time.perf_counter() - t)
+"""
+
+
+def run(car_name, eager, cold, n):
+  first_can, car_loaded = [], []
+  for _ in range(n):
+    if cold and os.path.exists(MANIFEST_PATH):
+      os.unlink(MANIFEST_PATH)
+    out = subprocess.check_output([sys.executable, "-c", RUN.format(eager=eager, car=car_name)], encoding='utf8')
+    a, b = map(float, out.split()[-2:])
+    first_can.append(a)
+    car_loaded.append(b)
+  return statistics.median(first_can) * 1e3, statistics.median(car_loaded) * 1e3
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("--car", default="TOYOTA COROLLA TSS2 2019")
+  parser.add_argument("-n", type=int, default=10)
+  args = parser.parse_args()
+
+  print(f"{'':36s} {'first can ms':>12s} {'car loaded ms':>13s}")
+  for name, eager, cold in [("all brands imported (before)", True, False),
+                            ("lazy, cached manifest", False, False),
+                            ("lazy, manifest rebuilt", False, True)]:
+    first_can, car_loaded = run(args.car, eager, cold, args.n)
+    print(f"{name:36s} {first_can:12.1f} {car_loaded:13.1f}")
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+import argparse
+import itertools
+import time
+from collections import defaultdict
+
+from selfdrive.car.car_helpers import can_fingerprint
+from selfdrive.car.fingerprints import get_attr_from_cars
+from selfdrive.car.tests.fingerprint_streams import fingerprint_stream
+from selfdrive.car.tests.test_fingerprint_index import ref_can_fingerprint
+
+
+def run(f, batches):
+  it = iter(batches)
+  n = 0
+
+  def next_can():
+    nonlocal n
+    n += 1
+    return next(it)
+  t = time.perf_counter()
+  car_fingerprint, _ = f(next_can)
+  return car_fingerprint, n, time.perf_counter() - t
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="CAN fingerprinting time per brand, before and after the fingerprint index")
+  parser.add_argument("brands", nargs="*", help="all brands by default")
+  args = parser.parse_args()
+
+  print(f"{'brand':12s} {'streams':>7s} {'frames':>7s} {'before ms':>10s} {'after ms':>9s} {'speedup':>8s} {'identified':>10s}")
+  totals = defaultdict(float)
+  for brand, fingerprints in sorted(get_attr_from_cars('FINGERPRINTS', combine_brands=False).items()):
+    if args.brands and brand not in args.brands:
+      continue
+    streams, frames, before, after, identified = 0, 0, 0., 0., 0
+    for car_name, fps in fingerprints.items():
+      for i, fingerprint in enumerate(fps):
+        batches = list(itertools.islice(fingerprint_stream(fingerprint, seed=i), 202))
+        ref, _, t_ref = run(ref_can_fingerprint, batches)
+        ret, n, t = run(can_fingerprint, batches)
+        assert ret == ref, (car_name, ret, ref)
+        streams += 1
+        frames += n
+        before += t_ref
+        after += t
+        identified += ret == car_name
+    print(f"{brand:12s} {streams:7d} {frames:7d} {before * 1e3:10.1f} {after * 1e3:9.1f} {before / after:7.1f}x {identified:5d}/{streams}")
+    for k, v in (("streams", streams), ("frames", frames), ("before", before), ("after", after)):
+      totals[k] += v
+  print(f"{'total':12s} {totals['streams']:7.0f} {totals['frames']:7.0f} {totals['before'] * 1e3:10.1f} "
+        f"{totals['after'] * 1e3:9.1f} {totals['before'] / totals['after']:7.1f}x")
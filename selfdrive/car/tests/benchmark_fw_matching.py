@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+import argparse
+import time
+
+from selfdrive.car.fw_versions import FwMatchIndex, match_fw_to_car_exact, match_fw_to_car_fuzzy
+from selfdrive.car.fingerprints import FW_VERSIONS
+from selfdrive.car.tests.fw_sets import synthetic_fw_sets
+from selfdrive.car.tests.test_fw_matching import ref_match_fw_to_car_exact, ref_match_fw_to_car_fuzzy
+
+
+def run(f, fw_sets):
+  t = time.perf_counter()
+  ret = [f(fw) for fw in fw_sets]
+  return ret, time.perf_counter() - t
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Exact and fuzzy FW matching of synthetic FW sets, before and after the FwMatchIndex")
+  parser.add_argument("-n", type=int, default=10000, help="FW sets")
+  args = parser.parse_args()
+
+  fw_sets = [fw for _, fw in synthetic_fw_sets(args.n)]
+  t = time.perf_counter()
+  FwMatchIndex(FW_VERSIONS)
+  print(f"{len(FW_VERSIONS)} cars, index built in {(time.perf_counter() - t) * 1e3:.1f} ms")
+
+  print(f"{'':6s} {'before ms':>10s} {'after ms':>9s} {'us/set':>7s} {'speedup':>8s}")
+  for name, ref, f in [("exact", ref_match_fw_to_car_exact, match_fw_to_car_exact),
+                       ("fuzzy", ref_match_fw_to_car_fuzzy, lambda fw: match_fw_to_car_fuzzy(fw, log=False))]:
+    expected, before = run(ref, fw_sets)
+    ret, after = run(f, fw_sets)
+    assert ret == expected
+    print(f"{name:6s} {before * 1e3:10.1f} {after * 1e3:9.1f} {after / len(fw_sets) * 1e6:7.1f} {before / after:7.1f}x")
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""Total FW query time against simulated cars: the serial query over every request of every
+brand like before, and the IsoTpQueue of get_fw_versions with and without stop_on_match"""
+import argparse
+import time
+from unittest import mock
+
+from selfdrive.car.fw_versions import REQUESTS, get_fw_versions, match_fw_to_car
+from selfdrive.car.isotp_parallel_query import IsoTpParallelQuery
+from selfdrive.car.manifest import get_manifest
+from selfdrive.car.tests.simulated_car import SimulatedCar, SimulatedPoller, car_ecus
+
+
+def serial_fw_versions(logcan, sendcan, bus, timeout=0.1):
+  """get_fw_versions before the IsoTpQueue, returns {(addr, sub_addr): version}"""
+  addrs = []
+  parallel_addrs = []
+  for brand, brand_versions in get_manifest()["fw_versions"].items():
+    for c in brand_versions.values():
+      for _, addr, sub_addr in c.keys():
+        a = (brand, addr, sub_addr)
+        if sub_addr is None:
+          if a not in parallel_addrs:
+            parallel_addrs.append(a)
+        elif [a] not in addrs:
+          addrs.append([a])
+  addrs.insert(0, parallel_addrs)
+
+  fw_versions = {}
+  for i, addr_chunk in enumerate(addrs):
+    for brand, request, response, response_offset in REQUESTS:
+      query_addrs = [(a, s) for (b, a, s) in addr_chunk if b in (brand, 'any')]
+      if query_addrs:
+        query = IsoTpParallelQuery(sendcan, logcan, bus, query_addrs, request, response, response_offset)
+        fw_versions.update(query.get_data(2 * timeout if i == 0 else timeout))
+  return fw_versions
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("--brands", default="toyota,honda,hyundai,volkswagen,mazda")
+  parser.add_argument("--latency", type=float, default=0.002, help="ECU response time (s)")
+  args = parser.parse_args()
+
+  manifest = get_manifest()["fw_versions"]
+  with mock.patch("cereal.messaging.Poller", SimulatedPoller):
+    print(f"{'car':32s} {'serial s':>8s} {'queue s':>8s} {'stop s':>8s} {'match':>6s}")
+    for brand in args.brands.split(','):
+      name, fws = next(iter(manifest[brand].items()))
+      fw = {ecu: versions[0] for ecu, versions in fws.items()}
+
+      times = []
+      for f in (serial_fw_versions, lambda *a: get_fw_versions(*a, stop_on_match=False), get_fw_versions):
+        car = SimulatedCar(car_ecus(brand, fw, latency=args.latency))
+        t = time.monotonic()
+        ret = f(car.logcan, car.sendcan, car.bus)
+        times.append(time.monotonic() - t)
+      _, matches = match_fw_to_car(ret)
+      print(f"{name:32s} {times[0]:8.2f} {times[1]:8.2f} {times[2]:8.2f} {str(matches == {name}):>6s}")
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""CPU time and latency of IsoTpParallelQuery.get_data against simulated ECUs behind can traffic
+at 100 Hz, with the IsoTpDispatcher and with the receive loop before it"""
+import argparse
+import statistics
+import time
+from collections import defaultdict
+from functools import partial
+from unittest import mock
+
+import cereal.messaging as messaging
+from panda.python.uds import CanClient, IsoTpMessage
+from selfdrive.car.isotp_parallel_query import IsoTpParallelQuery
+from selfdrive.car.tests.simulated_car import SimulatedCar, SimulatedEcu, SimulatedPoller
+
+REQUEST = b"\x22\xf1\x81"
+RESPONSE = b"\x62\xf1\x81"
+
+
+class PollingQuery(IsoTpParallelQuery):
+  """get_data before the IsoTpDispatcher: every packet is sorted by a scan of the rx addresses
+  and every ISO-TP message is polled after every packet"""
+  def rx(self):
+    for packet in messaging.drain_sock(self.logcan, wait_for_one=True):
+      for msg in packet.can:
+        if msg.src == self.bus and msg.address in self.msg_addrs.values():
+          self.msg_buffer[msg.address].append((msg.address, msg.busTime, msg.dat, msg.src))
+
+  def _can_rx(self, addr, sub_addr=None):
+    keep_msgs = []
+    if sub_addr is None:
+      msgs = self.msg_buffer[addr]
+    else:
+      msgs = []
+      for m in self.msg_buffer[addr]:
+        (msgs if m[2][0] == sub_addr else keep_msgs).append(m)
+    self.msg_buffer[addr] = keep_msgs
+    return msgs
+
+  def get_data(self, timeout):
+    messaging.drain_sock(self.logcan)
+    self.msg_buffer = defaultdict(list)
+
+    msgs = {}
+    request_done = {}
+    for tx_addr, rx_addr in self.msg_addrs.items():
+      can_client = CanClient(self._can_tx, partial(self._can_rx, rx_addr, sub_addr=tx_addr[1]), tx_addr[0], rx_addr,
+                             self.bus, sub_addr=tx_addr[1])
+      msgs[tx_addr] = IsoTpMessage(can_client, timeout=0, max_len=8 if tx_addr[1] is None else 7)
+      msgs[tx_addr].send(self.request[0])
+      request_done[tx_addr] = False
+
+    results = {}
+    start_time = time.time()
+    while True:
+      self.rx()
+      if all(request_done.values()):
+        break
+      for tx_addr, msg in msgs.items():
+        dat = msg.recv()
+        if dat:
+          if dat[:len(self.response[0])] == self.response[0]:
+            results[tx_addr] = dat[len(self.response[0]):]
+          request_done[tx_addr] = True
+      if time.time() - start_time > timeout:
+        break
+    return results
+
+
+def bench(query_cls, ecus, addrs, traffic, timeout, n):
+  wall, cpu = [], []
+  for _ in range(n):
+    car = SimulatedCar(ecus(), traffic=traffic)
+    query = query_cls(car.sendcan, car.logcan, car.bus, addrs, [REQUEST], [RESPONSE])
+    t, c = time.monotonic(), time.process_time()
+    ret = query.get_data(timeout)
+    wall.append(time.monotonic() - t)
+    cpu.append(time.process_time() - c)
+    assert len(ret) == len(ecus())
+  return statistics.median(wall) * 1e3, statistics.median(cpu) * 1e3
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("--ecus", type=int, default=30)
+  parser.add_argument("--absent", type=int, default=30, help="addresses without an ECU")
+  parser.add_argument("--traffic", type=int, default=100, help="other frames per can packet")
+  parser.add_argument("--timeout", type=float, default=0.2)
+  parser.add_argument("-n", type=int, default=5)
+  args = parser.parse_args()
+
+  # 29 bit addresses like honda, they don't overlap with the rx addresses
+  present = [0x18da00f1 + (i << 8) for i in range(args.ecus)]
+  absent = [0x18da00f1 + ((0x80 + i) << 8) for i in range(args.absent)]
+
+  def ecus():
+    return [SimulatedEcu(addr, {REQUEST: RESPONSE + b"version%02d" % i}) for i, addr in enumerate(present)]
+
+  with mock.patch("cereal.messaging.Poller", SimulatedPoller):
+    print(f"{args.ecus} ECUs, {args.traffic} frames per can packet, timeout {args.timeout} s")
+    print(f"{'':40s} {'wall ms':>8s} {'cpu ms':>8s}")
+    for name, addrs in [("all answer (latency)", present), (f"{args.absent} more don't (until timeout)", present + absent)]:
+      for cls_name, cls in [("polling", PollingQuery), ("dispatcher", IsoTpParallelQuery)]:
+        wall, cpu = bench(cls, ecus, addrs, args.traffic, args.timeout, args.n)
+        print(f"{name + ', ' + cls_name:40s} {wall:8.1f} {cpu:8.1f}")
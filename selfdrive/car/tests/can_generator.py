@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Synthetic can traffic of a car, packed with its DBC, for benchmarks and replay without a car"""
+import os
+from collections import namedtuple
+from typing import Callable, Dict, Iterable, Iterator, Optional, Union
+
+from cereal import log
+from opendbc import DBC_PATH
+from opendbc.can.dbc import dbc
+from opendbc.can.packer import CANPacker
+from selfdrive.car.fingerprints import _FINGERPRINTS as FINGERPRINTS
+from selfdrive.car.fingerprints import get_attr_from_cars
+
+# rate of the can batches, like boardd
+BATCH_RATE = 100
+
+DBCS = get_attr_from_cars('DBC')
+
+GeneratedMsg = namedtuple('GeneratedMsg', ['address', 'size', 'name', 'counter_size', 'period', 'buses'])
+
+
+def brand_cars():
+  """A car of every brand that has can fingerprints and a DBC, {brand: car}"""
+  ret = {}
+  for brand, fingerprints in sorted(get_attr_from_cars('FINGERPRINTS', combine_brands=False).items()):
+    cars = sorted(c for c in fingerprints if c in DBCS and DBCS[c]['pt'] is not None)
+    if len(cars):
+      ret[brand] = cars[0]
+  return ret
+
+
+class CanGenerator:
+  """Packs the fingerprint messages of a car with its pt DBC, with counters that
+  increment every message and checksums computed by the CANPacker.
+
+  rates: {address: Hz}, messages not in it are sent in every batch (BATCH_RATE)
+  buses: buses every message is sent on, or {address: buses}, bus 0 for addresses not in it
+  values: values(msg_name, count) -> {signal: value}, for signals that shouldn't be zero
+  extra_msgs: {address: size}, sent in addition to the fingerprint
+  """
+  def __init__(self, car_fingerprint: str, rates: Optional[Dict[int, float]] = None,
+               buses: Union[Iterable[int], Dict[int, Iterable[int]]] = (0,),
+               values: Optional[Callable[[str, int], Dict[str, float]]] = None,
+               extra_msgs: Optional[Dict[int, int]] = None):
+    self.car_fingerprint = car_fingerprint
+    self.dbc_name = DBCS[car_fingerprint]['pt']
+    self.dbc = dbc(os.path.join(DBC_PATH, self.dbc_name + ".dbc"))
+    self.packer = CANPacker(self.dbc_name)
+    self.values = values
+    # without values, a message only changes with its counter
+    self._cache: Dict[tuple, bytes] = {}
+
+    rates = {} if rates is None else rates
+    msgs = dict(FINGERPRINTS[car_fingerprint][0])
+    msgs.update({} if extra_msgs is None else extra_msgs)
+
+    self.msgs = []
+    for address, size in sorted(msgs.items()):
+      name, counter_size = None, None
+      if address in self.dbc.msgs:
+        (name, size), signals = self.dbc.msgs[address]
+        counter_size = next((s.size for s in signals if s.name == "COUNTER"), None)
+      period = max(1, round(BATCH_RATE / rates.get(address, BATCH_RATE)))
+      msg_buses = tuple(buses.get(address, (0,)) if isinstance(buses, dict) else buses)
+      self.msgs.append(GeneratedMsg(address, size, name, counter_size, period, msg_buses))
+
+  def _pack(self, msg, count):
+    if msg.name is None:
+      # not in the DBC, only its length is known
+      return bytes(msg.size)
+
+    counter = count % (1 << msg.counter_size) if msg.counter_size is not None else None
+    if self.values is None and (msg.address, counter) in self._cache:
+      return self._cache[(msg.address, counter)]
+
+    values = {} if self.values is None else dict(self.values(msg.name, count))
+    if counter is not None:
+      values["COUNTER"] = counter
+    dat = self.packer.make_can_msg(msg.address, 0, values)[2]
+    if self.values is None:
+      self._cache[(msg.address, counter)] = dat
+    return dat
+
+  def frame(self, i: int):
+    """Batch i as a can list: [address, 0, dat, bus]"""
+    ret = []
+    for msg in self.msgs:
+      if i % msg.period == 0:
+        dat = self._pack(msg, i // msg.period)
+        ret += [[msg.address, 0, dat, bus] for bus in msg.buses]
+    return ret
+
+  def event(self, i: int, mono_time: int) -> bytes:
+    """Batch i as a serialized can event"""
+    frames = self.frame(i)
+    msg = log.Event.new_message()
+    msg.logMonoTime = mono_time
+    msg.valid = True
+    cans = msg.init('can', len(frames))
+    for c, (address, _, dat, bus) in zip(cans, frames):
+      c.address = address
+      c.busTime = i & 0xffff
+      c.dat = dat
+      c.src = bus
+    return msg.to_bytes()
+
+  def events(self, n: int, start_mono_time: int = 0) -> Iterator[bytes]:
+    for i in range(n):
+      yield self.event(i, start_mono_time + int(i * 1e9 / BATCH_RATE))
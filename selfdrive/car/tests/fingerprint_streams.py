@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""Can streams like the first seconds of a route, made from the fingerprints of a car"""
+import random
+from typing import Dict, Iterator
+
+from cereal import log
+from selfdrive.car.fingerprints import _FINGERPRINTS as FINGERPRINTS
+from tools.lib.logreader import event_from_bytes
+
+RATES = [100, 50, 20, 10, 1]  # Hz
+DEBUG_ADDRESS = 1880
+
+
+def fingerprint_stream(fingerprint: Dict[int, int], seed: int = 0, camera_bus: bool = True,
+                       noise: bool = True) -> Iterator:
+  """Can events at 100 Hz with every message of the fingerprint on bus 0 at a rate picked by
+  address. With camera_bus a quarter of them are forwarded to bus 2, with noise there are
+  extended addresses, UDS responses and the debug address like on a real car."""
+  rng = random.Random(seed)
+  msgs = []
+  for address, length in sorted(fingerprint.items()):
+    period = 100 // rng.choice(RATES)
+    buses = [0, 2] if camera_bus and rng.random() < 0.25 else [0]
+    msgs.append((address, length, period, rng.randrange(period), buses))
+  if noise:
+    msgs += [(0x18daf1, 8, 10, 3, [0]), (0x7e8, 8, 50, 7, [0]), (DEBUG_ADDRESS, 8, 100, 40, [1])]
+
+  frame = 0
+  while True:
+    msg = log.Event.new_message()
+    frames = [(address, length, bus) for address, length, period, offset, buses in msgs
+              if frame % period == offset for bus in buses]
+    cans = msg.init('can', len(frames))
+    for c, (address, length, bus) in zip(cans, frames):
+      c.address = address
+      c.dat = bytes(length)
+      c.src = bus
+    # readers, like the messages of a socket
+    yield event_from_bytes(msg.to_bytes())
+    frame += 1
+
+
+def all_streams(**kwargs):
+  """(car, fingerprint number, stream) for every fingerprint of every car"""
+  for car_name, fingerprints in FINGERPRINTS.items():
+    for i, fingerprint in enumerate(fingerprints):
+      yield car_name, i, fingerprint_stream(fingerprint, seed=i, **kwargs)
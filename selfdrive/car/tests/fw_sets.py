@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""Synthetic FW version sets like the responses of the FW query, made from the FW versions of a car"""
+import random
+from collections import defaultdict
+from typing import Dict, Iterator, Optional, Tuple
+
+from selfdrive.car.fingerprints import FW_VERSIONS
+
+FwDict = Dict[Tuple[int, Optional[int]], bytes]
+
+
+def synthetic_fw_sets(n: int, seed: int = 0) -> Iterator[Tuple[str, FwDict]]:
+  """(car, {(addr, sub_addr): version}) with a known version of every ECU of the car, except
+  for some missing ECUs, versions of other cars, unknown versions and ECUs of no car"""
+  rng = random.Random(seed)
+  cars = sorted(FW_VERSIONS)
+  pool = defaultdict(set)
+  for fws in FW_VERSIONS.values():
+    for (_, addr, sub_addr), versions in fws.items():
+      pool[(addr, sub_addr)].update(versions)
+  pool = {addr: sorted(versions) for addr, versions in pool.items()}
+
+  for _ in range(n):
+    car = rng.choice(cars)
+    fw: FwDict = {}
+    for (_, addr, sub_addr), versions in FW_VERSIONS[car].items():
+      r = rng.random()
+      if r < 0.1:
+        continue
+      elif r < 0.2:
+        fw[(addr, sub_addr)] = rng.choice(pool[(addr, sub_addr)])
+      elif r < 0.25:
+        fw[(addr, sub_addr)] = b"unknown version"
+      else:
+        fw[(addr, sub_addr)] = rng.choice(versions)
+    if rng.random() < 0.1:
+      fw[(0x7ff, None)] = b"not in the database"
+    yield car, fw
@@ -0,0 +1,182 @@
+"""Simulated ECUs answering ISO-TP requests, behind fake can and sendcan sockets"""
+import heapq
+import struct
+import time
+
+from cereal import log
+from panda.python.uds import get_rx_addr_for_tx_addr
+from selfdrive.boardd.boardd import can_list_to_can_capnp
+from selfdrive.car.fw_versions import REQUESTS
+
+CAN_INTERVAL = 0.01  # s, a blocking receive returns at least this often like on a car
+
+
+class SimulatedEcu:
+  def __init__(self, addr, responses, sub_addr=None, rx_offset=0x8, latency=0.002, functional_addr=None):
+    """addr is the tx address of the tester, responses maps a complete request to its response.
+    With functional_addr the ECU also answers the requests to that address."""
+    self.addr = addr
+    self.functional_addr = functional_addr
+    self.sub_addr = sub_addr
+    self.rx_addr = get_rx_addr_for_tx_addr(addr, rx_offset=rx_offset)
+    self.responses = responses
+    self.latency = latency
+    self.max_len = 8 if sub_addr is None else 7
+
+    self.requests = []
+    self._rx_dat = b""
+    self._rx_len = 0
+    self._tx_dat = b""
+
+  def receive(self, car, t, dat):
+    if self.sub_addr is not None:
+      if dat[0] != self.sub_addr:
+        return
+      dat = dat[1:]
+
+    frame_type = dat[0] >> 4
+    if frame_type == 0x0:
+      self._request(car, t, dat[1:1 + (dat[0] & 0xF)])
+    elif frame_type == 0x1:
+      self._rx_len = ((dat[0] & 0xF) << 8) + dat[1]
+      self._rx_dat = dat[2:]
+      self._send(car, t, [b"\x30\x00\x00"])
+    elif frame_type == 0x2:
+      self._rx_dat += dat[1:]
+      if len(self._rx_dat) >= self._rx_len:
+        self._request(car, t, self._rx_dat[:self._rx_len])
+    elif frame_type == 0x3 and self._tx_dat:
+      # the rest of the response after the flow control of the tester
+      n = self.max_len - 1
+      frames = []
+      for i, start in enumerate(range(self.max_len - 2, len(self._tx_dat), n)):
+        frames.append(bytes([0x20 | ((i + 1) & 0xF)]) + self._tx_dat[start:start + n])
+      self._tx_dat = b""
+      self._send(car, t, frames)
+
+  def _request(self, car, t, request):
+    self.requests.append(request)
+    response = self.responses.get(request)
+    if response is None:
+      return
+
+    if len(response) < self.max_len:
+      self._send(car, t + self.latency, [bytes([len(response)]) + response])
+    else:
+      self._tx_dat = response
+      self._send(car, t + self.latency, [struct.pack("!H", 0x1000 | len(response)) + response[:self.max_len - 2]])
+
+  def _send(self, car, t, frames):
+    for f in frames:
+      if self.sub_addr is not None:
+        f = bytes([self.sub_addr]) + f
+      car.schedule(t, self.rx_addr, f.ljust(8, b"\x00"))
+
+
+class SimulatedCar:
+  """sendcan and logcan stand in for the sockets of boardd. With traffic, the frames come in
+  can packets at 100 Hz like from boardd, with that many frames of the other ECUs of the car."""
+  def __init__(self, ecus, bus=1, traffic=0):
+    self.bus = bus
+    self.all_ecus = list(ecus)
+    self.ecus = {}
+    for ecu in ecus:
+      self.ecus.setdefault(ecu.addr, []).append(ecu)
+      if ecu.functional_addr is not None:
+        self.ecus.setdefault(ecu.functional_addr, []).append(ecu)
+
+    self.frames = []
+    self.counter = 0
+    self.traffic = [[0x100 + i, 0, b"\x00" * 8, i % 3] for i in range(traffic)]
+    self.traffic_packet = can_list_to_can_capnp(self.traffic)
+    self.next_packet = time.time()
+    self.sendcan = _SendSocket(self)
+    self.logcan = _CanSocket(self)
+
+  def schedule(self, t, addr, dat):
+    self.counter += 1
+    heapq.heappush(self.frames, (t, self.counter, addr, dat))
+
+  def _next_frame(self):
+    # with traffic the frames of the ECUs come with the next can packet
+    if self.traffic:
+      return self.next_packet
+    return self.frames[0][0] if self.frames else float('inf')
+
+  def wait(self, timeout):
+    """Sleeps up to timeout seconds until a frame is due, returns True when one is"""
+    t = time.time()
+    next_frame = self._next_frame()
+    if next_frame > t:
+      time.sleep(max(min(next_frame, t + timeout) - t, 0.))
+    return self._next_frame() <= time.time()
+
+  def send(self, dat):
+    t = time.time()
+    for msg in log.Event.from_bytes(dat).sendcan:
+      if msg.src == self.bus:
+        for ecu in self.ecus.get(msg.address, []):
+          ecu.receive(self, t, bytes(msg.dat))
+
+  def receive(self, non_blocking=False):
+    if not non_blocking:
+      self.wait(CAN_INTERVAL)
+
+    t = time.time()
+    if self._next_frame() > t:
+      return None if non_blocking else can_list_to_can_capnp([])
+
+    can = []
+    while self.frames and self.frames[0][0] <= t:
+      _, _, addr, dat = heapq.heappop(self.frames)
+      can.append([addr, 0, dat, self.bus])
+    if self.traffic:
+      self.next_packet = max(self.next_packet + CAN_INTERVAL, t)
+      if not can:
+        return self.traffic_packet
+      can += self.traffic
+    return can_list_to_can_capnp(can)
+
+  @property
+  def requests(self):
+    return sum(len(ecu.requests) for ecu in self.all_ecus)
+
+
+class _SendSocket:
+  def __init__(self, car):
+    self.car = car
+
+  def send(self, dat):
+    self.car.send(dat)
+
+
+class _CanSocket:
+  def __init__(self, car):
+    self.car = car
+
+  def receive(self, non_blocking=False):
+    return self.car.receive(non_blocking)
+
+
+class SimulatedPoller:
+  """Replaces messaging.Poller for the logcan of a SimulatedCar"""
+  def __init__(self):
+    self.sockets = []
+
+  def registerSocket(self, sock):
+    self.sockets.append(sock)
+
+  def poll(self, timeout):
+    return [s for s in self.sockets if s.car.wait(timeout / 1000.)]
+
+
+def car_ecus(brand, fw_versions, latency=0.002):
+  """ECUs with the given FW versions {(ecu, addr, sub_addr): version}, answering every step
+  of the first request of their brand"""
+  _, request, response, response_offset = next(r for r in REQUESTS if r[0] == brand)
+  ecus = []
+  for (_, addr, sub_addr), version in fw_versions.items():
+    responses = dict(zip(request, response))
+    responses[request[-1]] = response[-1] + version
+    ecus.append(SimulatedEcu(addr, responses, sub_addr=sub_addr, rx_offset=response_offset, latency=latency))
+  return ecus
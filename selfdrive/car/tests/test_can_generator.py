@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+import unittest
+from parameterized import parameterized
+
+from opendbc.can.parser import CANParser
+from selfdrive.car.tests.can_generator import BATCH_RATE, CanGenerator, brand_cars
+from tools.lib.logreader import event_from_bytes
+
+N_BATCHES = 200
+
+
+class TestCanGenerator(unittest.TestCase):
+
+  @parameterized.expand(brand_cars().items())
+  def test_checksums_and_counters(self, brand, car_name):
+    gen = CanGenerator(car_name)
+    # every message with a counter or checksum the parser checks, at the generated rate
+    checked = [m for m in gen.msgs if m.name is not None and
+               any(s.name in ("COUNTER", "CHECKSUM") for s in gen.dbc.msgs[m.address][1])]
+    signals = [(s.name, m.address, 0) for m in checked for s in gen.dbc.msgs[m.address][1] if s.name in ("COUNTER", "CHECKSUM")]
+    if not len(signals):
+      self.skipTest(f"{brand}: no counters or checksums")
+
+    cp = CANParser(gen.dbc_name, signals, [(m.address, BATCH_RATE) for m in checked], 0)
+    for dat in gen.events(N_BATCHES):
+      cp.update_strings([dat])
+      self.assertTrue(cp.can_valid, brand)
+
+    counters = [m for m in checked if m.counter_size is not None]
+    for m in counters:
+      self.assertEqual(cp.vl[m.address]["COUNTER"], (N_BATCHES - 1) % (1 << m.counter_size))
+
+  def test_rates_and_buses(self):
+    car_name = brand_cars()["toyota"]
+    gen = CanGenerator(car_name)
+    slow, camera = gen.msgs[0].address, gen.msgs[1].address
+    gen = CanGenerator(car_name, rates={slow: 10}, buses={camera: (0, 2)})
+
+    n_msgs = len(gen.msgs)
+    for i in range(20):
+      frames = gen.frame(i)
+      addresses = [f[0] for f in frames]
+      # the slow message is skipped in 9 of 10 batches, the camera message is sent twice
+      self.assertEqual(len(frames), n_msgs + 1 - (1 if i % 10 else 0))
+      self.assertEqual(slow in addresses, i % 10 == 0)
+      self.assertEqual(sorted(f[3] for f in frames if f[0] == camera), [0, 2])
+
+    msg = event_from_bytes(gen.event(3, 123))
+    self.assertEqual(msg.logMonoTime, 123)
+    self.assertEqual(len(msg.can), len(gen.frame(3)))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+import itertools
+import random
+import unittest
+from parameterized import parameterized
+
+from cereal import log
+from selfdrive.car import gen_empty_fingerprint
+from selfdrive.car.car_helpers import can_fingerprint, only_toyota_left
+from selfdrive.car.fingerprints import _FINGERPRINTS as FINGERPRINTS
+from selfdrive.car.fingerprints import all_legacy_fingerprint_cars, eliminate_incompatible_cars
+from selfdrive.car.tests.fingerprint_streams import all_streams, fingerprint_stream
+
+# the fingerprinting before the index, with the debug address added to copies of the fingerprints
+REF_FINGERPRINTS = {c: [{**f, 1880: 8} for f in fps] for c, fps in FINGERPRINTS.items()}
+
+
+def ref_eliminate_incompatible_cars(msg, candidate_cars):
+  compatible_cars = []
+  for car_name in candidate_cars:
+    for fingerprint in REF_FINGERPRINTS[car_name]:
+      adr = msg.address
+      if (adr in fingerprint and fingerprint[adr] == len(msg.dat)) or adr >= 0x800:
+        compatible_cars.append(car_name)
+        break
+  return compatible_cars
+
+
+def ref_can_fingerprint(next_can):
+  finger = gen_empty_fingerprint()
+  candidate_cars = {i: all_legacy_fingerprint_cars() for i in [0, 1]}
+  frame = 0
+  frame_fingerprint = 10
+  car_fingerprint = None
+  done = False
+
+  while not done:
+    a = next_can()
+    for can in a.can:
+      if can.src in range(0, 4):
+        finger[can.src][can.address] = len(can.dat)
+      for b in candidate_cars:
+        if (can.src == b or (only_toyota_left(candidate_cars[b]) and can.src == 2)) and \
+           can.address < 0x800 and can.address not in [0x7df, 0x7e0, 0x7e8]:
+          candidate_cars[b] = ref_eliminate_incompatible_cars(can, candidate_cars[b])
+
+    for b in candidate_cars:
+      if only_toyota_left(candidate_cars[b]):
+        frame_fingerprint = 100
+      if len(candidate_cars[b]) == 1 and frame > frame_fingerprint:
+        car_fingerprint = candidate_cars[b][0]
+
+    failed = (all(len(cc) == 0 for cc in candidate_cars.values()) and frame > frame_fingerprint) or frame > 200
+    done = failed or car_fingerprint is not None
+    frame += 1
+
+  return car_fingerprint, finger
+
+
+def make_can(address, length, src=0):
+  msg = log.Event.new_message()
+  c = msg.init('can', 1)[0]
+  c.address, c.dat, c.src = address, bytes(length), src
+  return c
+
+
+class TestFingerprintIndex(unittest.TestCase):
+  def test_eliminate(self):
+    rng = random.Random(0)
+    cars = all_legacy_fingerprint_cars()
+    keys = sorted({(a, l) for fps in FINGERPRINTS.values() for f in fps for a, l in f.items()})
+    keys += [(1880, 8), (1880, 4), (0x800, 8), (0x18daf1, 8), (0x7ff, 8), (0, 0)]
+    for address, length in keys:
+      msg = make_can(address, length)
+      for candidates in [cars, rng.sample(cars, len(cars) // 3), []]:
+        self.assertEqual(eliminate_incompatible_cars(msg, candidates),
+                         ref_eliminate_incompatible_cars(msg, candidates), (address, length))
+
+  @parameterized.expand([(c, i, s) for c, i, s in all_streams()], skip_on_empty=True)
+  def test_can_fingerprint(self, car_name, i, stream):
+    streams = itertools.tee(stream)
+    self.assertEqual(can_fingerprint(lambda: next(streams[0])), ref_can_fingerprint(lambda: next(streams[1])))
+
+  def test_mixed_streams(self):
+    # two cars on one bus: every candidate is eliminated
+    cars = all_legacy_fingerprint_cars()
+    for a, b in zip(cars, cars[1:]):
+      mixed = [fingerprint_stream(FINGERPRINTS[a][0]), fingerprint_stream(FINGERPRINTS[b][0], seed=1)]
+      ref = list(zip(*[itertools.islice(s, 250) for s in mixed]))
+      batches = []
+      for m1, m2 in ref:
+        msg = log.Event.new_message()
+        cans = msg.init('can', len(m1.can) + len(m2.can))
+        for c, src in zip(cans, list(m1.can) + list(m2.can)):
+          c.address, c.dat, c.src = src.address, src.dat, src.src
+        batches.append(msg)
+      it1, it2 = iter(batches), iter(batches)
+      self.assertEqual(can_fingerprint(lambda: next(it1)), ref_can_fingerprint(lambda: next(it2)), (a, b))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+import random
+import unittest
+from collections import defaultdict
+
+from cereal import car
+from selfdrive.car.fingerprints import FW_VERSIONS
+from selfdrive.car.fw_versions import match_fw_to_car_exact, match_fw_to_car_fuzzy
+from selfdrive.car.manifest import get_manifest
+from selfdrive.car.tests.fw_sets import synthetic_fw_sets
+from selfdrive.car.toyota.values import CAR as TOYOTA
+
+Ecu = car.CarParams.Ecu
+
+
+# the matching before the FwMatchIndex
+def ref_match_fw_to_car_fuzzy(fw_versions_dict, exclude=None):
+  exclude_types = [Ecu.fwdCamera, Ecu.fwdRadar, Ecu.eps]
+
+  all_fw_versions = defaultdict(list)
+  for candidate, fw_by_addr in FW_VERSIONS.items():
+    if candidate == exclude:
+      continue
+
+    for addr, fws in fw_by_addr.items():
+      if addr[0] in exclude_types:
+        continue
+      for f in fws:
+        all_fw_versions[(addr[1], addr[2], f)].append(candidate)
+
+  match_count = 0
+  candidate = None
+  for addr, version in fw_versions_dict.items():
+    candidates = all_fw_versions[(addr[0], addr[1], version)]
+
+    if len(candidates) == 1:
+      match_count += 1
+      if candidate is None:
+        candidate = candidates[0]
+      elif candidate != candidates[0]:
+        return set()
+
+  if match_count >= 2:
+    return set([candidate])
+  else:
+    return set()
+
+
+def ref_match_fw_to_car_exact(fw_versions_dict, candidates=None, unknown=frozenset()):
+  invalid = []
+  if candidates is None:
+    candidates = FW_VERSIONS
+
+  for candidate, fws in candidates.items():
+    for ecu, expected_versions in fws.items():
+      ecu_type = ecu[0]
+      addr = ecu[1:]
+      found_version = fw_versions_dict.get(addr, None)
+      if found_version is None and addr in unknown:
+        continue
+      ESSENTIAL_ECUS = [Ecu.engine, Ecu.eps, Ecu.esp, Ecu.fwdRadar, Ecu.fwdCamera, Ecu.vsa]
+      if ecu_type == Ecu.esp and candidate in [TOYOTA.RAV4, TOYOTA.COROLLA, TOYOTA.HIGHLANDER] and found_version is None:
+        continue
+
+      if ecu_type == Ecu.engine and candidate in [TOYOTA.CAMRY, TOYOTA.COROLLA_TSS2, TOYOTA.CHR, TOYOTA.LEXUS_IS] and found_version is None:
+        continue
+
+      if ecu_type not in ESSENTIAL_ECUS and found_version is None:
+        continue
+
+      if found_version not in expected_versions:
+        invalid.append(candidate)
+        break
+
+  return set(candidates.keys()) - set(invalid)
+
+
+class TestFwMatching(unittest.TestCase):
+  def test_exact(self):
+    for _, fw in synthetic_fw_sets(2000):
+      self.assertEqual(match_fw_to_car_exact(fw), ref_match_fw_to_car_exact(fw))
+
+  def test_exact_unique(self):
+    # the first version of every ECU, most cars only match themselves
+    matched = 0
+    for name, fws in FW_VERSIONS.items():
+      fw = {(addr, sub_addr): versions[0] for (_, addr, sub_addr), versions in fws.items()}
+      matches = match_fw_to_car_exact(fw)
+      self.assertIn(name, matches)
+      self.assertEqual(matches, ref_match_fw_to_car_exact(fw))
+      matched += matches == {name}
+    self.assertGreater(matched, len(FW_VERSIONS) // 2)
+
+  def test_exact_unknown(self):
+    # as used by get_fw_versions, per brand and with some addresses not queried yet
+    rng = random.Random(0)
+    by_brand = get_manifest()["fw_versions"]
+    for _, fw in synthetic_fw_sets(1000, seed=1):
+      brand_versions = by_brand[rng.choice(sorted(by_brand))]
+      addrs = sorted({k[1:] for fws in brand_versions.values() for k in fws}, key=str)
+      unknown = set(rng.sample(addrs, rng.randrange(len(addrs) + 1)))
+      self.assertEqual(match_fw_to_car_exact(fw, brand_versions, unknown),
+                       ref_match_fw_to_car_exact(fw, brand_versions, unknown))
+
+  def test_fuzzy(self):
+    fuzzy_matches = 0
+    for name, fw in synthetic_fw_sets(2000, seed=2):
+      ret = match_fw_to_car_fuzzy(fw, log=False)
+      self.assertEqual(ret, ref_match_fw_to_car_fuzzy(fw))
+      self.assertEqual(match_fw_to_car_fuzzy(fw, log=False, exclude=name), ref_match_fw_to_car_fuzzy(fw, exclude=name))
+      fuzzy_matches += len(ret)
+    self.assertGreater(fuzzy_matches, 0)
+
+
+if __name__ == "__main__":
+  unittest.main()
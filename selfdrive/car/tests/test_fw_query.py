@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+import time
+import unittest
+from unittest import mock
+from parameterized import parameterized
+
+from selfdrive.car.fw_versions import REQUESTS, build_fw_dict, get_fw_versions, match_fw_to_car, match_fw_to_car_exact
+from selfdrive.car.isotp_parallel_query import IsoTpParallelQuery, IsoTpQueue
+from selfdrive.car.manifest import get_manifest
+from selfdrive.car.tests.simulated_car import SimulatedCar, SimulatedEcu, SimulatedPoller, car_ecus
+from selfdrive.car.vin import VIN_REQUEST, VIN_RESPONSE, get_vin
+
+TIMEOUT = 0.05
+BRANDS = ["toyota", "honda", "hyundai", "volkswagen", "mazda"]
+
+
+def first_unique_car(brand):
+  # the first car of the brand that only matches itself with the first FW version of every ECU
+  for name, fws in get_manifest()["fw_versions"][brand].items():
+    fw = {ecu: versions[0] for ecu, versions in fws.items()}
+    if match_fw_to_car_exact({(addr, sub_addr): v for (_, addr, sub_addr), v in fw.items()}) == {name}:
+      return name, fw
+  raise ValueError(brand)
+
+
+@mock.patch("cereal.messaging.Poller", SimulatedPoller)
+class TestFwQuery(unittest.TestCase):
+  @parameterized.expand([(b,) for b in BRANDS])
+  def test_fw_query(self, brand):
+    name, fw = first_unique_car(brand)
+    car = SimulatedCar(car_ecus(brand, fw))
+    car_fw = get_fw_versions(car.logcan, car.sendcan, car.bus, timeout=TIMEOUT, stop_on_match=False)
+
+    self.assertEqual(build_fw_dict(car_fw), {(addr, sub_addr): v for (_, addr, sub_addr), v in fw.items()})
+    self.assertEqual(match_fw_to_car(car_fw), (True, {name}))
+
+  @parameterized.expand([(b,) for b in BRANDS])
+  def test_stop_on_match(self, brand):
+    name, fw = first_unique_car(brand)
+    full = SimulatedCar(car_ecus(brand, fw))
+    t = time.monotonic()
+    get_fw_versions(full.logcan, full.sendcan, full.bus, timeout=TIMEOUT, stop_on_match=False)
+    full_time = time.monotonic() - t
+
+    car = SimulatedCar(car_ecus(brand, fw))
+    t = time.monotonic()
+    car_fw = get_fw_versions(car.logcan, car.sendcan, car.bus, timeout=TIMEOUT)
+    stop_time = time.monotonic() - t
+
+    self.assertEqual(match_fw_to_car(car_fw), (True, {name}))
+    self.assertEqual(build_fw_dict(car_fw), {(addr, sub_addr): v for (_, addr, sub_addr), v in fw.items()})
+    self.assertLess(stop_time, full_time)
+    self.assertLessEqual(car.requests, full.requests)
+
+  def test_stop_on_match_late_ecu(self):
+    # the DSU isn't needed for the match, but enableDsu depends on it being in carFw.
+    # It only answers the last toyota request, after the other ECUs already matched
+    name, fw = first_unique_car("toyota")
+    ecus = [e for e in car_ecus("toyota", fw) if e.addr != 0x791]
+    _, request, response, response_offset = [r for r in REQUESTS if r[0] == "toyota"][-1]
+    responses = dict(zip(request, response))
+    responses[request[-1]] = response[-1] + next(v for (_, addr, _), v in fw.items() if addr == 0x791)
+    ecus.append(SimulatedEcu(0x791, responses, rx_offset=response_offset))
+    car = SimulatedCar(ecus)
+
+    # only toyota is queried, so nothing else holds up the match
+    toyota = {"fw_versions": {"toyota": get_manifest()["fw_versions"]["toyota"]}}
+    with mock.patch("selfdrive.car.fw_versions.get_manifest", return_value=toyota):
+      car_fw = get_fw_versions(car.logcan, car.sendcan, car.bus, timeout=TIMEOUT)
+
+    self.assertEqual(build_fw_dict(car_fw), {(addr, sub_addr): v for (_, addr, sub_addr), v in fw.items()})
+    self.assertEqual(match_fw_to_car(car_fw), (True, {name}))
+
+  def test_stop_on_match_shared_addr(self):
+    # a volkswagen ECU shares the address of the DSU. Its query is still running when toyota matches,
+    # after the engine only answered the second toyota request, and its answer comes before the DSU's
+    name, fw = first_unique_car("toyota")
+    toyota = [r for r in REQUESTS if r[0] == "toyota"]
+    ecus = [e for e in car_ecus("toyota", fw) if e.addr not in (0x791, 0x7e0)]
+    for addr, (_, request, response, response_offset) in [(0x7e0, toyota[1]), (0x791, toyota[-1])]:
+      responses = dict(zip(request, response))
+      responses[request[-1]] = response[-1] + next(v for (_, a, _), v in fw.items() if a == addr)
+      ecus.append(SimulatedEcu(addr, responses, rx_offset=response_offset))
+    _, request, response, response_offset = next(r for r in REQUESTS if r[0] == "volkswagen")
+    ecus.append(SimulatedEcu(0x791, {request[0]: response[0] + b"VW"}, rx_offset=response_offset, latency=TIMEOUT))
+    car = SimulatedCar(ecus)
+
+    dsu = next(k for k in fw if k[1] == 0x791)
+    manifest = {"fw_versions": {"toyota": get_manifest()["fw_versions"]["toyota"], "volkswagen": {"VW": {dsu: [b"VW"]}}}}
+    with mock.patch("selfdrive.car.fw_versions.get_manifest", return_value=manifest):
+      car_fw = get_fw_versions(car.logcan, car.sendcan, car.bus, timeout=TIMEOUT)
+
+    self.assertEqual(build_fw_dict(car_fw), {(addr, sub_addr): v for (_, addr, sub_addr), v in fw.items()})
+    self.assertEqual(match_fw_to_car(car_fw), (True, {name}))
+
+  def test_ecu_timeout(self):
+    # an ECU answering too late doesn't hold up the others
+    name, fw = first_unique_car("toyota")
+    ecus = car_ecus("toyota", fw)
+    ecus[0].latency = 10.
+    car = SimulatedCar(ecus)
+    car_fw = build_fw_dict(get_fw_versions(car.logcan, car.sendcan, car.bus, timeout=TIMEOUT, stop_on_match=False))
+
+    expected = {(addr, sub_addr): v for (_, addr, sub_addr), v in fw.items()}
+    del expected[(ecus[0].addr, ecus[0].sub_addr)]
+    self.assertEqual(car_fw, expected)
+
+  def test_queue(self):
+    # 0x700 with the volkswagen offset and 0x762 answer on 0x76a, 0x750 has ECUs on two subaddresses
+    ecus = [
+      SimulatedEcu(0x700, {b"\x01": b"\x41a", b"\x02": b"\x42" + b"b" * 20}, rx_offset=0x6a),
+      SimulatedEcu(0x762, {b"\x01": b"\x41c"}),
+      SimulatedEcu(0x750, {b"\x01": b"\x41d"}, sub_addr=0xf),
+      SimulatedEcu(0x750, {b"\x01": b"\x41e"}, sub_addr=0x6d),
+      SimulatedEcu(0x7e0, {b"\x01": b"\x41f"}),
+    ]
+    car = SimulatedCar(ecus)
+    queue = IsoTpQueue(car.sendcan, car.logcan)
+    queries = [
+      queue.add(car.bus, 0x700, [b"\x01"], [b"\x41"], 0x6a, timeout=TIMEOUT),
+      queue.add(car.bus, 0x700, [b"\x02"], [b"\x42"], 0x6a, timeout=TIMEOUT),
+      queue.add(car.bus, 0x762, [b"\x01"], [b"\x41"], timeout=TIMEOUT),
+      queue.add(car.bus, 0x750, [b"\x01"], [b"\x41"], sub_addr=0xf, timeout=TIMEOUT),
+      queue.add(car.bus, 0x750, [b"\x01"], [b"\x41"], sub_addr=0x6d, timeout=TIMEOUT),
+      queue.add(car.bus, 0x7e0, [b"\x01", b"\x03"], [b"\x41", b"\x43"], timeout=TIMEOUT),
+      queue.add(car.bus, 0x7e8, [b"\x01"], [b"\x41"], timeout=TIMEOUT),
+    ]
+    done = []
+    queue.run(lambda q: done.append(q) and False)
+
+    self.assertEqual([q.result for q in queries], [b"a", b"b" * 20, b"c", b"d", b"e", None, None])
+    self.assertEqual(len(queue), 0)
+    # queries sharing an address run in the order they were added
+    for a, b in [(0, 1), (1, 2), (3, 4)]:
+      self.assertLess(done.index(queries[a]), done.index(queries[b]))
+
+  def test_queue_stop(self):
+    ecus = [SimulatedEcu(0x700 + i, {b"\x01": b"\x41" + bytes([i])}) for i in range(4)]
+    car = SimulatedCar(ecus)
+    queue = IsoTpQueue(car.sendcan, car.logcan, max_running=2)
+    for i in range(8):
+      queue.add(car.bus, 0x700 + i % 4, [b"\x01"], [b"\x41"], timeout=TIMEOUT)
+    done = []
+    queue.run(lambda q: done.append(q) or len(done) == 3)
+
+    self.assertEqual(len(done), 3)
+    self.assertEqual(len(queue), 0)
+    self.assertLessEqual(car.requests, 4)
+
+  @parameterized.expand([(0,), (300,)])
+  def test_parallel_query(self, traffic):
+    ecus = [
+      SimulatedEcu(0x7e0, {b"\x01": b"\x41a"}),
+      SimulatedEcu(0x7e1, {b"\x01": b"\x41" + b"b" * 30}),
+      SimulatedEcu(0x750, {b"\x01": b"\x41c"}, sub_addr=0xf),
+      SimulatedEcu(0x18da30f1, {b"\x01": b"\x41d"}),
+      SimulatedEcu(0x7e2, {b"\x01": b"\x7f"}),
+    ]
+    car = SimulatedCar(ecus, traffic=traffic)
+    query = IsoTpParallelQuery(car.sendcan, car.logcan, car.bus, [0x7e0, 0x7e1, (0x750, 0xf), 0x18da30f1, 0x7e2, 0x7e3],
+                               [b"\x01"], [b"\x41"])
+    t = time.monotonic()
+    ret = query.get_data(0.5)
+
+    self.assertEqual(ret, {(0x7e0, None): b"a", (0x7e1, None): b"b" * 30, (0x750, 0xf): b"c", (0x18da30f1, None): b"d"})
+    # 0x7e3 doesn't answer
+    self.assertGreaterEqual(time.monotonic() - t, 0.5)
+
+  def test_vin(self):
+    vin = "1HGCV1F3XJA000000"
+    ecu = SimulatedEcu(0x7e0, {VIN_REQUEST: VIN_RESPONSE + vin.encode()}, functional_addr=0x7df)
+    car = SimulatedCar([ecu])
+    self.assertEqual(get_vin(car.logcan, car.sendcan, car.bus, retry=1), (0x7df, vin))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from selfdrive.car import manifest
+
+
+class TestManifest(unittest.TestCase):
+  def setUp(self):
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+    self.car_dir = os.path.join(tmp.name, "car")
+    self.cache_dir = os.path.join(tmp.name, "cache")
+    self.values = os.path.join(self.car_dir, "brand", "values.py")
+    os.makedirs(os.path.dirname(self.values))
+    self.write("CAR = 1\n")
+
+    for name, value in [("CAR_DIR", self.car_dir), ("CACHE_DIR", self.cache_dir),
+                        ("MANIFEST_PATH", os.path.join(self.cache_dir, "car_manifest.pkl"))]:
+      patcher = mock.patch.object(manifest, name, value)
+      patcher.start()
+      self.addCleanup(patcher.stop)
+
+  def write(self, src):
+    with open(self.values, "w") as f:
+      f.write(src)
+
+  def get_manifest(self):
+    # like a new process
+    manifest._manifest = None
+    self.addCleanup(setattr, manifest, "_manifest", None)
+    with mock.patch.object(manifest, "build_manifest", wraps=manifest.build_manifest) as build:
+      m = manifest.get_manifest()
+    return m, build.called
+
+  def test_cache(self):
+    self.assertTrue(self.get_manifest()[1])
+    self.assertTrue(os.path.isfile(manifest.MANIFEST_PATH))
+    self.assertEqual(os.listdir(self.car_dir), ["brand"])
+    self.assertFalse(self.get_manifest()[1])
+
+    # a new mtime alone doesn't rebuild it, new contents do
+    os.utime(self.values, (0, 0))
+    self.assertFalse(self.get_manifest()[1])
+    self.write("CAR = 2\n")
+    self.assertTrue(self.get_manifest()[1])
+
+  def test_read_only(self):
+    open(self.cache_dir, "w").close()
+    m, built = self.get_manifest()
+    self.assertTrue(built)
+    self.assertEqual(m["hashes"], manifest._values_hashes())
+
+
+if __name__ == "__main__":
+  unittest.main()
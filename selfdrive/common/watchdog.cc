@@ -1,19 +1,46 @@
 #include "selfdrive/common/watchdog.h"
 
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
 #include <unistd.h>
 
-#include <cstdint>
-#include <string>
-
 #include "selfdrive/common/timing.h"
-#include "selfdrive/common/util.h"
 
-const std::string watchdog_fn_prefix = "/dev/shm/wd_";  // + <pid>
+static WatchdogSlot *watchdog_table() {
+  static WatchdogSlot *table = nullptr;
+  if (table == nullptr) {
+    int fd = open(WATCHDOG_SHM, O_RDWR);
+    if (fd < 0) return nullptr;
+
+    struct stat st;
+    if (fstat(fd, &st) == 0 && st.st_size >= (off_t)(sizeof(WatchdogSlot) * WATCHDOG_SLOTS)) {
+      void *p = mmap(nullptr, sizeof(WatchdogSlot) * WATCHDOG_SLOTS, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+      if (p != MAP_FAILED) table = (WatchdogSlot *)p;
+    }
+    close(fd);
+  }
+  return table;
+}
 
 bool watchdog_kick() {
-  std::string fn = watchdog_fn_prefix + std::to_string(getpid());
-  std::string cur_t = std::to_string(nanos_since_boot());
+  static int slot = -1;
+  WatchdogSlot *table = watchdog_table();
+  if (table == nullptr) return false;
+
+  // the manager writes our pid to a slot once we're running
+  const uint64_t pid = getpid();
+  if (slot < 0 || __atomic_load_n(&table[slot].pid, __ATOMIC_ACQUIRE) != pid) {
+    slot = -1;
+    for (int i = 0; i < WATCHDOG_SLOTS; i++) {
+      if (__atomic_load_n(&table[i].pid, __ATOMIC_ACQUIRE) == pid) {
+        slot = i;
+        break;
+      }
+    }
+    if (slot < 0) return false;
+  }
 
-  int r = util::write_file(fn.c_str(), cur_t.data(), cur_t.length(), O_WRONLY | O_CREAT);
-  return r == 0;
+  __atomic_store_n(&table[slot].last_kick_ns, nanos_since_boot(), __ATOMIC_RELEASE);
+  return true;
 }
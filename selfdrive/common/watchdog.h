@@ -1,3 +1,14 @@
 #pragma once
 
+#include <cstdint>
+
+// shared with the manager, see common/watchdog.py
+#define WATCHDOG_SHM "/dev/shm/openpilot_watchdog"
+#define WATCHDOG_SLOTS 64
+
+struct WatchdogSlot {
+  uint64_t pid;
+  uint64_t last_kick_ns;
+};
+
 bool watchdog_kick();
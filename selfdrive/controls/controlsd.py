@@ -5,7 +5,7 @@ import numpy as np
 from cereal import car, log
 from common.numpy_fast import clip, interp, mean
 from common.realtime import sec_since_boot, config_realtime_process, Priority, Ratekeeper, DT_CTRL
-from common.profiler import Profiler
+from common.profiler import HistogramProfiler
 from common.params import Params, put_nonblocking
 import cereal.messaging as messaging
 from selfdrive.config import Conversions as CV
@@ -43,7 +43,7 @@ STEER_ANGLE_SATURATION_THRESHOLD = 2.5  # Degrees
 
 SIMULATION = "SIMULATION" in os.environ
 NOSENSOR = "NOSENSOR" in os.environ
-IGNORE_PROCESSES = set(["rtshield", "uploader", "deleter", "loggerd", "logmessaged", "tombstoned", "logcatd", "proclogd", "clocksd", "updated", "timezoned", "manage_athenad"])
+IGNORE_PROCESSES = set(["rtshield", "uploader", "deleter", "loggerd", "logmessaged", "tombstoned", "logcatd", "proclogd", "procstatsd", "clocksd", "updated", "timezoned", "manage_athenad"])
 
 ThermalStatus = log.DeviceState.ThermalStatus
 State = log.ControlsState.OpenpilotState
@@ -194,8 +194,9 @@ class Controls:
       self.startup_event = None
 
     # controlsd is driven by can recv, expected at 100Hz
-    self.rk = Ratekeeper(100, print_delay_threshold=None)
-    self.prof = Profiler(False)  # off by default
+    self.rk = Ratekeeper(100, print_delay_threshold=None, publish_interval=60., gc_budget=0.001)
+    self.frame_start = 0.
+    self.prof = HistogramProfiler("controlsd", ["Ratekeeper", "Sample", "State transition", "State Control", "Sent"])
 
   def kph_to_clu(self, kph):
     return int(kph * CV.KPH_TO_MS * self.speed_conv_to_clu)
@@ -460,6 +461,7 @@ class Controls:
 
     # Update carState from CAN
     can_strs = messaging.drain_sock_raw(self.can_sock, wait_for_one=True)
+    self.frame_start = sec_since_boot()
     CS = self.CI.update(self.CC, can_strs)
 
     self.sm.update(0)
@@ -854,7 +856,7 @@ class Controls:
   def controlsd_thread(self):
     while True:
       self.step()
-      self.rk.monitor_time()
+      self.rk.monitor_time(self.frame_start)
       self.prof.display()
 
 def main(sm=None, pm=None, logcan=None):
@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 from cereal import car
 from common.params import Params
-from common.realtime import Priority, config_realtime_process
+from common.profiler import HistogramProfiler
+from common.realtime import DT_MDL, Priority, Ratekeeper, config_realtime_process, sec_since_boot
 from selfdrive.swaglog import cloudlog
 from selfdrive.controls.lib.longitudinal_planner import Planner
 from selfdrive.controls.lib.lateral_planner import LateralPlanner
@@ -32,15 +33,26 @@ def plannerd_thread(sm=None, pm=None):
   if pm is None:
     pm = messaging.PubMaster(['longitudinalPlan', 'liveLongitudinalMpc', 'lateralPlan', 'liveMpc'])
 
+  prof = HistogramProfiler("plannerd", ["Wait", "Lateral", "Longitudinal"])
+  # runs on modelV2, only for the stats and garbage collection
+  rk = Ratekeeper(1. / DT_MDL, print_delay_threshold=None, publish_interval=60., gc_budget=0.002)
+
   while True:
     sm.update()
+    frame_start = sec_since_boot()
+    prof.checkpoint("Wait", ignore=True)
 
     if sm.updated['modelV2']:
       lateral_planner.update(sm, CP)
       lateral_planner.publish(sm, pm)
+      prof.checkpoint("Lateral")
     if sm.updated['radarState']:
       longitudinal_planner.update(sm, CP)
       longitudinal_planner.publish(sm, pm)
+      prof.checkpoint("Longitudinal")
+    if sm.updated['modelV2']:
+      rk.monitor_time(frame_start)
+    prof.display()
 
 
 def main(sm=None, pm=None):
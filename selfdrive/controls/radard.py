@@ -7,7 +7,8 @@ import cereal.messaging as messaging
 from cereal import car
 from common.numpy_fast import interp
 from common.params import Params
-from common.realtime import Ratekeeper, Priority, config_realtime_process
+from common.profiler import HistogramProfiler
+from common.realtime import Ratekeeper, Priority, config_realtime_process, sec_since_boot
 from selfdrive.config import RADAR_TO_CAMERA
 from selfdrive.controls.lib.cluster.fastcluster_py import cluster_points_centroid
 from selfdrive.controls.lib.radar_helpers import Cluster, Track
@@ -195,40 +196,48 @@ def radard_thread(sm=None, pm=None, can_sock=None):
 
   RI = RadarInterface(CP)
 
-  rk = Ratekeeper(1.0 / CP.radarTimeStep, print_delay_threshold=None)
+  rk = Ratekeeper(1.0 / CP.radarTimeStep, print_delay_threshold=None, publish_interval=60., gc_budget=0.002)
   RD = RadarD(CP.radarTimeStep, RI.delay)
 
   # TODO: always log leads once we can hide them conditionally
   enable_lead = CP.openpilotLongitudinalControl or not CP.radarOffCan
 
+  prof = HistogramProfiler("radard", ["Wait", "Radar", "RadarD", "Sent"])
+
   while 1:
     can_strings = messaging.drain_sock_raw(can_sock, wait_for_one=True)
+    frame_start = sec_since_boot()
+    prof.checkpoint("Wait", ignore=True)
     rr = RI.update(can_strings)
+    prof.checkpoint("Radar")
 
-    if rr is None:
-      continue
+    # not every can packet completes a radar frame, only those are processed and paced
+    if rr is not None:
+      sm.update(0)
 
-    sm.update(0)
+      dat = RD.update(sm, rr, enable_lead)
+      dat.radarState.cumLagMs = -rk.remaining*1000.
+      prof.checkpoint("RadarD")
 
-    dat = RD.update(sm, rr, enable_lead)
-    dat.radarState.cumLagMs = -rk.remaining*1000.
+      pm.send('radarState', dat)
 
-    pm.send('radarState', dat)
+      # *** publish tracks for UI debugging (keep last) ***
+      tracks = RD.tracks
+      dat = messaging.new_message('liveTracks', len(tracks))
 
-    # *** publish tracks for UI debugging (keep last) ***
-    tracks = RD.tracks
-    dat = messaging.new_message('liveTracks', len(tracks))
+      for cnt, ids in enumerate(sorted(tracks.keys())):
+        dat.liveTracks[cnt] = {
+          "trackId": ids,
+          "dRel": float(tracks[ids].dRel),
+          "yRel": float(tracks[ids].yRel),
+          "vRel": float(tracks[ids].vRel),
+        }
+      pm.send('liveTracks', dat)
+      prof.checkpoint("Sent")
 
-    for cnt, ids in enumerate(sorted(tracks.keys())):
-      dat.liveTracks[cnt] = {
-        "trackId": ids,
-        "dRel": float(tracks[ids].dRel),
-        "yRel": float(tracks[ids].yRel),
-        "vRel": float(tracks[ids].vRel),
-      }
-    pm.send('liveTracks', dat)
+      rk.monitor_time(frame_start)
 
-    rk.monitor_time()
+    prof.display()
 
 
 def main(sm=None, pm=None, can_sock=None):
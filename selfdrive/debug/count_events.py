@@ -12,9 +12,8 @@ if __name__ == "__main__":
 
   cnt: Counter = Counter()
   for q in tqdm(r.qlog_paths()):
-    lr = LogReader(q)
-    car_events = [m for m in lr if m.which() == 'carEvents']
-    for car_event in car_events:
+    # only reads the blocks with carEvents if the qlog is indexed
+    for car_event in LogReader(q, which=['carEvents']):
       for e in car_event.carEvents:
         cnt[e.name] += 1
   pprint(cnt)
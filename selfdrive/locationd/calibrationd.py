@@ -13,6 +13,7 @@ import cereal.messaging as messaging
 from cereal import log
 from selfdrive.hardware import TICI
 from common.params import Params, put_nonblocking
+from common.profiler import HistogramProfiler
 from common.transformations.model import model_height
 from common.transformations.camera import get_view_frame_from_road_frame
 from common.transformations.orientation import rot_from_euler, euler_from_rot
@@ -189,10 +190,12 @@ def calibrationd_thread(sm=None, pm=None):
     pm = messaging.PubMaster(['liveCalibration'])
 
   calibrator = Calibrator(param_put=True)
+  prof = HistogramProfiler("calibrationd", ["Wait", "Calibrate", "Sent"])
 
   while 1:
     timeout = 0 if sm.frame == -1 else 100
     sm.update(timeout)
+    prof.checkpoint("Wait", ignore=True)
 
     if sm.updated['cameraOdometry']:
       calibrator.handle_v_ego(sm['carState'].vEgo)
@@ -203,10 +206,13 @@ def calibrationd_thread(sm=None, pm=None):
 
       if DEBUG and new_rpy is not None:
         print('got new rpy', new_rpy)
+      prof.checkpoint("Calibrate")
 
     # 4Hz driven by cameraOdometry
     if sm.frame % 5 == 0:
       calibrator.send_data(pm)
+      prof.checkpoint("Sent")
+    prof.display()
 
 
 def main(sm=None, pm=None):
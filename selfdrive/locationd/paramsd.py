@@ -8,7 +8,8 @@ import numpy as np
 import cereal.messaging as messaging
 from cereal import car
 from common.params import Params, put_nonblocking
-from common.realtime import set_realtime_priority, DT_MDL
+from common.profiler import HistogramProfiler
+from common.realtime import set_realtime_priority, DT_MDL, Ratekeeper, sec_since_boot
 from common.numpy_fast import clip
 from selfdrive.locationd.models.car_kf import CarKalman, ObservationKind, States
 from selfdrive.locationd.models.constants import GENERATED_DIR
@@ -130,13 +131,20 @@ def main(sm=None, pm=None):
   angle_offset_average = params['angleOffsetAverageDeg']
   angle_offset = angle_offset_average
 
+  prof = HistogramProfiler("paramsd", ["Wait", "Learner", "Sent"])
+  # runs on liveLocationKalman, only for the stats and garbage collection
+  rk = Ratekeeper(1. / DT_MDL, print_delay_threshold=None, publish_interval=60., gc_budget=0.002)
+
   while True:
     sm.update()
+    frame_start = sec_since_boot()
+    prof.checkpoint("Wait", ignore=True)
 
     for which, updated in sm.updated.items():
       if updated:
         t = sm.logMonoTime[which] * 1e-9
         learner.handle_log(t, which, sm[which])
+    prof.checkpoint("Learner")
 
     if sm.updated['liveLocationKalman']:
       x = learner.kf.x
@@ -174,6 +182,9 @@ def main(sm=None, pm=None):
         put_nonblocking("LiveParameters", json.dumps(params))
 
       pm.send('liveParameters', msg)
+      prof.checkpoint("Sent")
+      rk.monitor_time(frame_start)
+    prof.display()
 
 
 if __name__ == "__main__":
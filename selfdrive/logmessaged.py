@@ -1,10 +1,53 @@
 #!/usr/bin/env python3
+import time
 import zmq
 from typing import NoReturn
 
 import cereal.messaging as messaging
-from common.logging_extra import SwagLogFileFormatter
-from selfdrive.swaglog import get_file_handler
+from common.logging_extra import SwagCompactFormatter, SwagLogFileFormatter, json_robust_dumps
+from selfdrive.swaglog import cloudlog, get_file_handler
+
+MAX_BATCH_SIZE = 1000
+STATS_INTERVAL = 60.  # seconds
+
+# python processes send compact records, see SwagCompactFormatter
+compact_formatter = SwagCompactFormatter(None)
+
+
+def recv_batch(sock, max_records=MAX_BATCH_SIZE):
+  """Blocks for one record, then drains everything else available"""
+  batch = [b''.join(sock.recv_multipart())]
+  while len(batch) < max_records:
+    try:
+      batch.append(b''.join(sock.recv_multipart(zmq.NOBLOCK)))
+    except zmq.error.Again:
+      break
+  return batch
+
+
+def handle_batch(batch, log_handler, pub_sock, log_level=20):
+  records = []
+  file_records = []
+  for dat in batch:
+    record = dat[1:].decode("utf-8")
+    if compact_formatter.is_compact(record):
+      # file formatter takes the dict, no need to parse the JSON again
+      record_dict = compact_formatter.expand(record)
+      record = json_robust_dumps(record_dict)
+    else:
+      record_dict = record
+    records.append(record)
+    if dat[0] >= log_level:
+      file_records.append(record_dict)
+
+  # one buffered write for the whole batch
+  log_handler.emit_batch(file_records)
+
+  # then we publish them
+  for record in records:
+    msg = messaging.new_message()
+    msg.logMessage = record
+    pub_sock.send(msg.to_bytes())
 
 
 def main() -> NoReturn:
@@ -19,17 +62,21 @@ def main() -> NoReturn:
   # and we publish them
   pub_sock = messaging.pub_sock('logMessage')
 
+  records, batches, max_batch = 0, 0, 0
+  last_stats = time.monotonic()
   while True:
-    dat = b''.join(sock.recv_multipart())
-    level = dat[0]
-    record = dat[1:].decode("utf-8")
-    if level >= log_level:
-      log_handler.emit(record)
+    batch = recv_batch(sock)
+    handle_batch(batch, log_handler, pub_sock, log_level)
 
-    # then we publish them
-    msg = messaging.new_message()
-    msg.logMessage = record
-    pub_sock.send(msg.to_bytes())
+    records += len(batch)
+    batches += 1
+    max_batch = max(max_batch, len(batch))
+
+    # senders report their own drops with a swaglog.dropped event
+    if time.monotonic() - last_stats > STATS_INTERVAL:
+      cloudlog.event("logmessaged.stats", records=records, batches=batches, max_batch=max_batch)
+      records, batches, max_batch = 0, 0, 0
+      last_stats = time.monotonic()
 
 
 if __name__ == "__main__":
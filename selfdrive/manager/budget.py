@@ -0,0 +1,189 @@
+"""CPU and memory budgets of the managed processes.
+
+The manager samples the CPU time and RSS of every process with a budget from a pread() of its
+/proc/<pid>/stat, which stays open, and applies its nice value and CPU affinity to it and to the
+processes it starts, whenever they start. While a realtime process is over its CPU budget, the
+processes that may be throttled only get the CPU time nothing else wants (SCHED_IDLE)."""
+import os
+from collections import defaultdict, deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from common.realtime import sec_since_boot
+from selfdrive.swaglog import cloudlog
+
+CLK_TCK = os.sysconf(os.sysconf_names['SC_CLK_TCK'])
+PAGE_SIZE = os.sysconf(os.sysconf_names['SC_PAGE_SIZE'])
+
+WINDOW = 5.  # s, the CPU usage is averaged over it
+
+
+class Budget:
+  """cpu is the expected usage in % of one core, like in test_onroad. A process is over it
+  above max(1.1x, +5 points). rss is in MB. nice and affinity are applied when the process
+  starts. realtime processes over their CPU budget throttle the processes with throttle set."""
+  def __init__(self, cpu: Optional[float] = None, rss: Optional[float] = None, nice: Optional[int] = None,
+               affinity: Optional[List[int]] = None, realtime: bool = False, throttle: bool = False):
+    self.cpu = cpu
+    self.rss = rss
+    self.nice = nice
+    self.affinity = affinity
+    self.realtime = realtime
+    self.throttle = throttle
+
+  def cpu_over(self, usage: float) -> bool:
+    return self.cpu is not None and usage > max(self.cpu * 1.1, self.cpu + 5.)
+
+  def rss_over(self, rss: int) -> bool:
+    return self.rss is not None and rss > self.rss * 1e6
+
+  def sets_sched(self) -> bool:
+    return self.nice is not None or self.affinity is not None or self.throttle
+
+
+class ProcessUsage:
+  def __init__(self, pid: int, window: float = WINDOW):
+    self.pid = pid
+    self.stat = os.open(f"/proc/{pid}/stat", os.O_RDONLY)
+    self.window = window
+    self.samples: Deque[Tuple[float, float]] = deque()
+    self.cpu_usage = 0.
+    self.rss = 0
+    # the process and its children, once their nice value and affinity are set
+    self.pids: Set[int] = set()
+
+  def close(self) -> None:
+    os.close(self.stat)
+
+  def update(self, t: float) -> None:
+    """Raises OSError when the process exited"""
+    # the name in parentheses can contain spaces
+    stat = os.pread(self.stat, 1024, 0)
+    if not stat:
+      raise ProcessLookupError(self.pid)
+    fields = stat[stat.rindex(b")") + 2:].split()
+    cpu = (int(fields[11]) + int(fields[12])) / CLK_TCK
+    self.rss = int(fields[21]) * PAGE_SIZE
+
+    self.samples.append((t, cpu))
+    while len(self.samples) > 2 and t - self.samples[1][0] >= self.window:
+      self.samples.popleft()
+    t0, cpu0 = self.samples[0]
+    self.cpu_usage = (cpu - cpu0) / (t - t0) * 100. if t > t0 else 0.
+
+
+def _children() -> Dict[int, List[int]]:
+  """The pids of the running processes by the pid of their parent"""
+  children: Dict[int, List[int]] = defaultdict(list)
+  for d in os.listdir("/proc"):
+    if d.isdigit():
+      try:
+        with open(f"/proc/{d}/stat", "rb") as f:
+          stat = f.read()
+      except OSError:
+        continue  # exited since the listdir
+      children[int(stat[stat.rindex(b")") + 2:].split()[1])].append(int(d))
+  return children
+
+
+def _pids(pid: int, children: Dict[int, List[int]]) -> List[int]:
+  # the process and the ones it started, like athenad started by manage_athenad
+  pids = [pid]
+  for p in pids:
+    pids += children.get(p, [])
+  return pids
+
+
+def apply_sched(pids: List[int], budget: Budget) -> None:
+  for p in pids:
+    try:
+      if budget.nice is not None:
+        os.setpriority(os.PRIO_PROCESS, p, budget.nice)
+      if budget.affinity is not None:
+        cores = set(budget.affinity) & os.sched_getaffinity(0)
+        if cores:
+          os.sched_setaffinity(p, cores)
+    except OSError:
+      cloudlog.exception(f"failed to set the nice value and affinity of {p}")
+
+
+def set_throttled(pids: List[int], throttled: bool) -> bool:
+  # leaving SCHED_IDLE needs CAP_SYS_NICE or a RLIMIT_NICE that allows the nice value
+  policy = os.SCHED_IDLE if throttled else os.SCHED_OTHER
+  ok = True
+  for p in pids:
+    try:
+      os.sched_setscheduler(p, policy, os.sched_param(0))
+    except ProcessLookupError:
+      pass
+    except OSError:
+      cloudlog.exception(f"failed to set the scheduling policy of {p}")
+      ok = False
+  return ok
+
+
+class BudgetMonitor:
+  """Sets the usage of the processes with a budget: cpu_usage, mem_rss, cpu_over_budget,
+  rss_over_budget and throttled, which get_process_state_msg reports in managerState"""
+  def __init__(self, procs, throttle: bool = True, window: float = WINDOW):
+    self.procs = [p for p in procs if p.budget is not None]
+    self.throttle = throttle
+    self.window = window
+    self.usage = {}
+    self.throttling = False
+
+  def update(self, t: Optional[float] = None) -> None:
+    t = sec_since_boot() if t is None else t
+    children = None  # read once per update, when a process needs it
+    for p in self.procs:
+      pid = p.get_pid()
+      usage = self.usage.get(p.name)
+      if usage is not None and usage.pid != pid:
+        self.usage.pop(p.name).close()
+        usage = None
+
+      if usage is None and pid is not None:
+        try:
+          usage = self.usage[p.name] = ProcessUsage(pid, self.window)
+        except OSError:
+          pass
+        else:
+          p.throttled = False
+
+      if usage is not None:
+        try:
+          usage.update(t)
+        except OSError:
+          usage.close()
+          del self.usage[p.name]
+          usage = None
+
+      # a child can be restarted any time, like athenad by manage_athenad
+      if usage is not None and p.budget.sets_sched():
+        if children is None:
+          children = _children()
+        pids = _pids(usage.pid, children)
+        new = [q for q in pids if q not in usage.pids]
+        if new:
+          apply_sched(new, p.budget)
+          if p.throttled:
+            set_throttled(new, True)
+        usage.pids = set(pids)
+
+      if usage is None:
+        p.throttled = False
+      p.cpu_usage = 0. if usage is None else usage.cpu_usage
+      p.mem_rss = 0 if usage is None else usage.rss
+      p.cpu_over_budget = p.budget.cpu_over(p.cpu_usage)
+      p.rss_over_budget = p.budget.rss_over(p.mem_rss)
+
+    if self.throttle:
+      throttling = any(p.cpu_over_budget for p in self.procs if p.budget.realtime)
+      if throttling != self.throttling:
+        over = [p.name for p in self.procs if p.budget.realtime and p.cpu_over_budget]
+        cloudlog.event("throttling" if throttling else "throttling stopped", over_budget=over)
+      self.throttling = throttling
+
+      for p in self.procs:
+        if p.budget.throttle and p.name in self.usage and p.throttled != throttling:
+          if set_throttled(list(self.usage[p.name].pids), throttling):
+            p.throttled = throttling
@@ -11,20 +11,31 @@ import cereal.messaging as messaging
 import selfdrive.crash as crash
 from common.basedir import BASEDIR
 from common.params import Params, ParamKeyType
+from common.realtime import sec_since_boot
 from common.text_window import TextWindow
+from common.watchdog import WatchdogTable
 from selfdrive.boardd.set_time import set_time
 from selfdrive.hardware import HARDWARE, PC
+from selfdrive.manager.budget import BudgetMonitor
 from selfdrive.manager.helpers import unblock_stdout
-from selfdrive.manager.process import ensure_running, launcher
+from selfdrive.manager.process import ManagerProcess, PythonProcess, ServicePublishing, ensure_running, launcher
 from selfdrive.manager.process_config import managed_processes
+from selfdrive.manager.zygote import Zygote
 from selfdrive.athena.registration import register, UNREGISTERED_DONGLE_ID
 from selfdrive.swaglog import cloudlog, add_file_handler
-from selfdrive.version import dirty, get_git_commit, version, origin, branch, commit, \
-                              terms_version, training_version, comma_remote, \
-                              get_git_branch, get_git_remote
+from selfdrive.version import dirty, version, origin, branch, short_branch, commit, \
+                              terms_version, training_version, comma_remote
 
 sys.path.append(os.path.join(BASEDIR, "pyextra"))
 
+ENABLE_ZYGOTE = os.getenv("NO_ZYGOTE") is None
+ENABLE_THROTTLE = os.getenv("NO_THROTTLE") is None
+
+# how often the dependencies are checked while processes wait for them, in ms, for
+# the first seconds onroad. After that they're checked with every deviceState
+DEPENDENCY_CHECK_INTERVAL = 20
+DEPENDENCY_CHECK_TIME = 10.
+
 def manager_init():
 
   # update system time from panda
@@ -77,9 +88,9 @@ def manager_init():
   params.put("Version", version)
   params.put("TermsVersion", terms_version)
   params.put("TrainingVersion", training_version)
-  params.put("GitCommit", get_git_commit(default=""))
-  params.put("GitBranch", get_git_branch(default=""))
-  params.put("GitRemote", get_git_remote(default=""))
+  params.put("GitCommit", commit or "")
+  params.put("GitBranch", short_branch or "")
+  params.put("GitRemote", origin or "")
 
   # set dongle id
   reg_res = register(show_spinner=True)
@@ -103,15 +114,32 @@ def manager_init():
                    device=HARDWARE.get_device_type())
 
 
+def manager_start_watchdog():
+  # before any process starts, a running process keeps the table it found
+  try:
+    ManagerProcess.watchdog = WatchdogTable(create=True)
+  except OSError:
+    cloudlog.exception("failed to create the watchdog table")
+
+
 def manager_prepare():
   for p in managed_processes.values():
     p.prepare()
 
 
+def manager_start_zygote():
+  if ENABLE_ZYGOTE and PythonProcess.zygote is None:
+    PythonProcess.zygote = Zygote()
+
+
 def manager_cleanup():
   for p in managed_processes.values():
     p.stop()
 
+  if PythonProcess.zygote is not None:
+    PythonProcess.zygote.close()
+    PythonProcess.zygote = None
+
   cloudlog.info("everything is dead")
 
 
@@ -137,22 +165,32 @@ def manager_thread():
   if os.getenv("BLOCK") is not None:
     ignore += os.getenv("BLOCK").split(",")
 
-  ensure_running(managed_processes.values(), started=False, not_run=ignore)
+  # the services processes wait for, received without waking up the manager
+  dependency_services = sorted({d.service for p in managed_processes.values()
+                                for d in p.dependencies if isinstance(d, ServicePublishing)})
 
   started_prev = False
-  sm = messaging.SubMaster(['deviceState'])
+  started_time = 0.
+  sm = messaging.SubMaster(['deviceState'] + dependency_services, poll=['deviceState'])
   pm = messaging.PubMaster(['managerState'])
+  budgets = BudgetMonitor(managed_processes.values(), throttle=ENABLE_THROTTLE)
+
+  waiting = ensure_running(managed_processes.values(), started=False, not_run=ignore, sm=sm)
 
   while True:
-    sm.update()
+    # check the dependencies often while processes wait for them, processes start in waves as they're ready
+    fast_check = waiting and started_prev and sec_since_boot() - started_time < DEPENDENCY_CHECK_TIME
+    sm.update(DEPENDENCY_CHECK_INTERVAL if fast_check else 1000)
     not_run = ignore[:]
 
     if sm['deviceState'].freeSpacePercent < 5:
       not_run.append("loggerd")
 
     started = sm['deviceState'].started
+    if started and not started_prev:
+      started_time = sec_since_boot()
     driverview = params.get_bool("IsDriverViewEnabled")
-    ensure_running(managed_processes.values(), started, driverview, not_run)
+    waiting = ensure_running(managed_processes.values(), started, driverview, not_run, sm, started_time)
 
     # trigger an update after going offroad
     if started_prev and not started and 'updated' in managed_processes:
@@ -161,14 +199,17 @@ def manager_thread():
 
     started_prev = started
 
-    running_list = ["%s%s\u001b[0m" % ("\u001b[32m" if p.proc.is_alive() else "\u001b[31m", p.name)
-                    for p in managed_processes.values() if p.proc]
-    cloudlog.debug(' '.join(running_list))
+    # sample the usage and send managerState with deviceState, not every time the dependencies are checked
+    if sm.updated['deviceState']:
+      budgets.update()
 
-    # send managerState
-    msg = messaging.new_message('managerState')
-    msg.managerState.processes = [p.get_process_state_msg() for p in managed_processes.values()]
-    pm.send('managerState', msg)
+      running_list = ["%s%s\u001b[0m" % ("\u001b[32m" if p.proc.is_alive() else "\u001b[31m", p.name)
+                      for p in managed_processes.values() if p.proc]
+      cloudlog.debug(' '.join(running_list))
+
+      msg = messaging.new_message('managerState')
+      msg.managerState.processes = [p.get_process_state_msg() for p in managed_processes.values()]
+      pm.send('managerState', msg)
 
     # TODO: let UI handle this
     # Exit main loop when uninstall is needed
@@ -180,6 +221,7 @@ def main():
   prepare_only = os.getenv("PREPAREONLY") is not None
 
   manager_init()
+  manager_start_watchdog()
 
   # Start UI early so prepare can happen in the background
   if not prepare_only:
@@ -190,6 +232,8 @@ def main():
   if prepare_only:
     return
 
+  manager_start_zygote()
+
   # SystemExit on sigterm
   signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
 
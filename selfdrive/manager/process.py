@@ -4,11 +4,13 @@ import signal
 import time
 import subprocess
 from abc import ABC, abstractmethod
+from typing import List
 from multiprocessing import Process
 
 from setproctitle import setproctitle  # pylint: disable=no-name-in-module
 
 import cereal.messaging as messaging
+from cereal.services import service_list
 import selfdrive.crash as crash
 from common.basedir import BASEDIR
 from common.params import Params
@@ -17,8 +19,8 @@ from selfdrive.swaglog import cloudlog
 from selfdrive.hardware import HARDWARE
 from cereal import log
 
-WATCHDOG_FN = "/dev/shm/wd_"
 ENABLE_WATCHDOG = os.getenv("NO_WATCHDOG") is None
+SERVICE_MAX_FREQUENCY = 10.  # Hz, see ServicePublishing
 
 
 def launcher(proc):
@@ -49,6 +51,35 @@ def nativelauncher(pargs, cwd):
   os.execvp(pargs[0], pargs)
 
 
+class ParamWritten:
+  """Ready once the param is written, like Params().get(key, block=True) returns"""
+  def __init__(self, key):
+    self.key = key
+    self.params = None
+
+  def __str__(self):
+    return self.key
+
+  def ready(self, sm):
+    if self.params is None:
+      self.params = Params()
+    return self.params.get(self.key) is not None
+
+
+class ServicePublishing:
+  """Ready while the service is alive in the manager's SubMaster. The manager subscribes to it
+  for the whole drive, so only low-rate services like pandaState, not can."""
+  def __init__(self, service):
+    assert service_list[service].frequency <= SERVICE_MAX_FREQUENCY, f"{service} is too frequent to wait for"
+    self.service = service
+
+  def __str__(self):
+    return self.service
+
+  def ready(self, sm):
+    return sm is not None and sm.rcv_time[self.service] > 0 and sm.alive[self.service]
+
+
 def join_process(process, timeout):
   # Process().join(timeout) will hang due to a python 3 bug: https://bugs.python.org/issue28382
   # We have to poll the exitcode instead
@@ -68,8 +99,24 @@ class ManagerProcess(ABC):
   last_watchdog_time = 0
   watchdog_max_dt = None
   watchdog_seen = False
+  watchdog_slot = None
+  # the WatchdogTable the processes kick, set by the manager before they start
+  watchdog = None
   shutting_down = False
 
+  # started once all are ready, see ensure_running
+  dependencies: List = []
+  waiting_for = ""
+  start_delay = 0.
+
+  # set by the BudgetMonitor
+  budget = None
+  cpu_usage = 0.
+  mem_rss = 0
+  cpu_over_budget = False
+  rss_over_budget = False
+  throttled = False
+
   @abstractmethod
   def prepare(self):
     pass
@@ -82,15 +129,22 @@ class ManagerProcess(ABC):
     self.stop()
     self.start()
 
+  def get_pid(self):
+    if self.proc is None or self.proc.exitcode is not None:
+      return None
+    return self.proc.pid
+
   def check_watchdog(self, started):
-    if self.watchdog_max_dt is None or self.proc is None:
+    if self.watchdog_max_dt is None or self.proc is None or self.watchdog is None:
       return
 
-    try:
-      fn = WATCHDOG_FN + str(self.proc.pid)
-      self.last_watchdog_time = int(open(fn).read())
-    except Exception:
-      pass
+    # a restarted process gets the slot of the previous one
+    if self.watchdog_slot is None or self.watchdog.pid(self.watchdog_slot) != self.proc.pid:
+      self.watchdog_slot = self.watchdog.claim(self.proc.pid, self.watchdog_slot)
+      if self.watchdog_slot is None:
+        cloudlog.error(f"no watchdog slot for {self.name}")
+        return
+    self.last_watchdog_time = self.watchdog.last_kick(self.watchdog_slot)
 
     dt = sec_since_boot() - self.last_watchdog_time / 1e9
 
@@ -162,11 +216,19 @@ class ManagerProcess(ABC):
       state.running = self.proc.is_alive()
       state.pid = self.proc.pid or 0
       state.exitCode = self.proc.exitcode or 0
+    state.startDelay = self.start_delay
+    state.waitingFor = self.waiting_for
+    if self.budget is not None:
+      state.cpuUsage = self.cpu_usage
+      state.memRss = self.mem_rss
+      state.cpuOverBudget = self.cpu_over_budget
+      state.rssOverBudget = self.rss_over_budget
+      state.throttled = self.throttled
     return state
 
 
 class NativeProcess(ManagerProcess):
-  def __init__(self, name, cwd, cmdline, enabled=True, persistent=False, driverview=False, unkillable=False, sigkill=False, watchdog_max_dt=None):
+  def __init__(self, name, cwd, cmdline, enabled=True, persistent=False, driverview=False, unkillable=False, sigkill=False, watchdog_max_dt=None, dependencies=None, budget=None):
     self.name = name
     self.cwd = cwd
     self.cmdline = cmdline
@@ -176,6 +238,8 @@ class NativeProcess(ManagerProcess):
     self.unkillable = unkillable
     self.sigkill = sigkill
     self.watchdog_max_dt = watchdog_max_dt
+    self.dependencies = [] if dependencies is None else dependencies
+    self.budget = budget
 
   def prepare(self):
     pass
@@ -197,7 +261,10 @@ class NativeProcess(ManagerProcess):
 
 
 class PythonProcess(ManagerProcess):
-  def __init__(self, name, module, enabled=True, persistent=False, driverview=False, unkillable=False, sigkill=False, watchdog_max_dt=None):
+  # set by the manager once the processes are preimported, see zygote.py
+  zygote = None
+
+  def __init__(self, name, module, enabled=True, persistent=False, driverview=False, unkillable=False, sigkill=False, watchdog_max_dt=None, dependencies=None, budget=None):
     self.name = name
     self.module = module
     self.enabled = enabled
@@ -206,6 +273,8 @@ class PythonProcess(ManagerProcess):
     self.unkillable = unkillable
     self.sigkill = sigkill
     self.watchdog_max_dt = watchdog_max_dt
+    self.dependencies = [] if dependencies is None else dependencies
+    self.budget = budget
 
   def prepare(self):
     if self.enabled:
@@ -221,8 +290,11 @@ class PythonProcess(ManagerProcess):
       return
 
     cloudlog.info("starting python %s" % self.module)
-    self.proc = Process(name=self.name, target=launcher, args=(self.module,))
-    self.proc.start()
+    if self.zygote is not None:
+      self.proc = self.zygote.start(self.name, self.module)
+    if self.proc is None:
+      self.proc = Process(name=self.name, target=launcher, args=(self.module,))
+      self.proc.start()
     self.watchdog_seen = False
     self.shutting_down = False
 
@@ -230,12 +302,17 @@ class PythonProcess(ManagerProcess):
 class DaemonProcess(ManagerProcess):
   """Python process that has to stay running accross manager restart.
   This is used for athena so you don't lose SSH access when restarting manager."""
-  def __init__(self, name, module, param_name, enabled=True):
+  def __init__(self, name, module, param_name, enabled=True, budget=None):
     self.name = name
     self.module = module
     self.param_name = param_name
     self.enabled = enabled
     self.persistent = True
+    self.budget = budget
+    self.pid = None
+
+  def get_pid(self):
+    return self.pid
 
   def prepare(self):
     pass
@@ -250,6 +327,7 @@ class DaemonProcess(ManagerProcess):
         with open(f'/proc/{pid}/cmdline') as f:
           if self.module in f.read():
             # daemon is running
+            self.pid = int(pid)
             return
       except (OSError, FileNotFoundError):
         # process is dead
@@ -263,28 +341,43 @@ class DaemonProcess(ManagerProcess):
                                preexec_fn=os.setpgrp)
 
     params.put(self.param_name, str(proc.pid))
+    self.pid = proc.pid
 
   def stop(self, retry=True, block=True):
     pass
 
 
-def ensure_running(procs, started, driverview=False, not_run=None):
+def start_when_ready(p, sm, started_time):
+  if p.proc is None or p.shutting_down:
+    for d in p.dependencies:
+      if not d.ready(sm):
+        p.waiting_for = str(d)
+        return False
+    p.start_delay = max(sec_since_boot() - started_time, 0.) if started_time else 0.
+
+  p.start()
+  return True
+
+
+def ensure_running(procs, started, driverview=False, not_run=None, sm=None, started_time=0.):
+  """Starts and stops the processes, a process is only started once its dependencies are ready.
+  Returns the processes waiting for them, started_time is when started went True."""
   if not_run is None:
     not_run = []
 
+  waiting = []
   for p in procs:
+    p.waiting_for = ""
     if p.name in not_run:
       p.stop(block=False)
     elif not p.enabled:
       p.stop(block=False)
-    elif p.persistent:
-      p.start()
-    elif p.driverview and driverview:
-      p.start()
-    elif started:
-      p.start()
+    elif p.persistent or (p.driverview and driverview) or started:
+      if not start_when_ready(p, sm, started_time if started else 0.):
+        waiting.append(p)
     else:
       p.stop(block=False)
 
     p.check_watchdog(started)
 
+  return waiting
@@ -1,40 +1,49 @@
 import os
 
-from selfdrive.manager.process import PythonProcess, NativeProcess, DaemonProcess
+from selfdrive.manager.budget import Budget
+from selfdrive.manager.process import PythonProcess, NativeProcess, DaemonProcess, ParamWritten, ServicePublishing
 from selfdrive.hardware import EON, TICI, PC
 
 WEBCAM = os.getenv("USE_WEBCAM") is not None
 
+# written by controlsd once the car is fingerprinted
+CAR_PARAMS = ParamWritten("CarParams")
+
+# the daemons that can wait, away from the cores of the realtime processes, and throttled
+# while a realtime process is over its CPU budget. cpu budgets are the usage checked by test_onroad
+BACKGROUND = dict(nice=10, affinity=None if PC else [0, 1], throttle=True)
+
 procs = [
-  DaemonProcess("manage_athenad", "selfdrive.athena.manage_athenad", "AthenadPid"),
+  DaemonProcess("manage_athenad", "selfdrive.athena.manage_athenad", "AthenadPid", budget=Budget(**BACKGROUND)),
   # due to qualcomm kernel bugs SIGKILLing camerad sometimes causes page table corruption
-  NativeProcess("camerad", "selfdrive/camerad", ["./camerad"], unkillable=True, driverview=True),
-  NativeProcess("clocksd", "selfdrive/clocksd", ["./clocksd"]),
-  NativeProcess("dmonitoringmodeld", "selfdrive/modeld", ["./dmonitoringmodeld"], enabled=(not PC or WEBCAM), driverview=True),
-  NativeProcess("logcatd", "selfdrive/logcatd", ["./logcatd"]),
-  NativeProcess("loggerd", "selfdrive/loggerd", ["./loggerd"]),
-  NativeProcess("modeld", "selfdrive/modeld", ["./modeld"]),
-  NativeProcess("proclogd", "selfdrive/proclogd", ["./proclogd"]),
-  NativeProcess("sensord", "selfdrive/sensord", ["./sensord"], enabled=not PC, persistent=EON, sigkill=EON),
-  NativeProcess("ubloxd", "selfdrive/locationd", ["./ubloxd"], enabled=(not PC or WEBCAM)),
-  NativeProcess("ui", "selfdrive/ui", ["./ui"], persistent=True, watchdog_max_dt=(5 if TICI else None)),
-  NativeProcess("soundd", "selfdrive/ui", ["./soundd"]),
-  NativeProcess("locationd", "selfdrive/locationd", ["./locationd"]),
-  PythonProcess("calibrationd", "selfdrive.locationd.calibrationd"),
-  PythonProcess("controlsd", "selfdrive.controls.controlsd"),
-  PythonProcess("deleter", "selfdrive.loggerd.deleter", persistent=True),
-  PythonProcess("dmonitoringd", "selfdrive.monitoring.dmonitoringd", enabled=(not PC or WEBCAM), driverview=True),
-  PythonProcess("logmessaged", "selfdrive.logmessaged", persistent=True),
-  PythonProcess("pandad", "selfdrive.pandad", persistent=True),
-  PythonProcess("paramsd", "selfdrive.locationd.paramsd"),
-  PythonProcess("plannerd", "selfdrive.controls.plannerd"),
-  PythonProcess("radard", "selfdrive.controls.radard"),
+  NativeProcess("camerad", "selfdrive/camerad", ["./camerad"], unkillable=True, driverview=True, budget=Budget(cpu=25. if TICI else 7.07, realtime=True)),
+  NativeProcess("clocksd", "selfdrive/clocksd", ["./clocksd"], budget=Budget(cpu=0.02)),
+  NativeProcess("dmonitoringmodeld", "selfdrive/modeld", ["./dmonitoringmodeld"], enabled=(not PC or WEBCAM), driverview=True, budget=Budget(cpu=10. if TICI else 2.67)),
+  NativeProcess("logcatd", "selfdrive/logcatd", ["./logcatd"], budget=Budget(cpu=0.)),
+  NativeProcess("loggerd", "selfdrive/loggerd", ["./loggerd"], budget=Budget(cpu=60. if TICI else 45.)),
+  NativeProcess("modeld", "selfdrive/modeld", ["./modeld"], budget=Budget(cpu=4.48, realtime=True)),
+  NativeProcess("proclogd", "selfdrive/proclogd", ["./proclogd"], budget=Budget(cpu=1.54)),
+  NativeProcess("sensord", "selfdrive/sensord", ["./sensord"], enabled=not PC, persistent=EON, sigkill=EON, budget=Budget(cpu=6.17, realtime=True)),
+  NativeProcess("ubloxd", "selfdrive/locationd", ["./ubloxd"], enabled=(not PC or WEBCAM), budget=Budget(cpu=0.02)),
+  NativeProcess("ui", "selfdrive/ui", ["./ui"], persistent=True, watchdog_max_dt=(5 if TICI else None), budget=Budget(cpu=21. if TICI else 15.)),
+  NativeProcess("soundd", "selfdrive/ui", ["./soundd"], budget=Budget(cpu=2.)),
+  NativeProcess("locationd", "selfdrive/locationd", ["./locationd"], budget=Budget(cpu=9.1, realtime=True)),
+  PythonProcess("calibrationd", "selfdrive.locationd.calibrationd", budget=Budget(cpu=2.)),
+  PythonProcess("controlsd", "selfdrive.controls.controlsd", dependencies=[ServicePublishing("pandaState")], budget=Budget(cpu=26. if TICI else 50., realtime=True)),
+  PythonProcess("deleter", "selfdrive.loggerd.deleter", persistent=True, budget=Budget(**BACKGROUND)),
+  PythonProcess("dmonitoringd", "selfdrive.monitoring.dmonitoringd", enabled=(not PC or WEBCAM), driverview=True, budget=Budget(cpu=1.9)),
+  PythonProcess("logmessaged", "selfdrive.logmessaged", persistent=True, budget=Budget(cpu=0.2, **BACKGROUND)),
+  PythonProcess("pandad", "selfdrive.pandad", persistent=True, budget=Budget(cpu=3.63, realtime=True)),
+  PythonProcess("paramsd", "selfdrive.locationd.paramsd", dependencies=[CAR_PARAMS], budget=Budget(cpu=5. if TICI else 9.1, realtime=True)),
+  PythonProcess("plannerd", "selfdrive.controls.plannerd", dependencies=[CAR_PARAMS], budget=Budget(cpu=12. if TICI else 20., realtime=True)),
+  PythonProcess("procstatsd", "selfdrive.procstatsd", budget=Budget(cpu=0.5)),
+  PythonProcess("radard", "selfdrive.controls.radard", dependencies=[CAR_PARAMS], budget=Budget(cpu=5.67, realtime=True)),
   PythonProcess("rtshield", "selfdrive.rtshield", enabled=EON),
-  PythonProcess("thermald", "selfdrive.thermald.thermald", persistent=True),
+  PythonProcess("thermald", "selfdrive.thermald.thermald", persistent=True, budget=Budget(cpu=1.5 if TICI else 2.41)),
   PythonProcess("timezoned", "selfdrive.timezoned", enabled=TICI, persistent=True),
-  PythonProcess("tombstoned", "selfdrive.tombstoned", enabled=not PC, persistent=True),
+  PythonProcess("tombstoned", "selfdrive.tombstoned", enabled=not PC, persistent=True, budget=Budget(cpu=0.)),
   PythonProcess("updated", "selfdrive.updated", enabled=not PC, persistent=True),
-  PythonProcess("uploader", "selfdrive.loggerd.uploader", persistent=True),
+  PythonProcess("uploader", "selfdrive.loggerd.uploader", persistent=True, budget=Budget(**BACKGROUND)),
 ]
 
 managed_processes = {p.name: p for p in procs}
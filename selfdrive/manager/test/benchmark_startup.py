@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Critical path of the onroad startup, from started to all processes set up, with every process
+started at once and with the processes started in waves as their dependencies are ready. The
+processes are stubs that use CPU to set up before and after they wait for their dependency,
+polling for it every 0.1 s like Params().get(key, block=True)."""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from common.realtime import sec_since_boot
+from selfdrive.manager.manager import DEPENDENCY_CHECK_INTERVAL
+from selfdrive.manager.process import PythonProcess, ensure_running
+from selfdrive.manager.test.test_dependencies import FileWritten
+from selfdrive.manager.zygote import Zygote
+
+# name: (ms of CPU before waiting, dependency, ms of CPU after it, file written when set up)
+PROCESSES = {
+  "controlsd": (100, None, 400, "CarParams"),
+  "radard": (30, "CarParams", 100, None),
+  "plannerd": (30, "CarParams", 300, None),
+  "paramsd": (30, "CarParams", 150, None),
+  "calibrationd": (30, None, 50, None),
+  "dmonitoringd": (30, None, 50, None),
+}
+
+STUB = """import os, time
+def burn(ms):
+  t = time.process_time()
+  while time.process_time() - t < ms / 1e3:
+    pass
+def main():
+  burn({before})
+  while {dependency!r} is not None and not os.path.exists(os.path.join({d!r}, {dependency!r})):
+    time.sleep(0.1)
+  burn({after})
+  for fn in [{writes!r}, {name!r} + ".ready"]:
+    if fn is not None:
+      open(os.path.join({d!r}, fn), "w").close()
+  time.sleep(1e6)
+"""
+
+
+def run(d, staged):
+  procs = []
+  for name, (before, dependency, after, writes) in PROCESSES.items():
+    deps = [FileWritten(os.path.join(d, dependency))] if staged and dependency is not None else []
+    procs.append(PythonProcess(name, f"bench_{name}", dependencies=deps))
+
+  ready = {}
+  started_time = sec_since_boot()
+  while len(ready) < len(procs):
+    ensure_running(procs, True, started_time=started_time)
+    for p in procs:
+      if p.name not in ready and os.path.exists(os.path.join(d, p.name + ".ready")):
+        ready[p.name] = sec_since_boot() - started_time
+    time.sleep(DEPENDENCY_CHECK_INTERVAL / 1e3)
+
+  for p in procs:
+    p.stop(retry=False)
+  for fn in os.listdir(d):
+    if not fn.endswith(".py"):
+      os.unlink(os.path.join(d, fn))
+  return max(ready.values()), ready["controlsd"]
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("--runs", type=int, default=10)
+  args = parser.parse_args()
+
+  d = tempfile.mkdtemp()
+  try:
+    for name, (before, dependency, after, writes) in PROCESSES.items():
+      with open(os.path.join(d, f"bench_{name}.py"), "w") as f:
+        f.write(STUB.format(d=d, name=name, before=before, dependency=dependency, after=after, writes=writes))
+    sys.path.insert(0, d)
+    PythonProcess.zygote = Zygote()
+
+    print(f"{os.cpu_count()} CPUs, median of {args.runs} runs")
+    print(f"{'':10s} {'all set up ms':>14s} {'controlsd ms':>13s}")
+    for name, staged in [("at once", False), ("staged", True)]:
+      results = [run(d, staged) for _ in range(args.runs)]
+      print(f"{name:10s} {statistics.median(r[0] for r in results) * 1e3:14.0f} "
+            f"{statistics.median(r[1] for r in results) * 1e3:13.0f}")
+  finally:
+    PythonProcess.zygote.close()
+    shutil.rmtree(d)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Cost of the watchdog check of every watched process in a manager loop, reading a /dev/shm/wd_<pid>
+file per process like before and loading the last kicks from the shared WatchdogTable."""
+import argparse
+import os
+import tempfile
+import time
+
+from common.realtime import sec_since_boot
+from common.watchdog import SLOTS, WatchdogTable
+
+
+def scan_files(fns):
+  last = 0
+  for fn in fns:
+    try:
+      last = int(open(fn).read())
+    except Exception:
+      pass
+  return sec_since_boot() - last / 1e9
+
+
+def scan_table(table, slots):
+  last = 0
+  for slot in slots:
+    last = table.last_kick(slot)
+  return sec_since_boot() - last / 1e9
+
+
+def bench(f, *args, loops):
+  t = time.perf_counter_ns()
+  for _ in range(loops):
+    f(*args)
+  return (time.perf_counter_ns() - t) / loops / 1e3
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("--loops", type=int, default=10000)
+  args = parser.parse_args()
+
+  d = tempfile.mkdtemp(dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+  try:
+    table = WatchdogTable(os.path.join(d, "watchdog"), create=True)
+    print(f"{'processes':>9s} {'files us':>9s} {'table us':>9s}")
+    for n in [1, 4, 16, SLOTS]:
+      fns = []
+      for pid in range(1, n + 1):
+        fns.append(os.path.join(d, f"wd_{pid}"))
+        with open(fns[-1], "w") as f:
+          f.write(str(int(sec_since_boot() * 1e9)))
+      slots = [table.claim(pid) for pid in range(1, n + 1)]
+      for slot in slots:
+        table.kick(slot)
+
+      files = bench(scan_files, fns, loops=args.loops)
+      shm = bench(scan_table, table, slots, loops=args.loops)
+      print(f"{n:9d} {files:9.2f} {shm:9.2f}")
+      for slot in slots:
+        table.release(slot)
+  finally:
+    for fn in os.listdir(d):
+      os.unlink(os.path.join(d, fn))
+    os.rmdir(d)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Onroad transition time, from starting the python processes to all of them running, and their
+PSS, with the processes forked from the manager and from the zygote. The processes are this
+module, after the modules of the python processes are preimported like manager_prepare does."""
+import argparse
+import gc
+import importlib
+import os
+import statistics
+import time
+from multiprocessing import Process
+
+from selfdrive.manager.process import PythonProcess, launcher
+from selfdrive.manager.process_config import managed_processes
+from selfdrive.manager.zygote import Zygote
+
+MODULE = "selfdrive.manager.test.benchmark_zygote"
+
+
+def main():
+  # allocate and collect, like a process does once it's running
+  state = [{"i": i} for i in range(10000)]
+  gc.collect()
+  os.write(int(os.environ["BENCHMARK_READY_FD"]), b"x")
+  time.sleep(1e6)
+  del state
+
+
+def pss_kb(pid):
+  try:
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+      lines = f.readlines()
+  except FileNotFoundError:
+    with open(f"/proc/{pid}/smaps") as f:
+      lines = f.readlines()
+  return sum(int(line.split()[1]) for line in lines if line.startswith("Pss:"))
+
+
+def start_all(start, n, ready_r):
+  t = time.monotonic()
+  procs = [start(f"bench{i}") for i in range(n)]
+  for _ in range(n):
+    os.read(ready_r, 1)
+  return time.monotonic() - t, procs
+
+
+def from_manager(name):
+  p = Process(name=name, target=launcher, args=(MODULE,))
+  p.start()
+  return p
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("-n", type=int, default=len([p for p in managed_processes.values()
+                                                   if isinstance(p, PythonProcess) and not p.persistent]),
+                      help="processes, the non-persistent python processes by default")
+  parser.add_argument("--runs", type=int, default=5)
+  args = parser.parse_args()
+
+  skipped = []
+  for p in managed_processes.values():
+    if isinstance(p, PythonProcess) and p.enabled:
+      try:
+        importlib.import_module(p.module)
+      except Exception:
+        skipped.append(p.name)
+  if skipped:
+    print(f"couldn't preimport {', '.join(skipped)}")
+
+  ready_r, ready_w = os.pipe()
+  os.environ["BENCHMARK_READY_FD"] = str(ready_w)
+
+  print(f"{args.n} processes, {len(gc.get_objects())} objects tracked by the gc in the manager")
+  print(f"{'':12s} {'start ms':>9s} {'PSS MB':>7s} {'+ zygote':>9s}")
+  for name in ["manager", "zygote"]:
+    zygote = Zygote() if name == "zygote" else None
+    start = from_manager if zygote is None else lambda n: zygote.start(n, MODULE)
+    times, pss = [], []
+    for _ in range(args.runs):
+      t, procs = start_all(start, args.n, ready_r)
+      times.append(t)
+      time.sleep(0.5)
+      pss.append(sum(pss_kb(p.pid) for p in procs) / 1024)
+      for p in procs:
+        os.kill(p.pid, 9)
+        p.join()
+
+    total = statistics.median(pss)
+    if zygote is not None:
+      total += pss_kb(zygote.proc.pid) / 1024
+      zygote.close()
+    print(f"{name:12s} {statistics.median(times) * 1e3:9.1f} {statistics.median(pss):7.1f} {total:9.1f}")
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+import os
+import signal
+import sys
+import tempfile
+import time
+import unittest
+
+from cereal import log
+from selfdrive.manager.budget import Budget, BudgetMonitor
+from selfdrive.manager.process import PythonProcess
+
+MODULES = {
+  # writes a file once it's running so the tests don't interrupt it while it starts
+  "budget_hog": "import os\ndef main():\n  open(os.path.join({d!r}, 'budget_hog'), 'w').close()\n  while True:\n    pass\n",
+  "budget_idle": "import os, time\ndef main():\n  open(os.path.join({d!r}, 'budget_idle'), 'w').close()\n  time.sleep(100)\n",
+  "budget_alloc": "import os, time\ndef main():\n  b = bytearray(50 * 1024 * 1024)\n" +
+                  "  open(os.path.join({d!r}, 'budget_alloc'), 'w').close()\n  time.sleep(100)\n",
+  # restarts its child when it exits, like manage_athenad. the child resets the nice value it inherited
+  "budget_parent": "import os, time\nfrom multiprocessing import Process\n" +
+                   "def child():\n  os.setpriority(os.PRIO_PROCESS, 0, 0)\n  time.sleep(100)\n" +
+                   "def main():\n  while True:\n    p = Process(target=child)\n    p.start()\n" +
+                   "    with open(os.path.join({d!r}, 'budget_child'), 'w') as f:\n      f.write(str(p.pid))\n" +
+                   "    os.rename(os.path.join({d!r}, 'budget_child'), os.path.join({d!r}, 'budget_parent'))\n    p.join()\n",
+}
+
+
+class TestBudget(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls.tmp = tempfile.TemporaryDirectory()
+    for name, src in MODULES.items():
+      with open(os.path.join(cls.tmp.name, name + ".py"), "w") as f:
+        f.write(src.format(d=cls.tmp.name))
+    sys.path.insert(0, cls.tmp.name)
+
+  @classmethod
+  def tearDownClass(cls):
+    sys.path.remove(cls.tmp.name)
+    cls.tmp.cleanup()
+
+  def start(self, module, budget):
+    fn = os.path.join(self.tmp.name, module)
+    if os.path.exists(fn):
+      os.unlink(fn)
+    p = PythonProcess(module, module, budget=budget)
+    p.start()
+    self.addCleanup(p.stop, retry=False)
+    for _ in range(1000):
+      if os.path.exists(fn):
+        break
+      time.sleep(0.01)
+    return p
+
+  def sample(self, monitor, seconds=1.):
+    monitor.update()
+    time.sleep(seconds)
+    monitor.update()
+
+  def test_cpu_over_budget(self):
+    hog = self.start("budget_hog", Budget(cpu=10.))
+    idle = self.start("budget_idle", Budget(cpu=10.))
+    monitor = BudgetMonitor([hog, idle], throttle=False)
+    self.sample(monitor)
+
+    self.assertGreater(hog.cpu_usage, 20.)
+    self.assertTrue(hog.cpu_over_budget)
+    self.assertLess(idle.cpu_usage, 5.)
+    self.assertFalse(idle.cpu_over_budget)
+    self.assertFalse(idle.rss_over_budget)
+
+  def test_rss_over_budget(self):
+    alloc = self.start("budget_alloc", Budget(rss=20.))
+    idle = self.start("budget_idle", Budget(rss=200.))
+    monitor = BudgetMonitor([alloc, idle], throttle=False)
+    monitor.update()
+
+    self.assertGreater(alloc.mem_rss, 50e6)
+    self.assertTrue(alloc.rss_over_budget)
+    self.assertFalse(idle.rss_over_budget)
+
+  def test_sched(self):
+    idle = self.start("budget_idle", Budget(nice=10, affinity=[0]))
+    monitor = BudgetMonitor([idle])
+    monitor.update()
+    self.assertEqual(os.getpriority(os.PRIO_PROCESS, idle.get_pid()), 10)
+    self.assertEqual(os.sched_getaffinity(idle.get_pid()), {0})
+
+  def test_throttle(self):
+    hog = self.start("budget_hog", Budget(cpu=10., realtime=True))
+    idle = self.start("budget_idle", Budget(throttle=True))
+    pid = idle.get_pid()
+    monitor = BudgetMonitor([hog, idle])
+    self.sample(monitor)
+
+    self.assertTrue(hog.cpu_over_budget)
+    self.assertTrue(idle.throttled)
+    self.assertEqual(os.sched_getscheduler(pid), os.SCHED_IDLE)
+
+    # throttling stops once the realtime process is back within its budget
+    hog.stop(retry=False)
+    monitor.update()
+    self.assertFalse(hog.cpu_over_budget)
+    self.assertFalse(idle.throttled)
+    self.assertEqual(os.sched_getscheduler(pid), os.SCHED_OTHER)
+
+  def test_no_throttle(self):
+    hog = self.start("budget_hog", Budget(cpu=10., realtime=True))
+    idle = self.start("budget_idle", Budget(throttle=True))
+    monitor = BudgetMonitor([hog, idle], throttle=False)
+    self.sample(monitor)
+
+    self.assertTrue(hog.cpu_over_budget)
+    self.assertFalse(idle.throttled)
+    self.assertEqual(os.sched_getscheduler(idle.get_pid()), os.SCHED_OTHER)
+
+  def test_restart(self):
+    idle = self.start("budget_idle", Budget(cpu=10., nice=10))
+    monitor = BudgetMonitor([idle])
+    monitor.update()
+    idle.stop(retry=False)
+    monitor.update()
+    self.assertEqual(idle.mem_rss, 0)
+
+    # the new process gets its nice value too
+    idle.start()
+    time.sleep(0.2)
+    monitor.update()
+    self.assertEqual(os.getpriority(os.PRIO_PROCESS, idle.get_pid()), 10)
+    self.assertGreater(idle.mem_rss, 0)
+
+  def test_child_restart(self):
+    hog = self.start("budget_hog", Budget(cpu=10., realtime=True))
+    parent = self.start("budget_parent", Budget(nice=10, throttle=True))
+    fn = os.path.join(self.tmp.name, "budget_parent")
+    monitor = BudgetMonitor([hog, parent])
+
+    for _ in range(2):
+      with open(fn) as f:
+        child = int(f.read())
+      time.sleep(0.2)
+      self.sample(monitor)
+      self.assertTrue(parent.throttled)
+      self.assertEqual(os.getpriority(os.PRIO_PROCESS, child), 10)
+      self.assertEqual(os.sched_getscheduler(child), os.SCHED_IDLE)
+
+      # the new child gets them too
+      os.unlink(fn)
+      os.kill(child, signal.SIGKILL)
+      for _ in range(1000):
+        if os.path.exists(fn):
+          break
+        time.sleep(0.01)
+
+  def test_manager_state(self):
+    hog = self.start("budget_hog", Budget(cpu=10.))
+    monitor = BudgetMonitor([hog])
+    self.sample(monitor, 0.5)
+
+    msg = log.ManagerState.new_message()
+    msg.processes = [hog.get_process_state_msg()]
+    state = msg.processes[0]
+    self.assertAlmostEqual(state.cpuUsage, hog.cpu_usage, places=3)
+    self.assertEqual(state.memRss, hog.mem_rss)
+    self.assertTrue(state.cpuOverBudget)
+    self.assertFalse(state.rssOverBudget)
+    self.assertFalse(state.throttled)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+import os
+import sys
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+
+from cereal import log
+from common.realtime import sec_since_boot
+from selfdrive.manager.process import PythonProcess, ServicePublishing, ensure_running
+
+# a stub process that writes a file once it's running
+STUB = "import os, time\ndef main():\n  open(os.path.join({d!r}, {name!r}), 'w').close()\n  time.sleep(100)\n"
+
+
+class FileWritten:
+  """Ready once the file exists, a stand-in for ParamWritten"""
+  def __init__(self, path):
+    self.path = path
+
+  def __str__(self):
+    return os.path.basename(self.path)
+
+  def ready(self, sm):
+    return os.path.exists(self.path)
+
+
+class TestDependencies(unittest.TestCase):
+  def setUp(self):
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+    self.dir = tmp.name
+    sys.path.insert(0, self.dir)
+    self.addCleanup(sys.path.remove, self.dir)
+
+  def stub(self, name, dependencies=None, persistent=False):
+    with open(os.path.join(self.dir, f"stub_{name}.py"), "w") as f:
+      f.write(STUB.format(d=self.dir, name=name))
+    p = PythonProcess(name, f"stub_{name}", persistent=persistent, dependencies=dependencies)
+    self.addCleanup(p.stop)
+    return p
+
+  def wait_written(self, name):
+    # a process interrupted while it starts can miss the SIGINT
+    for _ in range(1000):
+      if os.path.exists(os.path.join(self.dir, name)):
+        break
+      time.sleep(0.01)
+
+  def written(self, name):
+    return FileWritten(os.path.join(self.dir, name))
+
+  def test_waves(self):
+    # c waits for a and b, d waits for c, e is started offroad
+    procs = [
+      self.stub("d", [self.written("c")]),
+      self.stub("c", [self.written("a"), self.written("b")]),
+      self.stub("a"),
+      self.stub("b"),
+      self.stub("e", persistent=True),
+    ]
+    by_name = {p.name: p for p in procs}
+
+    waiting = ensure_running(procs, started=False)
+    self.assertEqual(waiting, [])
+    self.assertEqual([p.name for p in procs if p.proc is not None], ["e"])
+
+    started_time = sec_since_boot()
+    order = [p.name for p in procs if p.proc is not None]
+    waiting = [None]
+    while waiting and sec_since_boot() - started_time < 10:
+      waiting = ensure_running(procs, True, started_time=started_time)
+      for p in procs:
+        if p.proc is not None and p.name not in order:
+          order.append(p.name)
+        state = p.get_process_state_msg()
+        self.assertEqual(state.waitingFor, p.waiting_for)
+        self.assertEqual(state.running, p.proc is not None and p.proc.is_alive())
+      time.sleep(0.01)
+
+    self.assertEqual(waiting, [])
+    self.assertEqual(order, ["e", "a", "b", "c", "d"])
+    self.wait_written("d")
+    self.assertEqual(by_name["e"].start_delay, 0.)
+    self.assertLess(by_name["a"].start_delay, by_name["c"].start_delay)
+    self.assertLess(by_name["c"].start_delay, by_name["d"].start_delay)
+
+  def test_waiting_for(self):
+    p = self.stub("b", [self.written("a")])
+    self.assertEqual(ensure_running([p], True), [p])
+    self.assertIsNone(p.proc)
+    self.assertEqual(p.get_process_state_msg().waitingFor, "a")
+
+    # offroad it doesn't wait anymore
+    self.assertEqual(ensure_running([p], False), [])
+    self.assertEqual(p.waiting_for, "")
+
+    # a running process keeps running when its dependencies aren't ready anymore
+    open(os.path.join(self.dir, "a"), "w").close()
+    ensure_running([p], True)
+    self.assertIsNotNone(p.proc)
+    os.unlink(os.path.join(self.dir, "a"))
+    self.assertEqual(ensure_running([p], True), [])
+    self.assertTrue(p.proc.is_alive())
+    self.wait_written("b")
+
+  def test_service_publishing(self):
+    dep = ServicePublishing("pandaState")
+    self.assertFalse(dep.ready(None))
+    sm = SimpleNamespace(rcv_time={"pandaState": 0.}, alive={"pandaState": True})
+    self.assertFalse(dep.ready(sm))
+    sm.rcv_time["pandaState"] = 1.
+    self.assertTrue(dep.ready(sm))
+    sm.alive["pandaState"] = False
+    self.assertFalse(dep.ready(sm))
+
+    # the manager doesn't subscribe to services like can for the whole drive
+    with self.assertRaises(AssertionError):
+      ServicePublishing("can")
+
+  def test_manager_state(self):
+    p = self.stub("b", [self.written("a")])
+    ensure_running([p], True)
+    self.assertIsNone(p.proc)
+    msg = log.ManagerState.new_message()
+    msg.processes = [p.get_process_state_msg()]
+    self.assertEqual(msg.processes[0].waitingFor, "a")
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from common import watchdog
+from common.watchdog import WatchdogTable
+from selfdrive.manager.process import ManagerProcess, PythonProcess, ensure_running
+
+MODULES = {
+  "wd_kick": "import time\nfrom common.watchdog import kick\ndef main():\n  while True:\n    kick()\n    time.sleep(0.02)\n",
+  # kicks for 0.5 s, then hangs
+  "wd_stall": "import time\nfrom common.watchdog import kick\ndef main():\n  for _ in range(25):\n    kick()\n" +
+              "    time.sleep(0.02)\n  time.sleep(100)\n",
+  "wd_never": "import time\ndef main():\n  time.sleep(100)\n",
+}
+
+
+class TestWatchdog(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls.tmp = tempfile.TemporaryDirectory()
+    for name, src in MODULES.items():
+      with open(os.path.join(cls.tmp.name, name + ".py"), "w") as f:
+        f.write(src)
+    sys.path.insert(0, cls.tmp.name)
+
+  @classmethod
+  def tearDownClass(cls):
+    sys.path.remove(cls.tmp.name)
+    cls.tmp.cleanup()
+
+  def setUp(self):
+    # the processes are forked from here and find the table at the patched path
+    path = os.path.join(self.tmp.name, "watchdog")
+    patcher = mock.patch.object(watchdog, "WATCHDOG_SHM", path)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    ManagerProcess.watchdog = WatchdogTable(path, create=True)
+    self.addCleanup(setattr, ManagerProcess, "watchdog", None)
+
+  def run_procs(self, procs, seconds):
+    pids = {p.name: [] for p in procs}
+    t = time.monotonic()
+    while time.monotonic() - t < seconds:
+      ensure_running(procs, True)
+      for p in procs:
+        if p.proc is not None and p.proc.pid not in pids[p.name]:
+          pids[p.name].append(p.proc.pid)
+      time.sleep(0.01)
+    return pids
+
+  def proc(self, module):
+    p = PythonProcess(module, module, watchdog_max_dt=0.3)
+    self.addCleanup(p.stop, retry=False)
+    return p
+
+  def test_missed_kicks(self):
+    stall = self.proc("wd_stall")
+    pids = self.run_procs([stall], 2.)
+
+    # restarted after 0.8 s and 1.6 s, each process in the slot of the previous one
+    self.assertGreaterEqual(len(pids["wd_stall"]), 2)
+    self.assertEqual(stall.watchdog_slot, 0)
+    self.assertEqual(ManagerProcess.watchdog.pid(0), stall.proc.pid)
+
+  def test_kicking(self):
+    procs = [self.proc("wd_kick"), self.proc("wd_never")]
+    pids = self.run_procs(procs, 1.5)
+
+    # a process that never kicked isn't restarted
+    self.assertEqual(pids, {"wd_kick": [procs[0].proc.pid], "wd_never": [procs[1].proc.pid]})
+    self.assertTrue(procs[0].watchdog_seen)
+    self.assertFalse(procs[1].watchdog_seen)
+    self.assertNotEqual(procs[0].watchdog_slot, procs[1].watchdog_slot)
+
+  def test_disabled(self):
+    with mock.patch("selfdrive.manager.process.ENABLE_WATCHDOG", False):
+      pids = self.run_procs([self.proc("wd_stall")], 1.5)
+    self.assertEqual(len(pids["wd_stall"]), 1)
+
+
+if __name__ == "__main__":
+  unittest.main()
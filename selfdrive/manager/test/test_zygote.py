@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+import gc
+import os
+import signal
+import sys
+import tempfile
+import time
+import unittest
+
+from selfdrive.manager.process import PythonProcess
+from selfdrive.manager.zygote import EXITCODE_LOST, Zygote
+
+MODULES = {
+  "zygote_exit": "import sys\ndef main():\n  sys.exit(3)\n",
+  "zygote_raise": "def main():\n  raise ValueError\n",
+  "zygote_sleep": "import time\ndef main():\n  time.sleep(100)\n",
+  # exits with the number of objects the gc tracks, less than in the zygote if they're frozen
+  "zygote_gc": "import gc, os\ndef main():\n  os._exit(min(len(gc.get_objects()) // 1000, 255))\n",
+}
+
+
+class TestZygote(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls.tmp = tempfile.TemporaryDirectory()
+    for name, src in MODULES.items():
+      with open(os.path.join(cls.tmp.name, name + ".py"), "w") as f:
+        f.write(src)
+    sys.path.insert(0, cls.tmp.name)
+
+  @classmethod
+  def tearDownClass(cls):
+    sys.path.remove(cls.tmp.name)
+    cls.tmp.cleanup()
+
+  def setUp(self):
+    self.zygote = Zygote()
+    self.addCleanup(self.zygote.close)
+
+  def start(self, module):
+    proc = self.zygote.start(module, module)
+    self.assertIsNotNone(proc)
+    self.addCleanup(lambda: proc.exitcode is None and os.kill(proc.pid, signal.SIGKILL))
+    return proc
+
+  def test_exitcode(self):
+    for module, exitcode in [("zygote_exit", 3), ("zygote_raise", 1)]:
+      proc = self.start(module)
+      proc.join(10)
+      self.assertFalse(proc.is_alive())
+      self.assertEqual(proc.exitcode, exitcode)
+
+  def test_signal(self):
+    proc = self.start("zygote_sleep")
+    self.assertNotEqual(proc.pid, self.zygote.proc.pid)
+    proc.join(0.2)
+    self.assertTrue(proc.is_alive())
+
+    # SIGINT is a KeyboardInterrupt in the process, not in the zygote
+    os.kill(proc.pid, signal.SIGINT)
+    proc.join(10)
+    self.assertEqual(proc.exitcode, 0)
+
+    # SIGTERM is a SystemExit, like in the processes the manager forks itself
+    proc = self.start("zygote_sleep")
+    proc.join(0.2)
+    os.kill(proc.pid, signal.SIGTERM)
+    proc.join(10)
+    self.assertEqual(proc.exitcode, 1)
+
+    proc = self.start("zygote_sleep")
+    os.kill(proc.pid, signal.SIGKILL)
+    proc.join(10)
+    self.assertEqual(proc.exitcode, -signal.SIGKILL)
+    self.assertTrue(self.zygote.proc.is_alive())
+
+  def test_gc_freeze(self):
+    proc = self.start("zygote_gc")
+    proc.join(10)
+    self.assertLess(proc.exitcode, len(gc.get_objects()) // 1000)
+
+  def test_zygote_lost(self):
+    proc = self.start("zygote_sleep")
+    os.kill(self.zygote.proc.pid, signal.SIGKILL)
+    self.zygote.proc.join()
+    self.zygote.poll(10)
+
+    # the process keeps running, the manager starts new ones itself
+    self.assertTrue(proc.is_alive())
+    self.assertFalse(self.zygote.alive)
+    self.assertIsNone(self.zygote.start("zygote_exit", "zygote_exit"))
+
+    os.kill(proc.pid, signal.SIGKILL)
+    proc.join(10)
+    self.assertEqual(proc.exitcode, EXITCODE_LOST)
+
+  def test_python_process(self):
+    PythonProcess.zygote = self.zygote
+    self.addCleanup(setattr, PythonProcess, "zygote", None)
+
+    p = PythonProcess("zygote_sleep", "zygote_sleep")
+    p.start()
+    self.addCleanup(p.stop)
+    self.assertTrue(p.get_process_state_msg().running)
+    self.assertEqual(p.stop(), 0)
+    self.assertIsNone(p.proc)
+
+    # started by the manager without the zygote
+    os.kill(self.zygote.proc.pid, signal.SIGKILL)
+    self.zygote.proc.join()
+    p.start()
+    self.assertEqual(p.proc.name, "zygote_sleep")
+    time.sleep(0.1)
+    self.assertEqual(p.stop(), 0)
+
+
+if __name__ == "__main__":
+  unittest.main()
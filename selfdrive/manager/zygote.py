@@ -0,0 +1,168 @@
+"""The zygote starts the python processes for the manager.
+
+It is forked from the manager once all the python processes are preimported, so a process
+forked from it starts with the shared modules (numpy, cereal, the capnp schemas, opendbc, ...)
+already imported, and from pages that the manager hasn't written to since. Everything the
+zygote has allocated is moved out of the garbage collector with gc.freeze(), so collections
+in the processes don't write to, and copy, the shared pages."""
+import gc
+import os
+import signal
+import sys
+import time
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import wait
+from typing import Dict, Optional
+
+from setproctitle import setproctitle  # pylint: disable=no-name-in-module
+
+from selfdrive.manager.process import launcher
+from selfdrive.swaglog import cloudlog
+
+# exit code of a process whose exit status was lost with the zygote
+EXITCODE_LOST = 1
+
+
+def zygote_launcher(conn, proc):
+  conn.close()
+
+  # SystemExit on sigterm, like the processes the manager forks after setting it. the zygote is
+  # forked before that and the process would die without running its finally blocks
+  signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+
+  # a SIGINT since the fork is pending until here
+  try:
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, [signal.SIGINT])
+  except KeyboardInterrupt:
+    cloudlog.warning("child %s got SIGINT" % proc)
+    return
+
+  launcher(proc)
+
+
+def zygote_main(conn, manager_conn):
+  manager_conn.close()
+  setproctitle("zygote")
+
+  # the manager stops the processes and then the zygote
+  signal.pthread_sigmask(signal.SIG_BLOCK, [signal.SIGINT])
+
+  children: Dict[int, Process] = {}
+  gc.collect()
+  while True:
+    for r in wait([conn, *children]):
+      if r is conn:
+        try:
+          msg = conn.recv()
+        except EOFError:
+          msg = None
+        if msg is None:
+          # don't wait for the processes like multiprocessing would, they outlive the zygote
+          os._exit(0)
+
+        name, module = msg
+        gc.freeze()
+        p = Process(name=name, target=zygote_launcher, args=(conn, module))
+        p.start()
+        children[p.sentinel] = p
+        conn.send(("started", p.pid))
+      else:
+        p = children.pop(r)
+        p.join()
+        conn.send(("exit", p.pid, p.exitcode))
+
+
+class ZygoteProcess:
+  """The multiprocessing.Process interface the manager uses, for a process started by the zygote"""
+  def __init__(self, zygote, name, pid):
+    self.zygote = zygote
+    self.name = name
+    self.pid = pid
+
+  @property
+  def exitcode(self) -> Optional[int]:
+    return self.zygote.exitcode(self.pid)
+
+  def is_alive(self) -> bool:
+    return self.exitcode is None
+
+  def join(self, timeout: Optional[float] = None) -> None:
+    self.zygote.join(self.pid, timeout)
+
+
+class Zygote:
+  def __init__(self):
+    self.conn, zygote_conn = Pipe()
+    self.proc = Process(name="zygote", target=zygote_main, args=(zygote_conn, self.conn))
+    self.proc.start()
+    zygote_conn.close()
+
+    self.alive = True
+    self.exitcodes: Dict[int, int] = {}
+
+  def start(self, name: str, module: str) -> Optional[ZygoteProcess]:
+    if not self.alive:
+      return None
+
+    try:
+      self.conn.send((name, module))
+      while True:
+        msg = self.conn.recv()
+        if msg[0] == "started":
+          self.exitcodes.pop(msg[1], None)  # the pid of an earlier process
+          return ZygoteProcess(self, name, msg[1])
+        self._handle(msg)
+    except (EOFError, OSError):
+      self._lost()
+      return None
+
+  def _handle(self, msg):
+    _, pid, exitcode = msg
+    self.exitcodes[pid] = exitcode
+
+  def _lost(self):
+    if self.alive:
+      cloudlog.error(f"zygote died with {self.proc.exitcode}, starting python processes from the manager")
+      self.alive = False
+
+  def poll(self, timeout: float = 0.) -> None:
+    if not self.alive:
+      return
+
+    try:
+      while self.conn.poll(timeout):
+        self._handle(self.conn.recv())
+        timeout = 0.
+    except (EOFError, OSError):
+      self._lost()
+
+  def exitcode(self, pid: int) -> Optional[int]:
+    self.poll()
+    if pid not in self.exitcodes and not self.alive:
+      # the process was reparented when the zygote died, only its exit status is lost
+      try:
+        os.kill(pid, 0)
+      except ProcessLookupError:
+        self.exitcodes[pid] = EXITCODE_LOST
+    return self.exitcodes.get(pid)
+
+  def join(self, pid: int, timeout: Optional[float] = None) -> None:
+    end = None if timeout is None else time.monotonic() + timeout
+    while self.exitcode(pid) is None:
+      wait_time = 0.1 if end is None else min(0.1, end - time.monotonic())
+      if wait_time <= 0:
+        return
+      if self.alive:
+        self.poll(wait_time)
+      else:
+        time.sleep(wait_time)
+
+  def close(self) -> None:
+    if self.alive:
+      try:
+        self.conn.send(None)
+      except OSError:
+        pass
+      self.alive = False
+    self.conn.close()
+    self.proc.join()
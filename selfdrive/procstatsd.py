@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""CPU accounting of the managed processes: cpu time, run queue delay and involuntary
+context switches, read from /proc with pread()s of files that stay open"""
+import os
+from typing import Dict, List, Optional
+
+import cereal.messaging as messaging
+from common.realtime import Ratekeeper, sec_since_boot
+from selfdrive.swaglog import cloudlog
+
+INTERVAL = 1.  # s, like the procStats frequency
+CLK_TCK = os.sysconf(os.sysconf_names['SC_CLK_TCK'])
+SWITCHES_KEY = b"nonvoluntary_ctxt_switches:"
+
+
+class ThreadFiles:
+  def __init__(self, pid: int, tid: int):
+    self.schedstat = os.open(f"/proc/{pid}/task/{tid}/schedstat", os.O_RDONLY)
+    try:
+      self.status = os.open(f"/proc/{pid}/task/{tid}/status", os.O_RDONLY)
+    except OSError:
+      # the thread exited in between
+      os.close(self.schedstat)
+      raise
+
+  def close(self) -> None:
+    os.close(self.schedstat)
+    os.close(self.status)
+
+
+class ProcessAccount:
+  """Cumulative counters of a process, every thread's schedstat and status are summed since
+  /proc/<pid>/schedstat and status only cover the main thread"""
+  def __init__(self, name: str, pid: int):
+    self.name = name
+    self.pid = pid
+    self.stat = os.open(f"/proc/{pid}/stat", os.O_RDONLY)
+    self.threads: Dict[int, ThreadFiles] = {}
+
+    self.num_threads = 0
+    self.cpu_user = 0.
+    self.cpu_system = 0.
+    self.run_delay = 0.
+    self.involuntary_switches = 0
+
+  def close(self) -> None:
+    os.close(self.stat)
+    for t in self.threads.values():
+      t.close()
+    self.threads = {}
+
+  def _update_threads(self) -> None:
+    tids = set(map(int, os.listdir(f"/proc/{self.pid}/task")))
+    for tid in set(self.threads) - tids:
+      self.threads.pop(tid).close()
+    for tid in tids - set(self.threads):
+      try:
+        self.threads[tid] = ThreadFiles(self.pid, tid)
+      except FileNotFoundError:
+        pass  # exited since the listdir
+
+  def update(self) -> None:
+    """Raises OSError when the process exited"""
+    # the name in parentheses can contain spaces
+    stat = os.pread(self.stat, 1024, 0)
+    fields = stat[stat.rindex(b")") + 2:].split()
+    self.cpu_user = int(fields[11]) / CLK_TCK
+    self.cpu_system = int(fields[12]) / CLK_TCK
+    self.num_threads = int(fields[17])
+
+    # the thread list is only read again when threads come or go
+    if self.num_threads != len(self.threads):
+      self._update_threads()
+    run_delay_ns, switches = 0, 0
+    for tid, t in list(self.threads.items()):
+      try:
+        schedstat = os.pread(t.schedstat, 128, 0)
+        status = os.pread(t.status, 4096, 0)
+      except OSError:
+        # replaced by another thread, picked up on the next update
+        self.threads.pop(tid).close()
+        continue
+      run_delay_ns += int(schedstat.split()[1])
+      i = status.index(SWITCHES_KEY) + len(SWITCHES_KEY)
+      switches += int(status[i:status.index(b"\n", i)])
+    self.run_delay = run_delay_ns / 1e9
+    self.involuntary_switches = switches
+
+
+class ProcStats:
+  """Keeps a ProcessAccount of every running process, and the counters of the previous
+  update to fill in the rates"""
+  def __init__(self):
+    self.accounts: Dict[str, ProcessAccount] = {}
+    self.prev: Dict[str, tuple] = {}
+    self.last_time: Optional[float] = None
+
+  def set_processes(self, pids: Dict[str, int]) -> None:
+    for name, acc in list(self.accounts.items()):
+      if pids.get(name) != acc.pid:
+        acc.close()
+        del self.accounts[name]
+        self.prev.pop(name, None)
+    for name, pid in pids.items():
+      if name not in self.accounts:
+        try:
+          self.accounts[name] = ProcessAccount(name, pid)
+        except FileNotFoundError:
+          pass
+
+  def update(self) -> List[dict]:
+    t = sec_since_boot()
+    dt = None if self.last_time is None else t - self.last_time
+    self.last_time = t
+
+    ret = []
+    for name, acc in list(self.accounts.items()):
+      try:
+        acc.update()
+      except OSError:
+        acc.close()
+        del self.accounts[name]
+        self.prev.pop(name, None)
+        continue
+
+      cpu = acc.cpu_user + acc.cpu_system
+      p = {
+        'name': name,
+        'pid': acc.pid,
+        'numThreads': acc.num_threads,
+        'cpuUser': acc.cpu_user,
+        'cpuSystem': acc.cpu_system,
+        'runDelay': acc.run_delay,
+        'involuntarySwitches': acc.involuntary_switches,
+      }
+      prev = self.prev.get(name)
+      if prev is not None and dt:
+        # exited threads take their run delay and switches with them
+        p['cpuUsagePercent'] = (cpu - prev[0]) / dt * 100.
+        p['runDelayPercent'] = max(acc.run_delay - prev[1], 0.) / dt * 100.
+        p['involuntarySwitchesPerSec'] = max(acc.involuntary_switches - prev[2], 0) / dt
+      self.prev[name] = (cpu, acc.run_delay, acc.involuntary_switches)
+      ret.append(p)
+    return ret
+
+
+def main(sm=None, pm=None):
+  if sm is None:
+    sm = messaging.SubMaster(['managerState'])
+  if pm is None:
+    pm = messaging.PubMaster(['procStats'])
+
+  stats = ProcStats()
+  rk = Ratekeeper(1. / INTERVAL, print_delay_threshold=None)
+  while True:
+    sm.update(0)
+    if sm.updated['managerState']:
+      stats.set_processes({p.name: p.pid for p in sm['managerState'].processes if p.running and p.pid > 0})
+
+    try:
+      procs = stats.update()
+    except Exception:
+      cloudlog.exception("procstatsd.update failed")
+      procs = []
+
+    msg = messaging.new_message('procStats')
+    msg.procStats.procs = procs
+    pm.send('procStats', msg)
+    rk.keep_time()
+
+
+if __name__ == "__main__":
+  main()
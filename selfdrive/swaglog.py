@@ -6,9 +6,12 @@ from logging.handlers import BaseRotatingHandler
 
 import zmq
 
-from common.logging_extra import SwagLogger, SwagFormatter, SwagLogFileFormatter
+from common.logging_extra import SwagLogger, SwagFormatter, SwagCompactFormatter, SwagLogFileFormatter
 from selfdrive.hardware import PC
 
+# compact IPC records, full formatting is done by logmessaged
+SWAGLOG_COMPACT = os.getenv("SWAGLOG_COMPACT", "1") == "1"
+
 if PC:
   SWAGLOG_DIR = os.path.join(str(Path.home()), ".comma", "log")
 else:
@@ -51,10 +54,36 @@ class SwaglogRotatingFileHandler(BaseRotatingHandler):
     return sorted(log_files)
 
   def shouldRollover(self, record):
-    size_exceeded = self.max_bytes > 0 and self.stream.tell() >= self.max_bytes
+    return self._rollover_due(self.stream.tell())
+
+  def _rollover_due(self, size):
+    size_exceeded = self.max_bytes > 0 and size >= self.max_bytes
     time_exceeded = self.interval > 0 and self.last_rollover + self.interval <= time.monotonic()
     return size_exceeded or time_exceeded
 
+  def emit_batch(self, records):
+    """Formats several records and writes them with a write per log file, used by logmessaged.
+    The rollover is checked before every record, like emit does."""
+    if not len(records):
+      return
+    try:
+      lines = []
+      # in characters, the same as bytes for the (mostly ascii) json records
+      size = self.stream.tell()
+      for record in records:
+        if self._rollover_due(size):
+          self.stream.write("".join(lines))
+          self.doRollover()
+          lines = []
+          size = 0
+        line = self.format(record) + self.terminator
+        lines.append(line)
+        size += len(line)
+      self.stream.write("".join(lines))
+      self.flush()
+    except Exception:
+      self.handleError(records[-1])
+
   def doRollover(self):
     if self.stream:
       self.stream.close()
@@ -71,6 +100,7 @@ class UnixDomainSocketHandler(logging.Handler):
     logging.Handler.__init__(self)
     self.setFormatter(formatter)
     self.pid = None
+    self.dropped = 0
 
   def connect(self):
     self.zctx = zmq.Context()
@@ -90,6 +120,21 @@ class UnixDomainSocketHandler(logging.Handler):
       self.sock.send(s.encode('utf8'), zmq.NOBLOCK)
     except zmq.error.Again:
       # drop :/
+      self.dropped += 1
+      return
+
+    if self.dropped:
+      self.report_dropped()
+
+  def report_dropped(self):
+    # let logmessaged know how many records never made it
+    record = logging.makeLogRecord({'name': 'swaglog', 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                                    'msg': {'event': 'swaglog.dropped', 'count': self.dropped}})
+    try:
+      s = chr(record.levelno) + self.format(record)
+      self.sock.send(s.encode('utf8'), zmq.NOBLOCK)
+      self.dropped = 0
+    except zmq.error.Again:
       pass
 
 
@@ -109,4 +154,4 @@ log.setLevel(logging.DEBUG)
 outhandler = logging.StreamHandler()
 log.addHandler(outhandler)
 # logs are sent through IPC before writing to disk to prevent disk I/O blocking
-log.addHandler(UnixDomainSocketHandler(SwagFormatter(log)))
+log.addHandler(UnixDomainSocketHandler(SwagCompactFormatter(log) if SWAGLOG_COMPACT else SwagFormatter(log)))
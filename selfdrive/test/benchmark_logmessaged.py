@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+import zmq
+
+import cereal.messaging as messaging
+from common.logging_extra import SwagFormatter, SwagLogFileFormatter, SwagLogger
+from selfdrive.logmessaged import handle_batch, recv_batch
+from selfdrive.swaglog import SwaglogRotatingFileHandler
+
+N_RECORDS = 20000
+ADDR = "ipc:///tmp/logmessage_benchmark"
+
+
+def sender(n, nonblocking, ready, result):
+  formatter = SwagFormatter(SwagLogger())
+  record = logging.makeLogRecord({'name': 'swaglog', 'levelno': logging.INFO, 'levelname': 'INFO',
+                                  'msg': {'event': 'benchmark', 'v_ego': 12.3, 'enabled': True, 'alerts': ['a', 'b']}})
+  dat = (chr(record.levelno) + formatter.format(record)).encode('utf8')
+
+  sock = zmq.Context().socket(zmq.PUSH)
+  sock.setsockopt(zmq.LINGER, 1000)
+  sock.connect(ADDR)
+  ready.wait()
+
+  dropped = 0
+  for _ in range(n):
+    try:
+      # like UnixDomainSocketHandler, a full queue drops the record
+      sock.send(dat, zmq.NOBLOCK if nonblocking else 0)
+    except zmq.error.Again:
+      dropped += 1
+  # end marker, always delivered
+  sock.send(b"\x00end")
+  result.put(dropped)
+
+
+def run(batched, nonblocking):
+  log_dir = tempfile.mkdtemp()
+  handler = SwaglogRotatingFileHandler(os.path.join(log_dir, "swaglog"))
+  handler.setFormatter(SwagLogFileFormatter(None))
+  pub_sock = messaging.pub_sock('logMessage')
+
+  sock = zmq.Context().socket(zmq.PULL)
+  sock.bind(ADDR)
+
+  ready, result = multiprocessing.Event(), multiprocessing.Queue()
+  proc = multiprocessing.Process(target=sender, args=(N_RECORDS, nonblocking, ready, result))
+  proc.start()
+
+  received = 0
+  done = False
+  ready.set()
+  start = time.monotonic()
+  while not done:
+    if batched:
+      batch = recv_batch(sock)
+    else:
+      batch = [b''.join(sock.recv_multipart())]
+    if batch[-1] == b"\x00end":
+      done = True
+      batch = batch[:-1]
+    received += len(batch)
+
+    if batched:
+      handle_batch(batch, handler, pub_sock)
+    else:
+      # per-record pipeline before batching
+      for dat in batch:
+        record = dat[1:].decode("utf-8")
+        if dat[0] >= 20:
+          handler.emit(record)
+        msg = messaging.new_message()
+        msg.logMessage = record
+        pub_sock.send(msg.to_bytes())
+  elapsed = time.monotonic() - start
+
+  dropped = result.get()
+  proc.join()
+  sock.close()
+  handler.close()
+  shutil.rmtree(log_dir)
+  return received / elapsed, received, dropped
+
+
+if __name__ == "__main__":
+  print(f"{N_RECORDS} records")
+  for name, batched in (("per-record", False), ("batched", True)):
+    rate, _, _ = run(batched, nonblocking=False)
+    _, received, dropped = run(batched, nonblocking=True)
+    print(f"{name:10s}: {rate:8.0f} records/s, burst: received {received} dropped {dropped}")
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""CPU cost of procstatsd against the psutil polling of the old cpu_usage_stat.py, for
+processes with a few threads each like the managed processes"""
+import argparse
+import subprocess
+import sys
+import time
+
+import psutil
+
+from selfdrive.procstatsd import INTERVAL, ProcStats
+
+PSUTIL_INTERVAL = 0.2  # cpu_usage_stat.py
+CHILD = """
+import threading, time
+for _ in range({threads} - 1):
+  threading.Thread(target=time.sleep, args=(1e6,), daemon=True).start()
+time.sleep(1e6)
+"""
+
+
+def bench(f, n):
+  f()
+  t, cpu = time.perf_counter(), time.process_time()
+  for _ in range(n):
+    f()
+  return (time.perf_counter() - t) / n, (time.process_time() - cpu) / n
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("--procs", type=int, default=30)
+  parser.add_argument("--threads", type=int, default=4)
+  parser.add_argument("-n", type=int, default=200, help="samples")
+  args = parser.parse_args()
+
+  children = [subprocess.Popen([sys.executable, "-c", CHILD.format(threads=args.threads)]) for _ in range(args.procs)]
+  try:
+    time.sleep(1)
+
+    stats = ProcStats()
+    stats.set_processes({f"proc{i}": p.pid for i, p in enumerate(children)})
+    wall, cpu = bench(stats.update, args.n)
+    print(f"procstatsd, all threads      : {wall * 1e3:6.2f} ms/sample, {cpu * 1e3:6.2f} ms cpu/sample, "
+          f"{cpu / INTERVAL * 100:5.2f}% cpu at {1 / INTERVAL:.0f} Hz")
+
+    # cpu_usage_stat.py looked up the cmdline and cpu_times of every process at every sample,
+    # without the context switches and run queue delay
+    procs = [psutil.Process(p.pid) for p in children]
+
+    def psutil_sample():
+      for p in procs:
+        ' '.join(p.cmdline())
+        p.cpu_times()
+    wall, cpu = bench(psutil_sample, args.n)
+    print(f"psutil, cmdline + cpu_times  : {wall * 1e3:6.2f} ms/sample, {cpu * 1e3:6.2f} ms cpu/sample, "
+          f"{cpu / PSUTIL_INTERVAL * 100:5.2f}% cpu at {1 / PSUTIL_INTERVAL:.0f} Hz")
+
+    def psutil_switches():
+      for p in procs:
+        p.cpu_times()
+        p.num_ctx_switches()
+    wall, cpu = bench(psutil_switches, args.n)
+    print(f"psutil, + ctx switches       : {wall * 1e3:6.2f} ms/sample, {cpu * 1e3:6.2f} ms cpu/sample "
+          "(main threads only)")
+  finally:
+    for p in children:
+      p.kill()
+      p.wait()
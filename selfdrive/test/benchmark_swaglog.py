@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+import logging
+import multiprocessing
+import time
+
+import numpy as np
+import zmq
+
+import common.logging_extra as logging_extra
+from common.logging_extra import SwagCompactFormatter, SwagFormatter, SwagLogger
+from selfdrive.swaglog import UnixDomainSocketHandler
+
+N_STEPS = 20000
+
+
+def receiver(ready):
+  # stand-in for logmessaged, stop it before running this benchmark
+  sock = zmq.Context().socket(zmq.PULL)
+  sock.bind("ipc:///tmp/logmessage")
+  ready.set()
+  while True:
+    sock.recv_multipart()
+
+
+def controlsd_like_loop(log):
+  # one event and one formatted message per 100Hz step, like a busy controlsd
+  dt = np.zeros(2 * N_STEPS, dtype=np.int64)
+  v_ego, a_target = 0., 0.
+  for i in range(N_STEPS):
+    v_ego += 0.01
+    a_target = 0.5 * a_target + 0.1
+
+    t = time.perf_counter_ns()
+    log.event("controlsd.step", v_ego=v_ego, a_target=a_target, enabled=True, alerts=["steerSaturated"])
+    dt[2 * i] = time.perf_counter_ns() - t
+
+    t = time.perf_counter_ns()
+    log.info("frame %d lagging by %.2f ms", i, v_ego)
+    dt[2 * i + 1] = time.perf_counter_ns() - t
+  return dt
+
+
+if __name__ == "__main__":
+  ready = multiprocessing.Event()
+  proc = multiprocessing.Process(target=receiver, args=(ready,), daemon=True)
+  proc.start()
+  ready.wait()
+
+  orjson = logging_extra.orjson
+  for name, formatter_cls, fast_json in (("SwagFormatter, json", SwagFormatter, False),
+                                         ("SwagFormatter, orjson", SwagFormatter, True),
+                                         ("SwagCompactFormatter, json", SwagCompactFormatter, False),
+                                         ("SwagCompactFormatter, orjson", SwagCompactFormatter, True)):
+    if fast_json and orjson is None:
+      print(f"{name:30s}: orjson not installed")
+      continue
+    logging_extra.orjson = orjson if fast_json else None
+
+    log = SwagLogger()
+    log.setLevel(logging.DEBUG)
+    log.addHandler(UnixDomainSocketHandler(formatter_cls(log)))
+    dt = controlsd_like_loop(log) / 1000.
+    print(f"{name:30s}: per call mean {np.mean(dt):6.1f} us  p50 {np.median(dt):6.1f} us  p99 {np.percentile(dt, 99):6.1f} us")
+
+  proc.terminate()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+import bz2
+import math
+import sys
+from typing import Any, Dict, List, Optional
+
+from tools.lib.logreader import LogReader
+
+EPSILON = sys.float_info.epsilon
+
+
+def save_log(dest, log_msgs, compress=True):
+  dat = b"".join(msg.as_builder().to_bytes() for msg in log_msgs)
+
+  if compress:
+    dat = bz2.compress(dat)
+
+  with open(dest, "wb") as f:
+    f.write(dat)
+
+
+def remove_ignored_fields(msg_dict: Dict[str, Any], ignore: List[str]):
+  """Drops dotted field paths (e.g. "controlsState.cumLagMs") from a message dict"""
+  for path in ignore:
+    keys = path.split(".")
+    d = msg_dict
+    for k in keys[:-1]:
+      d = d.get(k) if isinstance(d, dict) else None
+      if d is None:
+        break
+    if isinstance(d, dict):
+      d.pop(keys[-1], None)
+  return msg_dict
+
+
+def _diff(a, b, path: str, tolerance: Optional[float], diffs: List[tuple]):
+  if isinstance(a, dict) and isinstance(b, dict):
+    for k in sorted(set(a) | set(b)):
+      if k not in a or k not in b:
+        diffs.append(("add" if k not in a else "remove", f"{path}.{k}", a.get(k), b.get(k)))
+      else:
+        _diff(a[k], b[k], f"{path}.{k}", tolerance, diffs)
+  elif isinstance(a, list) and isinstance(b, list):
+    if len(a) != len(b):
+      diffs.append(("change", f"{path}.len", len(a), len(b)))
+    for i, (x, y) in enumerate(zip(a, b)):
+      _diff(x, y, f"{path}.{i}", tolerance, diffs)
+  elif isinstance(a, float) and isinstance(b, float):
+    tol = EPSILON if tolerance is None else tolerance
+    if not (math.isclose(a, b, rel_tol=tol, abs_tol=tol) or (math.isnan(a) and math.isnan(b))):
+      diffs.append(("change", path, a, b))
+  elif a != b:
+    diffs.append(("change", path, a, b))
+
+
+def compare_logs(log1, log2, ignore_fields=None, ignore_msgs=None, tolerance=None):
+  """Field by field differences of two lists of log.Event, as (kind, path, old, new)"""
+  ignore_fields = [] if ignore_fields is None else ignore_fields
+  ignore_msgs = [] if ignore_msgs is None else ignore_msgs
+
+  log1, log2 = [[m for m in log if m.which() not in ignore_msgs] for log in (log1, log2)]
+
+  if len(log1) != len(log2):
+    cnt1 = {}
+    cnt2 = {}
+    for m in log1:
+      cnt1[m.which()] = cnt1.get(m.which(), 0) + 1
+    for m in log2:
+      cnt2[m.which()] = cnt2.get(m.which(), 0) + 1
+    raise Exception(f"logs are not same length: {len(log1)} VS {len(log2)}\n\t\t{cnt1}\n\t\t{cnt2}")
+
+  diffs: List[tuple] = []
+  for i, (msg1, msg2) in enumerate(zip(log1, log2)):
+    if msg1.which() != msg2.which():
+      raise Exception(f"msgs not aligned between logs at {i}: {msg1.which()} VS {msg2.which()}")
+
+    msg1_dict = remove_ignored_fields(msg1.to_dict(verbose=True), ignore_fields)
+    msg2_dict = remove_ignored_fields(msg2.to_dict(verbose=True), ignore_fields)
+    _diff(msg1_dict, msg2_dict, str(i), tolerance, diffs)
+  return diffs
+
+
+def format_diff(results, ref):
+  """results: {segment: {process: diffs or error string}}, returns (summary, full diff, failed)"""
+  diff1, diff2 = "", ""
+  diff2 += f"***** tested against {ref} *****\n"
+
+  failed = False
+  for segment, result in list(results.items()):
+    diff1 += f"***** results for segment {segment} *****\n"
+    diff2 += f"***** differences for segment {segment} *****\n"
+
+    for proc, diff in list(result.items()):
+      diff1 += f"\t{proc}\n"
+      diff2 += f"*** process: {proc} ***\n"
+
+      if isinstance(diff, str):
+        diff1 += f"\t\t{diff}\n"
+        failed = True
+      elif len(diff):
+        cnt: Dict[str, int] = {}
+        for d in diff:
+          diff2 += f"\t{str(d)}\n"
+
+          k = str(d[1])
+          cnt[k] = 1 if k not in cnt else cnt[k] + 1
+
+        for k, v in sorted(cnt.items()):
+          diff1 += f"\t\t{k}: {v}\n"
+        failed = True
+  return diff1, diff2, failed
+
+
+if __name__ == "__main__":
+  log1 = list(LogReader(sys.argv[1]))
+  log2 = list(LogReader(sys.argv[2]))
+  print(compare_logs(log1, log2, sys.argv[3:]))
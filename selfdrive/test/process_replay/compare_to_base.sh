@@ -0,0 +1,24 @@
+#!/bin/bash -e
+# Replays the synthetic drive with the base commit (origin/master by default) to create the reference
+# outputs and the step time baseline, then checks this tree against them. Both run on this machine,
+# the baseline isn't comparable across machines.
+BASE=${1:-origin/master}
+ROOT=$(git rev-parse --show-toplevel)
+HARNESS=selfdrive/test/process_replay/test_processes.py
+
+# a base without the harness (or one that can't write a baseline) has no references to compare to
+if ! git -C $ROOT show $BASE:$HARNESS 2>/dev/null | grep -q -- "--runs"; then
+  echo "$BASE has no process replay harness with step times, skipping the comparison"
+  exit 0
+fi
+
+WORK=$(mktemp -d)
+trap "git -C $ROOT worktree remove --force $WORK/base; rm -rf $WORK" EXIT
+
+git -C $ROOT worktree add --detach $WORK/base $BASE
+(cd $WORK/base && scons -j$(nproc))
+(cd $WORK/base/selfdrive/test/process_replay && \
+  ./test_processes.py --update-refs --update-baseline --ref-dir $WORK/refs --baseline $WORK/baseline.json)
+
+cd $ROOT/selfdrive/test/process_replay
+./test_processes.py --ref-dir $WORK/refs --baseline $WORK/baseline.json "${@:2}"
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+import importlib
+import os
+import sys
+import threading
+import time
+from collections import deque, namedtuple
+from typing import Any, List, Optional
+
+import cereal.messaging as messaging
+from common.params import Params
+from selfdrive.car.car_helpers import interfaces
+from tools.lib.logreader import event_from_bytes, event_mono_time, event_which
+
+# a step that doesn't get back to waiting for input within this many seconds is a hang
+TIMEOUT = 15
+
+ProcessConfig = namedtuple('ProcessConfig', ['proc_name', 'module', 'subs', 'sm_kwargs', 'pubs',
+                                             'triggers', 'ignore', 'init_callback', 'tolerance'])
+
+# outputs of one replay. timings are the wall times, in seconds, of each step: everything the
+# process does between receiving a trigger message and blocking for the next one
+ReplayResult = namedtuple('ReplayResult', ['outputs', 'timings'])
+
+
+class ReplayTimeout(Exception):
+  pass
+
+
+class ReplayFinished(Exception):
+  """Raised inside the process thread to unwind it once the replay is over"""
+
+
+class Lockstep:
+  """Hands control back and forth between the replay loop and the process under test,
+  so the process only ever runs while the replay loop is waiting for it"""
+  def __init__(self, timeout=TIMEOUT):
+    self.timeout = timeout
+    self.cv = threading.Condition()
+    self.ready = False
+    self.idle = False
+    self.finished = False
+    self.error: Optional[BaseException] = None
+
+  def wait_for_input(self):
+    with self.cv:
+      self.idle = True
+      self.cv.notify_all()
+      while not self.ready:
+        if self.finished:
+          raise ReplayFinished
+        self.cv.wait()
+      self.ready = False
+      self.idle = False
+
+  def wait_for_idle(self, thread):
+    deadline = time.monotonic() + self.timeout
+    with self.cv:
+      while not self.idle:
+        if self.error is not None:
+          raise self.error
+        if not thread.is_alive():
+          raise Exception("process exited during replay")
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+          raise ReplayTimeout(f"process did not wait for input within {self.timeout} s")
+        self.cv.wait(min(remaining, 1.))
+
+  def step(self, thread):
+    with self.cv:
+      self.ready = True
+      self.idle = False
+      self.cv.notify_all()
+    self.wait_for_idle(thread)
+
+  def finish(self):
+    with self.cv:
+      self.finished = True
+      self.cv.notify_all()
+
+  def fail(self, e):
+    with self.cv:
+      self.error = e
+      self.cv.notify_all()
+
+
+class DumbSocket:
+  def __init__(self, s=None):
+    if s is not None:
+      try:
+        dat = messaging.new_message(s)
+      except Exception:  # lists
+        dat = messaging.new_message(s, 0)
+      self.data = dat.to_bytes()
+
+  def receive(self, non_blocking=False):
+    return self.data
+
+  def send(self, dat):
+    pass
+
+
+class FakeSocket:
+  """Sub socket whose queue is filled by the replay loop. Blocking receives on an empty
+  queue hand control back to the replay loop."""
+  def __init__(self, lockstep):
+    self.lockstep = lockstep
+    self.data: deque = deque()
+
+  def receive(self, non_blocking=False):
+    while not self.data:
+      if non_blocking:
+        return None
+      self.lockstep.wait_for_input()
+    return self.data.popleft()
+
+  def send(self, dat):
+    pass
+
+
+class FakeSubMaster(messaging.SubMaster):
+  def __init__(self, services, lockstep, **kwargs):
+    super().__init__(services, addr=None, **kwargs)
+    self.sock = {s: DumbSocket(s) for s in services}
+    self.lockstep = lockstep
+    self.polled = [s for s in services if s not in self.non_polled_services] if kwargs.get('poll') else []
+    self.pending: List[Any] = []
+    # log time of the newest input, in place of the receive time
+    self.cur_time = 0.
+    # called once, on the first data access. processes touch sm data as soon as their setup is done
+    self.getitem_callback = None
+
+  def __getitem__(self, s):
+    if self.getitem_callback is not None:
+      cb, self.getitem_callback = self.getitem_callback, None
+      cb()
+    return self.data[s]
+
+  def update(self, timeout=1000):
+    # a blocking update on polled services waits for one of them, like the real poller
+    if timeout != 0 and self.polled:
+      while not any(m.which() in self.polled for m in self.pending):
+        self.lockstep.wait_for_input()
+    msgs, self.pending = self.pending, []
+    self.update_msgs(self.cur_time, msgs)
+
+
+class FakePubMaster(messaging.PubMaster):
+  def __init__(self, services):  # pylint: disable=super-init-not-called
+    self.sock = {s: DumbSocket() for s in services}
+    self.data: List[bytes] = []
+
+  def send(self, s, dat):
+    if not isinstance(dat, bytes):
+      dat = dat.to_bytes()
+    self.data.append(dat)
+
+
+def fingerprint(msgs, fsm, can_sock):
+  # controlsd fingerprints from the first can messages before its first step.
+  # give it those up front, and replay from the start once it touches sm data
+  fsm.sock['pandaState'].data = next(dat for dat in msgs if event_which(dat) == 'pandaState')
+  can_sock.data.extend([dat for dat in msgs if event_which(dat) == 'can'][:300])
+  fsm.getitem_callback = can_sock.data.clear
+
+
+def get_car_params(msgs, fsm, can_sock):
+  cp = [dat for dat in msgs if event_which(dat) == 'carParams']
+  if len(cp):
+    Params().put("CarParams", event_from_bytes(cp[0]).carParams.as_builder().to_bytes())
+  else:
+    fp = os.environ['FINGERPRINT']
+    CarInterface, _, _ = interfaces[fp]
+    Params().put("CarParams", CarInterface.get_params(fp).to_bytes())
+
+
+CONFIGS = [
+  ProcessConfig(
+    proc_name="controlsd",
+    module="selfdrive.controls.controlsd",
+    subs=['deviceState', 'pandaState', 'modelV2', 'liveCalibration', 'driverMonitoringState', 'longitudinalPlan',
+          'lateralPlan', 'liveLocationKalman', 'managerState', 'liveParameters', 'radarState',
+          'roadCameraState', 'driverCameraState'],
+    sm_kwargs={'ignore_avg_freq': ['radarState', 'longitudinalPlan']},
+    pubs=['sendcan', 'controlsState', 'carState', 'carControl', 'carEvents', 'carParams'],
+    triggers=['can'],
+    ignore=["logMonoTime", "valid", "controlsState.startMonoTime", "controlsState.cumLagMs"],
+    init_callback=fingerprint,
+    tolerance=None,
+  ),
+  ProcessConfig(
+    proc_name="radard",
+    module="selfdrive.controls.radard",
+    subs=['modelV2', 'carState'],
+    sm_kwargs={'ignore_avg_freq': ['modelV2', 'carState']},
+    pubs=['radarState', 'liveTracks'],
+    triggers=['can'],
+    ignore=["logMonoTime", "valid", "radarState.cumLagMs"],
+    init_callback=get_car_params,
+    tolerance=None,
+  ),
+  ProcessConfig(
+    proc_name="plannerd",
+    module="selfdrive.controls.plannerd",
+    subs=['carState', 'controlsState', 'radarState', 'modelV2'],
+    sm_kwargs={'poll': ['radarState', 'modelV2'], 'ignore_avg_freq': ['radarState']},
+    pubs=['longitudinalPlan', 'liveLongitudinalMpc', 'lateralPlan', 'liveMpc'],
+    triggers=['modelV2', 'radarState'],
+    ignore=["logMonoTime", "valid", "longitudinalPlan.processingDelay"],
+    init_callback=get_car_params,
+    tolerance=None,
+  ),
+]
+
+CONFIGS_BY_NAME = {cfg.proc_name: cfg for cfg in CONFIGS}
+
+
+def setup_env(car_fingerprint):
+  params = Params()
+  params.clear_all()
+  params.put_bool("OpenpilotEnabledToggle", True)
+  params.put_bool("Passive", False)
+  params.put_bool("CommunityFeaturesToggle", True)
+
+  # no sleeps waiting on the radar, and no fingerprinting or fw queries over the (fake) can bus
+  os.environ['NO_RADAR_SLEEP'] = "1"
+  os.environ['SKIP_FW_QUERY'] = "1"
+  os.environ['FINGERPRINT'] = car_fingerprint
+
+
+def replay_process(cfg, msgs, car_fingerprint):
+  """Replays serialized events, sorted by logMonoTime, through one process. Returns the serialized
+  outputs and per-step wall times."""
+  setup_env(car_fingerprint)
+
+  lockstep = Lockstep()
+  fsm = FakeSubMaster(cfg.subs, lockstep, **cfg.sm_kwargs)
+  fpm = FakePubMaster(cfg.pubs)
+  can_sock = FakeSocket(lockstep)
+  args = (fsm, fpm, can_sock) if 'can' in cfg.triggers else (fsm, fpm)
+
+  # decode everything up front, so it isn't part of the step times
+  inputs = []
+  for dat in msgs:
+    which = event_which(dat)
+    if which == 'can' and 'can' in cfg.triggers:
+      inputs.append((which, dat, event_mono_time(dat)))
+    elif which in cfg.subs:
+      msg = event_from_bytes(dat)
+      inputs.append((which, msg, msg.logMonoTime))
+
+  if cfg.init_callback is not None:
+    cfg.init_callback(msgs, fsm, can_sock)
+
+  main = importlib.import_module(cfg.module).main
+
+  def run():
+    try:
+      main(*args)
+    except ReplayFinished:
+      pass
+    except BaseException as e:  # pylint: disable=broad-except
+      lockstep.fail(e)
+
+  thread = threading.Thread(target=run, name=cfg.proc_name, daemon=True)
+  thread.start()
+  try:
+    lockstep.wait_for_idle(thread)
+    fpm.data.clear()
+
+    timings = []
+    for which, msg, mono_time in inputs:
+      if which == 'can':
+        can_sock.data.append(msg)
+      else:
+        fsm.pending.append(msg)
+      fsm.cur_time = mono_time / 1e9
+
+      if which in cfg.triggers:
+        t = time.perf_counter()
+        lockstep.step(thread)
+        timings.append(time.perf_counter() - t)
+  finally:
+    lockstep.finish()
+    thread.join(1.)
+
+  return ReplayResult(fpm.data, timings)
+
+
+if __name__ == "__main__":
+  import argparse
+  from selfdrive.test.process_replay.synthetic import DEFAULT_FINGERPRINT, make_drive
+
+  parser = argparse.ArgumentParser(description="Replay a log through controlsd, radard or plannerd")
+  parser.add_argument("process", choices=list(CONFIGS_BY_NAME))
+  parser.add_argument("log", nargs='?', help="rlog to replay, a synthetic drive by default")
+  parser.add_argument("--fingerprint", default=DEFAULT_FINGERPRINT)
+  args = parser.parse_args()
+
+  if args.log is None:
+    msgs = make_drive()
+  else:
+    from tools.lib.logreader import LogReader
+    msgs = sorted(LogReader(args.log).raw_events(), key=event_mono_time)
+
+  result = replay_process(CONFIGS_BY_NAME[args.process], msgs, args.fingerprint)
+  timings = sorted(result.timings)
+  print(f"{args.process}: {len(result.outputs)} outputs, {len(timings)} steps, "
+        f"p50 {timings[len(timings) // 2] * 1e3:.3f} ms, max {timings[-1] * 1e3:.3f} ms")
+  sys.exit(0)
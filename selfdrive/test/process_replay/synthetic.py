@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""Deterministic synthetic drive, for replaying without a recorded route"""
+import math
+
+from cereal import car, log
+from cereal.services import service_list
+from selfdrive.car.tests.can_generator import CanGenerator
+from selfdrive.modeld.constants import T_IDXS
+
+DEFAULT_FINGERPRINT = "HYUNDAI SONATA 2020"
+
+SERVICES = ["can", "pandaState", "deviceState", "managerState", "liveCalibration", "driverMonitoringState",
+            "modelV2", "radarState", "carState", "controlsState", "longitudinalPlan", "lateralPlan",
+            "liveLocationKalman", "liveParameters", "roadCameraState", "driverCameraState"]
+
+LANE_WIDTH = 3.6
+LEAD_DISTANCE = 35.
+
+
+def _speed(t):
+  return 20. + 2. * math.sin(t / 10.)
+
+
+def _curvature(t):
+  return 0.002 * math.sin(t / 7.)
+
+
+def _xyzt(d, xs, ys, ts):
+  d.x = xs
+  d.y = ys
+  d.z = [0.] * len(xs)
+  d.t = ts
+
+
+def _fill(msg, service, t, frame):
+  v_ego = _speed(t)
+  if service == "pandaState":
+    msg.pandaState.pandaType = log.PandaState.PandaType.uno
+    msg.pandaState.ignitionLine = True
+    msg.pandaState.controlsAllowed = True
+    msg.pandaState.fanSpeedRpm = 5000
+  elif service == "deviceState":
+    msg.deviceState.freeSpacePercent = 80.
+    msg.deviceState.memoryUsagePercent = 30
+    msg.deviceState.batteryPercent = 100
+    msg.deviceState.started = True
+  elif service == "managerState":
+    p = msg.managerState.init("processes", 1)[0]
+    p.name = "controlsd"
+    p.running = True
+  elif service == "liveCalibration":
+    msg.liveCalibration.calStatus = 1
+    msg.liveCalibration.rpyCalib = [0., 0., 0.]
+  elif service == "driverMonitoringState":
+    msg.driverMonitoringState.faceDetected = True
+    msg.driverMonitoringState.isDistracted = False
+    msg.driverMonitoringState.awarenessStatus = 1.
+  elif service == "modelV2":
+    md = msg.modelV2
+    md.frameId = frame
+    curv = _curvature(t)
+    xs = [v_ego * ti for ti in T_IDXS]
+    _xyzt(md.init("position"), xs, [curv * x ** 2 / 2. for x in xs], T_IDXS)
+    md.position.xStd = md.position.yStd = md.position.zStd = [0.1] * len(T_IDXS)
+    _xyzt(md.init("orientation"), [0.] * len(T_IDXS), [0.] * len(T_IDXS), T_IDXS)
+    md.orientation.z = [curv * x for x in xs]
+    md.orientation.xStd = md.orientation.yStd = md.orientation.zStd = [0.01] * len(T_IDXS)
+    _xyzt(md.init("velocity"), [v_ego] * len(T_IDXS), [0.] * len(T_IDXS), T_IDXS)
+    _xyzt(md.init("orientationRate"), [0.] * len(T_IDXS), [0.] * len(T_IDXS), T_IDXS)
+    for lines, offsets in ((md.init("laneLines", 4), (-1.5, -0.5, 0.5, 1.5)), (md.init("roadEdges", 2), (-1.75, 1.75))):
+      for line, offset in zip(lines, offsets):
+        _xyzt(line, xs, [offset * LANE_WIDTH + curv * x ** 2 / 2. for x in xs], T_IDXS)
+    md.laneLineProbs = [0.5, 0.9, 0.9, 0.5]
+    md.laneLineStds = [0.2, 0.1, 0.1, 0.2]
+    md.roadEdgeStds = [0.3, 0.3]
+    leads = md.init("leads", 2)
+    for lead, d in zip(leads, (LEAD_DISTANCE, 2 * LEAD_DISTANCE)):
+      lead.prob = 0.9
+      lead.xyva = [d, 0., v_ego - 1., 0.]
+      lead.xyvaStd = [1., 0.5, 0.5, 0.5]
+    md.meta.engagedProb = 1.
+  elif service == "radarState":
+    msg.radarState.leadOne.status = True
+    msg.radarState.leadOne.dRel = LEAD_DISTANCE
+    msg.radarState.leadOne.vRel = -1.
+    msg.radarState.leadOne.vLead = v_ego - 1.
+    msg.radarState.leadOne.aLeadK = 0.
+    msg.radarState.leadOne.modelProb = 0.9
+  elif service == "carState":
+    msg.carState.vEgo = v_ego
+    msg.carState.vEgoRaw = v_ego
+    msg.carState.aEgo = math.cos(t / 10.) / 5.
+    msg.carState.steeringAngleDeg = math.degrees(_curvature(t) * 2.7 * 15.)
+    msg.carState.gearShifter = car.CarState.GearShifter.drive
+    msg.carState.cruiseState.enabled = True
+    msg.carState.cruiseState.available = True
+    msg.carState.cruiseState.speed = 25.
+    msg.carState.canValid = True
+  elif service == "controlsState":
+    msg.controlsState.enabled = True
+    msg.controlsState.active = True
+    msg.controlsState.vCruise = 90.
+    msg.controlsState.curvature = _curvature(t)
+    msg.controlsState.longControlState = log.ControlsState.LongControlState.pid
+  elif service == "longitudinalPlan":
+    msg.longitudinalPlan.speeds = [v_ego] * 17
+    msg.longitudinalPlan.accels = [0.] * 17
+    msg.longitudinalPlan.hasLead = True
+  elif service == "lateralPlan":
+    msg.lateralPlan.mpcSolutionValid = True
+    msg.lateralPlan.curvatures = [_curvature(t)] * 17
+    msg.lateralPlan.curvatureRates = [0.] * 17
+  elif service == "liveLocationKalman":
+    msg.liveLocationKalman.sensorsOK = True
+    msg.liveLocationKalman.posenetOK = True
+    msg.liveLocationKalman.deviceStable = True
+    msg.liveLocationKalman.inputsOK = True
+    msg.liveLocationKalman.angularVelocityCalibrated.value = [0., 0., v_ego * _curvature(t)]
+    msg.liveLocationKalman.angularVelocityCalibrated.valid = True
+  elif service == "liveParameters":
+    msg.liveParameters.valid = True
+    msg.liveParameters.steerRatio = 13.7
+    msg.liveParameters.stiffnessFactor = 1.
+  elif service in ("roadCameraState", "driverCameraState"):
+    getattr(msg, service).frameId = frame
+
+
+def make_drive(seconds=30, fingerprint=DEFAULT_FINGERPRINT, services=None):
+  """Serialized events of a synthetic drive in logMonoTime order. Contents only depend on the arguments."""
+  services = SERVICES if services is None else services
+  can_gen = CanGenerator(fingerprint)
+  t0 = int(100e9)
+
+  events = []
+  for service in services:
+    freq = service_list[service].frequency
+    for frame in range(int(seconds * freq)):
+      # offset services from each other, so there are no ties in logMonoTime
+      mono_time = t0 + int(frame * 1e9 / freq) + SERVICES.index(service) * 1000
+      if service == "can":
+        events.append((mono_time, can_gen.event(frame, mono_time)))
+        continue
+
+      msg = log.Event.new_message()
+      msg.logMonoTime = mono_time
+      msg.valid = True
+      msg.init(service)
+      _fill(msg, service, (mono_time - t0) / 1e9, frame)
+      events.append((mono_time, msg.to_bytes()))
+
+  events.sort(key=lambda e: e[0])
+  return [dat for _, dat in events]
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+import argparse
+import bz2
+import json
+import os
+import sys
+
+import numpy as np
+
+from selfdrive.test.process_replay.compare_logs import compare_logs, format_diff
+from selfdrive.test.process_replay.process_replay import CONFIGS, replay_process
+from selfdrive.test.process_replay.synthetic import DEFAULT_FINGERPRINT, make_drive
+from tools.lib.logreader import LogReader, event_from_bytes, event_mono_time
+
+PROCESS_REPLAY_DIR = os.path.dirname(os.path.abspath(__file__))
+REF_DIR = os.path.join(PROCESS_REPLAY_DIR, "refs")
+BASELINE_PATH = os.path.join(PROCESS_REPLAY_DIR, "baseline.json")
+
+SYNTHETIC_SEGMENT = "synthetic"
+
+# allowed slowdown of the median step time before it counts as a regression. the p99 of a few
+# hundred steps is a handful of the slowest ones, which moves with whatever else the machine runs
+PERF_TOLERANCE = 0.25
+PERF_STATS = ("p50_ms",)
+PERF_RUNS = 3
+
+
+def step_stats(timings):
+  t = np.array(timings) * 1e3
+  return {
+    "steps": len(t),
+    "mean_ms": float(np.mean(t)),
+    "p50_ms": float(np.percentile(t, 50)),
+    "p99_ms": float(np.percentile(t, 99)),
+    "max_ms": float(np.max(t)),
+  }
+
+
+def median_stats(runs):
+  """Median of every stat over the runs of the same replay"""
+  stats = {k: float(np.median([s[k] for s in runs])) for k in runs[0]}
+  stats["steps"] = runs[0]["steps"]
+  return stats
+
+
+def perf_regressions(stats, baseline, tolerance):
+  """Step time stats that rose past the baseline, as (stat, baseline, current)"""
+  return [(k, baseline[k], stats[k]) for k in PERF_STATS if stats[k] > baseline[k] * (1 + tolerance)]
+
+
+def ref_path(ref_dir, segment, proc_name):
+  return os.path.join(ref_dir, f"{segment}_{proc_name}.bz2")
+
+
+def save_outputs(fn, outputs):
+  os.makedirs(os.path.dirname(fn), exist_ok=True)
+  with open(fn, "wb") as f:
+    f.write(bz2.compress(b"".join(outputs)))
+
+
+def load_segments(logs):
+  if not logs:
+    return {SYNTHETIC_SEGMENT: make_drive()}
+  # replay in log time, like the processes received it on the device
+  return {os.path.basename(os.path.dirname(os.path.abspath(fn))) or fn: sorted(LogReader(fn).raw_events(), key=event_mono_time)
+          for fn in logs}
+
+
+def print_stats(all_stats, baseline):
+  print(f"{'segment':24s} {'process':10s} {'steps':>6s} {'mean':>8s} {'p50':>8s} {'p99':>8s} {'max':>8s} {'base p50':>9s}")
+  for segment, procs in all_stats.items():
+    for proc_name, s in procs.items():
+      base = baseline.get(segment, {}).get(proc_name)
+      base_p50 = f"{base['p50_ms']:9.3f}" if base is not None else f"{'-':>9s}"
+      print(f"{segment:24s} {proc_name:10s} {s['steps']:6d} {s['mean_ms']:8.3f} {s['p50_ms']:8.3f} {s['p99_ms']:8.3f} "
+            f"{s['max_ms']:8.3f} {base_p50}")
+  print("(step times in ms)")
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Regression test and benchmark of the control processes, by replaying logs through them")
+  parser.add_argument("--logs", nargs="*", help="rlogs to replay, a synthetic drive by default")
+  parser.add_argument("--fingerprint", default=DEFAULT_FINGERPRINT)
+  parser.add_argument("--whitelist-procs", type=str, nargs="*", default=[])
+  parser.add_argument("--blacklist-procs", type=str, nargs="*", default=[])
+  parser.add_argument("--ref-dir", default=REF_DIR)
+  parser.add_argument("--update-refs", action="store_true", help="store the outputs as the new references")
+  parser.add_argument("--check-determinism", action="store_true", help="replay every process twice and compare the runs")
+  parser.add_argument("--baseline", default=BASELINE_PATH)
+  parser.add_argument("--update-baseline", action="store_true", help="store the step times as the new perf baseline")
+  parser.add_argument("--no-perf", action="store_true", help="don't fail on step time regressions")
+  parser.add_argument("--tolerance", type=float, default=PERF_TOLERANCE)
+  parser.add_argument("--runs", type=int, default=PERF_RUNS, help="replay every process this many times, the step times are the median")
+  args = parser.parse_args()
+
+  configs = [cfg for cfg in CONFIGS if (not args.whitelist_procs or cfg.proc_name in args.whitelist_procs) and
+             cfg.proc_name not in args.blacklist_procs]
+
+  baseline = {}
+  if os.path.isfile(args.baseline):
+    with open(args.baseline) as f:
+      baseline = json.load(f)
+
+  results = {}
+  all_stats = {}
+  perf_failures = []
+  for segment, msgs in load_segments(args.logs).items():
+    results[segment] = {}
+    all_stats[segment] = {}
+    for cfg in configs:
+      print(f"replaying {cfg.proc_name} on {segment}")
+      try:
+        outputs, timings = replay_process(cfg, msgs, args.fingerprint)
+        runs = [step_stats(timings)] + [step_stats(replay_process(cfg, msgs, args.fingerprint).timings)
+                                        for _ in range(args.runs - 1)]
+      except Exception as e:
+        results[segment][cfg.proc_name] = f"replay failed: {e!r}"
+        continue
+
+      stats = all_stats[segment][cfg.proc_name] = median_stats(runs)
+      base = baseline.get(segment, {}).get(cfg.proc_name)
+      if base is not None:
+        perf_failures += [(segment, cfg.proc_name, *r) for r in perf_regressions(stats, base, args.tolerance)]
+      elif not args.update_baseline:
+        # without a baseline the step times aren't checked, which fails like missing refs
+        perf_failures.append((segment, cfg.proc_name, None, None, None))
+
+      log_msgs = [event_from_bytes(dat) for dat in outputs]
+      if args.check_determinism:
+        rerun = [event_from_bytes(dat) for dat in replay_process(cfg, msgs, args.fingerprint).outputs]
+        try:
+          diff = compare_logs(log_msgs, rerun, cfg.ignore, tolerance=0.)
+        except Exception as e:
+          diff = str(e)
+        if len(diff):
+          results[segment][f"{cfg.proc_name} (determinism)"] = diff
+
+      fn = ref_path(args.ref_dir, segment, cfg.proc_name)
+      if args.update_refs:
+        save_outputs(fn, outputs)
+        results[segment][cfg.proc_name] = []
+      elif not os.path.isfile(fn):
+        results[segment][cfg.proc_name] = f"no reference outputs at {fn}, run with --update-refs"
+      else:
+        try:
+          results[segment][cfg.proc_name] = compare_logs(list(LogReader(fn)), log_msgs, cfg.ignore, tolerance=cfg.tolerance)
+        except Exception as e:
+          results[segment][cfg.proc_name] = str(e)
+
+  diff1, diff2, failed = format_diff(results, args.ref_dir)
+  with open(os.path.join(PROCESS_REPLAY_DIR, "diff.txt"), "w") as f:
+    f.write(diff2)
+  print(diff1)
+
+  print_stats(all_stats, baseline)
+  if args.update_baseline:
+    for segment, procs in all_stats.items():
+      baseline.setdefault(segment, {}).update(procs)
+    with open(args.baseline, "w") as f:
+      json.dump(baseline, f, indent=2, sort_keys=True)
+    print(f"baseline updated: {args.baseline}")
+  elif len(perf_failures):
+    print(f"\nstep time regressions, more than {args.tolerance:.0%} over baseline (median of {args.runs} runs):")
+    for segment, proc_name, stat, base, cur in perf_failures:
+      if stat is None:
+        print(f"  {segment} {proc_name}: no baseline in {args.baseline}, run with --update-baseline")
+      else:
+        print(f"  {segment} {proc_name} {stat}: {base:.3f} -> {cur:.3f}")
+    failed = failed or not args.no_perf
+
+  if failed:
+    print("TEST FAILED")
+    print("\n\nTo update the reference outputs, run with --update-refs")
+  else:
+    print("TEST SUCCEEDED")
+  sys.exit(int(failed))
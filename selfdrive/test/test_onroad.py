@@ -13,78 +13,45 @@ from cereal.services import service_list
 from common.basedir import BASEDIR
 from common.timeout import Timeout
 from common.params import Params
-from selfdrive.hardware import TICI
 from selfdrive.loggerd.config import ROOT
+from selfdrive.manager.process_config import managed_processes
 from selfdrive.test.helpers import set_params_enabled
 from tools.lib.logreader import LogReader
 
-# Baseline CPU usage by process
-PROCS = {
-  "selfdrive.controls.controlsd": 50.0,
-  "./loggerd": 45.0,
-  "./locationd": 9.1,
-  "selfdrive.controls.plannerd": 20.0,
-  "./_ui": 15.0,
-  "selfdrive.locationd.paramsd": 9.1,
-  "./camerad": 7.07,
-  "./_sensord": 6.17,
-  "selfdrive.controls.radard": 5.67,
-  "./_modeld": 4.48,
-  "./boardd": 3.63,
-  "./_dmonitoringmodeld": 2.67,
-  "selfdrive.thermald.thermald": 2.41,
-  "selfdrive.locationd.calibrationd": 2.0,
-  "./_soundd": 2.0,
-  "selfdrive.monitoring.dmonitoringd": 1.90,
-  "./proclogd": 1.54,
-  "selfdrive.logmessaged": 0.2,
-  "./clocksd": 0.02,
-  "./ubloxd": 0.02,
-  "selfdrive.tombstoned": 0,
-  "./logcatd": 0,
-}
-
-if TICI:
-  PROCS.update({
-    "./loggerd": 60.0,
-    "selfdrive.controls.controlsd": 26.0,
-    "./camerad": 25.0,
-    "./_ui": 21.0,
-    "selfdrive.controls.plannerd": 12.0,
-    "selfdrive.locationd.paramsd": 5.0,
-    "./_dmonitoringmodeld": 10.0,
-    "selfdrive.thermald.thermald": 1.5,
-  })
+# Baseline CPU usage by managed process, the CPU budgets in process_config
+PROCS = {p.name: p.budget.cpu for p in managed_processes.values() if p.budget is not None and p.budget.cpu is not None}
 
 
 def cputime_total(ct):
-  return ct.cpuUser + ct.cpuSystem + ct.cpuChildrenUser + ct.cpuChildrenSystem
+  return ct.cpuUser + ct.cpuSystem
 
 
-def check_cpu_usage(first_proc, last_proc):
+def check_cpu_usage(first_stats, last_stats):
   result =  "------------------------------------------------\n"
   result += "------------------ CPU Usage -------------------\n"
   result += "------------------------------------------------\n"
 
   r = True
-  dt = (last_proc.logMonoTime - first_proc.logMonoTime) / 1e9
+  dt = (last_stats.logMonoTime - first_stats.logMonoTime) / 1e9
+  first_procs = {p.name: p for p in first_stats.procStats.procs}
+  last_procs = {p.name: p for p in last_stats.procStats.procs}
   for proc_name, normal_cpu_usage in PROCS.items():
-    first, last = None, None
-    try:
-      first = [p for p in first_proc.procLog.procs if proc_name in p.cmdline][0]
-      last = [p for p in last_proc.procLog.procs if proc_name in p.cmdline][0]
-      cpu_time = cputime_total(last) - cputime_total(first)
-      cpu_usage = cpu_time / dt * 100.
-      if cpu_usage > max(normal_cpu_usage * 1.1, normal_cpu_usage + 5.0):
-        result += f"Warning {proc_name} using more CPU than normal\n"
-        r = False
-      elif cpu_usage < min(normal_cpu_usage * 0.65, max(normal_cpu_usage - 1.0, 0.0)):
-        result += f"Warning {proc_name} using less CPU than normal\n"
-        r = False
-      result += f"{proc_name.ljust(35)}  {cpu_usage:.2f}%\n"
-    except IndexError:
+    first, last = first_procs.get(proc_name), last_procs.get(proc_name)
+    if first is None or last is None or first.pid != last.pid:
       result += f"{proc_name.ljust(35)}  NO METRICS FOUND {first=} {last=}\n"
       r = False
+      continue
+
+    cpu_usage = (cputime_total(last) - cputime_total(first)) / dt * 100.
+    run_delay = max(last.runDelay - first.runDelay, 0.) / dt * 100.
+    switches = max(last.involuntarySwitches - first.involuntarySwitches, 0) / dt
+    if cpu_usage > max(normal_cpu_usage * 1.1, normal_cpu_usage + 5.0):
+      result += f"Warning {proc_name} using more CPU than normal\n"
+      r = False
+    elif cpu_usage < min(normal_cpu_usage * 0.65, max(normal_cpu_usage - 1.0, 0.0)):
+      result += f"Warning {proc_name} using less CPU than normal\n"
+      r = False
+    result += f"{proc_name.ljust(35)}  {cpu_usage:6.2f}%  run delay {run_delay:6.2f}%  {switches:6.0f} involuntary switches/s\n"
   result += "------------------------------------------------\n"
   print(result)
   return r
@@ -147,9 +114,9 @@ class TestOnroad(unittest.TestCase):
     self.assertEqual(len(big_logs), 0, f"Log spam: {big_logs}")
 
   def test_cpu_usage(self):
-    proclogs = [m for m in self.lr if m.which() == 'procLog']
-    self.assertGreater(len(proclogs), service_list['procLog'].frequency * 45, "insufficient samples")
-    cpu_ok = check_cpu_usage(proclogs[0], proclogs[-1])
+    procstats = [m for m in self.lr if m.which() == 'procStats']
+    self.assertGreater(len(procstats), service_list['procStats'].frequency * 45, "insufficient samples")
+    cpu_ok = check_cpu_usage(procstats[0], procstats[-1])
     self.assertTrue(cpu_ok)
 
   def test_model_timings(self):
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+import os
+import subprocess
+import sys
+import time
+import unittest
+from unittest import mock
+
+from selfdrive import procstatsd
+from selfdrive.procstatsd import ProcStats, ThreadFiles
+
+# a busy main thread, and a thread that starts and exits every 0.1 s
+CHILD = """
+import threading, time
+def spin(t):
+  end = time.monotonic() + t
+  while time.monotonic() < end:
+    pass
+threading.Thread(target=time.sleep, args=(1e6,), daemon=True).start()
+while True:
+  t = threading.Thread(target=spin, args=(0.01,))
+  t.start()
+  t.join()
+  spin(0.09)
+"""
+
+
+class TestProcStats(unittest.TestCase):
+  def setUp(self):
+    self.child = subprocess.Popen([sys.executable, "-c", CHILD])
+    self.addCleanup(self.child.wait)
+    self.addCleanup(self.child.kill)
+    time.sleep(0.5)
+
+  def test_update(self):
+    stats = ProcStats()
+    stats.set_processes({"child": self.child.pid})
+    first = stats.update()[0]
+    self.assertEqual(first["pid"], self.child.pid)
+    self.assertNotIn("cpuUsagePercent", first)
+
+    for _ in range(5):
+      time.sleep(0.2)
+      p = stats.update()[0]
+    self.assertIn(p["numThreads"], (2, 3))
+    self.assertGreater(p["cpuUser"] + p["cpuSystem"], first["cpuUser"] + first["cpuSystem"])
+    self.assertGreater(p["cpuUsagePercent"], 50.)
+    self.assertGreaterEqual(p["runDelay"], 0.)
+    self.assertGreaterEqual(p["involuntarySwitches"], first["involuntarySwitches"])
+    # every file of the threads that exited is closed
+    self.assertLessEqual(len(stats.accounts["child"].threads), 3)
+
+  def test_processes(self):
+    stats = ProcStats()
+    stats.set_processes({"child": self.child.pid, "missing": 2**22 + 1})
+    self.assertEqual(list(stats.accounts), ["child"])
+
+    self.child.kill()
+    self.child.wait()
+    self.assertEqual(stats.update(), [])
+    self.assertEqual(stats.accounts, {})
+
+  def test_thread_exited(self):
+    # the thread is gone between opening its schedstat and its status
+    opened = []
+    real_open = os.open
+    def fake_open(path, flags):
+      if path.endswith("/status"):
+        raise FileNotFoundError(path)
+      opened.append(real_open(path, flags))
+      return opened[-1]
+
+    with mock.patch.object(procstatsd.os, "open", side_effect=fake_open), \
+         mock.patch.object(procstatsd.os, "close", wraps=os.close) as close:
+      with self.assertRaises(FileNotFoundError):
+        ThreadFiles(self.child.pid, self.child.pid)
+    self.assertEqual(len(opened), 1)
+    close.assert_called_once_with(opened[0])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+import os
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+from parameterized import parameterized
+
+from selfdrive.version import CACHE_FILE, get_git_metadata, read_git_metadata
+
+ORIGIN = "https://github.com/commaai/openpilot.git"
+
+
+def git(cwd, *args):
+  return subprocess.check_output(["git", "-c", "user.name=test", "-c", "user.email=test@test",
+                                  "-c", "init.defaultBranch=master", *args], cwd=cwd, encoding="utf8").strip()
+
+
+class TestVersion(unittest.TestCase):
+  def setUp(self):
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+
+    # an upstream with devel and a clone tracking it
+    upstream = os.path.join(tmp.name, "upstream")
+    os.mkdir(upstream)
+    git(upstream, "init", "-q")
+    with open(os.path.join(upstream, "README"), "w") as f:
+      f.write("openpilot\n")
+    git(upstream, "add", "README")
+    git(upstream, "commit", "-q", "-m", "init")
+    git(upstream, "branch", "devel")
+
+    self.path = os.path.join(tmp.name, "openpilot")
+    git(tmp.name, "clone", "-q", "-b", "devel", upstream, self.path)
+    git(self.path, "remote", "set-url", "origin", ORIGIN)
+
+  def git_metadata(self):
+    return {
+      "origin": git(self.path, "config", "remote.origin.url"),
+      "branch": git(self.path, "rev-parse", "--abbrev-ref", "--symbolic-full-name", "@{u}"),
+      "short_branch": git(self.path, "rev-parse", "--abbrev-ref", "HEAD"),
+      "commit": git(self.path, "rev-parse", "HEAD"),
+    }
+
+  @parameterized.expand([("loose",), ("packed",)])
+  def test_read_git_metadata(self, refs):
+    if refs == "packed":
+      git(self.path, "pack-refs", "--all")
+      self.assertFalse(os.path.exists(os.path.join(self.path, ".git", "refs", "heads", "devel")))
+    self.assertEqual(read_git_metadata(self.path), self.git_metadata())
+
+  def test_read_git_metadata_detached(self):
+    git(self.path, "checkout", "-q", "--detach")
+    meta = read_git_metadata(self.path)
+    self.assertEqual((meta["short_branch"], meta["branch"]), ("HEAD", None))
+    self.assertEqual(meta["commit"], git(self.path, "rev-parse", "HEAD"))
+    self.assertEqual(meta["origin"], ORIGIN)
+
+  def test_cache(self):
+    meta = get_git_metadata(self.path)
+    self.assertEqual(meta, {**self.git_metadata(), "dirty": False})
+    self.assertTrue(os.path.isfile(os.path.join(self.path, ".git", CACHE_FILE)))
+
+    # read from the cache without running git
+    with mock.patch("subprocess.check_output", side_effect=AssertionError), \
+         mock.patch("subprocess.call", side_effect=AssertionError):
+      self.assertEqual(get_git_metadata(self.path), meta)
+
+    # a new commit isn't clean anymore on master
+    git(self.path, "checkout", "-q", "-b", "master")
+    git(self.path, "commit", "-q", "--allow-empty", "-m", "local")
+    meta = get_git_metadata(self.path)
+    self.assertEqual(meta["commit"], git(self.path, "rev-parse", "HEAD"))
+    self.assertEqual((meta["short_branch"], meta["branch"], meta["dirty"]), ("master", None, True))
+
+  def test_refresh(self):
+    self.assertFalse(get_git_metadata(self.path)["dirty"])
+
+    # edits without touching the index are only seen on refresh, like build.py does
+    with open(os.path.join(self.path, "README"), "a") as f:
+      f.write("modified\n")
+    self.assertTrue(get_git_metadata(self.path, refresh=True)["dirty"])
+    self.assertTrue(get_git_metadata(self.path)["dirty"])
+
+  def test_no_git(self):
+    with mock.patch("subprocess.check_output", side_effect=FileNotFoundError), \
+         mock.patch("subprocess.call", side_effect=FileNotFoundError):
+      meta = get_git_metadata(self.path)
+    self.assertEqual(meta, {**self.git_metadata(), "dirty": True})
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -38,6 +38,7 @@ from common.basedir import BASEDIR
 from common.params import Params
 from selfdrive.hardware import EON, TICI, HARDWARE
 from selfdrive.swaglog import cloudlog
+from selfdrive.version import get_git_metadata
 from selfdrive.controls.lib.alertmanager import set_offroad_alert
 
 LOCK_FILE = os.getenv("UPDATER_LOCK_FILE", "/tmp/safe_staging_overlay.lock")
@@ -216,6 +217,9 @@ def finalize_update() -> None:
     shutil.rmtree(FINALIZED)
   shutil.copytree(OVERLAY_MERGED, FINALIZED, symlinks=True)
 
+  # cache the git metadata, so the processes don't run git after the update is swapped in
+  get_git_metadata(FINALIZED, refresh=True)
+
   set_consistent_flag(True)
   cloudlog.info("done finalizing overlay")
 
@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
+import json
 import os
 import subprocess
-from typing import List, Optional
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
 
 from common.basedir import BASEDIR
 from selfdrive.swaglog import cloudlog
@@ -9,37 +11,42 @@ from selfdrive.swaglog import cloudlog
 
 TESTED_BRANCHES = ['devel', 'release2-staging', 'release3-staging', 'dashcam-staging', 'release2', 'release3', 'dashcam']
 
+# the git metadata of a checkout, written into its .git dir by the first process that
+# imports this module after an update (updated.py) or a build (build.py) and read by the others
+CACHE_FILE = "openpilot_version.json"
+CACHE_VERSION = 1
 
-def run_cmd(cmd: List[str]) -> str:
-    return subprocess.check_output(cmd, encoding='utf8').strip()
 
+def run_cmd(cmd: List[str], cwd: Optional[str] = None) -> str:
+    return subprocess.check_output(cmd, encoding='utf8', cwd=cwd).strip()
 
-def run_cmd_default(cmd: List[str], default: Optional[str] = None) -> Optional[str]:
+
+def run_cmd_default(cmd: List[str], default: Optional[str] = None, cwd: Optional[str] = None) -> Optional[str]:
   try:
-    return run_cmd(cmd)
+    return run_cmd(cmd, cwd=cwd)
   except subprocess.CalledProcessError:
     return default
 
 
-def get_git_commit(branch: str = "HEAD", default: Optional[str] = None) -> Optional[str]:
-  return run_cmd_default(["git", "rev-parse", branch], default=default)
+def get_git_commit(branch: str = "HEAD", default: Optional[str] = None, cwd: Optional[str] = None) -> Optional[str]:
+  return run_cmd_default(["git", "rev-parse", branch], default=default, cwd=cwd)
 
 
-def get_git_branch(default: Optional[str] = None) -> Optional[str]:
-  return run_cmd_default(["git", "rev-parse", "--abbrev-ref", "HEAD"], default=default)
+def get_git_branch(default: Optional[str] = None, cwd: Optional[str] = None) -> Optional[str]:
+  return run_cmd_default(["git", "rev-parse", "--abbrev-ref", "HEAD"], default=default, cwd=cwd)
 
 
-def get_git_full_branchname(default: Optional[str] = None) -> Optional[str]:
-  return run_cmd_default(["git", "rev-parse", "--abbrev-ref", "--symbolic-full-name", "@{u}"], default=default)
+def get_git_full_branchname(default: Optional[str] = None, cwd: Optional[str] = None) -> Optional[str]:
+  return run_cmd_default(["git", "rev-parse", "--abbrev-ref", "--symbolic-full-name", "@{u}"], default=default, cwd=cwd)
 
 
-def get_git_remote(default: Optional[str] = None) -> Optional[str]:
+def get_git_remote(default: Optional[str] = None, cwd: Optional[str] = None) -> Optional[str]:
   try:
-    local_branch = run_cmd(["git", "name-rev", "--name-only", "HEAD"])
-    tracking_remote = run_cmd(["git", "config", "branch." + local_branch + ".remote"])
-    return run_cmd(["git", "config", "remote." + tracking_remote + ".url"])
+    local_branch = run_cmd(["git", "name-rev", "--name-only", "HEAD"], cwd=cwd)
+    tracking_remote = run_cmd(["git", "config", "branch." + local_branch + ".remote"], cwd=cwd)
+    return run_cmd(["git", "config", "remote." + tracking_remote + ".url"], cwd=cwd)
   except subprocess.CalledProcessError:  # Not on a branch, fallback
-    return run_cmd_default(["git", "config", "--get", "remote.origin.url"], default=default)
+    return run_cmd_default(["git", "config", "--get", "remote.origin.url"], default=default, cwd=cwd)
 
 
 def get_version():
@@ -47,50 +54,229 @@ def get_version():
     version = _versionf.read().split('"')[1]
   return version
 
-version = get_version()
-prebuilt = os.path.exists(os.path.join(BASEDIR, 'prebuilt'))
 
-training_version: bytes = b"0.2.0"
-terms_version: bytes = b"2"
-
-dirty: bool = True
-comma_remote: bool = False
-tested_branch: bool = False
-origin = get_git_remote()
-branch = get_git_full_branchname()
-commit = get_git_commit()
+# *** reading .git without forking git ***
 
-if (origin is not None) and (branch is not None):
+def _read(path: str) -> Optional[str]:
   try:
-    comma_remote = origin.startswith('git@github.com:commaai') or origin.startswith('https://github.com/commaai')
-    tested_branch = get_git_branch() in TESTED_BRANCHES
+    with open(path) as f:
+      return f.read().strip()
+  except OSError:
+    return None
+
+
+def get_git_dir(path: str = BASEDIR) -> Optional[str]:
+  git_dir = os.path.join(path, ".git")
+  if os.path.isdir(git_dir):
+    return git_dir
+
+  # worktrees and submodules have a .git file pointing to the git dir
+  link = _read(git_dir)
+  if link is not None and link.startswith("gitdir:"):
+    return os.path.normpath(os.path.join(path, link[len("gitdir:"):].strip()))
+  return None
+
+
+def _common_dir(git_dir: str) -> str:
+  # refs other than HEAD and the config of a worktree are in the main git dir
+  common = _read(os.path.join(git_dir, "commondir"))
+  return git_dir if common is None else os.path.normpath(os.path.join(git_dir, common))
+
+
+def read_git_ref(git_dir: str, ref: str) -> Optional[str]:
+  """The commit of a full ref name like refs/heads/master, loose or packed"""
+  commit = _read(os.path.join(_common_dir(git_dir), ref))
+  if commit is not None:
+    return commit
+
+  packed = _read(os.path.join(_common_dir(git_dir), "packed-refs")) or ""
+  for line in packed.splitlines():
+    if line.startswith(("#", "^")):
+      continue
+    sha, _, name = line.partition(" ")
+    if name == ref:
+      return sha
+  return None
+
+
+def read_git_head(git_dir: str) -> Tuple[Optional[str], Optional[str]]:
+  """(ref, commit) of HEAD, the ref is None on a detached HEAD"""
+  head = _read(os.path.join(git_dir, "HEAD"))
+  if head is None:
+    return None, None
+  if head.startswith("ref:"):
+    ref = head[len("ref:"):].strip()
+    return ref, read_git_ref(git_dir, ref)
+  return None, head
+
+
+def read_git_config(git_dir: str) -> Dict[str, str]:
+  """{'section.subsection.key': value} like git config --list, without includes"""
+  config: Dict[str, str] = {}
+  section = ""
+  for line in (_read(os.path.join(_common_dir(git_dir), "config")) or "").splitlines():
+    line = line.strip()
+    if not line or line.startswith(("#", ";")):
+      continue
+    if line.startswith("["):
+      name, _, sub = line.strip("[]").partition(" ")
+      section = name.lower() + ("." + sub.strip().strip('"') if sub else "")
+    elif section:
+      key, _, value = line.partition("=")
+      config[f"{section}.{key.strip().lower()}"] = value.strip().strip('"') if value else "true"
+  return config
+
+
+def read_git_metadata(path: str = BASEDIR) -> Dict[str, Optional[str]]:
+  """origin, branch, short_branch and commit of the checkout at path like the get_git_* functions
+  return them, read from .git directly"""
+  ret: Dict[str, Optional[str]] = {"origin": None, "branch": None, "short_branch": None, "commit": None}
+  git_dir = get_git_dir(path)
+  if git_dir is None:
+    return ret
+
+  ref, ret["commit"] = read_git_head(git_dir)
+  config = read_git_config(git_dir)
+  local_branch = None
+  if ref is None:
+    ret["short_branch"] = "HEAD"
+  elif ref.startswith("refs/heads/"):
+    local_branch = ret["short_branch"] = ref[len("refs/heads/"):]
+
+  remote = config.get(f"branch.{local_branch}.remote")
+  merge = config.get(f"branch.{local_branch}.merge")
+  if remote is not None and merge is not None and merge.startswith("refs/heads/"):
+    ret["branch"] = merge[len("refs/heads/"):] if remote == "." else f"{remote}/{merge[len('refs/heads/'):]}"
+
+  ret["origin"] = config.get(f"remote.{remote}.url", config.get("remote.origin.url"))
+  return ret
+
+
+# *** metadata ***
+
+def _comma_remote(origin: Optional[str]) -> bool:
+  return origin is not None and (origin.startswith('git@github.com:commaai') or origin.startswith('https://github.com/commaai'))
+
 
-    dirty = False
+def _dirty(path: str, prebuilt: bool, origin: Optional[str], branch: Optional[str], commit: Optional[str], git: bool) -> bool:
+  if origin is None or branch is None:
+    return True
 
-    # Actually check dirty files
-    if not prebuilt:
-      # This is needed otherwise touched files might show up as modified
+  comma_remote = _comma_remote(origin)
+  dirty = False
+
+  # Actually check dirty files
+  if not prebuilt:
+    if not git:
+      return True
+
+    # This is needed otherwise touched files might show up as modified
+    try:
+      subprocess.check_call(["git", "update-index", "--refresh"], cwd=path)
+    except subprocess.CalledProcessError:
+      pass
+    dirty = (subprocess.call(["git", "diff-index", "--quiet", branch, "--"], cwd=path) != 0)
+
+    # Log dirty files
+    if dirty and comma_remote:
       try:
-        subprocess.check_call(["git", "update-index", "--refresh"])
+        dirty_files = run_cmd(["git", "diff-index", branch, "--"], cwd=path)
+        cloudlog.event("dirty comma branch", version=version, dirty=dirty, origin=origin, branch=branch,
+                       dirty_files=dirty_files, commit=commit, origin_commit=get_git_commit(branch, cwd=path))
       except subprocess.CalledProcessError:
         pass
-      dirty = (subprocess.call(["git", "diff-index", "--quiet", branch, "--"]) != 0)
 
-      # Log dirty files
-      if dirty and comma_remote:
-        try:
-          dirty_files = run_cmd(["git", "diff-index", branch, "--"])
-          cloudlog.event("dirty comma branch", version=version, dirty=dirty, origin=origin, branch=branch,
-                         dirty_files=dirty_files, commit=commit, origin_commit=get_git_commit(branch))
-        except subprocess.CalledProcessError:
-          pass
+  dirty = dirty or (not comma_remote)
+  dirty = dirty or ('master' in branch)
+  return dirty
 
-    dirty = dirty or (not comma_remote)
-    dirty = dirty or ('master' in branch)
 
-  except subprocess.CalledProcessError:
-    dirty = True
+def _compute_git_metadata(path: str) -> Dict[str, Any]:
+  prebuilt = os.path.exists(os.path.join(path, 'prebuilt'))
+  try:
+    meta: Dict[str, Any] = {
+      "origin": get_git_remote(cwd=path),
+      "branch": get_git_full_branchname(cwd=path),
+      "short_branch": get_git_branch(cwd=path),
+      "commit": get_git_commit(cwd=path),
+    }
+    git = True
+  except OSError:
+    # no git binary, the dirty files can't be checked
+    meta = read_git_metadata(path)
+    git = False
+
+  try:
+    meta["dirty"] = _dirty(path, prebuilt, meta["origin"], meta["branch"], meta["commit"], git)
+  except (subprocess.CalledProcessError, OSError):
+    meta["dirty"] = True
     cloudlog.exception("git subprocess failed while checking dirty")
+  return meta
+
+
+def _cache_key(path: str, git_dir: str) -> List[Any]:
+  # what the cached metadata depends on: commit and branch, the remotes in the config,
+  # the files checked in the index and whether this is a prebuilt release
+  key: List[Any] = [CACHE_VERSION, list(read_git_head(git_dir)), os.path.exists(os.path.join(path, 'prebuilt'))]
+  for fn in [os.path.join(git_dir, "index"), os.path.join(_common_dir(git_dir), "config")]:
+    try:
+      st = os.stat(fn)
+      key.append([st.st_mtime_ns, st.st_size])
+    except OSError:
+      key.append(None)
+  return key
+
+
+def _load_cache(git_dir: str) -> Optional[Dict[str, Any]]:
+  try:
+    with open(os.path.join(git_dir, CACHE_FILE)) as f:
+      return json.load(f)
+  except (OSError, ValueError):
+    return None
+
+
+def _save_cache(git_dir: str, cache: Dict[str, Any]) -> None:
+  # atomic, another process might be loading it
+  try:
+    with tempfile.NamedTemporaryFile("w", dir=git_dir, prefix="." + CACHE_FILE, delete=False) as f:
+      json.dump(cache, f)
+    os.replace(f.name, os.path.join(git_dir, CACHE_FILE))
+  except OSError:
+    pass  # read-only, computed every time
+
+
+def get_git_metadata(path: str = BASEDIR, refresh: bool = False) -> Dict[str, Any]:
+  """origin, branch, short_branch, commit and dirty of the checkout at path. Computed with git and
+  cached in its .git dir until the commit, the index or the config changes, unless refresh"""
+  git_dir = get_git_dir(path)
+  if git_dir is None:
+    return {"origin": None, "branch": None, "short_branch": None, "commit": None, "dirty": True}
+
+  if not refresh:
+    cache = _load_cache(git_dir)
+    if cache is not None and cache.get("key") == _cache_key(path, git_dir):
+      return cache["metadata"]
+
+  meta = _compute_git_metadata(path)
+  # after git update-index, which might have rewritten the index
+  _save_cache(git_dir, {"key": _cache_key(path, git_dir), "metadata": meta})
+  return meta
+
+
+version = get_version()
+prebuilt = os.path.exists(os.path.join(BASEDIR, 'prebuilt'))
+
+training_version: bytes = b"0.2.0"
+terms_version: bytes = b"2"
+
+_metadata = get_git_metadata()
+origin: Optional[str] = _metadata["origin"]
+branch: Optional[str] = _metadata["branch"]
+short_branch: Optional[str] = _metadata["short_branch"]
+commit: Optional[str] = _metadata["commit"]
+dirty: bool = _metadata["dirty"]
+comma_remote: bool = branch is not None and _comma_remote(origin)
+tested_branch: bool = branch is not None and origin is not None and short_branch in TESTED_BRANCHES
 
 
 if __name__ == "__main__":
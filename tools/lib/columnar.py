@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""Columnar export of log services for analytics.
+
+Every exported service becomes a directory of typed column files, one raw
+little-endian array per column (<column>.bin), plus schema.json with the
+dtypes, enum names and row count. Columns are derived from the capnp
+schema: every bool, number and enum field, with nested structs flattened
+into dotted names. Lists, text, data and union members are skipped. List
+services (can, sendcan) get one row per element.
+
+Rows are buffered and appended to the files in chunks, so memory use is
+bounded. Values are read straight from the message bytes: per row only the
+struct pointers are followed in python, the fields of a chunk are gathered
+with numpy. read_columns() memory maps the files for vectorized queries."""
+import argparse
+import json
+import os
+import struct
+from collections import namedtuple
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from cereal import log as capnp_log
+from tools.lib.logreader import LogReader, event_which
+
+DEFAULT_SERVICES = ["carState", "controlsState", "radarState", "can"]
+CHUNK_ROWS = 10000  # rows buffered per service before they are written out
+MAX_DEPTH = 3  # nesting depth of flattened structs
+CAN_DATA_SIZE = 8  # bytes stored per CAN frame, longer frames are truncated (see datLength)
+
+_CAPNP_DTYPES = {
+  "bool": np.bool_,
+  "int8": np.int8,
+  "int16": np.int16,
+  "int32": np.int32,
+  "int64": np.int64,
+  "uint8": np.uint8,
+  "uint16": np.uint16,
+  "uint32": np.uint32,
+  "uint64": np.uint64,
+  "float32": np.float32,
+  "float64": np.float64,
+  "enum": np.uint16,
+}
+
+_EVENT_FIELDS = ["logMonoTime", "valid"]
+
+# path: capnp field path in the service struct (or list element), None for fields of the event itself
+Column = namedtuple('Column', ['name', 'dtype', 'path', 'enum'])
+
+# Where the value of a column is in the message: struct is an index into
+# _Layout.structs, offset the byte offset in its data section (bit offset
+# for bools). Values are stored XORed with the field default.
+_Field = namedtuple('_Field', ['column', 'struct', 'offset', 'default'])
+
+_POINTER = struct.Struct("<iI")
+_U32_PAIR = struct.Struct("<II")
+
+
+def _service_schema(service: str):
+  """Returns the struct schema of a service and whether it's a list of them"""
+  if service not in capnp_log.Event.schema.fields:
+    raise ValueError(f"unknown service: {service}")
+  field = capnp_log.Event.schema.fields[service]
+  kind = field.proto.slot.type.which()
+  if kind == "struct":
+    return field.schema, False
+  if kind == "list" and field.proto.slot.type.list.elementType.which() == "struct":
+    return field.schema.elementType, True
+  raise ValueError(f"service {service} is not a struct or a list of structs")
+
+
+def _default_bits(proto, dtype: np.dtype) -> int:
+  value = proto.slot.defaultValue
+  value = getattr(value, value.which())
+  if dtype == np.bool_:
+    return int(value)
+  return int(np.array(value, dtype=dtype).view(f"u{dtype.itemsize}"))
+
+
+def _struct_fields(schema, prefix: str, depth: int, struct_idx: int, structs: List[tuple], fields: List[_Field], names=None):
+  """Appends the columns of schema to fields, nested structs are appended to structs as (parent, pointer index)"""
+  for name, field in schema.fields.items():
+    proto = field.proto
+    if proto.discriminantValue != 0xffff or name.endswith("DEPRECATED") or (names is not None and name not in names):
+      continue
+
+    path = prefix + name
+    if proto.which() == "group":
+      # groups live in the sections of the parent struct
+      if depth < MAX_DEPTH:
+        _struct_fields(field.schema, path + ".", depth + 1, struct_idx, structs, fields)
+      continue
+
+    kind = proto.slot.type.which()
+    if kind == "struct":
+      if depth < MAX_DEPTH:
+        structs.append((struct_idx, proto.slot.offset))
+        _struct_fields(field.schema, path + ".", depth + 1, len(structs) - 1, structs, fields)
+    elif kind in _CAPNP_DTYPES:
+      dtype = np.dtype(_CAPNP_DTYPES[kind])
+      enum = [e.name for e in field.schema.node.enum.enumerants] if kind == "enum" else None
+      offset = proto.slot.offset * (1 if kind == "bool" else dtype.itemsize)
+      fields.append(_Field(Column(path, dtype, path if struct_idx != 0 else None, enum), struct_idx, offset, _default_bits(proto, dtype)))
+
+
+class _Layout:
+  """Column locations of a service, compiled from the capnp schema.
+
+  structs[0] is the event, structs[1] the service struct (or list element),
+  the rest are nested structs as (parent index, pointer index)."""
+
+  def __init__(self, service: str):
+    schema, self.is_list = _service_schema(service)
+    self.pointer_idx = capnp_log.Event.schema.fields[service].proto.slot.offset
+    self.structs: List[tuple] = [(-1, -1), (0, self.pointer_idx)]
+    self.fields: List[_Field] = []
+    _struct_fields(capnp_log.Event.schema, "", 0, 0, self.structs, self.fields, names=_EVENT_FIELDS)
+    _struct_fields(schema, "", 0, 1, self.structs, self.fields)
+
+    # can data is stored as a fixed size byte array plus its length
+    self.dat_pointer_idx = None
+    if service in ("can", "sendcan"):
+      self.dat_pointer_idx = schema.fields["dat"].proto.slot.offset
+
+  @property
+  def columns(self) -> List[Column]:
+    columns = [f.column for f in self.fields]
+    if self.dat_pointer_idx is not None:
+      columns += [Column("dat", np.dtype((np.uint8, CAN_DATA_SIZE)), "dat", None),
+                  Column("datLength", np.dtype(np.uint8), "dat", None)]
+    return columns
+
+
+def service_columns(service: str) -> List[Column]:
+  return _Layout(service).columns
+
+
+def _struct_at(buf, pos: int):
+  """(data offset, data size, pointer offset, pointer count) of the struct a pointer at pos points to"""
+  lo, hi = _POINTER.unpack_from(buf, pos)
+  if lo == 0 and hi == 0:
+    return (0, 0, 0, 0)
+  if lo & 3 != 0:
+    raise ValueError("not a struct pointer")
+  data = pos + 8 + 8 * (lo >> 2)
+  return (data, 8 * (hi & 0xffff), data + 8 * (hi & 0xffff), hi >> 16)
+
+
+def _pointer(struct_loc, idx: int) -> Optional[int]:
+  """Position of pointer idx of a struct, None if the struct has no such pointer"""
+  return struct_loc[2] + 8 * idx if idx < struct_loc[3] else None
+
+
+def _single_segment(dat: bytes) -> bytes:
+  if _U32_PAIR.unpack_from(dat)[0] == 0:
+    return dat
+  # multi segment messages can have far pointers, re-encode them into one segment
+  msg = next(iter(capnp_log.Event.read_multiple_bytes(dat)))
+  return msg.as_builder(num_first_segment_words=len(dat) // 8 + 1).to_bytes()
+
+
+def _gather(buf: np.ndarray, offsets: np.ndarray, size: int) -> np.ndarray:
+  """Little endian unsigned integers of size bytes at offsets"""
+  values = np.zeros(len(offsets), dtype=np.uint64)
+  for k in range(size):
+    values |= buf[offsets + k].astype(np.uint64) << np.uint64(8 * k)
+  return values
+
+
+class _ServiceWriter:
+  def __init__(self, out_dir: str, service: str, chunk_rows: int):
+    self.path = os.path.join(out_dir, service)
+    self.service = service
+    self.chunk_rows = chunk_rows
+    self.layout = _Layout(service)
+    self.columns = self.layout.columns
+    self.rows = 0
+
+    # raw events of the chunk, and per group of rows the (data offset, data size,
+    # pointer offset, pointer count) of every struct, the number of rows and the
+    # distance between them. Elements of a list are one group.
+    self.chunk: List[bytes] = []
+    self.chunk_size = 0
+    self.locations: List[tuple] = []
+    self.counts: List[int] = []
+    self.strides: List[int] = []
+    self.chunk_rows_pending = 0
+
+    os.makedirs(self.path, exist_ok=True)
+    for c in self.columns:
+      open(os.path.join(self.path, f"{c.name}.bin"), "wb").close()
+
+  def _add_group(self, locs, base: int, count: int, stride: int):
+    # offsets into the chunk
+    self.locations.append(tuple(v for data, data_size, ptrs, ptr_count in locs for v in (data + base, data_size, ptrs + base, ptr_count)))
+    self.counts.append(count)
+    self.strides.append(stride)
+    self.chunk_rows_pending += count
+
+  def _nested(self, dat: bytes, event, row):
+    locs = [event, row]
+    for parent, idx in self.layout.structs[2:]:
+      pos = _pointer(locs[parent], idx)
+      locs.append(_struct_at(dat, pos) if pos is not None else (0, 0, 0, 0))
+    return locs
+
+  def append(self, dat: bytes):
+    dat = _single_segment(dat)
+    base = self.chunk_size
+    self.chunk.append(dat)
+    self.chunk_size += len(dat)
+
+    event = _struct_at(dat, 8)
+    pos = _pointer(event, self.layout.pointer_idx)
+    if pos is None:
+      return
+
+    if self.layout.is_list:
+      lo, hi = _POINTER.unpack_from(dat, pos)
+      if lo == 0 and hi == 0:
+        return
+      if lo & 3 != 1 or hi & 7 != 7:
+        raise ValueError(f"{self.service} is not a list of structs")
+      tag = pos + 8 + 8 * (lo >> 2)
+      count, sizes = _U32_PAIR.unpack_from(dat, tag)
+      count >>= 2
+      data_size, pointer_count = 8 * (sizes & 0xffff), sizes >> 16
+      stride = data_size + 8 * pointer_count
+      if count == 0:
+        return
+
+      if len(self.layout.structs) == 2:
+        # element locations only differ by the stride, expanded in flush()
+        self._add_group([event, (tag + 8, data_size, tag + 8 + data_size, pointer_count)], base, count, stride)
+      else:
+        for e in range(tag + 8, tag + 8 + stride * count, stride):
+          self._add_group(self._nested(dat, event, (e, data_size, e + data_size, pointer_count)), base, 1, 0)
+    else:
+      self._add_group(self._nested(dat, event, _struct_at(dat, pos)), base, 1, 0)
+
+    if self.chunk_rows_pending >= self.chunk_rows:
+      self.flush()
+
+  def _write(self, column: Column, values: np.ndarray):
+    with open(os.path.join(self.path, f"{column.name}.bin"), "ab") as f:
+      values.astype(column.dtype.base.newbyteorder("<"), copy=False).tofile(f)
+
+  def _can_data(self, buf: np.ndarray, row_locations: np.ndarray):
+    idx = self.layout.dat_pointer_idx
+    present = row_locations[:, 3] > idx
+    pointers = np.where(present, row_locations[:, 2] + 8 * idx, 0)
+    lo = _gather(buf, pointers, 4).astype(np.uint32).view(np.int32).astype(np.int64)
+    hi = _gather(buf, pointers + 4, 4).astype(np.int64)
+    present &= (lo & 3 == 1) & (hi & 7 == 2)  # list of bytes
+    lengths = np.where(present, hi >> 3, 0)
+    starts = np.where(present, pointers + 8 + 8 * (lo >> 2), 0)
+
+    k = np.arange(CAN_DATA_SIZE)
+    valid = k[None, :] < lengths[:, None]
+    data = np.where(valid, buf[np.where(valid, starts[:, None] + k[None, :], 0)], 0).astype(np.uint8)
+    return data, lengths
+
+  def flush(self):
+    if not self.chunk_rows_pending:
+      return
+
+    # zero padding, so reading a value never goes past the end of the buffer
+    buf = np.frombuffer(b"".join(self.chunk) + bytes(8), dtype=np.uint8)
+    locations = np.array(self.locations, dtype=np.int64).reshape(len(self.locations), -1, 4)
+    counts = np.array(self.counts, dtype=np.int64)
+    if np.any(counts != 1):
+      locations = np.repeat(locations, counts, axis=0)
+      element = np.arange(len(locations)) - np.repeat(np.cumsum(counts) - counts, counts)
+      shift = element * np.repeat(np.array(self.strides, dtype=np.int64), counts)
+      locations[:, 1, 0] += shift
+      locations[:, 1, 2] += shift
+
+    values = {}
+    for f in self.layout.fields:
+      loc = locations[:, f.struct]
+      dtype = f.column.dtype
+      if dtype == np.bool_:
+        present = loc[:, 1] * 8 > f.offset
+        offsets = np.where(present, loc[:, 0] + f.offset // 8, 0)
+        bits = np.where(present, (buf[offsets] >> (f.offset % 8)) & 1, 0)
+        values[f.column.name] = (bits ^ f.default).astype(np.bool_)
+      else:
+        present = loc[:, 1] >= f.offset + dtype.itemsize
+        offsets = np.where(present, loc[:, 0] + f.offset, 0)
+        raw = np.where(present, _gather(buf, offsets, dtype.itemsize), np.uint64(0)) ^ np.uint64(f.default)
+        values[f.column.name] = raw.astype(f"u{dtype.itemsize}").view(dtype)
+
+    if self.layout.dat_pointer_idx is not None:
+      values["dat"], values["datLength"] = self._can_data(buf, locations[:, 1])
+
+    for c in self.columns:
+      self._write(c, values[c.name])
+
+    self.rows += len(locations)
+    self.chunk, self.chunk_size = [], 0
+    self.locations, self.counts, self.strides, self.chunk_rows_pending = [], [], [], 0
+
+  def close(self):
+    self.flush()
+    schema = {
+      "service": self.service,
+      "rows": self.rows,
+      "columns": [{"name": c.name, "dtype": c.dtype.base.str, "shape": list(c.dtype.shape), "enum": c.enum} for c in self.columns],
+    }
+    with open(os.path.join(self.path, "schema.json"), "w") as f:
+      json.dump(schema, f, indent=2)
+
+
+class ColumnarWriter:
+  """Appends raw log.Event messages to the column files of their service"""
+
+  def __init__(self, out_dir: str, services: Iterable[str] = DEFAULT_SERVICES, chunk_rows: int = CHUNK_ROWS):
+    self.writers = {s: _ServiceWriter(out_dir, s, chunk_rows) for s in services}
+
+  def append(self, dat: bytes):
+    writer = self.writers.get(event_which(dat))
+    if writer is not None:
+      writer.append(dat)
+
+  def close(self):
+    for writer in self.writers.values():
+      writer.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+
+def export_logs(log_paths, out_dir: str, services: Iterable[str] = DEFAULT_SERVICES, chunk_rows: int = CHUNK_ROWS) -> Dict[str, int]:
+  """Exports the services of logs (in order) to out_dir, returns the number of rows per service"""
+  services = list(services)
+  with ColumnarWriter(out_dir, services, chunk_rows) as writer:
+    for fn in log_paths:
+      if fn is None:
+        continue
+      for dat in LogReader(fn, which=services).raw_events():
+        writer.append(dat)
+  return {s: w.rows for s, w in writer.writers.items()}
+
+
+def read_schema(out_dir: str, service: str):
+  with open(os.path.join(out_dir, service, "schema.json")) as f:
+    return json.load(f)
+
+
+def read_columns(out_dir: str, service: str, columns: Optional[Iterable[str]] = None) -> Dict[str, np.ndarray]:
+  """Memory mapped columns of an exported service"""
+  schema = read_schema(out_dir, service)
+  by_name = {c["name"]: c for c in schema["columns"]}
+  names = list(by_name) if columns is None else list(columns)
+
+  ret = {}
+  for name in names:
+    if name not in by_name:
+      raise KeyError(f"{service} has no column {name}")
+    c = by_name[name]
+    shape = (schema["rows"], *c["shape"])
+    fn = os.path.join(out_dir, service, f"{name}.bin")
+    if schema["rows"] == 0:
+      ret[name] = np.zeros(shape, dtype=c["dtype"])
+    else:
+      ret[name] = np.memmap(fn, dtype=c["dtype"], mode="r", shape=shape)
+  return ret
+
+
+def enum_names(out_dir: str, service: str, column: str) -> List[str]:
+  for c in read_schema(out_dir, service)["columns"]:
+    if c["name"] == column:
+      return c["enum"]
+  raise KeyError(f"{service} has no column {column}")
+
+
+if __name__ == "__main__":
+  from tools.lib.route import Route
+
+  parser = argparse.ArgumentParser(description="Export log services to columnar files")
+  parser.add_argument("route_or_log", help="route name or log file")
+  parser.add_argument("out_dir")
+  parser.add_argument("--services", nargs="+", default=DEFAULT_SERVICES)
+  parser.add_argument("--qlog", action="store_true", help="Use qlogs")
+  args = parser.parse_args()
+
+  if os.path.isfile(args.route_or_log):
+    logs = [args.route_or_log]
+  else:
+    r = Route(args.route_or_log)
+    logs = r.qlog_paths() if args.qlog else r.log_paths()
+
+  for service, rows in export_logs(logs, args.out_dir, args.services).items():
+    print(f"{service}: {rows} rows")
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""Sidecar index for random access into rlogs/qlogs.
+
+For every block of a log the index stores where it starts in the file and
+which events start in it. bz2 blocks are not byte aligned, so a block is
+read by cutting its bits out of the file and wrapping them into a new
+single-block bz2 stream. Uncompressed logs are split into fixed size
+blocks. The index of <log> is written next to it as <log>.idx (JSON)."""
+import bz2
+import json
+import os
+import sys
+from collections import namedtuple
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+from tools.lib.logreader import event_mono_time, event_which, in_time_window, message_size
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".idx"
+RAW_BLOCK_SIZE = 1024 * 1024  # block size for uncompressed logs
+
+_BZ2_BLOCK_MAGIC = 0x314159265359
+_BZ2_EOS_MAGIC = 0x177245385090
+_BZ2_HEADER_BITS = 32  # "BZh" + level
+
+# bit_offset: start of the block in the file, in bits
+# crc: bz2 block crc, 0 for uncompressed logs
+# offset: start of the block in the decompressed log
+# first_event: decompressed offset of the first event starting in this block, -1 if there is none
+IndexBlock = namedtuple('IndexBlock', ['bit_offset', 'crc', 'offset', 'first_event', 'first_mono_time', 'last_mono_time'])
+# blocks: [block, decompressed offset where the last event of the service starting in the block ends]
+ServiceIndex = namedtuple('ServiceIndex', ['count', 'first_mono_time', 'last_mono_time', 'blocks'])
+
+
+def _find_bits(data: bytes, magic: int) -> List[int]:
+  """Bit offsets of the 48 bit magic in data"""
+  found = []
+  for shift in range(8):
+    # bytes 1-5 of the magic shifted right by shift bits don't depend on the neighbouring bits
+    pattern = (magic << (16 - shift)).to_bytes(8, 'big')[1:6]
+    start = 0
+    while True:
+      idx = data.find(pattern, start)
+      if idx == -1:
+        break
+      start = idx + 1
+      bit = (idx - 1) * 8 + shift
+      if bit < 0:
+        continue
+      window = int.from_bytes(data[bit // 8:bit // 8 + 7].ljust(7, b'\0'), 'big')
+      if (window >> (8 - bit % 8)) & ((1 << 48) - 1) == magic:
+        found.append(bit)
+  return sorted(found)
+
+
+def _read_bits(data: bytes, start: int, length: int) -> int:
+  first, last = start // 8, (start + length + 7) // 8
+  value = int.from_bytes(data[first:last], 'big')
+  return (value >> ((last - first) * 8 - (start - first * 8) - length)) & ((1 << length) - 1)
+
+
+def _bz2_stream(data: bytes, data_bit_offset: int, level: int, start: int, end: int, crcs: Iterable[int]) -> bytes:
+  """Standalone bz2 stream with the blocks between bit offsets start and end.
+
+  data holds the file starting at bit data_bit_offset, crcs are the crcs of the blocks."""
+  combined = 0
+  for crc in crcs:
+    combined = (((combined << 1) | (combined >> 31)) & 0xffffffff) ^ crc
+
+  length = end - start
+  blocks = _read_bits(data, start - data_bit_offset, length)
+  stream = (((blocks << 48) | _BZ2_EOS_MAGIC) << 32) | combined
+  length += 80
+  padding = -length % 8
+  return b"BZh" + str(level).encode() + (stream << padding).to_bytes((length + padding) // 8, 'big')
+
+
+class LogIndex:
+  def __init__(self, log_size: int, compression: Optional[str], level: int, end_bit: int, size: int,
+               blocks: List[IndexBlock], services: Dict[str, ServiceIndex]):
+    self.log_size = log_size  # size of the indexed file, to detect a stale index
+    self.compression = compression
+    self.level = level
+    self.end_bit = end_bit  # end of the last block
+    self.size = size  # decompressed size
+    self.blocks = blocks
+    self.services = services
+
+  @property
+  def first_mono_time(self) -> Optional[int]:
+    return min((s.first_mono_time for s in self.services.values()), default=None)
+
+  @property
+  def last_mono_time(self) -> Optional[int]:
+    return max((s.last_mono_time for s in self.services.values()), default=None)
+
+  def to_dict(self):
+    return {
+      "version": INDEX_VERSION,
+      "log_size": self.log_size,
+      "compression": self.compression,
+      "level": self.level,
+      "end_bit": self.end_bit,
+      "size": self.size,
+      "blocks": [list(b) for b in self.blocks],
+      "services": {name: s._asdict() for name, s in self.services.items()},
+    }
+
+  @classmethod
+  def from_dict(cls, d):
+    if d.get("version") != INDEX_VERSION:
+      raise ValueError(f"unsupported index version {d.get('version')}")
+    return cls(d["log_size"], d["compression"], d["level"], d["end_bit"], d["size"],
+               [IndexBlock(*b) for b in d["blocks"]],
+               {name: ServiceIndex(**s) for name, s in d["services"].items()})
+
+  def block_end(self, idx: int) -> int:
+    """Decompressed offset where block idx ends"""
+    return self.blocks[idx + 1].offset if idx + 1 < len(self.blocks) else self.size
+
+  def events_end(self, idx: int, which: Optional[Set[str]] = None) -> int:
+    """Decompressed offset after which no event of a service in which starts in block idx"""
+    if which is None:
+      return self.block_end(idx)
+    return max((end for name in which if name in self.services for i, end in self.services[name].blocks if i == idx),
+               default=self.blocks[idx].offset)
+
+  def select_blocks(self, which: Optional[Set[str]] = None, start_mono_time: Optional[int] = None,
+                    end_mono_time: Optional[int] = None) -> List[int]:
+    """Blocks with events of a service in which, in the time window [start_mono_time, end_mono_time]"""
+    if which is None:
+      candidates = {i for i, b in enumerate(self.blocks) if b.first_event != -1}
+    else:
+      candidates = {i for name in which if name in self.services for i, _ in self.services[name].blocks}
+
+    return [i for i in sorted(candidates) if
+            (start_mono_time is None or self.blocks[i].last_mono_time >= start_mono_time) and
+            (end_mono_time is None or self.blocks[i].first_mono_time <= end_mono_time)]
+
+
+def index_path(fn: str) -> str:
+  return fn + INDEX_SUFFIX
+
+
+def _bz2_blocks(data: bytes):
+  """Returns the level, end of the last block and (bit offset, crc, decompressed data) of every block in a single stream bz2 file"""
+  if data[:3] != b"BZh":
+    raise ValueError("not a bz2 file")
+  level = int(data[3:4])
+
+  eos = _find_bits(data, _BZ2_EOS_MAGIC)
+  if not len(eos):
+    raise ValueError("bz2 stream is incomplete")
+  end_bit = eos[-1]
+  # end of stream marker, crc and padding to the next byte
+  if (end_bit + 80 + 7) // 8 != len(data):
+    raise ValueError("concatenated bz2 streams are not supported")
+
+  starts = [b for b in _find_bits(data, _BZ2_BLOCK_MAGIC) if b < end_bit]
+  if not len(starts) or starts[0] != _BZ2_HEADER_BITS:
+    raise ValueError("bz2 stream has no blocks")
+
+  blocks = []
+  idx = 0
+  while idx < len(starts):
+    start, crc = starts[idx], _read_bits(data, starts[idx] + 48, 32)
+    # the magic can show up inside a block too, skip over candidates until the block decodes
+    for end_idx in range(idx + 1, len(starts) + 1):
+      end = starts[end_idx] if end_idx < len(starts) else end_bit
+      try:
+        out = bz2.decompress(_bz2_stream(data, 0, level, start, end, [crc]))
+        break
+      except (OSError, EOFError, ValueError):
+        if end_idx == len(starts):
+          raise ValueError(f"bz2 block at bit {start} is corrupt") from None
+    blocks.append((start, crc, out))
+    idx = end_idx
+  return level, end_bit, blocks
+
+
+def build_index(fn: str) -> LogIndex:
+  with open(fn, "rb") as f:
+    data = f.read()
+
+  if fn.endswith(".bz2"):
+    compression = "bz2"
+    level, end_bit, bz2_blocks = _bz2_blocks(data)
+    block_starts = []
+    offset = 0
+    for bit_offset, crc, out in bz2_blocks:
+      block_starts.append((bit_offset, crc, offset))
+      offset += len(out)
+    dat = b"".join(out for _, _, out in bz2_blocks)
+  else:
+    compression, level, end_bit = None, 0, len(data) * 8
+    dat = data
+    block_starts = [(o * 8, 0, o) for o in range(0, len(data), RAW_BLOCK_SIZE)]
+
+  first_event = [-1] * len(block_starts)
+  block_times: List[List[int]] = [[] for _ in block_starts]
+  services: Dict[str, list] = {}
+
+  block = 0
+  offset = 0
+  with memoryview(dat) as view:
+    while offset < len(view):
+      size = message_size(view, offset)
+      if size is None or offset + size > len(view):
+        raise ValueError(f"log ends with an incomplete message ({len(view) - offset} bytes)")
+
+      while block + 1 < len(block_starts) and block_starts[block + 1][2] <= offset:
+        block += 1
+      if first_event[block] == -1:
+        first_event[block] = offset
+
+      which, mono_time = event_which(view, offset), event_mono_time(view, offset)
+      times = block_times[block]
+      if len(times):
+        times[0], times[1] = min(times[0], mono_time), max(times[1], mono_time)
+      else:
+        times.extend((mono_time, mono_time))
+
+      s = services.setdefault(which, [0, mono_time, mono_time, []])
+      s[0] += 1
+      s[1], s[2] = min(s[1], mono_time), max(s[2], mono_time)
+      if not len(s[3]) or s[3][-1][0] != block:
+        s[3].append([block, offset + size])
+      else:
+        s[3][-1][1] = offset + size
+      offset += size
+
+  blocks = [IndexBlock(bit_offset, crc, block_offset, first, *(times or (0, 0)))
+            for (bit_offset, crc, block_offset), first, times in zip(block_starts, first_event, block_times)]
+  return LogIndex(len(data), compression, level, end_bit, len(dat), blocks,
+                  {name: ServiceIndex(*s) for name, s in sorted(services.items())})
+
+
+def write_index(fn: str, index: Optional[LogIndex] = None) -> str:
+  if index is None:
+    index = build_index(fn)
+
+  path = index_path(fn)
+  tmp_path = path + ".tmp"
+  with open(tmp_path, "w") as f:
+    json.dump(index.to_dict(), f, separators=(',', ':'))
+  os.replace(tmp_path, path)
+  return path
+
+
+def load_index(fn: str) -> Optional[LogIndex]:
+  """Index of a local log, None if there is none or it doesn't match the log"""
+  try:
+    with open(index_path(fn)) as f:
+      index = LogIndex.from_dict(json.load(f))
+    if index.log_size != os.path.getsize(fn):
+      return None
+    return index
+  except (OSError, ValueError, KeyError, TypeError):
+    return None
+
+
+class BlockReader:
+  """Reads decompressed blocks of a log with seeks"""
+
+  def __init__(self, fn: str, index: LogIndex):
+    self.f = open(fn, "rb")
+    self.index = index
+
+  def close(self):
+    self.f.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def read(self, first: int, last: int) -> bytes:
+    """Decompressed contents of blocks first to last (inclusive)"""
+    blocks = self.index.blocks
+    start = blocks[first].bit_offset
+    end = blocks[last + 1].bit_offset if last + 1 < len(blocks) else self.index.end_bit
+    self.f.seek(start // 8)
+    data = self.f.read((end + 7) // 8 - start // 8)
+    if self.index.compression is None:
+      return data
+    crcs = [b.crc for b in blocks[first:last + 1]]
+    return bz2.decompress(_bz2_stream(data, start - start % 8, self.index.level, start, end, crcs))
+
+
+def iter_indexed_raw_events(fn: str, index: LogIndex, which: Optional[Set[str]] = None,
+                            start_mono_time: Optional[int] = None, end_mono_time: Optional[int] = None) -> Iterator[bytes]:
+  """Events of the selected services and time window, only reading the blocks that contain them"""
+  selected = index.select_blocks(which, start_mono_time, end_mono_time)
+
+  # runs of consecutive blocks
+  runs: List[List[int]] = []
+  for i in selected:
+    if len(runs) and runs[-1][1] == i - 1:
+      runs[-1][1] = i
+    else:
+      runs.append([i, i])
+
+  with BlockReader(fn, index) as reader:
+    for first, last in runs:
+      base = index.blocks[first].offset
+      buf = bytearray(reader.read(first, last))
+      next_block = last + 1
+      offset = index.blocks[first].first_event - base
+      # no need to read past the last selected event, it can continue into the following blocks
+      stop = index.events_end(last, which) - base
+      while offset < stop:
+        size = message_size(buf, offset)
+        while size is None or offset + size > len(buf):
+          if next_block == len(index.blocks):
+            raise ValueError(f"log ends with an incomplete message ({len(buf) - offset} bytes)")
+          buf += reader.read(next_block, next_block)
+          next_block += 1
+          size = message_size(buf, offset)
+
+        if (which is None or event_which(buf, offset) in which) and \
+           in_time_window(event_mono_time(buf, offset), start_mono_time, end_mono_time):
+          yield bytes(buf[offset:offset + size])
+        offset += size
+
+
+if __name__ == "__main__":
+  if len(sys.argv) < 2:
+    print(f"usage: {os.path.basename(sys.argv[0])} <log or segment directory> ...")
+    sys.exit(1)
+
+  for path in sys.argv[1:]:
+    if os.path.isdir(path):
+      logs = [os.path.join(path, fn) for fn in sorted(os.listdir(path)) if fn.split(".")[0] in ("rlog", "qlog") and not fn.endswith(INDEX_SUFFIX)]
+    else:
+      logs = [path]
+    for fn in logs:
+      print(write_index(fn))
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+import bz2
+import os
+import struct
+import sys
+import urllib.request
+from typing import Iterable, Iterator, Optional, Set
+
+from cereal import log as capnp_log
+
+CHUNK_SIZE = 64 * 1024  # compressed bytes read at a time
+READ_BATCH_SIZE = 1000  # events parsed with one read_multiple_bytes call
+
+# union discriminant of log.Event, read straight from the message bytes
+_EVENT_SCHEMA = capnp_log.Event.schema.node.struct
+_DISCRIMINANT_OFFSET = _EVENT_SCHEMA.discriminantOffset * 2  # bytes into the data section
+_WHICH_NAMES = {f.discriminantValue: f.name for f in _EVENT_SCHEMA.fields if f.discriminantValue != 0xffff}
+
+
+def event_from_bytes(dat: bytes):
+  return next(iter(capnp_log.Event.read_multiple_bytes(dat)))
+
+
+_U32_PAIR = struct.Struct("<II")
+_POINTER = struct.Struct("<iI")
+_U16 = struct.Struct("<H")
+_U64 = struct.Struct("<Q")
+
+
+def message_size(buf, offset: int = 0) -> Optional[int]:
+  """Size in bytes of the unpacked capnp message starting at offset, None if the header is incomplete"""
+  if len(buf) - offset < 8:
+    return None
+  num_segments_minus_one, first_segment_size = _U32_PAIR.unpack_from(buf, offset)
+  if num_segments_minus_one == 0:
+    return 8 + 8 * first_segment_size
+
+  num_segments = num_segments_minus_one + 1
+  header_size = (4 + 4 * num_segments + 7) & ~7
+  if len(buf) - offset < header_size:
+    return None
+  sizes = struct.unpack_from(f"<{num_segments}I", buf, offset + 4)
+  return header_size + 8 * sum(sizes)
+
+
+def _root_data_section(buf, offset: int):
+  """Returns (byte offset, size) of the root struct's data section"""
+  num_segments = _U32_PAIR.unpack_from(buf, offset)[0] + 1
+  seg_start = offset + ((4 + 4 * num_segments + 7) & ~7)
+  lo, hi = _POINTER.unpack_from(buf, seg_start)
+  if lo & 3 != 0:
+    # far pointer to the root, let capnp handle it
+    return None
+  data_start = seg_start + 8 + 8 * (lo >> 2)
+  return data_start, 8 * (hi & 0xffff)
+
+
+def event_which(buf, offset: int = 0) -> str:
+  """log.Event.which() without building a capnp reader"""
+  section = _root_data_section(buf, offset)
+  if section is None:
+    return event_from_bytes(bytes(buf[offset:offset + message_size(buf, offset)])).which()
+  data_start, data_size = section
+  discriminant = 0
+  if data_size >= _DISCRIMINANT_OFFSET + 2:
+    discriminant = _U16.unpack_from(buf, data_start + _DISCRIMINANT_OFFSET)[0]
+  return _WHICH_NAMES[discriminant]
+
+
+def event_mono_time(buf, offset: int = 0) -> int:
+  """log.Event.logMonoTime without building a capnp reader"""
+  section = _root_data_section(buf, offset)
+  if section is None:
+    return event_from_bytes(bytes(buf[offset:offset + message_size(buf, offset)])).logMonoTime
+  data_start, data_size = section
+  return _U64.unpack_from(buf, data_start)[0] if data_size >= 8 else 0
+
+
+def in_time_window(mono_time: int, start_mono_time: Optional[int], end_mono_time: Optional[int]) -> bool:
+  return (start_mono_time is None or mono_time >= start_mono_time) and (end_mono_time is None or mono_time <= end_mono_time)
+
+
+def _is_url(fn):
+  return fn.startswith("http://") or fn.startswith("https://")
+
+
+def _open(fn):
+  if _is_url(fn):
+    return urllib.request.urlopen(fn)
+  return open(fn, "rb")
+
+
+def iter_chunks(fn, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+  """Decompressed contents of a log file, a chunk at a time"""
+  decompress = bz2.BZ2Decompressor() if fn.endswith(".bz2") else None
+  with _open(fn) as f:
+    while True:
+      dat = f.read(chunk_size)
+      if not dat:
+        break
+
+      if decompress is None:
+        yield dat
+        continue
+
+      while dat:
+        out = decompress.decompress(dat)
+        if out:
+          yield out
+        # concatenated bz2 streams
+        if decompress.eof:
+          dat = decompress.unused_data
+          decompress = bz2.BZ2Decompressor()
+        else:
+          dat = b""
+
+
+def iter_raw_events(chunks: Iterable[bytes], which: Optional[Set[str]] = None) -> Iterator[bytes]:
+  """Splits a stream of bytes into capnp messages, skipping events not in which"""
+  buf = bytearray()
+  for chunk in chunks:
+    buf += chunk
+    offset = 0
+    with memoryview(buf) as view:
+      while True:
+        size = message_size(view, offset)
+        if size is None or offset + size > len(view):
+          break
+        if which is None or event_which(view, offset) in which:
+          yield bytes(view[offset:offset + size])
+        offset += size
+    del buf[:offset]
+
+  if len(buf):
+    raise ValueError(f"log ends with an incomplete message ({len(buf)} bytes)")
+
+
+class LogReader:
+  """Lazily reads log.Event messages from a rlog/qlog, compressed (.bz2) or not.
+
+  The file is decompressed incrementally, so memory use doesn't depend on the
+  log size. Events not in which are skipped before capnp parses them. If the
+  log has an index (see tools/lib/log_index.py) only the blocks with events
+  of the selected services and time window are read."""
+
+  def __init__(self, fn, which: Optional[Iterable[str]] = None, sort_by_time: bool = False,
+               start_mono_time: Optional[int] = None, end_mono_time: Optional[int] = None, use_index: bool = True):
+    self.fn = fn
+    self.which = set(which) if which is not None else None
+    if self.which is not None and not self.which.issubset(_WHICH_NAMES.values()):
+      raise ValueError(f"unknown services: {self.which - set(_WHICH_NAMES.values())}")
+    self.sort_by_time = sort_by_time
+    self.start_mono_time = start_mono_time
+    self.end_mono_time = end_mono_time
+    self.use_index = use_index
+
+  def raw_events(self) -> Iterator[bytes]:
+    if self.use_index and not _is_url(self.fn):
+      from tools.lib.log_index import iter_indexed_raw_events, load_index
+      index = load_index(self.fn)
+      if index is not None:
+        return iter_indexed_raw_events(self.fn, index, self.which, self.start_mono_time, self.end_mono_time)
+
+    events = iter_raw_events(iter_chunks(self.fn), self.which)
+    if self.start_mono_time is None and self.end_mono_time is None:
+      return events
+    return (dat for dat in events if in_time_window(event_mono_time(dat), self.start_mono_time, self.end_mono_time))
+
+  def _iter_events(self):
+    batch = []
+    for dat in self.raw_events():
+      batch.append(dat)
+      if len(batch) == READ_BATCH_SIZE:
+        yield from capnp_log.Event.read_multiple_bytes(b"".join(batch))
+        batch = []
+    if len(batch):
+      yield from capnp_log.Event.read_multiple_bytes(b"".join(batch))
+
+  def __iter__(self):
+    if self.sort_by_time:
+      yield from sorted(self._iter_events(), key=lambda m: m.logMonoTime)
+    else:
+      yield from self._iter_events()
+
+
+class MultiLogIterator:
+  """Iterates the events of several logs (e.g. a route) in order. Missing logs (None) are skipped."""
+
+  def __init__(self, log_paths, wraparound: bool = False, which: Optional[Iterable[str]] = None):
+    self.log_paths = [p for p in log_paths if p is not None]
+    self.wraparound = wraparound
+    self.which = which
+
+  def __iter__(self):
+    while True:
+      for fn in self.log_paths:
+        yield from LogReader(fn, which=self.which)
+      if not self.wraparound or not len(self.log_paths):
+        break
+
+
+if __name__ == "__main__":
+  if len(sys.argv) < 2:
+    print(f"usage: {os.path.basename(sys.argv[0])} <log> [service ...]")
+    sys.exit(1)
+
+  for msg in LogReader(sys.argv[1], which=sys.argv[2:] or None):
+    print(msg)
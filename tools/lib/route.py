@@ -0,0 +1,72 @@
+import os
+import re
+from typing import Dict, List, Optional
+
+from selfdrive.loggerd.config import ROOT
+
+# <route>--<segment number>, see logger_get_route_name in selfdrive/loggerd/logger.cc
+SEGMENT_NAME_RE = re.compile(r'^(?P<route>\d{4}-\d{2}-\d{2}--\d{2}-\d{2}-\d{2})--(?P<segment>\d+)$')
+
+LOG_FILENAMES = ('rlog.bz2', 'rlog')
+QLOG_FILENAMES = ('qlog.bz2', 'qlog')
+
+
+def _find_file(path: str, filenames) -> Optional[str]:
+  for fn in filenames:
+    fp = os.path.join(path, fn)
+    if os.path.isfile(fp):
+      return fp
+  return None
+
+
+class RouteSegment:
+  def __init__(self, name: str, path: str):
+    self.name = name
+    self.path = path
+    self.number = int(name.rsplit('--', 1)[1])
+
+  @property
+  def log_path(self) -> Optional[str]:
+    return _find_file(self.path, LOG_FILENAMES)
+
+  @property
+  def qlog_path(self) -> Optional[str]:
+    return _find_file(self.path, QLOG_FILENAMES)
+
+
+class Route:
+  """A route recorded by loggerd, with segments in <data_dir>/<route>--<n>/"""
+
+  def __init__(self, name: str, data_dir: str = ROOT):
+    # strip dongle id from canonical route names, e.g. "0123456789abcdef|2021-01-04--16-55-41"
+    self.name = name.split('|')[-1]
+    self.data_dir = data_dir
+    self._segments = self._get_segments()
+    if not len(self._segments):
+      raise ValueError(f"no segments found for route {self.name} in {self.data_dir}")
+
+  def _get_segments(self) -> Dict[int, RouteSegment]:
+    segments = {}
+    if os.path.isdir(self.data_dir):
+      for fn in os.listdir(self.data_dir):
+        m = SEGMENT_NAME_RE.match(fn)
+        if m is not None and m.group('route') == self.name:
+          segment = RouteSegment(fn, os.path.join(self.data_dir, fn))
+          segments[segment.number] = segment
+    return segments
+
+  @property
+  def segments(self) -> List[RouteSegment]:
+    return [self._segments[n] for n in sorted(self._segments)]
+
+  @property
+  def max_seg_number(self) -> int:
+    return max(self._segments)
+
+  def log_paths(self) -> List[Optional[str]]:
+    """rlog per segment number, None for missing segments or logs"""
+    return [self._segments[n].log_path if n in self._segments else None for n in range(self.max_seg_number + 1)]
+
+  def qlog_paths(self) -> List[Optional[str]]:
+    """qlog per segment number, None for missing segments or logs"""
+    return [self._segments[n].qlog_path if n in self._segments else None for n in range(self.max_seg_number + 1)]
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from tools.lib.columnar import DEFAULT_SERVICES, export_logs, read_columns
+from tools.lib.logreader import MultiLogIterator
+from tools.lib.route import Route
+from tools.lib.tests.helpers import make_synthetic_route
+
+N_SEGMENTS = 5
+
+
+def dir_size(path):
+  return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+
+if __name__ == "__main__":
+  tmp = tempfile.mkdtemp()
+  try:
+    print(f"generating {N_SEGMENTS} x 60 s segments...")
+    r = Route(make_synthetic_route(tmp, N_SEGMENTS), data_dir=tmp)
+    log_paths = r.log_paths()
+    out_dir = os.path.join(tmp, "columns")
+
+    t = time.monotonic()
+    n_events = sum(1 for _ in MultiLogIterator(log_paths, which=DEFAULT_SERVICES))
+    read_time = time.monotonic() - t
+    print(f"read only        : {n_events} events in {read_time:.2f} s, {n_events / read_time:.0f} events/s")
+
+    t = time.monotonic()
+    rows = export_logs(log_paths, out_dir)
+    dt = time.monotonic() - t
+    print(f"export           : {n_events} events in {dt:.2f} s, {n_events / dt:.0f} events/s, "
+          f"{sum(rows.values()) / dt:.0f} rows/s, {dir_size(out_dir) / 1e6:.1f} MB written")
+    for service, n in rows.items():
+      print(f"  {service:14s}: {n:8d} rows")
+
+    tracemalloc.start()
+    export_logs(log_paths, out_dir)
+    print(f"export peak python heap: {tracemalloc.get_traced_memory()[1] / 1e6:.1f} MB")
+    tracemalloc.stop()
+
+    # mean speed while braking
+    t = time.monotonic()
+    v = [m.carState.vEgo for m in MultiLogIterator(log_paths, which=["carState"]) if m.carState.brakePressed]
+    loop_mean, loop_time = sum(v) / len(v), time.monotonic() - t
+
+    t = time.monotonic()
+    cols = read_columns(out_dir, "carState", ["vEgo", "brakePressed"])
+    np_mean = float(np.mean(cols["vEgo"][cols["brakePressed"]]))
+    np_time = time.monotonic() - t
+    assert abs(loop_mean - np_mean) < 1e-3
+    print(f"query, LogReader : {loop_time * 1e3:8.1f} ms")
+    print(f"query, columns   : {np_time * 1e3:8.1f} ms")
+
+    t = time.monotonic()
+    can = read_columns(out_dir, "can", ["address", "src"])
+    counts = np.unique(can["address"][can["src"] == 0], return_counts=True)
+    print(f"can frames per address on bus 0 ({len(counts[0])} addresses, {len(can['address'])} frames): {(time.monotonic() - t) * 1e3:.1f} ms")
+  finally:
+    shutil.rmtree(tmp)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import tempfile
+import time
+
+from tools.lib.log_index import index_path, load_index, write_index
+from tools.lib.logreader import LogReader
+from tools.lib.route import Route
+from tools.lib.tests.helpers import make_synthetic_route
+
+N_SEGMENTS = 5
+SEGMENT_SECONDS = 60
+
+
+def run(name, log_paths, use_index, **kwargs):
+  t = time.monotonic()
+  n = 0
+  for fn in log_paths:
+    for msg in LogReader(fn, use_index=use_index, **kwargs):
+      msg.which()
+      n += 1
+  dt = time.monotonic() - t
+  print(f"{name:40s}: {n:6d} events in {dt * 1e3:8.1f} ms")
+  return dt
+
+
+if __name__ == "__main__":
+  tmp = tempfile.mkdtemp()
+  try:
+    print(f"generating {N_SEGMENTS} x {SEGMENT_SECONDS} s segments...")
+    r = Route(make_synthetic_route(tmp, N_SEGMENTS, seconds=SEGMENT_SECONDS), data_dir=tmp)
+    log_paths = r.log_paths()
+
+    t = time.monotonic()
+    for fn in log_paths:
+      write_index(fn)
+    dt = time.monotonic() - t
+    index = load_index(log_paths[0])
+    print(f"indexing: {dt / N_SEGMENTS * 1e3:.0f} ms per segment, {len(index.blocks)} blocks, "
+          f"{os.path.getsize(log_paths[0]) / 1e6:.1f} MB log, {os.path.getsize(index_path(log_paths[0])) / 1e3:.1f} kB index")
+
+    t0 = index.first_mono_time + int(30e9)
+    for name, kwargs in (("carParams", dict(which=["carParams"])),
+                         ("deviceState", dict(which=["deviceState"])),
+                         ("carState", dict(which=["carState"])),
+                         ("5 s window, segment 0", dict(start_mono_time=t0, end_mono_time=t0 + int(5e9)))):
+      full = run(f"{name}, full decompress", log_paths, False, **kwargs)
+      indexed = run(f"{name}, indexed", log_paths, True, **kwargs)
+      print(f"{'':40s}  {full / indexed:.1f}x")
+  finally:
+    shutil.rmtree(tmp)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+import bz2
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from cereal import log
+from tools.lib.logreader import LogReader, MultiLogIterator
+from tools.lib.route import Route
+from tools.lib.tests.helpers import make_synthetic_route
+
+N_SEGMENTS = 5
+
+
+def read_whole_files(log_paths):
+  # read, decompress and parse each log in one go
+  for fn in log_paths:
+    with open(fn, "rb") as f:
+      yield from log.Event.read_multiple_bytes(bz2.decompress(f.read()))
+
+
+def consume(events):
+  n = 0
+  for msg in events:
+    msg.which()
+    n += 1
+  return n
+
+
+def run(name, make_events, n_total):
+  t = time.monotonic()
+  n = consume(make_events())
+  dt = time.monotonic() - t
+
+  # separate pass, tracing slows everything down
+  tracemalloc.start()
+  consume(make_events())
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+  print(f"{name:32s}: {n:7d} events in {dt:6.2f} s, {n_total / dt:9.0f} events/s scanned, peak python heap {peak / 1e6:6.1f} MB")
+
+
+if __name__ == "__main__":
+  tmp = tempfile.mkdtemp()
+  try:
+    print(f"generating {N_SEGMENTS} x 60 s segments...")
+    r = Route(make_synthetic_route(tmp, N_SEGMENTS), data_dir=tmp)
+    n_total = sum(1 for _ in read_whole_files(r.log_paths()))
+    print(f"{n_total} events in route")
+
+    run("whole file read", lambda: read_whole_files(r.log_paths()), n_total)
+    run("whole file read, carParams", lambda: (m for m in read_whole_files(r.log_paths()) if m.which() == "carParams"), n_total)
+    run("LogReader", lambda: MultiLogIterator(r.log_paths()), n_total)
+    run("LogReader which=carState", lambda: MultiLogIterator(r.log_paths(), which=["carState"]), n_total)
+    run("LogReader which=carParams", lambda: MultiLogIterator(r.log_paths(), which=["carParams"]), n_total)
+    run("single segment LogReader", lambda: LogReader(r.log_paths()[0]), n_total // N_SEGMENTS)
+  finally:
+    shutil.rmtree(tmp)
@@ -0,0 +1,98 @@
+import bz2
+import os
+import random
+
+from cereal import log
+
+ROUTE_NAME = "2021-06-01--12-00-00"
+CAR_FINGERPRINT = "TOYOTA COROLLA TSS2 2019"
+
+# service: frequency in Hz
+SERVICE_FREQUENCIES = {
+  "can": 100,
+  "carState": 100,
+  "controlsState": 100,
+  "carControl": 100,
+  "radarState": 20,
+  "lateralPlan": 20,
+  "deviceState": 2,
+}
+
+
+def _event(service, mono_time, segment, idx):
+  msg = log.Event.new_message()
+  msg.logMonoTime = mono_time
+  msg.valid = True
+  if service == "can":
+    frames = msg.init("can", 30)
+    for i, c in enumerate(frames):
+      c.address = 0x100 + i
+      c.src = i % 3
+      c.busTime = idx & 0xffff
+      c.dat = bytes((idx + i + j) & 0xff for j in range(8))
+  else:
+    msg.init(service)
+
+  if service == "carState":
+    msg.carState.vEgo = 20. + random.random()
+    msg.carState.aEgo = random.random() - 0.5
+    msg.carState.steeringAngleDeg = 10 * random.random()
+    msg.carState.gas = 0.1
+    msg.carState.brakePressed = idx % 500 == 0
+    msg.carState.cruiseState.enabled = True
+    msg.carState.cruiseState.speed = 25.
+  elif service == "controlsState":
+    msg.controlsState.enabled = True
+    msg.controlsState.vCruise = 90.
+    msg.controlsState.curvature = 0.001 * random.random()
+    msg.controlsState.cumLagMs = random.random()
+  elif service == "carControl":
+    msg.carControl.enabled = True
+    msg.carControl.actuators.steer = random.random() - 0.5
+    msg.carControl.actuators.gas = 0.2
+  elif service == "radarState":
+    msg.radarState.leadOne.dRel = 30 + random.random()
+    msg.radarState.leadOne.vRel = random.random() - 0.5
+    msg.radarState.leadOne.status = True
+  elif service == "lateralPlan":
+    msg.lateralPlan.dPathPoints = [random.random() for _ in range(33)]
+  elif service == "deviceState":
+    msg.deviceState.cpuUsagePercent = 25
+  elif service == "carParams":
+    msg.carParams.carName = "toyota"
+    msg.carParams.carFingerprint = CAR_FINGERPRINT
+    msg.carParams.mass = 1400.
+  elif service == "initData":
+    msg.initData.kernelVersion = "4.9.103"
+  return msg.to_bytes()
+
+
+def make_segment_events(segment, seconds=60, frequencies=None):
+  """Raw events of a synthetic segment in logMonoTime order"""
+  frequencies = SERVICE_FREQUENCIES if frequencies is None else frequencies
+  t0 = int(segment * seconds * 1e9)
+  events = [(t0, _event("initData", t0, segment, 0)), (t0 + 1, _event("carParams", t0 + 1, segment, 0))]
+  for service, freq in frequencies.items():
+    for i in range(int(seconds * freq)):
+      t = t0 + int(i * 1e9 / freq) + 10
+      events.append((t, _event(service, t, segment, i)))
+  events.sort(key=lambda e: e[0])
+  return [dat for _, dat in events]
+
+
+def make_synthetic_route(data_dir, n_segments, seconds=60, frequencies=None, route_name=ROUTE_NAME, compress=True):
+  """Writes a route in the loggerd layout: <data_dir>/<route>--<n>/{rlog,qlog}.bz2"""
+  random.seed(0)
+  for segment in range(n_segments):
+    path = os.path.join(data_dir, f"{route_name}--{segment}")
+    os.makedirs(path, exist_ok=True)
+    dat = b"".join(make_segment_events(segment, seconds, frequencies))
+    # qlog has the same contents, no decimation
+    for fn in ("rlog", "qlog"):
+      if compress:
+        with bz2.open(os.path.join(path, f"{fn}.bz2"), "wb") as f:
+          f.write(dat)
+      else:
+        with open(os.path.join(path, fn), "wb") as f:
+          f.write(dat)
+  return route_name
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import tempfile
+import unittest
+from operator import attrgetter
+
+import numpy as np
+
+from cereal import log
+from tools.lib.columnar import CAN_DATA_SIZE, DEFAULT_SERVICES, MAX_DEPTH, ColumnarWriter, enum_names, export_logs, read_columns, service_columns
+from tools.lib.logreader import MultiLogIterator
+from tools.lib.route import Route
+from tools.lib.tests.helpers import make_synthetic_route
+
+PRIMITIVE_TYPES = {"bool", "int8", "int16", "int32", "int64", "uint8", "uint16", "uint32", "uint64", "float32", "float64", "enum"}
+
+
+def schema_leaves(schema, prefix="", depth=0):
+  """(path, capnp type) of all bool, number and enum fields reachable without lists or union members"""
+  for name, field in schema.fields.items():
+    proto = field.proto
+    if proto.discriminantValue != 0xffff or name.endswith("DEPRECATED"):
+      continue
+    if proto.which() == "group" or proto.slot.type.which() == "struct":
+      if depth < MAX_DEPTH:
+        yield from schema_leaves(field.schema, prefix + name + ".", depth + 1)
+    elif proto.slot.type.which() in PRIMITIVE_TYPES:
+      yield prefix + name, proto.slot.type.which()
+
+
+class TestColumnar(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls.tmp = tempfile.mkdtemp()
+    cls.out_dir = os.path.join(cls.tmp, "columns")
+    r = Route(make_synthetic_route(cls.tmp, 2, seconds=2), data_dir=cls.tmp)
+    cls.log_paths = r.log_paths()
+    # small chunks, so every column is written more than once
+    cls.rows = export_logs(cls.log_paths, cls.out_dir, chunk_rows=64)
+
+  @classmethod
+  def tearDownClass(cls):
+    shutil.rmtree(cls.tmp)
+
+  def test_schema_coverage(self):
+    for service in DEFAULT_SERVICES:
+      field = log.Event.schema.fields[service]
+      schema = field.schema if field.proto.slot.type.which() == "struct" else field.schema.elementType
+      leaves = dict(schema_leaves(schema))
+      columns = {c.name: c for c in service_columns(service)}
+
+      missing = set(leaves) - set(columns)
+      self.assertEqual(missing, set(), f"{service} fields without a column")
+      for path, kind in leaves.items():
+        self.assertEqual(columns[path].dtype.kind, "u" if kind == "enum" else np.dtype(kind if kind != "bool" else np.bool_).kind)
+        self.assertEqual(columns[path].enum is not None, kind == "enum")
+      self.assertEqual(set(columns) - set(leaves), {"logMonoTime", "valid"} | ({"dat", "datLength"} if service == "can" else set()))
+
+    self.assertIn("cruiseState.speed", [c.name for c in service_columns("carState")])
+    self.assertIn("leadOne.dRel", [c.name for c in service_columns("radarState")])
+    with self.assertRaises(ValueError):
+      service_columns("notAService")
+
+  def test_values(self):
+    msgs = {s: [] for s in DEFAULT_SERVICES}
+    for m in MultiLogIterator(self.log_paths, which=DEFAULT_SERVICES):
+      msgs[m.which()].append(m)
+
+    for service in ("carState", "controlsState", "radarState"):
+      cols = read_columns(self.out_dir, service)
+      self.assertEqual(self.rows[service], len(msgs[service]))
+      for c in service_columns(service):
+        if c.path is None:
+          expected = [getattr(m, c.name) for m in msgs[service]]
+        else:
+          getter = attrgetter(c.path + ".raw" if c.enum is not None else c.path)
+          expected = [getter(getattr(m, service)) for m in msgs[service]]
+        np.testing.assert_array_equal(cols[c.name], np.array(expected, dtype=c.dtype), err_msg=f"{service}.{c.name}")
+
+    frames = [(m.logMonoTime, f) for m in msgs["can"] for f in m.can]
+    cols = read_columns(self.out_dir, "can")
+    self.assertEqual(self.rows["can"], len(frames))
+    np.testing.assert_array_equal(cols["logMonoTime"], [t for t, _ in frames])
+    np.testing.assert_array_equal(cols["address"], [f.address for _, f in frames])
+    np.testing.assert_array_equal(cols["datLength"], [len(f.dat) for _, f in frames])
+    self.assertEqual(cols["dat"].shape, (len(frames), CAN_DATA_SIZE))
+    self.assertEqual(bytes(cols["dat"][5]), frames[5][1].dat)
+
+  def test_query(self):
+    cols = read_columns(self.out_dir, "carState", ["logMonoTime", "vEgo", "brakePressed", "gearShifter"])
+    self.assertEqual(len(cols), 4)
+    self.assertTrue(np.all(np.diff(cols["logMonoTime"].astype(np.int64)) > 0))
+    self.assertTrue(np.all(cols["vEgo"] >= 20.))
+    self.assertEqual(enum_names(self.out_dir, "carState", "gearShifter")[0], "unknown")
+
+    can = read_columns(self.out_dir, "can", ["address", "src"])
+    self.assertEqual(np.count_nonzero((can["address"] == 0x100) & (can["src"] == 0)), self.rows["can"] // 30)
+
+    with self.assertRaises(KeyError):
+      read_columns(self.out_dir, "carState", ["notAColumn"])
+
+  def test_encodings(self):
+    events = []
+    # multi segment message, far pointers
+    msg = log.Event.new_message(num_first_segment_words=4)
+    msg.logMonoTime = 1
+    msg.init("carState")
+    msg.carState.vEgo = 3.
+    msg.carState.cruiseState.speed = 5.
+    msg.carState.gearShifter = "reverse"
+    events.append(msg.to_bytes())
+    # defaults, no nested structs
+    msg = log.Event.new_message()
+    msg.logMonoTime = 2
+    msg.valid = False
+    msg.init("carState")
+    events.append(msg.to_bytes())
+
+    msg = log.Event.new_message()
+    msg.init("can", 2)
+    msg.can[0].dat = b"\x01\x02"
+    msg.can[1].dat = bytes(range(12))
+    events.append(msg.to_bytes())
+    events.append(log.Event.new_message(can=[]).to_bytes())
+
+    out_dir = os.path.join(self.tmp, "encodings")
+    with ColumnarWriter(out_dir, ["carState", "can"]) as writer:
+      for dat in events:
+        writer.append(dat)
+
+    cols = read_columns(out_dir, "carState")
+    np.testing.assert_array_equal(cols["logMonoTime"], [1, 2])
+    np.testing.assert_array_equal(cols["valid"], [True, False])
+    np.testing.assert_array_equal(cols["vEgo"], [3., 0.])
+    np.testing.assert_array_equal(cols["cruiseState.speed"], [5., 0.])
+    self.assertEqual(enum_names(out_dir, "carState", "gearShifter")[cols["gearShifter"][0]], "reverse")
+
+    cols = read_columns(out_dir, "can")
+    np.testing.assert_array_equal(cols["datLength"], [2, 12])
+    self.assertEqual(bytes(cols["dat"][0]), b"\x01\x02" + bytes(6))
+    self.assertEqual(bytes(cols["dat"][1]), bytes(range(8)))
+
+
+if __name__ == "__main__":
+  unittest.main()
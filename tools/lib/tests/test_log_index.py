@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+import bz2
+import os
+import shutil
+import tempfile
+import unittest
+from collections import Counter
+from unittest import mock
+
+from tools.lib import log_index
+from tools.lib.log_index import BlockReader, build_index, load_index, write_index
+from tools.lib.logreader import LogReader, event_mono_time, event_which
+from tools.lib.tests.helpers import make_segment_events
+
+
+class TestLogIndex(unittest.TestCase):
+  def setUp(self):
+    self.tmp = tempfile.mkdtemp()
+    self.events = make_segment_events(0, seconds=3)
+    self.dat = b"".join(self.events)
+
+    # 100 kB blocks, so the segment has several
+    self.fn = os.path.join(self.tmp, "rlog.bz2")
+    with bz2.open(self.fn, "wb", compresslevel=1) as f:
+      f.write(self.dat)
+
+    self.raw_fn = os.path.join(self.tmp, "rlog")
+    with open(self.raw_fn, "wb") as f:
+      f.write(self.dat)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp)
+
+  def _logs(self):
+    # small blocks for uncompressed logs, most events straddle two blocks
+    with mock.patch.object(log_index, "RAW_BLOCK_SIZE", 1000):
+      write_index(self.raw_fn)
+    write_index(self.fn)
+    return (self.fn, self.raw_fn)
+
+  def test_index(self):
+    counts = Counter(event_which(dat) for dat in self.events)
+    mono_times = [event_mono_time(dat) for dat in self.events]
+    for fn in self._logs():
+      index = load_index(fn)
+      self.assertIsNotNone(index)
+      self.assertGreater(len(index.blocks), 2)
+      self.assertEqual(index.size, len(self.dat))
+      self.assertEqual({name: s.count for name, s in index.services.items()}, counts)
+      self.assertEqual(index.first_mono_time, min(mono_times))
+      self.assertEqual(index.last_mono_time, max(mono_times))
+      self.assertEqual([b for b, _ in index.services["carParams"].blocks], [0])
+
+  def test_blocks(self):
+    index = build_index(self.fn)
+    self.assertEqual(index.level, 1)
+    with BlockReader(self.fn, index) as reader:
+      blocks = [reader.read(i, i) for i in range(len(index.blocks))]
+      self.assertEqual(b"".join(blocks), self.dat)
+      self.assertEqual(reader.read(1, 3), b"".join(blocks[1:4]))
+    for i, block in enumerate(index.blocks):
+      self.assertEqual(block.offset, sum(len(b) for b in blocks[:i]))
+
+  def test_which(self):
+    for fn in self._logs():
+      for which in (["carParams"], ["deviceState"], ["radarState", "can"], ["gpsNMEA"]):
+        with mock.patch("tools.lib.logreader.iter_chunks") as iter_chunks:
+          raw = list(LogReader(fn, which=which).raw_events())
+          iter_chunks.assert_not_called()
+        self.assertEqual(raw, [dat for dat in self.events if event_which(dat) in which])
+
+      self.assertEqual(list(LogReader(fn).raw_events()), self.events)
+
+  def test_time_window(self):
+    start, end = int(0.5e9), int(1.7e9)
+    expected = [dat for dat in self.events if start <= event_mono_time(dat) <= end]
+    self.assertEqual(list(LogReader(self.fn, start_mono_time=start, end_mono_time=end, use_index=False).raw_events()), expected)
+    for fn in self._logs():
+      self.assertEqual(list(LogReader(fn, start_mono_time=start, end_mono_time=end).raw_events()), expected)
+      self.assertEqual(list(LogReader(fn, which=["carState"], start_mono_time=start).raw_events()),
+                       [dat for dat in self.events if event_which(dat) == "carState" and event_mono_time(dat) >= start])
+
+  def test_stale_index(self):
+    self._logs()
+    with open(self.fn, "ab") as f:
+      f.write(bz2.compress(self.events[0]))
+    self.assertIsNone(load_index(self.fn))
+    self.assertEqual(len(list(LogReader(self.fn, which=["initData"]))), 2)
+
+  def test_concatenated_streams(self):
+    with open(self.fn, "ab") as f:
+      f.write(bz2.compress(self.events[0]))
+    with self.assertRaises(ValueError):
+      build_index(self.fn)
+
+
+if __name__ == "__main__":
+  unittest.main()
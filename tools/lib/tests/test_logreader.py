@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+import bz2
+import os
+import shutil
+import tempfile
+import unittest
+
+from cereal import log
+from tools.lib.logreader import LogReader, MultiLogIterator, event_mono_time, event_which, iter_raw_events
+from tools.lib.route import Route
+from tools.lib.tests.helpers import make_segment_events, make_synthetic_route
+
+
+class TestLogReader(unittest.TestCase):
+  def setUp(self):
+    self.tmp = tempfile.mkdtemp()
+    self.events = make_segment_events(0, seconds=2)
+    self.fn = os.path.join(self.tmp, "rlog.bz2")
+    with bz2.open(self.fn, "wb") as f:
+      f.write(b"".join(self.events))
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp)
+
+  def test_raw_fields(self):
+    for dat in self.events:
+      msg = next(iter(log.Event.read_multiple_bytes(dat)))
+      self.assertEqual(event_which(dat), msg.which())
+      self.assertEqual(event_mono_time(dat), msg.logMonoTime)
+
+  def test_read_all(self):
+    expected = list(log.Event.read_multiple_bytes(b"".join(self.events)))
+    msgs = list(LogReader(self.fn))
+    self.assertEqual(len(msgs), len(expected))
+    for m, e in zip(msgs, expected):
+      self.assertEqual(m.which(), e.which())
+      self.assertEqual(m.logMonoTime, e.logMonoTime)
+    self.assertEqual(msgs[0].which(), "initData")
+
+  def test_which_filter(self):
+    all_msgs = list(LogReader(self.fn))
+    for which in (["carState"], ["can", "carParams"], ["gpsNMEA"]):
+      msgs = list(LogReader(self.fn, which=which))
+      self.assertEqual([m.logMonoTime for m in msgs], [m.logMonoTime for m in all_msgs if m.which() in which])
+
+    with self.assertRaises(ValueError):
+      LogReader(self.fn, which=["notAService"])
+
+  def test_chunk_boundaries(self):
+    dat = b"".join(self.events)
+    for chunk_size in (1, 7, 100, 4096):
+      chunks = [dat[i:i + chunk_size] for i in range(0, len(dat), chunk_size)]
+      self.assertEqual(list(iter_raw_events(chunks)), self.events)
+
+    with self.assertRaises(ValueError):
+      list(iter_raw_events([dat[:-3]]))
+
+  def test_uncompressed(self):
+    fn = os.path.join(self.tmp, "rlog")
+    with open(fn, "wb") as f:
+      f.write(b"".join(self.events))
+    self.assertEqual(len(list(LogReader(fn))), len(self.events))
+
+  def test_route(self):
+    route_name = make_synthetic_route(self.tmp, 3, seconds=1)
+    shutil.rmtree(os.path.join(self.tmp, f"{route_name}--1"))
+
+    r = Route(f"0123456789abcdef|{route_name}", data_dir=self.tmp)
+    self.assertEqual([s.number for s in r.segments], [0, 2])
+    self.assertEqual(r.log_paths()[1], None)
+    self.assertTrue(r.qlog_paths()[2].endswith(f"{route_name}--2/qlog.bz2"))
+
+    msgs = list(MultiLogIterator(r.log_paths(), which=["carParams"]))
+    self.assertEqual(len(msgs), 2)
+
+    with self.assertRaises(ValueError):
+      Route("2000-01-01--00-00-00", data_dir=self.tmp)
+
+
+if __name__ == "__main__":
+  unittest.main()
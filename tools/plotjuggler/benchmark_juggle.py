@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from tools.lib.logreader import LogReader
+from tools.lib.route import Route
+from tools.lib.tests.helpers import make_synthetic_route
+from tools.plotjuggler.juggle import load_route
+
+
+def load_segment_list(fn):
+  # previous loader: whole segment as a list of events, pickled back to the parent
+  return list(LogReader(fn))
+
+
+def load_route_list(logs, out_fn, can):
+  all_data = []
+  with multiprocessing.Pool(24) as pool:
+    for d in pool.map(load_segment_list, logs):
+      all_data += d
+  if not can:
+    all_data = [d for d in all_data if d.which() not in ['can', 'sendcan']]
+  with open(out_fn, "wb") as f:
+    for m in all_data:
+      f.write(m.as_builder().to_bytes())
+
+
+def run(mode, data_dir, route_name):
+  logs = Route(route_name, data_dir=data_dir).log_paths()
+  out_fn = os.path.join(data_dir, "out.rlog")
+  t = time.monotonic()
+  (load_route if mode == "stream" else load_route_list)(logs, out_fn, False)
+  dt = time.monotonic() - t
+  parent = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+  child = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1e3
+  print(f"{mode:6s} {len(logs):2d} segments: {dt:5.2f} s, peak RSS parent {parent:6.0f} MB, largest worker {child:5.0f} MB, "
+        f"{os.path.getsize(out_fn) / 1e6:.0f} MB written", flush=True)
+
+
+if __name__ == "__main__":
+  if len(sys.argv) == 4:
+    run(*sys.argv[1:])
+    sys.exit(0)
+
+  for n_segments in (1, 10):
+    tmp = tempfile.mkdtemp()
+    try:
+      route_name = make_synthetic_route(tmp, n_segments)
+      for mode in ("list", "stream"):
+        # fresh process for every run, so ru_maxrss only covers that run
+        pid = os.fork()
+        if pid == 0:
+          os.execv(sys.executable, [sys.executable, __file__, mode, tmp, route_name])
+        os.waitpid(pid, 0)
+    finally:
+      shutil.rmtree(tmp)
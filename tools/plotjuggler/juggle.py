@@ -2,27 +2,69 @@
 import os
 import sys
 import multiprocessing
+import shutil
 import subprocess
 import argparse
-from tempfile import NamedTemporaryFile
+from tempfile import NamedTemporaryFile, TemporaryDirectory
 
 from common.basedir import BASEDIR
-from selfdrive.test.process_replay.compare_logs import save_log
 from tools.lib.route import Route
-from tools.lib.logreader import LogReader
+from tools.lib.logreader import LogReader, event_from_bytes, event_which
 
 juggle_dir = os.path.dirname(os.path.realpath(__file__))
 
-def load_segment(segment_name):
+CAN_SERVICES = ('can', 'sendcan')
+
+def load_segment(args):
+  """Writes the raw events of a segment to out_fn, returns (carName, carFingerprint) of its first carParams"""
+  segment_name, out_fn, can = args
   print(f"Loading {segment_name}")
-  if segment_name is None:
-    return []
+  car = None
+  with open(out_fn, 'wb') as f:
+    if segment_name is None:
+      return car
 
+    try:
+      for dat in LogReader(segment_name).raw_events():
+        which = event_which(dat)
+        if not can and which in CAN_SERVICES:
+          continue
+        if car is None and which == 'carParams':
+          cp = event_from_bytes(dat).carParams
+          car = (cp.carName, cp.carFingerprint)
+        f.write(dat)
+    except ValueError as e:
+      print(f"Error parsing {segment_name}: {e}")
+  return car
+
+def infer_dbc(car):
+  if car is None:
+    return None
+  car_name, car_fingerprint = car
   try:
-    return list(LogReader(segment_name))
-  except ValueError as e:
-    print(f"Error parsing {segment_name}: {e}")
-    return []
+    DBC = __import__(f"selfdrive.car.{car_name}.values", fromlist=['DBC']).DBC
+    return DBC[car_fingerprint]['pt']
+  except (ImportError, KeyError, AttributeError):
+    return None
+
+def load_route(logs, out_fn, can, processes=24):
+  """Concatenates the events of logs into out_fn, in segment order. Returns the DBC name inferred from the first carParams.
+
+  Workers write each segment to a temporary file, so memory use doesn't depend on the route length."""
+  dbc = None
+  found_car = False
+  with TemporaryDirectory(dir=os.path.dirname(os.path.abspath(out_fn))) as tmp, open(out_fn, 'wb') as out, \
+       multiprocessing.Pool(max(1, min(processes, len(logs)))) as pool:
+    segment_fns = [os.path.join(tmp, f"{i}.rlog") for i in range(len(logs))]
+    args = [(log, fn, can) for log, fn in zip(logs, segment_fns)]
+    for segment_fn, car in zip(segment_fns, pool.imap(load_segment, args)):
+      if not found_car and car is not None:
+        dbc = infer_dbc(car)
+        found_car = True
+      with open(segment_fn, 'rb') as f:
+        shutil.copyfileobj(f, out)
+      os.unlink(segment_fn)
+  return dbc
 
 def start_juggler(fn=None, dbc=None, layout=None):
   env = os.environ.copy()
@@ -62,27 +104,8 @@ def juggle_route(route_name, segment_number, segment_count, qlog, can, layout):
       print(f"Please try a different {'segment' if segment_number is not None else 'route'}")
       return
 
-  all_data = []
-  pool = multiprocessing.Pool(24)
-  for d in pool.map(load_segment, logs):
-    all_data += d
-
-  if not can:
-    all_data = [d for d in all_data if d.which() not in ['can', 'sendcan']]
-
-  # Infer DBC name from logs
-  dbc = None
-  for cp in [m for m in all_data if m.which() == 'carParams']:
-    try:
-      DBC = __import__(f"selfdrive.car.{cp.carParams.carName}.values", fromlist=['DBC']).DBC
-      dbc = DBC[cp.carParams.carFingerprint]['pt']
-    except (ImportError, KeyError, AttributeError):
-      pass
-    break
-
   tempfile = NamedTemporaryFile(suffix='.rlog', dir=juggle_dir)
-  save_log(tempfile.name, all_data, compress=False)
-  del all_data
+  dbc = load_route(logs, tempfile.name, can)
 
   start_juggler(tempfile.name, dbc, layout)
 
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import tempfile
+import unittest
+
+from tools.lib.logreader import LogReader, event_which, iter_raw_events
+from tools.lib.route import Route
+from tools.lib.tests.helpers import make_synthetic_route
+from tools.plotjuggler.juggle import load_route
+
+
+class TestJuggleLoadRoute(unittest.TestCase):
+  def setUp(self):
+    self.tmp = tempfile.mkdtemp()
+    self.route = Route(make_synthetic_route(self.tmp, 3, seconds=1), data_dir=self.tmp)
+    self.events = [dat for fn in self.route.log_paths() for dat in LogReader(fn).raw_events()]
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp)
+
+  def _read(self, fn):
+    with open(fn, "rb") as f:
+      return list(iter_raw_events([f.read()]))
+
+  def test_load_route(self):
+    out_fn = os.path.join(self.tmp, "out.rlog")
+    for can in (False, True):
+      dbc = load_route(self.route.log_paths(), out_fn, can, processes=2)
+      self.assertEqual(dbc, "toyota_nodsu_pt_generated")
+      expected = [dat for dat in self.events if can or event_which(dat) not in ("can", "sendcan")]
+      self.assertEqual(self._read(out_fn), expected)
+    self.assertEqual(os.listdir(self.tmp).count("out.rlog"), 1)
+
+  def test_missing_segment(self):
+    out_fn = os.path.join(self.tmp, "out.rlog")
+    logs = self.route.log_paths()
+    logs[0] = None
+    self.assertEqual(load_route(logs, out_fn, True), "toyota_nodsu_pt_generated")
+    self.assertEqual(len(self._read(out_fn)), len(self.events) * 2 // 3)
+
+
+if __name__ == "__main__":
+  unittest.main()